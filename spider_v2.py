@@ -4,8 +4,15 @@ import os
 import argparse
 import json
 
-from src.config import STATE_FILE
-from src.scraper import scrape_xianyu
+from src.config import SPIDER_PROFILE, SPIDER_WARM_BROWSER, STATE_FILE, get_client
+from src.loop_watchdog import start_loop_watchdog, stop_loop_watchdog
+from src.memory_monitor import save_memory_report, start_memory_sampler, stop_memory_sampler
+from src.metrics import start_metrics_writer, stop_metrics_writer
+from src.notification_outbox import start_outbox_sender, stop_outbox_sender
+from src.notifier import close_notification_dispatcher
+from src.price_history import start_price_history_writer, stop_price_history_writer
+from src.run_profiler import RunProfiler, save_profile_report
+from src.scraper import launch_browser, scrape_xianyu
 
 
 async def main():
@@ -21,14 +28,69 @@ async def main():
 
   # 调试模式: 运行所有任务，但每个任务只处理前3个新发现的商品
   python spider_v2.py --debug-limit 3
+
+  # 查看启动时各模块的导入耗时
+  python spider_v2.py --profile-startup
 """,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
     parser.add_argument("--debug-limit", type=int, default=0, help="调试模式：每个任务仅处理前 N 个新商品（0 表示无限制）")
     parser.add_argument("--config", type=str, default="config.json", help="指定任务配置文件路径（默认为 config.json）")
     parser.add_argument("--task-name", type=str, help="只运行指定名称的单个任务 (用于定时任务调度)")
+    parser.add_argument("--worker", action="store_true", help="预热工作进程模式：完成导入后从标准输入等待一个任务 (由Web服务的进程池使用)")
+    parser.add_argument("--profile-startup", action="store_true", help="输出爬虫进程启动时各模块的导入耗时后退出")
     args = parser.parse_args()
 
+    if args.profile_startup:
+        from src.startup_profile import profile_startup
+        print(profile_startup("spider_v2"))
+        return
+
+    if args.worker:
+        await run_worker(args)
+    else:
+        await run(args)
+
+
+async def run_worker(args):
+    """
+    预热工作进程：模块导入和AI客户端初始化在启动时完成，可选地预先启动浏览器，
+    然后阻塞等待标准输入中的一行 JSON 任务 ({"task_name": ...})，执行一次后退出。
+    每个进程只执行一个任务，停止任务时仍可直接终止整个进程组。
+    """
+    # openai 改为首次使用时导入，工作进程在等待任务前提前完成
+    get_client()
+
+    browser = None
+    playwright = None
+    if SPIDER_WARM_BROWSER:
+        try:
+            from playwright.async_api import async_playwright
+            playwright = await async_playwright().start()
+            browser = await launch_browser(playwright)
+        except Exception as e:
+            print(f"预热浏览器失败，将在任务开始时启动: {e}")
+            browser = None
+
+    loop = asyncio.get_running_loop()
+    line = await loop.run_in_executor(None, sys.stdin.readline)
+    try:
+        if not line.strip():
+            # 标准输入关闭，进程池正在回收空闲进程
+            return
+        job = json.loads(line)
+        args.task_name = job["task_name"]
+        args.config = job.get("config", args.config)
+        args.debug_limit = int(job.get("debug_limit", args.debug_limit))
+        await run(args, browser=browser)
+    finally:
+        if browser is not None and browser.is_connected():
+            await browser.close()
+        if playwright is not None:
+            await playwright.stop()
+
+
+async def run(args, browser=None):
     if not os.path.exists(STATE_FILE):
         sys.exit(f"错误: 登录状态文件 '{STATE_FILE}' 不存在。请先运行 login.py 生成。")
 
@@ -112,11 +174,50 @@ async def main():
     coroutines = []
     for task_conf in active_task_configs:
         print(f"-> 任务 '{task_conf['task_name']}' 已加入执行队列。")
-        coroutines.append(scrape_xianyu(task_config=task_conf, debug_limit=args.debug_limit))
+        # 预热的浏览器只交给单任务运行使用
+        task_browser = browser if len(active_task_configs) == 1 else None
+        coroutines.append(scrape_xianyu(task_config=task_conf, debug_limit=args.debug_limit, browser=task_browser))
+
+    # 通知先写入发件箱，由后台投递器异步发送
+    start_outbox_sender()
+    # 定期写出指标快照，由Web服务的 /metrics 汇总
+    start_metrics_writer()
+    # 搜索结果中的价格先缓存在内存中，定期批量写入价格历史
+    start_price_history_writer()
+    start_loop_watchdog("spider")
+
+    # 开启性能分析的任务：对本次运行采样，同一进程中并发的任务共享同一份采样
+    profiled_tasks = [t['task_name'] for t in active_task_configs if SPIDER_PROFILE or t.get('profile')]
+    profiler = None
+    if profiled_tasks:
+        profiler = RunProfiler()
+        profiler.start()
+        print(f"-> 已开启性能分析，采样间隔 {profiler.interval * 1000:.0f} ms。")
+
+    start_memory_sampler()
 
     # 并发执行所有任务
     results = await asyncio.gather(*coroutines, return_exceptions=True)
 
+    memory_report = await stop_memory_sampler()
+    if memory_report is not None:
+        for task_conf in active_task_configs:
+            path = save_memory_report(task_conf['task_name'], memory_report)
+            print(f"-> 任务 '{task_conf['task_name']}' 的内存报告已保存: {path} (RSS 峰值 {memory_report['peak_rss_mb']} MB)")
+
+    if profiler is not None:
+        report = profiler.stop()
+        for profiled_name in profiled_tasks:
+            report_id = save_profile_report(profiled_name, report)
+            print(f"-> 任务 '{profiled_name}' 的性能分析报告已保存: {report_id} "
+                  f"({report['samples']} 个采样，事件循环空闲 {report['idle_percent']}%)")
+    # 退出前尽量发送完本次运行产生的通知，未发送的消息留在发件箱中由下次运行或Web服务继续投递
+    await stop_outbox_sender(flush_timeout=30)
+    await close_notification_dispatcher()
+    await stop_loop_watchdog()
+    await stop_metrics_writer()
+    await stop_price_history_writer()
+
     print("\n--- 所有任务执行完毕 ---")
     for i, result in enumerate(results):
         task_name = active_task_configs[i]['task_name']
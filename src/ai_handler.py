@@ -1,12 +1,12 @@
 import asyncio
 import base64
+import io
 import json
 import os
 import re
 import sys
 import shutil
 from datetime import datetime
-from urllib.parse import urlencode, urlparse, urlunparse, parse_qsl
 
 import requests
 
@@ -18,25 +18,19 @@ if sys.platform.startswith('win'):
 
 from src.config import (
     AI_DEBUG_MODE,
+    AI_IMAGE_INPUT_MODE,
     IMAGE_DOWNLOAD_HEADERS,
+    IMAGE_IN_MEMORY,
+    IMAGE_MAX_DIMENSION,
+    IMAGE_MEMORY_LIMIT_MB,
     IMAGE_SAVE_DIR,
     TASK_IMAGE_DIR_PREFIX,
     MODEL_NAME,
-    NTFY_TOPIC_URL,
-    GOTIFY_URL,
-    GOTIFY_TOKEN,
-    BARK_URL,
-    PCURL_TO_MOBILE,
-    WX_BOT_URL,
-    WEBHOOK_URL,
-    WEBHOOK_METHOD,
-    WEBHOOK_HEADERS,
-    WEBHOOK_CONTENT_TYPE,
-    WEBHOOK_QUERY_PARAMETERS,
-    WEBHOOK_BODY,
-    client,
+    get_client,
 )
-from src.utils import convert_goofish_link, retry_on_failure
+from src.metrics import get_metrics
+from src.notifier import build_notification_message, get_notification_dispatcher
+from src.utils import retry_on_failure
 
 
 def safe_print(text):
@@ -68,6 +62,17 @@ async def _download_single_image(url, save_path):
     return save_path
 
 
+def _build_image_file_name(product_id, index, url):
+    """根据商品ID、序号和图片URL生成一个安全的本地文件名。"""
+    clean_url = url.split('.heic')[0] if '.heic' in url else url
+    file_name_base = os.path.basename(clean_url).split('?')[0]
+    file_name = f"product_{product_id}_{index}_{file_name_base}"
+    file_name = re.sub(r'[\\/*?:"<>|]', "", file_name)
+    if not os.path.splitext(file_name)[1]:
+        file_name += ".jpg"
+    return file_name
+
+
 async def download_all_images(product_id, image_urls, task_name="default"):
     """异步下载一个商品的所有图片。如果图片已存在则跳过。支持任务隔离。"""
     if not image_urls:
@@ -85,30 +90,134 @@ async def download_all_images(product_id, image_urls, task_name="default"):
     total_images = len(urls)
     for i, url in enumerate(urls):
         try:
-            clean_url = url.split('.heic')[0] if '.heic' in url else url
-            file_name_base = os.path.basename(clean_url).split('?')[0]
-            file_name = f"product_{product_id}_{i + 1}_{file_name_base}"
-            file_name = re.sub(r'[\\/*?:"<>|]', "", file_name)
-            if not os.path.splitext(file_name)[1]:
-                file_name += ".jpg"
-
-            save_path = os.path.join(task_image_dir, file_name)
+            save_path = os.path.join(task_image_dir, _build_image_file_name(product_id, i + 1, url))
 
             if os.path.exists(save_path):
                 safe_print(f"   [图片] 图片 {i + 1}/{total_images} 已存在，跳过下载: {os.path.basename(save_path)}")
+                get_metrics().inc("goofish_images_total", result="cached")
                 saved_paths.append(save_path)
                 continue
 
             safe_print(f"   [图片] 正在下载图片 {i + 1}/{total_images}: {url}")
             if await _download_single_image(url, save_path):
                 safe_print(f"   [图片] 图片 {i + 1}/{total_images} 已成功下载到: {os.path.basename(save_path)}")
+                get_metrics().inc("goofish_images_total", result="downloaded")
+                get_metrics().inc("goofish_image_bytes_total", os.path.getsize(save_path))
                 saved_paths.append(save_path)
+            else:
+                get_metrics().inc("goofish_images_total", result="failed")
         except Exception as e:
             safe_print(f"   [图片] 处理图片 {url} 时发生错误，已跳过此图: {e}")
+            get_metrics().inc("goofish_images_total", result="failed")
 
     return saved_paths
 
 
+@retry_on_failure(retries=2, delay=3)
+async def _fetch_image_bytes(url):
+    """一个带重试的内部函数，用于异步下载单个图片到内存。"""
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(
+        None,
+        lambda: requests.get(url, headers=IMAGE_DOWNLOAD_HEADERS, timeout=20)
+    )
+    response.raise_for_status()
+    return response.content
+
+
+def _resize_image_bytes(data, max_dimension):
+    """将图片等比缩放到最长边不超过 max_dimension，返回 JPEG 字节。无需缩放时原样返回。"""
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if max(img.size) <= max_dimension:
+                return data
+            img.thumbnail((max_dimension, max_dimension))
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            buffer = io.BytesIO()
+            img.save(buffer, format="JPEG", quality=85)
+            return buffer.getvalue()
+    except Exception as e:
+        safe_print(f"   [图片] 缩放图片时出错，将使用原图: {e}")
+        return data
+
+
+def _write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+async def download_images_in_memory(product_id, image_urls, task_name="default"):
+    """
+    异步下载一个商品的所有图片到内存，可选缩放。
+    返回列表中的元素为 bytes（内存中的图片）或 str（超出内存上限后落盘的图片路径）。
+    """
+    if not image_urls:
+        return []
+
+    urls = [url.strip() for url in image_urls if url.strip().startswith('http')]
+    if not urls:
+        return []
+
+    loop = asyncio.get_running_loop()
+    memory_limit = int(IMAGE_MEMORY_LIMIT_MB * 1024 * 1024)
+    memory_used = 0
+    images = []
+    total_images = len(urls)
+    for i, url in enumerate(urls):
+        try:
+            safe_print(f"   [图片] 正在下载图片 {i + 1}/{total_images} 到内存: {url}")
+            data = await _fetch_image_bytes(url)
+            if not data:
+                get_metrics().inc("goofish_images_total", result="failed")
+                continue
+            get_metrics().inc("goofish_images_total", result="downloaded")
+            get_metrics().inc("goofish_image_bytes_total", len(data))
+
+            if IMAGE_MAX_DIMENSION > 0:
+                data = await loop.run_in_executor(None, _resize_image_bytes, data, IMAGE_MAX_DIMENSION)
+
+            if memory_used + len(data) <= memory_limit:
+                images.append(data)
+                memory_used += len(data)
+                continue
+
+            # 超出内存上限，落盘保存
+            task_image_dir = os.path.join(IMAGE_SAVE_DIR, f"{TASK_IMAGE_DIR_PREFIX}{task_name}")
+            os.makedirs(task_image_dir, exist_ok=True)
+            save_path = os.path.join(task_image_dir, _build_image_file_name(product_id, i + 1, url))
+            await loop.run_in_executor(None, _write_bytes, save_path, data)
+            safe_print(f"   [图片] 已超出内存上限 ({IMAGE_MEMORY_LIMIT_MB}MB)，图片 {i + 1}/{total_images} 已落盘: {os.path.basename(save_path)}")
+            images.append(save_path)
+        except Exception as e:
+            safe_print(f"   [图片] 处理图片 {url} 时发生错误，已跳过此图: {e}")
+            get_metrics().inc("goofish_images_total", result="failed")
+
+    return images
+
+
+async def download_item_images(product_id, image_urls, task_name="default"):
+    """按 IMAGE_IN_MEMORY 配置下载商品图片：内存模式返回图片字节（超限部分为落盘路径），否则返回本地文件路径。"""
+    if IMAGE_IN_MEMORY:
+        return await download_images_in_memory(product_id, image_urls, task_name)
+    return await download_all_images(product_id, image_urls, task_name)
+
+
+def remove_downloaded_images(images):
+    """删除下载到磁盘上的临时图片文件，内存中的图片无需处理。"""
+    for img_path in images:
+        if not isinstance(img_path, str):
+            continue
+        try:
+            if os.path.exists(img_path):
+                os.remove(img_path)
+                safe_print(f"   [图片] 已删除临时图片文件: {img_path}")
+        except Exception as e:
+            safe_print(f"   [图片] 删除图片文件时出错: {e}")
+
+
 def cleanup_task_images(task_name):
     """清理指定任务的图片目录"""
     task_image_dir = os.path.join(IMAGE_SAVE_DIR, f"{TASK_IMAGE_DIR_PREFIX}{task_name}")
@@ -123,7 +232,9 @@ def cleanup_task_images(task_name):
 
 
 def encode_image_to_base64(image_path):
-    """将本地图片文件编码为 Base64 字符串。"""
+    """将本地图片文件（或内存中的图片字节）编码为 Base64 字符串。"""
+    if isinstance(image_path, (bytes, bytearray)):
+        return base64.b64encode(image_path).decode('utf-8')
     if not image_path or not os.path.exists(image_path):
         return None
     try:
@@ -196,260 +307,108 @@ def validate_ai_response_format(parsed_response):
     return True
 
 
-@retry_on_failure(retries=3, delay=5)
 async def send_ntfy_notification(product_data, reason):
-    """当发现推荐商品时，异步发送一个高优先级的 ntfy.sh 通知。"""
-    if not NTFY_TOPIC_URL and not WX_BOT_URL and not (GOTIFY_URL and GOTIFY_TOKEN) and not BARK_URL and not WEBHOOK_URL:
+    """当发现推荐商品时，并发推送到所有已配置的通知渠道，返回各渠道的发送结果。"""
+    dispatcher = get_notification_dispatcher()
+    if not dispatcher.channels:
         safe_print("警告：未在 .env 文件中配置任何通知服务 (NTFY_TOPIC_URL, WX_BOT_URL, GOTIFY_URL/TOKEN, BARK_URL, WEBHOOK_URL)，跳过通知。")
-        return
-
-    title = product_data.get('商品标题', 'N/A')
-    price = product_data.get('当前售价', 'N/A')
-    link = product_data.get('商品链接', '#')
-    if PCURL_TO_MOBILE:
-        mobile_link = convert_goofish_link(link)
-        message = f"价格: {price}\n原因: {reason}\n手机端链接: {mobile_link}\n电脑端链接: {link}"
-    else:
-        message = f"价格: {price}\n原因: {reason}\n链接: {link}"
+        return []
 
-    notification_title = f"🚨 新推荐! {title[:30]}..."
+    message = build_notification_message(product_data, reason)
+    safe_print(f"   -> 正在并发发送通知到 {len(dispatcher.channels)} 个渠道...")
+    results = await dispatcher.dispatch(message)
+    for result in results:
+        if result["success"]:
+            safe_print(f"   -> {result['channel']} 通知发送成功。耗时 {result['latency_ms']}ms")
+        else:
+            safe_print(f"   -> 发送 {result['channel']} 通知失败 ({result['latency_ms']}ms): {result['error']}")
+    return results
 
-    # --- 发送 ntfy 通知 ---
-    if NTFY_TOPIC_URL:
-        try:
-            safe_print(f"   -> 正在发送 ntfy 通知到: {NTFY_TOPIC_URL}")
-            loop = asyncio.get_running_loop()
-            await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    NTFY_TOPIC_URL,
-                    data=message.encode('utf-8'),
-                    headers={
-                        "Title": notification_title.encode('utf-8'),
-                        "Priority": "urgent",
-                        "Tags": "bell,vibration"
-                    },
-                    timeout=10
-                )
-            )
-            safe_print("   -> ntfy 通知发送成功。")
-        except Exception as e:
-            safe_print(f"   -> 发送 ntfy 通知失败: {e}")
 
-    # --- 发送 Gotify 通知 ---
-    if GOTIFY_URL and GOTIFY_TOKEN:
-        try:
-            safe_print(f"   -> 正在发送 Gotify 通知到: {GOTIFY_URL}")
-            # Gotify uses multipart/form-data
-            payload = {
-                'title': (None, notification_title),
-                'message': (None, message),
-                'priority': (None, '5')
-            }
-
-            gotify_url_with_token = f"{GOTIFY_URL}/message?token={GOTIFY_TOKEN}"
-
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    gotify_url_with_token,
-                    files=payload,
-                    timeout=10
-                )
-            )
-            response.raise_for_status()
-            safe_print("   -> Gotify 通知发送成功。")
-        except requests.exceptions.RequestException as e:
-            safe_print(f"   -> 发送 Gotify 通知失败: {e}")
-        except Exception as e:
-            safe_print(f"   -> 发送 Gotify 通知时发生未知错误: {e}")
+# 服务商拒绝远程图片URL后，本进程内后续请求直接使用 Base64 上传
+_remote_image_urls_supported = True
+# 以 Base64 方式上传过的图片的原始字节统计，用于估算URL模式节省的流量
+_observed_image_bytes = 0
+_observed_image_count = 0
 
-    # --- 发送 Bark 通知 ---
-    if BARK_URL:
-        try:
-            safe_print(f"   -> 正在发送 Bark 通知...")
-
-            bark_payload = {
-                "title": notification_title,
-                "body": message,
-                "level": "timeSensitive",
-                "group": "闲鱼监控"
-            }
-
-            link_to_use = convert_goofish_link(link) if PCURL_TO_MOBILE else link
-            bark_payload["url"] = link_to_use
-
-            # Add icon if available
-            main_image = product_data.get('商品主图链接')
-            if not main_image:
-                # Fallback to image list if main image not present
-                image_list = product_data.get('商品图片列表', [])
-                if image_list:
-                    main_image = image_list[0]
-
-            if main_image:
-                bark_payload['icon'] = main_image
-
-            headers = { "Content-Type": "application/json; charset=utf-8" }
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    BARK_URL,
-                    json=bark_payload,
-                    headers=headers,
-                    timeout=10
-                )
-            )
-            response.raise_for_status()
-            safe_print("   -> Bark 通知发送成功。")
-        except requests.exceptions.RequestException as e:
-            safe_print(f"   -> 发送 Bark 通知失败: {e}")
-        except Exception as e:
-            safe_print(f"   -> 发送 Bark 通知时发生未知错误: {e}")
-
-    # --- 发送企业微信机器人通知 ---
-    if WX_BOT_URL:
-        # 将消息转换为Markdown格式，使链接可点击
-        lines = message.split('\n')
-        markdown_content = f"## {notification_title}\n\n"
-
-        for line in lines:
-            if line.startswith('手机端链接:') or line.startswith('电脑端链接:') or line.startswith('链接:'):
-                # 提取链接部分并转换为Markdown超链接
-                if ':' in line:
-                    label, url = line.split(':', 1)
-                    url = url.strip()
-                    if url and url != '#':
-                        markdown_content += f"- **{label}:** [{url}]({url})\n"
-                    else:
-                        markdown_content += f"- **{label}:** 暂无链接\n"
-                else:
-                    markdown_content += f"- {line}\n"
-            else:
-                # 其他行保持原样
-                if line:
-                    markdown_content += f"- {line}\n"
-                else:
-                    markdown_content += "\n"
 
-        payload = {
-            "msgtype": "markdown",
-            "markdown": {
-                "content": markdown_content
-            }
-        }
+def remote_image_urls_enabled():
+    """当前是否直接向AI传递图片URL：AI_IMAGE_INPUT_MODE=url 且服务商尚未拒绝过远程URL。"""
+    return AI_IMAGE_INPUT_MODE == "url" and _remote_image_urls_supported
 
-        try:
-            safe_print(f"   -> 正在发送企业微信通知到: {WX_BOT_URL}")
-            headers = { "Content-Type": "application/json" }
-            loop = asyncio.get_running_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: requests.post(
-                    WX_BOT_URL,
-                    json=payload,
-                    headers=headers,
-                    timeout=10
-                )
-            )
-            response.raise_for_status()
-            result = response.json()
-            safe_print(f"   -> 企业微信通知发送成功。响应: {result}")
-        except requests.exceptions.RequestException as e:
-            safe_print(f"   -> 发送企业微信通知失败: {e}")
-        except Exception as e:
-            safe_print(f"   -> 发送企业微信通知时发生未知错误: {e}")
 
-    # --- 发送通用 Webhook 通知 ---
-    if WEBHOOK_URL:
-        try:
-            safe_print(f"   -> 正在发送通用 Webhook 通知到: {WEBHOOK_URL}")
-
-            # 替换占位符
-            def replace_placeholders(template_str):
-                if not template_str:
-                    return ""
-                # 对内容进行JSON转义，避免换行符和特殊字符破坏JSON格式
-                safe_title = json.dumps(notification_title, ensure_ascii=False)[1:-1]  # 去掉外层引号
-                safe_content = json.dumps(message, ensure_ascii=False)[1:-1]  # 去掉外层引号
-                # 同时支持旧的${title}${content}和新的{{title}}{{content}}格式
-                return template_str.replace("${title}", safe_title).replace("${content}", safe_content).replace("{{title}}", safe_title).replace("{{content}}", safe_content)
-
-            # 准备请求头
-            headers = {}
-            if WEBHOOK_HEADERS:
-                try:
-                    headers = json.loads(WEBHOOK_HEADERS)
-                except json.JSONDecodeError:
-                    safe_print(f"   -> [警告] Webhook 请求头格式错误，请检查 .env 中的 WEBHOOK_HEADERS。")
-
-            loop = asyncio.get_running_loop()
-
-            if WEBHOOK_METHOD == "GET":
-                # 准备查询参数
-                final_url = WEBHOOK_URL
-                if WEBHOOK_QUERY_PARAMETERS:
-                    try:
-                        params_str = replace_placeholders(WEBHOOK_QUERY_PARAMETERS)
-                        params = json.loads(params_str)
-
-                        # 解析原始URL并追加新参数
-                        url_parts = list(urlparse(final_url))
-                        query = dict(parse_qsl(url_parts[4]))
-                        query.update(params)
-                        url_parts[4] = urlencode(query)
-                        final_url = urlunparse(url_parts)
-                    except json.JSONDecodeError:
-                        safe_print(f"   -> [警告] Webhook 查询参数格式错误，请检查 .env 中的 WEBHOOK_QUERY_PARAMETERS。")
-
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: requests.get(final_url, headers=headers, timeout=15)
-                )
+def _base64_length(raw_size):
+    """计算 raw_size 字节数据编码为 Base64 后的长度。"""
+    return 4 * ((raw_size + 2) // 3)
 
-            elif WEBHOOK_METHOD == "POST":
-                # 准备请求体
-                data = None
-                json_payload = None
 
-                if WEBHOOK_BODY:
-                    body_str = replace_placeholders(WEBHOOK_BODY)
-                    try:
-                        if WEBHOOK_CONTENT_TYPE == "JSON":
-                            json_payload = json.loads(body_str)
-                            if 'Content-Type' not in headers and 'content-type' not in headers:
-                                headers['Content-Type'] = 'application/json; charset=utf-8'
-                        elif WEBHOOK_CONTENT_TYPE == "FORM":
-                            data = json.loads(body_str)  # requests会处理url-encoding
-                            if 'Content-Type' not in headers and 'content-type' not in headers:
-                                headers['Content-Type'] = 'application/x-www-form-urlencoded'
-                        else:
-                            safe_print(f"   -> [警告] 不支持的 WEBHOOK_CONTENT_TYPE: {WEBHOOK_CONTENT_TYPE}。")
-                    except json.JSONDecodeError:
-                        safe_print(f"   -> [警告] Webhook 请求体格式错误，请检查 .env 中的 WEBHOOK_BODY。")
-
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: requests.post(WEBHOOK_URL, headers=headers, json=json_payload, data=data, timeout=15)
-                )
-            else:
-                safe_print(f"   -> [警告] 不支持的 WEBHOOK_METHOD: {WEBHOOK_METHOD}。")
-                return
+async def _build_base64_image_contents(image_paths):
+    """将图片（内存字节或磁盘路径）编码为 data URI 形式的 image_url 内容列表。"""
+    global _observed_image_bytes, _observed_image_count
+    contents = []
+    loop = asyncio.get_running_loop()
+    for path in image_paths or []:
+        if isinstance(path, (bytes, bytearray)):
+            base64_image = encode_image_to_base64(path)
+        else:
+            # 磁盘上的图片在线程池中读取，避免阻塞事件循环
+            base64_image = await loop.run_in_executor(None, encode_image_to_base64, path)
+        if base64_image:
+            _observed_image_bytes += len(base64_image) * 3 // 4
+            _observed_image_count += 1
+            contents.append({"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
+    return contents
+
+
+def _estimate_url_mode_savings(image_urls, image_paths):
+    """
+    估算URL模式相对 Base64 模式节省的字节数（免去的上传量，以及未预先下载时免去的下载量）。
+    返回 (节省字节数, 是否为估算值)；无法估算时字节数为 None。
+    """
+    in_memory = [img for img in image_paths or [] if isinstance(img, (bytes, bytearray))]
+    on_disk = [img for img in image_paths or [] if isinstance(img, str) and os.path.exists(img)]
+    if image_paths and len(in_memory) + len(on_disk) == len(image_paths):
+        sizes = [len(img) for img in in_memory] + [os.path.getsize(img) for img in on_disk]
+        return sum(_base64_length(size) for size in sizes), False
+    if _observed_image_count:
+        average = _observed_image_bytes // _observed_image_count
+        return len(image_urls) * (average + _base64_length(average)), True
+    return None, True
+
+
+def _is_remote_image_rejection(error):
+    """判断AI服务商的报错是否是因为不支持（或无法获取）远程图片URL。"""
+    status_code = getattr(error, 'status_code', None)
+    if status_code not in (400, 415, 422):
+        return False
+    message = str(error).lower()
+    return any(keyword in message for keyword in ("image", "url", "download", "fetch", "media"))
 
-            response.raise_for_status()
-            safe_print(f"   -> Webhook 通知发送成功。状态码: {response.status_code}")
 
-        except requests.exceptions.RequestException as e:
-            safe_print(f"   -> 发送 Webhook 通知失败: {e}")
-        except Exception as e:
-            safe_print(f"   -> 发送 Webhook 通知时发生未知错误: {e}")
+def _with_image_input(parsed_response, image_input):
+    """将本次请求使用的图片传输方式记录到AI分析结果中。"""
+    if isinstance(parsed_response, dict):
+        parsed_response['image_input'] = dict(image_input)
+    return parsed_response
 
 
 @retry_on_failure(retries=3, delay=5)
-async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
-    """将完整的商品JSON数据和所有图片发送给 AI 进行分析（异步）。"""
+async def get_ai_analysis(product_data, image_paths=None, prompt_text="", image_urls=None, task_name="default"):
+    """
+    将完整的商品JSON数据和所有图片发送给 AI 进行分析（异步）。
+    AI_IMAGE_INPUT_MODE=url 时直接传递图片CDN链接，由服务商自行拉取；服务商拒绝远程URL时自动回退为 Base64 上传。
+    回退时调用方没有预先下载图片，图片在这里按任务下载，分析结束后删除其中落盘的文件。
+    """
+    fallback_images = []
+    try:
+        return await _request_ai_analysis(product_data, image_paths, prompt_text, image_urls, task_name, fallback_images)
+    finally:
+        remove_downloaded_images(fallback_images)
+
+
+async def _request_ai_analysis(product_data, image_paths, prompt_text, image_urls, task_name, fallback_images):
+    global _remote_image_urls_supported
+    client = get_client()
     if not client:
         safe_print("   [AI分析] 错误：AI客户端未初始化，跳过分析。")
         return None
@@ -483,20 +442,38 @@ async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
 
 {system_prompt}
 """
-    user_content_list = []
-
-    # 先添加图片内容
-    if image_paths:
-        for path in image_paths:
-            base64_image = encode_image_to_base64(path)
-            if base64_image:
-                user_content_list.append(
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}})
-
-    # 再添加文本内容
-    user_content_list.append({"type": "text", "text": combined_text_prompt})
+    image_urls = [url.strip() for url in image_urls or [] if url and url.strip().startswith('http')]
+    use_remote_urls = remote_image_urls_enabled() and bool(image_urls)
+
+    async def build_messages(remote_urls):
+        if remote_urls:
+            image_contents = [{"type": "image_url", "image_url": {"url": url}} for url in image_urls]
+        else:
+            images = image_paths
+            if not images and image_urls:
+                # 调用方未预先下载图片（URL模式回退），此时再下载
+                images = await download_item_images(product_id, image_urls, task_name)
+                fallback_images.extend(images)
+            image_contents = await _build_base64_image_contents(images)
+        # 先添加图片内容，再添加文本内容
+        return [{"role": "user", "content": image_contents + [{"type": "text", "text": combined_text_prompt}]}]
+
+    def describe_image_input(remote_urls, request_messages):
+        info = {
+            "mode": "url" if remote_urls else "base64",
+            "image_count": len(request_messages[0]["content"]) - 1,
+            "request_bytes": len(json.dumps(request_messages, ensure_ascii=False).encode('utf-8')),
+        }
+        if remote_urls:
+            info["bytes_saved"], info["bytes_saved_estimated"] = _estimate_url_mode_savings(image_urls, image_paths)
+        return info
 
-    messages = [{"role": "user", "content": user_content_list}]
+    messages = await build_messages(use_remote_urls)
+    image_input = describe_image_input(use_remote_urls, messages)
+    metrics = get_metrics()
+    metrics.observe("goofish_ai_request_bytes", image_input['request_bytes'])
+    safe_print(f"   [AI分析] 图片传输方式: {image_input['mode']}，请求大小: {image_input['request_bytes']} 字节" +
+               (f"，节省约 {image_input['bytes_saved']} 字节" if image_input.get('bytes_saved') else ""))
 
     # 保存最终传输内容到日志文件
     try:
@@ -523,22 +500,34 @@ async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
 
     # 增强的AI调用，包含更严格的格式控制和重试机制
     max_retries = 3
-    for attempt in range(max_retries):
+    # 远程图片URL被拒绝后改用 Base64 重新发送的那一次不计入尝试次数，最后一次尝试被拒绝时同样会回退
+    attempt = -1
+    while attempt < max_retries - 1:
+        attempt += 1
+        if attempt > 0:
+            metrics.inc("goofish_retries_total", function="ai_request")
+        response = None
         try:
             # 根据重试次数调整参数
             current_temperature = 0.1 if attempt == 0 else 0.05  # 重试时使用更低的温度
 
             from src.config import get_ai_request_params
             
-            response = await client.chat.completions.create(
-                **get_ai_request_params(
-                    model=MODEL_NAME,
-                    messages=messages,
-                    response_format={"type": "json_object"},
-                    temperature=current_temperature,
-                    max_tokens=4000
+            with metrics.timer("goofish_stage_seconds", stage="ai_request"):
+                response = await client.chat.completions.create(
+                    **get_ai_request_params(
+                        model=MODEL_NAME,
+                        messages=messages,
+                        response_format={"type": "json_object"},
+                        temperature=current_temperature,
+                        max_tokens=4000
+                    )
                 )
-            )
+            metrics.inc("goofish_ai_requests_total", outcome="success")
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                metrics.inc("goofish_ai_tokens_total", getattr(usage, "prompt_tokens", 0) or 0, kind="prompt")
+                metrics.inc("goofish_ai_tokens_total", getattr(usage, "completion_tokens", 0) or 0, kind="completion")
 
             ai_response_content = response.choices[0].message.content
 
@@ -555,7 +544,7 @@ async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
                 # 验证响应格式
                 if validate_ai_response_format(parsed_response):
                     safe_print(f"   [AI分析] 第{attempt + 1}次尝试成功，响应格式验证通过")
-                    return parsed_response
+                    return _with_image_input(parsed_response, image_input)
                 else:
                     safe_print(f"   [AI分析] 第{attempt + 1}次尝试格式验证失败")
                     if attempt < max_retries - 1:
@@ -563,7 +552,7 @@ async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
                         continue
                     else:
                         safe_print("   [AI分析] 所有重试完成，使用最后一次结果")
-                        return parsed_response
+                        return _with_image_input(parsed_response, image_input)
 
             except json.JSONDecodeError:
                 safe_print(f"   [AI分析] 第{attempt + 1}次尝试JSON解析失败，尝试清理响应内容...")
@@ -588,14 +577,14 @@ async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
                         parsed_response = json.loads(json_str)
                         if validate_ai_response_format(parsed_response):
                             safe_print(f"   [AI分析] 第{attempt + 1}次尝试清理后成功")
-                            return parsed_response
+                            return _with_image_input(parsed_response, image_input)
                         else:
                             if attempt < max_retries - 1:
                                 safe_print(f"   [AI分析] 准备第{attempt + 2}次重试...")
                                 continue
                             else:
                                 safe_print("   [AI分析] 所有重试完成，使用清理后的结果")
-                                return parsed_response
+                                return _with_image_input(parsed_response, image_input)
                     except json.JSONDecodeError as e:
                         safe_print(f"   [AI分析] 第{attempt + 1}次尝试清理后JSON解析仍然失败: {e}")
                         if attempt < max_retries - 1:
@@ -612,6 +601,17 @@ async def get_ai_analysis(product_data, image_paths=None, prompt_text=""):
                         raise json.JSONDecodeError("No valid JSON object found", ai_response_content, 0)
 
         except Exception as e:
+            if response is None:
+                metrics.inc("goofish_ai_requests_total", outcome="error")
+            if use_remote_urls and _is_remote_image_rejection(e):
+                safe_print(f"   [AI分析] 服务商不支持远程图片URL，回退为 Base64 上传: {e}")
+                _remote_image_urls_supported = False
+                use_remote_urls = False
+                messages = await build_messages(False)
+                image_input = describe_image_input(False, messages)
+                image_input["fallback_from"] = "url"
+                attempt -= 1
+                continue
             safe_print(f"   [AI分析] 第{attempt + 1}次尝试AI调用失败: {e}")
             if attempt < max_retries - 1:
                 safe_print(f"   [AI分析] 准备第{attempt + 2}次重试...")
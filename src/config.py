@@ -1,8 +1,7 @@
 import os
 import sys
 
-from dotenv import load_dotenv
-from openai import AsyncOpenAI
+from dotenv import dotenv_values, load_dotenv
 
 # --- AI & Notification Configuration ---
 load_dotenv()
@@ -11,11 +10,64 @@ load_dotenv()
 STATE_FILE = "xianyu_state.json"
 IMAGE_SAVE_DIR = "images"
 CONFIG_FILE = "config.json"
-os.makedirs(IMAGE_SAVE_DIR, exist_ok=True)
+DATA_DIR = "data"
+LOG_DIR = "logs"
+IMAGE_HASH_INDEX_FILE = os.path.join(DATA_DIR, "image_hash_index.npz")
+NOTIFY_OUTBOX_FILE = os.path.join(DATA_DIR, "notification_outbox.db")
+PRICE_HISTORY_FILE = os.path.join(DATA_DIR, "price_history.db")
+PRESCREEN_MODEL_FILE = os.path.join(DATA_DIR, "prescreen_model.npz")
+# 爬虫进程写出指标快照的目录，由Web服务汇总后通过 /metrics 暴露
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")
 
 # 任务隔离的临时图片目录前缀
 TASK_IMAGE_DIR_PREFIX = "task_images_"
 
+# 单个日志文件的大小上限 (MB)，超过后压缩归档
+TASK_LOG_MAX_MB = float(os.getenv("TASK_LOG_MAX_MB", "10"))
+# 日志归档的保留天数，0 表示永久保留
+TASK_LOG_RETENTION_DAYS = float(os.getenv("TASK_LOG_RETENTION_DAYS", "14"))
+
+# --- Run Queue ---
+# 同时运行的爬虫数上限，超出的运行 (定时触发或手动启动) 按任务优先级排队
+MAX_CONCURRENT_SPIDERS = int(os.getenv("MAX_CONCURRENT_SPIDERS", "2"))
+
+# 定时任务错开窗口 (秒)：每个 cron 任务按任务名哈希推后 [0, 窗口) 内的固定秒数，0 表示不错开
+SCHEDULE_SPREAD_SECONDS = int(os.getenv("SCHEDULE_SPREAD_SECONDS", "0"))
+
+# --- Spider Worker Pool ---
+# Web服务预先启动的爬虫工作进程数，任务启动时直接使用已完成导入的进程；0 表示每次运行都启动新进程
+SPIDER_WORKER_POOL_SIZE = int(os.getenv("SPIDER_WORKER_POOL_SIZE", "1"))
+# 空闲工作进程的最长存活时间 (分钟)，超过后替换为新进程，以便加载最新的代码和配置
+SPIDER_WORKER_MAX_IDLE_MINUTES = float(os.getenv("SPIDER_WORKER_MAX_IDLE_MINUTES", "60"))
+# 开启后工作进程在等待任务时预先启动浏览器 (常驻占用一个浏览器的内存)
+SPIDER_WARM_BROWSER = os.getenv("SPIDER_WARM_BROWSER", "false").lower() == "true"
+
+# --- Metrics ---
+# 爬虫进程写出指标快照的间隔 (秒)
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "10"))
+
+# --- Run Profiling ---
+# 开启后对所有任务的运行进行采样分析；也可在单个任务配置中设置 "profile": true
+SPIDER_PROFILE = os.getenv("SPIDER_PROFILE", "false").lower() == "true"
+# 采样间隔 (毫秒)
+SPIDER_PROFILE_INTERVAL_MS = float(os.getenv("SPIDER_PROFILE_INTERVAL_MS", "10"))
+# 性能分析报告目录，每个任务一个子目录
+PROFILE_DIR = os.path.join(LOG_DIR, "profiles")
+
+# --- Memory Sampling ---
+# 开启后爬虫进程用 tracemalloc 定期记录内存分配最多的位置及各阶段的 RSS 变化 (含 Chromium 子进程)
+SPIDER_MEMORY_PROFILE = os.getenv("SPIDER_MEMORY_PROFILE", "false").lower() == "true"
+# 拍摄内存快照的间隔 (秒)
+SPIDER_MEMORY_INTERVAL_SECONDS = float(os.getenv("SPIDER_MEMORY_INTERVAL_SECONDS", "30"))
+# 内存报告目录，每个任务一个子目录
+MEMORY_REPORT_DIR = os.path.join(LOG_DIR, "memory")
+
+# --- Event Loop Watchdog ---
+# 开启后检测事件循环阻塞：记录循环延迟，阻塞超过阈值时输出阻塞处的调用栈
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "false").lower() == "true"
+# 判定为阻塞的阈值 (毫秒)
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100"))
+
 # --- API URL Patterns ---
 API_URL_PATTERN = "h5api.m.goofish.com/h5/mtop.taobao.idlemtopsearch.pc.search"
 DETAIL_API_URL_PATTERN = "h5api.m.goofish.com/h5/mtop.taobao.idle.pc.detail"
@@ -25,24 +77,98 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 BASE_URL = os.getenv("OPENAI_BASE_URL")
 MODEL_NAME = os.getenv("OPENAI_MODEL_NAME")
 PROXY_URL = os.getenv("PROXY_URL")
-NTFY_TOPIC_URL = os.getenv("NTFY_TOPIC_URL")
-GOTIFY_URL = os.getenv("GOTIFY_URL")
-GOTIFY_TOKEN = os.getenv("GOTIFY_TOKEN")
-BARK_URL = os.getenv("BARK_URL")
-WX_BOT_URL = os.getenv("WX_BOT_URL")
-WEBHOOK_URL = os.getenv("WEBHOOK_URL")
-WEBHOOK_METHOD = os.getenv("WEBHOOK_METHOD", "POST").upper()
-WEBHOOK_HEADERS = os.getenv("WEBHOOK_HEADERS")
-WEBHOOK_CONTENT_TYPE = os.getenv("WEBHOOK_CONTENT_TYPE", "JSON").upper()
-WEBHOOK_QUERY_PARAMETERS = os.getenv("WEBHOOK_QUERY_PARAMETERS")
-WEBHOOK_BODY = os.getenv("WEBHOOK_BODY")
-PCURL_TO_MOBILE = os.getenv("PCURL_TO_MOBILE", "false").lower() == "true"
+# 通知渠道配置，可在Web界面中修改，修改后由 reload_notification_config() 重新读取
+NOTIFICATION_ENV_KEYS = (
+    "NTFY_TOPIC_URL", "GOTIFY_URL", "GOTIFY_TOKEN", "BARK_URL", "WX_BOT_URL", "WEBHOOK_URL", "WEBHOOK_METHOD",
+    "WEBHOOK_HEADERS", "WEBHOOK_CONTENT_TYPE", "WEBHOOK_QUERY_PARAMETERS", "WEBHOOK_BODY", "PCURL_TO_MOBILE",
+)
+
+
+def _load_notification_config():
+    global NTFY_TOPIC_URL, GOTIFY_URL, GOTIFY_TOKEN, BARK_URL, WX_BOT_URL, WEBHOOK_URL, WEBHOOK_METHOD
+    global WEBHOOK_HEADERS, WEBHOOK_CONTENT_TYPE, WEBHOOK_QUERY_PARAMETERS, WEBHOOK_BODY, PCURL_TO_MOBILE
+    NTFY_TOPIC_URL = os.getenv("NTFY_TOPIC_URL")
+    GOTIFY_URL = os.getenv("GOTIFY_URL")
+    GOTIFY_TOKEN = os.getenv("GOTIFY_TOKEN")
+    BARK_URL = os.getenv("BARK_URL")
+    WX_BOT_URL = os.getenv("WX_BOT_URL")
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_METHOD = os.getenv("WEBHOOK_METHOD", "POST").upper()
+    WEBHOOK_HEADERS = os.getenv("WEBHOOK_HEADERS")
+    WEBHOOK_CONTENT_TYPE = os.getenv("WEBHOOK_CONTENT_TYPE", "JSON").upper()
+    WEBHOOK_QUERY_PARAMETERS = os.getenv("WEBHOOK_QUERY_PARAMETERS")
+    WEBHOOK_BODY = os.getenv("WEBHOOK_BODY")
+    PCURL_TO_MOBILE = os.getenv("PCURL_TO_MOBILE", "false").lower() == "true"
+
+
+def reload_notification_config(env_file: str = ".env"):
+    """从 .env 重新读取通知渠道配置，使当前进程改用Web界面中保存的新设置。"""
+    values = dotenv_values(env_file)
+    for key in NOTIFICATION_ENV_KEYS:
+        if key in values:
+            os.environ[key] = values[key] or ""
+    _load_notification_config()
+
+
+_load_notification_config()
+# 各通知渠道每分钟最多发送的消息数，如 "wecom=20,ntfy=60"；未配置的渠道默认60条/分钟
+NOTIFY_RATE_LIMITS = os.getenv("NOTIFY_RATE_LIMITS", "wecom=20")
+# 启用汇总模式的渠道及其汇总窗口 (分钟)，如 "wecom=10,bark=5"；任务中的 digest_window_minutes 优先
+NOTIFY_DIGEST_CHANNELS = os.getenv("NOTIFY_DIGEST_CHANNELS", "")
+# 汇总消息最多包含的商品数，达到后不等窗口结束立即发送
+NOTIFY_DIGEST_MAX_ITEMS = int(os.getenv("NOTIFY_DIGEST_MAX_ITEMS", "10"))
+# 紧急商品的得分阈值 (0~1)，达到后跳过汇总窗口立即通知；留空表示不启用
+NOTIFY_URGENT_SCORE = float(os.getenv("NOTIFY_URGENT_SCORE")) if os.getenv("NOTIFY_URGENT_SCORE") else None
 RUN_HEADLESS = os.getenv("RUN_HEADLESS", "true").lower() != "false"
 LOGIN_IS_EDGE = os.getenv("LOGIN_IS_EDGE", "false").lower() == "true"
 RUNNING_IN_DOCKER = os.getenv("RUNNING_IN_DOCKER", "false").lower() == "true"
 AI_DEBUG_MODE = os.getenv("AI_DEBUG_MODE", "false").lower() == "true"
 SKIP_AI_ANALYSIS = os.getenv("SKIP_AI_ANALYSIS", "false").lower() == "true"
 ENABLE_THINKING = os.getenv("ENABLE_THINKING", "false").lower() == "true"
+# 图片传给AI的方式: base64 (下载后上传) 或 url (直接传CDN链接，由服务商拉取，不支持时自动回退)
+AI_IMAGE_INPUT_MODE = os.getenv("AI_IMAGE_INPUT_MODE", "base64").lower()
+
+# --- Image Pipeline ---
+# 开启后图片下载到内存并直接编码进AI请求，不再经过临时文件
+IMAGE_IN_MEMORY = os.getenv("IMAGE_IN_MEMORY", "false").lower() == "true"
+# 单个商品在内存中保留的图片总字节上限 (MB)，超出部分落盘保存
+IMAGE_MEMORY_LIMIT_MB = float(os.getenv("IMAGE_MEMORY_LIMIT_MB", "20"))
+# 图片最长边的缩放上限 (像素)，0 表示不缩放
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "0"))
+# 开启后对已分析图片建立感知哈希索引，图片近似重复的商品可复用结论或标记为盗图
+IMAGE_HASH_DEDUP = os.getenv("IMAGE_HASH_DEDUP", "false").lower() == "true"
+# 判定两张图片近似重复的最大汉明距离 (64位 dHash)
+IMAGE_HASH_MAX_DISTANCE = int(os.getenv("IMAGE_HASH_MAX_DISTANCE", "6"))
+# 当前商品中至少有该比例的图片与同一历史商品匹配时，才视为重复商品
+IMAGE_HASH_MIN_MATCH_RATIO = float(os.getenv("IMAGE_HASH_MIN_MATCH_RATIO", "0.5"))
+
+# --- Price History ---
+# 开启后记录每页搜索结果中所有商品的价格和想要人数
+PRICE_HISTORY = os.getenv("PRICE_HISTORY", "true").lower() == "true"
+# 爬虫进程批量写入价格观测记录的间隔 (秒)
+PRICE_HISTORY_FLUSH_SECONDS = float(os.getenv("PRICE_HISTORY_FLUSH_SECONDS", "30"))
+
+# --- Price Model ---
+# 每个关键词保留的最近价格样本数，用于计算价格中位数和 MAD
+PRICE_MODEL_WINDOW = int(os.getenv("PRICE_MODEL_WINDOW", "500"))
+# 样本数少于该值时不打分
+PRICE_MODEL_MIN_SAMPLES = int(os.getenv("PRICE_MODEL_MIN_SAMPLES", "20"))
+# 价格 z 分数达到该值的商品标记为低价异常
+PRICE_ANOMALY_Z = float(os.getenv("PRICE_ANOMALY_Z", "2.0"))
+# 开启后价格评分随商品信息一起发给AI
+PRICE_SCORE_IN_PROMPT = os.getenv("PRICE_SCORE_IN_PROMPT", "false").lower() == "true"
+
+# --- AI Prescreen ---
+# 开启后在调用AI前用本地预筛模型 (train_prescreen.py 训练) 打分，跳过把握很大的不推荐商品
+PRESCREEN = os.getenv("PRESCREEN", "false").lower() == "true"
+# 跳过AI的推荐概率阈值，留空时使用训练时在验证集上选出的阈值
+PRESCREEN_SKIP_THRESHOLD = float(os.getenv("PRESCREEN_SKIP_THRESHOLD")) if os.getenv("PRESCREEN_SKIP_THRESHOLD") else None
+
+# --- Item Change Tracking ---
+# 开启后，已处理过的商品在搜索结果中降价或改标题时会重新分析
+ITEM_REANALYZE_ON_CHANGE = os.getenv("ITEM_REANALYZE_ON_CHANGE", "true").lower() == "true"
+# 相对上次分析时的价格至少下降该百分比，才视为需要重新分析的降价
+ITEM_REANALYZE_PRICE_DROP_PERCENT = float(os.getenv("ITEM_REANALYZE_PRICE_DROP_PERCENT", "5"))
 
 # --- Headers ---
 IMAGE_DOWNLOAD_HEADERS = {
@@ -57,27 +183,51 @@ IMAGE_DOWNLOAD_HEADERS = {
 # 检查配置是否齐全
 if not all([BASE_URL, MODEL_NAME]):
     print("警告：未在 .env 文件中完整设置 OPENAI_BASE_URL 和 OPENAI_MODEL_NAME。AI相关功能可能无法使用。")
-    client = None
-else:
+
+
+def apply_proxy_env():
+    """把 PROXY_URL 写入 HTTP_PROXY/HTTPS_PROXY，httpx (openai 客户端) 和 requests 都会从环境变量中读取代理设置。"""
+    if PROXY_URL:
+        print(f"正在为AI请求使用HTTP/S代理: {PROXY_URL}")
+        os.environ['HTTP_PROXY'] = PROXY_URL
+        os.environ['HTTPS_PROXY'] = PROXY_URL
+
+
+# 代理在导入时设置，之后创建的所有 HTTP 客户端都会使用；只有 openai 的导入和客户端创建推迟到首次使用
+apply_proxy_env()
+
+_client = None
+_client_initialized = False
+
+
+def get_client():
+    """
+    返回共享的 AsyncOpenAI 客户端，首次调用时才导入 openai 并创建（openai 的导入约占进程启动时间的一半）。
+    配置不完整或创建失败时返回 None，由调用方决定跳过AI分析或报错。
+    """
+    global _client, _client_initialized
+    if _client_initialized:
+        return _client
+    _client_initialized = True
+    if not all([BASE_URL, MODEL_NAME]):
+        return None
     try:
-        if PROXY_URL:
-            print(f"正在为AI请求使用HTTP/S代理: {PROXY_URL}")
-            # httpx 会自动从环境变量中读取代理设置
-            os.environ['HTTP_PROXY'] = PROXY_URL
-            os.environ['HTTPS_PROXY'] = PROXY_URL
+        from openai import AsyncOpenAI
 
         # openai 客户端内部的 httpx 会自动从环境变量中获取代理配置
-        client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL)
+        _client = AsyncOpenAI(api_key=API_KEY, base_url=BASE_URL)
     except Exception as e:
         print(f"初始化 OpenAI 客户端时出错: {e}")
-        client = None
-
-# 检查AI客户端是否成功初始化
-if not client:
-    # 在 prompt_generator.py 中，如果 client 为 None，会直接报错退出
-    # 在 spider_v2.py 中，AI分析会跳过
-    # 为了保持一致性，这里只打印警告，具体逻辑由调用方处理
-    pass
+        _client = None
+    return _client
+
+
+def __getattr__(name):
+    # 兼容旧的 `from src.config import client` 写法，访问时才创建客户端
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # 检查关键配置
 if not all([BASE_URL, MODEL_NAME]) and 'prompt_generator.py' in sys.argv[0]:
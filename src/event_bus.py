@@ -0,0 +1,102 @@
+import re
+import time
+
+from src.sse import BoundedSubscriber, format_sse
+
+# 每个订阅者最多缓存的事件数，超过后丢弃积压事件并要求客户端重新同步
+SUBSCRIBER_QUEUE_SIZE = 256
+
+_PAGE_PATTERN = re.compile(r"正在处理第 (\d+)/(\d+) 页")
+_PROCESSED_PATTERN = re.compile(r"累计处理 (\d+) 个新商品")
+_RECOMMENDED_MARKER = "商品被AI推荐"
+
+
+class EventSubscriber(BoundedSubscriber):
+    """事件总线的订阅者；消费过慢时积压事件被丢弃，并收到一个 resync 事件。"""
+
+    queue_size = SUBSCRIBER_QUEUE_SIZE
+
+
+class EventBus:
+    """进程内事件总线，将任务生命周期事件广播给所有连接的仪表盘。"""
+
+    def __init__(self):
+        self.subscribers = set()
+        self._seq = 0
+
+    def subscribe(self) -> EventSubscriber:
+        subscriber = EventSubscriber()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: EventSubscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, event_type: str, data: dict):
+        self._seq += 1
+        event = {"type": event_type, "seq": self._seq, "ts": time.time(), "data": data}
+        for subscriber in list(self.subscribers):
+            subscriber.push(event)
+
+
+class TaskProgressParser:
+    """从爬虫的输出中解析任务进度（当前页、已处理新商品数、推荐数）。"""
+
+    def __init__(self):
+        self.page = 0
+        self.max_pages = 0
+        self.processed = 0
+        self.recommended = 0
+
+    def feed(self, line: str) -> dict | None:
+        """解析一行输出，进度发生变化时返回最新进度，否则返回 None。"""
+        match = _PAGE_PATTERN.search(line)
+        if match:
+            self.page, self.max_pages = int(match.group(1)), int(match.group(2))
+            return self.snapshot()
+        match = _PROCESSED_PATTERN.search(line)
+        if match:
+            self.processed = int(match.group(1))
+            return self.snapshot()
+        if _RECOMMENDED_MARKER in line:
+            self.recommended += 1
+            return self.snapshot()
+        return None
+
+    def snapshot(self) -> dict:
+        return {
+            "page": self.page,
+            "max_pages": self.max_pages,
+            "processed": self.processed,
+            "recommended": self.recommended,
+        }
+
+
+async def stream_events(bus: EventBus, snapshot_factory, heartbeat: float = 15.0):
+    """
+    以 SSE 格式输出事件流：先推送一次完整快照 (snapshot 事件)，之后推送增量事件。
+    客户端消费过慢触发 resync 时重新推送快照。
+    """
+    subscriber = bus.subscribe()
+    try:
+        yield format_sse("snapshot", await snapshot_factory())
+        while True:
+            event = await subscriber.get(timeout=heartbeat)
+            if event is None:
+                yield ": keep-alive\n\n"
+            elif event["type"] == "resync":
+                yield format_sse("snapshot", await snapshot_factory())
+            else:
+                yield format_sse(event["type"], event["data"], event["seq"])
+    finally:
+        bus.unsubscribe(subscriber)
+
+
+_bus = None
+
+
+def get_event_bus() -> EventBus:
+    global _bus
+    if _bus is None:
+        _bus = EventBus()
+    return _bus
@@ -0,0 +1,326 @@
+import asyncio
+import io
+import json
+import os
+from itertools import combinations
+
+import numpy as np
+
+from src.config import (
+    IMAGE_HASH_INDEX_FILE,
+    IMAGE_HASH_MAX_DISTANCE,
+    IMAGE_HASH_MIN_MATCH_RATIO,
+)
+
+# 64位哈希被切分为4个16位分段，用于多重索引哈希 (multi-index hashing) 的候选检索
+_BAND_COUNT = 4
+_BAND_BITS = 16
+_BAND_MASK = np.uint64((1 << _BAND_BITS) - 1)
+# 未建立分段索引的新增哈希超过该数量时，重建分段索引
+_REBUILD_THRESHOLD = 4096
+# 每个分段允许的最大探测半径（即最大距离 7），超过时探测量过大，退化为全量扫描
+_MAX_PROBE_RADIUS = 1
+
+
+def compute_dhash(image, hash_size: int = 8) -> int:
+    """
+    计算图片的差异哈希 (dHash)，返回一个64位整数。
+    image 可以是图片字节或本地文件路径。
+    """
+    from PIL import Image
+
+    source = io.BytesIO(image) if isinstance(image, (bytes, bytearray)) else image
+    with Image.open(source) as img:
+        gray = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+        pixels = np.asarray(gray, dtype=np.int16)
+    diff = pixels[:, 1:] > pixels[:, :-1]
+    value = 0
+    for bit in diff.flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _popcount64(values: np.ndarray) -> np.ndarray:
+    """计算 uint64 数组中每个元素的置位数。"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    as_bytes = values.view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+def _neighbours16(value: int, radius: int) -> np.ndarray:
+    """返回与一个16位分段值汉明距离不超过 radius 的所有值。"""
+    result = [value]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(_BAND_BITS), r):
+            flipped = value
+            for bit in bits:
+                flipped ^= 1 << bit
+            result.append(flipped)
+    return np.array(result, dtype=np.uint64)
+
+
+class ImageHashIndex:
+    """
+    已分析图片的感知哈希索引。
+    哈希以紧凑的 uint64 数组保存，每个哈希指向其所属商品；商品的AI结论单独保存，
+    以便在图片近似重复时直接复用结论或标记盗图。
+    """
+
+    def __init__(self, filepath: str = IMAGE_HASH_INDEX_FILE):
+        self.filepath = filepath
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._owners = np.zeros(1024, dtype=np.int32)
+        self._size = 0
+        self._item_ids = []
+        self._item_positions = {}
+        self._verdicts = {}
+        self._indexed_count = 0
+        self._band_keys = []
+        self._band_order = []
+        self._dirty = False
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def dirty(self) -> bool:
+        return self._dirty
+
+    def _item_position(self, item_id: str) -> int:
+        position = self._item_positions.get(item_id)
+        if position is None:
+            position = len(self._item_ids)
+            self._item_ids.append(item_id)
+            self._item_positions[item_id] = position
+        return position
+
+    def _ensure_capacity(self, extra: int):
+        required = self._size + extra
+        if required <= len(self._hashes):
+            return
+        capacity = max(required, len(self._hashes) * 2)
+        hashes = np.zeros(capacity, dtype=np.uint64)
+        owners = np.zeros(capacity, dtype=np.int32)
+        hashes[:self._size] = self._hashes[:self._size]
+        owners[:self._size] = self._owners[:self._size]
+        self._hashes, self._owners = hashes, owners
+
+    def _rebuild_bands(self):
+        hashes = self._hashes[:self._size]
+        self._band_keys, self._band_order = [], []
+        for band in range(_BAND_COUNT):
+            segment = (hashes >> np.uint64(band * _BAND_BITS)) & _BAND_MASK
+            order = np.argsort(segment, kind="stable")
+            self._band_keys.append(segment[order])
+            self._band_order.append(order)
+        self._indexed_count = self._size
+
+    def add(self, item_id: str, hashes: list, verdict: dict | None = None):
+        """登记一个商品的图片哈希及其AI结论。"""
+        item_id = str(item_id)
+        if verdict is not None:
+            self._verdicts[item_id] = verdict
+        if not hashes:
+            return
+        position = self._item_position(item_id)
+        self._ensure_capacity(len(hashes))
+        end = self._size + len(hashes)
+        self._hashes[self._size:end] = np.array(hashes, dtype=np.uint64)
+        self._owners[self._size:end] = position
+        self._size = end
+        self._dirty = True
+        if self._size - self._indexed_count > _REBUILD_THRESHOLD:
+            self._rebuild_bands()
+
+    def _candidates(self, value: int, max_distance: int) -> np.ndarray | None:
+        """利用分段索引取出可能在 max_distance 内的哈希位置；无法使用索引时返回 None。"""
+        radius = max_distance // _BAND_COUNT
+        if self._indexed_count == 0 or radius > _MAX_PROBE_RADIUS:
+            return None
+        parts = []
+        for band in range(_BAND_COUNT):
+            segment = (value >> (band * _BAND_BITS)) & ((1 << _BAND_BITS) - 1)
+            probes = _neighbours16(segment, radius)
+            keys = self._band_keys[band]
+            left = np.searchsorted(keys, probes, side="left")
+            right = np.searchsorted(keys, probes, side="right")
+            order = self._band_order[band]
+            parts.extend(order[lo:hi] for lo, hi in zip(left, right) if hi > lo)
+        if self._size > self._indexed_count:
+            parts.append(np.arange(self._indexed_count, self._size))
+        if not parts:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def find(self, value: int, max_distance: int = 6) -> list:
+        """查找与给定哈希汉明距离不超过 max_distance 的记录，返回 [(商品ID, 距离), ...]。"""
+        if self._size == 0:
+            return []
+        query = np.uint64(value)
+        positions = self._candidates(value, max_distance)
+        if positions is None:
+            distances = _popcount64(self._hashes[:self._size] ^ query)
+            positions = np.flatnonzero(distances <= max_distance)
+            distances = distances[positions]
+        else:
+            distances = _popcount64(self._hashes[positions] ^ query)
+            keep = distances <= max_distance
+            positions, distances = positions[keep], distances[keep]
+        return [(self._item_ids[self._owners[p]], int(d)) for p, d in zip(positions, distances)]
+
+    def find_similar_item(self, hashes: list, max_distance: int = 6, exclude_item_id: str | None = None):
+        """
+        找出与一组图片哈希匹配最多的历史商品。
+        返回 (商品ID, 匹配图片数, 该商品的AI结论) 或 None。
+        """
+        matches = {}
+        for value in hashes:
+            matched_items = {item_id for item_id, _ in self.find(value, max_distance)}
+            for item_id in matched_items:
+                if item_id != exclude_item_id:
+                    matches[item_id] = matches.get(item_id, 0) + 1
+        if not matches:
+            return None
+        best_item = max(matches, key=matches.get)
+        return best_item, matches[best_item], self._verdicts.get(best_item)
+
+    def load(self) -> bool:
+        """从磁盘加载索引，文件不存在时返回 False。"""
+        if not os.path.exists(self.filepath):
+            return False
+        try:
+            with np.load(self.filepath, allow_pickle=False) as data:
+                hashes = data["hashes"]
+                owners = data["owners"]
+                meta = json.loads(str(data["meta"]))
+        except Exception as e:
+            print(f"   [图片哈希] 加载索引文件 {self.filepath} 失败: {e}")
+            return False
+
+        self._hashes = np.array(hashes, dtype=np.uint64)
+        self._owners = np.array(owners, dtype=np.int32)
+        self._size = len(hashes)
+        self._item_ids = meta.get("items", [])
+        self._item_positions = {item_id: i for i, item_id in enumerate(self._item_ids)}
+        self._verdicts = meta.get("verdicts", {})
+        self._rebuild_bands()
+        self._dirty = False
+        return True
+
+    def save(self) -> bool:
+        """以先写临时文件再替换的方式保存索引。"""
+        try:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            meta = json.dumps({"items": self._item_ids, "verdicts": self._verdicts}, ensure_ascii=False)
+            tmp_path = f"{self.filepath}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    hashes=self._hashes[:self._size],
+                    owners=self._owners[:self._size],
+                    meta=np.array(meta),
+                )
+            os.replace(tmp_path, self.filepath)
+            self._dirty = False
+            return True
+        except Exception as e:
+            print(f"   [图片哈希] 保存索引文件 {self.filepath} 失败: {e}")
+            return False
+
+
+_index = None
+
+
+def get_image_hash_index() -> ImageHashIndex:
+    """返回进程内共享的图片哈希索引，首次调用时从磁盘加载。"""
+    global _index
+    if _index is None:
+        _index = ImageHashIndex()
+        if _index.load():
+            print(f"LOG: 已加载图片哈希索引，共 {len(_index)} 个哈希。")
+    return _index
+
+
+async def compute_image_hashes(images: list) -> list:
+    """在线程池中计算一组图片（字节或路径）的 dHash，无法解码的图片会被跳过。"""
+    loop = asyncio.get_running_loop()
+    hashes = []
+    for image in images:
+        try:
+            hashes.append(await loop.run_in_executor(None, compute_dhash, image))
+        except Exception as e:
+            print(f"   [图片哈希] 计算图片哈希失败，已跳过: {e}")
+    return hashes
+
+
+def match_previous_verdict(image_hashes: list, item_id: str, seller_id: str) -> dict | None:
+    """
+    将商品图片与历史索引比对。
+    - 与其他卖家的商品图片重复：直接标记为疑似盗图，不推荐；
+    - 与同一卖家的历史商品重复（重新上架）：复用该商品的AI结论；
+    其余情况返回 None，由AI正常分析。
+    """
+    if not image_hashes:
+        return None
+    match = get_image_hash_index().find_similar_item(
+        image_hashes, IMAGE_HASH_MAX_DISTANCE, exclude_item_id=str(item_id)
+    )
+    if not match:
+        return None
+
+    matched_item_id, matched_count, verdict = match
+    if matched_count / len(image_hashes) < IMAGE_HASH_MIN_MATCH_RATIO or not verdict:
+        return None
+
+    match_info = {
+        "matched_item_id": matched_item_id,
+        "matched_images": matched_count,
+        "total_images": len(image_hashes),
+    }
+    previous_seller = verdict.get("seller_id")
+    if previous_seller and seller_id and previous_seller != seller_id:
+        return {
+            "is_recommended": False,
+            "reason": f"商品图片与卖家 {previous_seller} 的商品 #{matched_item_id} 高度相似，疑似盗用图片。",
+            "risk_tags": ["疑似盗图"],
+            "image_hash_match": match_info,
+        }
+    if "is_recommended" in verdict:
+        return {
+            "is_recommended": verdict["is_recommended"],
+            "reason": verdict.get("reason", ""),
+            "risk_tags": ["图片重复，复用历史结论"],
+            "reused_from_item_id": matched_item_id,
+            "image_hash_match": match_info,
+        }
+    return None
+
+
+_SAVE_EVERY = 20
+_unsaved_items = 0
+
+
+async def record_image_hashes(image_hashes: list, item_id: str, seller_id: str, ai_analysis: dict | None):
+    """将商品图片哈希和AI结论写入索引，每累计一定数量的商品落盘一次。"""
+    global _unsaved_items
+    verdict = None
+    if ai_analysis and "is_recommended" in ai_analysis:
+        verdict = {
+            "is_recommended": ai_analysis.get("is_recommended"),
+            "reason": ai_analysis.get("reason", ""),
+            "seller_id": seller_id,
+        }
+    get_image_hash_index().add(str(item_id), image_hashes, verdict)
+    _unsaved_items += 1
+    if _unsaved_items >= _SAVE_EVERY:
+        await save_image_hash_index()
+
+
+async def save_image_hash_index():
+    """如有未保存的变更，在线程池中将索引落盘。"""
+    global _unsaved_items
+    if _index is None or not _index.dirty:
+        return
+    _unsaved_items = 0
+    await asyncio.get_running_loop().run_in_executor(None, _index.save)
@@ -0,0 +1,118 @@
+import json
+import os
+
+from src.config import ITEM_REANALYZE_ON_CHANGE, ITEM_REANALYZE_PRICE_DROP_PERCENT
+from src.utils import get_link_unique_key, parse_price
+
+
+def item_fingerprint(item_data: dict) -> tuple:
+    """商品在搜索结果中的紧凑指纹：(价格, 标题, 想要人数)，均取自搜索接口的响应，无需额外请求。"""
+    return (
+        parse_price(item_data.get('当前售价')),
+        str(item_data.get('商品标题', '')),
+        str(item_data.get('“想要”人数', '')),
+    )
+
+
+def material_change(previous: tuple, current: tuple,
+                    price_drop_percent: float = ITEM_REANALYZE_PRICE_DROP_PERCENT) -> str | None:
+    """
+    判断指纹变化是否值得重新分析，返回变动说明；不需要时返回 None。
+    只有降价幅度达到阈值或标题被修改才算，涨价和想要人数的变化不触发重新分析。
+    """
+    old_price, old_title, _ = previous
+    new_price, new_title, _ = current
+    if old_price and new_price is not None and new_price <= old_price * (1 - price_drop_percent / 100):
+        return f"降价 ¥{old_price:g} -> ¥{new_price:g} ({(1 - new_price / old_price) * 100:.0f}%)"
+    if old_title and new_title and new_title != old_title:
+        return "标题已修改"
+    return None
+
+
+class ItemTracker:
+    """
+    记录结果文件中已处理商品的指纹。
+    指纹取自各商品最近一次保存的记录，因此重新分析后追加的记录会成为新的比较基准；
+    内存中只保存指纹和该记录在文件中的字节偏移，重新分析时只读取那一行，复用其中的卖家信息和图片列表。
+    """
+
+    def __init__(self, filepath: str, enabled: bool = ITEM_REANALYZE_ON_CHANGE,
+                 price_drop_percent: float = ITEM_REANALYZE_PRICE_DROP_PERCENT):
+        self.filepath = filepath
+        self.enabled = enabled
+        self.price_drop_percent = price_drop_percent
+        self._fingerprints = {}
+        self._offsets = {}
+
+    def __contains__(self, unique_key: str) -> bool:
+        return unique_key in self._fingerprints
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def _records(self):
+        """逐行读取结果文件，返回 (行首字节偏移, 记录)。"""
+        offset = 0
+        with open(self.filepath, 'rb') as f:
+            for line in f:
+                start, offset = offset, offset + len(line)
+                try:
+                    yield start, json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    print("   [警告] 文件中有一行无法解析为JSON，已跳过。")
+
+    def load(self):
+        if not os.path.exists(self.filepath):
+            print(f"LOG: 输出文件 {self.filepath} 不存在，将创建新文件。")
+            return
+        print(f"LOG: 发现已存在文件 {self.filepath}，正在加载历史记录以去重...")
+        try:
+            for offset, record in self._records():
+                item = record.get('商品信息', {})
+                link = item.get('商品链接', '')
+                if link:
+                    self.record(get_link_unique_key(link), item, offset)
+            print(f"LOG: 加载完成，已记录 {len(self)} 个已处理过的商品。")
+        except IOError as e:
+            print(f"   [警告] 读取历史文件时发生错误: {e}")
+
+    def end_offset(self) -> int:
+        """结果文件当前的末尾位置，即下一条追加记录的字节偏移。"""
+        try:
+            return os.path.getsize(self.filepath)
+        except OSError:
+            return 0
+
+    def record(self, unique_key: str, item_data: dict, offset: int | None = None):
+        """记录商品的指纹；offset 为该商品最新一条记录的字节偏移，未知时 (如写入失败) 保留原来的偏移。"""
+        self._fingerprints[unique_key] = item_fingerprint(item_data)
+        if offset is not None:
+            self._offsets[unique_key] = offset
+
+    def change(self, unique_key: str, item_data: dict) -> dict | None:
+        """已处理商品的指纹发生需要重新分析的变化时，返回变动信息 (写入结果记录)；否则返回 None。"""
+        previous = self._fingerprints.get(unique_key)
+        if not self.enabled or previous is None:
+            return None
+        reason = material_change(previous, item_fingerprint(item_data), self.price_drop_percent)
+        if reason is None:
+            return None
+        return {"变动说明": reason, "上次售价": previous[0], "上次标题": previous[1], "上次想要人数": previous[2]}
+
+    def previous_record(self, unique_key: str) -> dict | None:
+        """按加载时记下的字节偏移，从结果文件中只读取该商品最近一次保存的那一行完整记录。"""
+        offset = self._offsets.get(unique_key)
+        if offset is None:
+            return None
+        try:
+            with open(self.filepath, 'rb') as f:
+                f.seek(offset)
+                record = json.loads(f.readline())
+        except (IOError, json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"   [警告] 读取历史记录时发生错误: {e}")
+            return None
+        # 文件在运行期间被外部修改时，偏移处可能已是其他商品的记录
+        link = record.get('商品信息', {}).get('商品链接', '')
+        if not link or get_link_unique_key(link) != unique_key:
+            return None
+        return record
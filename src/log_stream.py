@@ -0,0 +1,154 @@
+import asyncio
+import codecs
+import os
+
+from src.sse import BoundedSubscriber, format_sse
+
+# 每次从日志文件读取的最大字节数，单个推送块不会超过该大小
+READ_CHUNK_BYTES = 64 * 1024
+# 每个订阅者最多缓存的推送块数，超过后丢弃积压内容并要求客户端重新同步
+SUBSCRIBER_QUEUE_SIZE = 64
+
+
+def read_tail(path: str, tail_bytes: int) -> tuple[str, int]:
+    """
+    读取文件末尾不超过 tail_bytes 字节的内容，从完整的一行开始。
+    返回 (内容, 文件当前大小)。
+    """
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        return "", 0
+    start = max(0, size - tail_bytes)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(size - start)
+    if start > 0:
+        newline = data.find(b'\n')
+        data = data[newline + 1:] if newline != -1 else b''
+    return data.decode('utf-8', errors='replace'), size
+
+
+class LogSubscriber(BoundedSubscriber):
+    """一个日志流订阅者；消费过慢时积压内容会被丢弃并收到 resync 事件。"""
+
+    queue_size = SUBSCRIBER_QUEUE_SIZE
+
+
+class LogTailer:
+    """
+    日志文件的共享跟踪读取器。
+    无论有多少订阅者，同一文件只有一个后台协程通过 stat 轮询读取新增内容并解码一次，
+    再分发给所有订阅者；没有订阅者时自动停止。文件被截断或替换时向订阅者推送 reset 事件。
+    """
+
+    def __init__(self, path: str, poll_interval: float = 0.5):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self._position = 0
+        self._inode = None
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._task = None
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_size, st.st_ino
+        except FileNotFoundError:
+            return 0, None
+
+    def _read_from(self, position: int, size: int) -> bytes:
+        with open(self.path, 'rb') as f:
+            f.seek(position)
+            return f.read(min(size - position, READ_CHUNK_BYTES))
+
+    def _broadcast(self, event: dict):
+        for subscriber in list(self.subscribers):
+            subscriber.push(event)
+
+    async def _poll_once(self):
+        loop = asyncio.get_running_loop()
+        size, inode = self._stat()
+        if inode != self._inode or size < self._position:
+            # 文件被清空、轮转或重新创建，从头开始
+            self._inode = inode
+            self._position = 0
+            self._decoder.reset()
+            self._broadcast({"type": "reset", "pos": 0})
+        while size > self._position:
+            data = await loop.run_in_executor(None, self._read_from, self._position, size)
+            if not data:
+                break
+            start = self._position
+            self._position += len(data)
+            text = self._decoder.decode(data)
+            if text:
+                self._broadcast({"type": "chunk", "content": text, "start": start, "pos": self._position})
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    await self._poll_once()
+                except Exception as e:
+                    print(f"读取日志文件 {self.path} 时出错: {e}")
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self._task = None
+
+    def subscribe(self) -> LogSubscriber:
+        """新增订阅者；首个订阅者会启动后台读取协程，从文件当前末尾开始跟踪。"""
+        subscriber = LogSubscriber()
+        if self._task is None:
+            self._position, self._inode = self._stat()
+            self._decoder.reset()
+            self._task = asyncio.create_task(self._run())
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: LogSubscriber):
+        self.subscribers.discard(subscriber)
+
+
+async def stream_log_events(path: str, tail_bytes: int, heartbeat: float = 15.0):
+    """
+    以 SSE 格式输出日志流：先推送文件末尾 tail_bytes 字节的快照，再持续推送新增内容。
+    客户端消费过慢触发 resync 时，重新推送一次快照。
+    """
+    loop = asyncio.get_running_loop()
+    tailer = get_log_tailer(path)
+    subscriber = tailer.subscribe()
+    try:
+        snapshot, snapshot_end = await loop.run_in_executor(None, read_tail, path, tail_bytes)
+        yield format_sse("reset", {"content": snapshot, "pos": snapshot_end})
+        while True:
+            event = await subscriber.get(timeout=heartbeat)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            if event["type"] == "chunk":
+                if event["pos"] <= snapshot_end:
+                    continue
+                content = event["content"]
+                if event["start"] < snapshot_end:
+                    # 与快照重叠的部分只推送快照之后的内容
+                    content = content.encode('utf-8')[snapshot_end - event["start"]:].decode('utf-8', errors='replace')
+                snapshot_end = 0
+                yield format_sse("chunk", {"content": content, "pos": event["pos"]})
+            elif event["type"] in ("reset", "resync"):
+                snapshot, snapshot_end = await loop.run_in_executor(None, read_tail, path, tail_bytes)
+                yield format_sse("reset", {"content": snapshot, "pos": snapshot_end})
+    finally:
+        tailer.unsubscribe(subscriber)
+
+
+_tailers = {}
+
+
+def get_log_tailer(path: str) -> LogTailer:
+    """返回指定日志文件的共享读取器。"""
+    tailer = _tailers.get(path)
+    if tailer is None:
+        tailer = _tailers[path] = LogTailer(path)
+    return tailer
@@ -0,0 +1,118 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from src.config import LOOP_BLOCK_THRESHOLD_MS, LOOP_WATCHDOG
+from src.metrics import get_metrics
+
+# 心跳间隔 (秒)：事件循环每隔该时间被唤醒一次，实际唤醒时间与预期的差值即为循环延迟
+HEARTBEAT_INTERVAL = 0.05
+# 输出阻塞栈时保留的最内层栈帧数
+STACK_LINES = 12
+
+
+class LoopWatchdog:
+    """
+    事件循环阻塞检测器。
+    - 心跳协程定期休眠，记录实际唤醒时间比预期晚了多少（循环延迟），写入指标 goofish_loop_lag_seconds；
+    - 看门狗线程发现心跳超过阈值未更新时，立即抓取事件循环线程当前的调用栈，此时栈上正是阻塞循环的同步代码；
+    - 心跳恢复后，若本次延迟超过阈值，则把阻塞时长和抓到的调用栈写入日志，并计入阻塞次数和时长指标。
+    """
+
+    def __init__(self, process: str, threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS,
+                 interval: float = HEARTBEAT_INTERVAL, history_size: int = 50):
+        self.process = process
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.recent = deque(maxlen=history_size)  # 最近的阻塞记录
+        self._tick = 0
+        self._last_tick_at = time.monotonic()
+        self._captured = None  # (心跳序号, 调用栈文本)
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        metrics = get_metrics()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            tick = self._tick
+            self._tick += 1
+            self._last_tick_at = time.monotonic()
+            metrics.observe("goofish_loop_lag_seconds", lag, process=self.process)
+            if lag >= self.threshold:
+                captured = self._captured
+                stack = captured[1] if captured and captured[0] == tick else ""
+                self._report(lag, stack)
+
+    def _report(self, lag: float, stack: str):
+        metrics = get_metrics()
+        metrics.inc("goofish_loop_blocked_total", process=self.process)
+        metrics.observe("goofish_loop_blocked_seconds", lag, process=self.process)
+        self.recent.append({"time": datetime.now().isoformat(), "blocked_ms": round(lag * 1000, 1), "stack": stack})
+        print(f"[事件循环阻塞] {self.process} 进程的事件循环被阻塞 {lag * 1000:.0f} ms (阈值 {self.threshold * 1000:.0f} ms)。")
+        if stack:
+            print(f"阻塞时的调用栈 (最内层 {STACK_LINES} 帧):\n{stack}")
+
+    def _watch(self):
+        # 检查频率取阈值的四分之一，保证在阻塞结束前抓到调用栈
+        check_interval = max(self.threshold / 4, 0.005)
+        while not self._stop_event.wait(check_interval):
+            tick = self._tick
+            if self._captured and self._captured[0] == tick:
+                continue
+            if time.monotonic() - self._last_tick_at < self.interval + self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame)[-STACK_LINES:]).rstrip()
+            self._captured = (tick, stack)
+
+    def start(self):
+        """在事件循环中调用。"""
+        self._loop_thread_id = threading.get_ident()
+        self._last_tick_at = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+_watchdog = None
+
+
+def start_loop_watchdog(process: str) -> LoopWatchdog | None:
+    """LOOP_WATCHDOG 开启时启动当前事件循环的阻塞检测，返回检测器；未开启时返回 None。"""
+    global _watchdog
+    if not LOOP_WATCHDOG:
+        return None
+    if _watchdog is None:
+        _watchdog = LoopWatchdog(process)
+        _watchdog.start()
+        print(f"已开启事件循环阻塞检测，阈值 {_watchdog.threshold * 1000:.0f} ms。")
+    return _watchdog
+
+
+async def stop_loop_watchdog():
+    global _watchdog
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog = None
@@ -0,0 +1,243 @@
+import asyncio
+import contextlib
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+
+from src.config import MEMORY_REPORT_DIR, SPIDER_MEMORY_INTERVAL_SECONDS, SPIDER_MEMORY_PROFILE
+from src.task_logs import task_log_slug
+
+# 每份快照记录的分配位置数
+TOP_ALLOCATIONS = 15
+# 每个任务保留的内存报告数
+MAX_REPORTS_PER_TASK = 20
+_MB = 1024 * 1024
+
+
+def read_rss_bytes(pid: int) -> int | None:
+    """读取进程的常驻内存 (RSS)，只支持 Linux (/proc)；无法读取时返回 None。"""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _parent_pids() -> dict:
+    """返回 {pid: 父进程pid}。"""
+    parents = {}
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return parents
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # 进程名可能包含空格和括号，从最后一个 ')' 之后解析
+        fields = stat[stat.rfind(")") + 2:].split()
+        if len(fields) > 1:
+            parents[int(name)] = int(fields[1])
+    return parents
+
+
+def descendant_pids(pid: int) -> list:
+    """返回进程的所有后代进程（如 Playwright 驱动及其启动的 Chromium 进程）。"""
+    children = {}
+    for child, parent in _parent_pids().items():
+        children.setdefault(parent, []).append(child)
+    result = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        result.append(child)
+        stack.extend(children.get(child, []))
+    return result
+
+
+def process_tree_rss(pid: int) -> dict:
+    """进程自身及其全部子进程的 RSS (字节)；无法读取时各项为 None。"""
+    self_rss = read_rss_bytes(pid)
+    children = descendant_pids(pid) if self_rss is not None else []
+    children_rss = sum(read_rss_bytes(child) or 0 for child in children)
+    return {
+        "rss_bytes": self_rss,
+        "children_rss_bytes": children_rss if self_rss is not None else None,
+        "children": len(children),
+    }
+
+
+def _to_mb(value) -> float | None:
+    return round(value / _MB, 1) if value is not None else None
+
+
+class MemorySampler:
+    """
+    爬虫运行的内存采样器。
+    - 用 tracemalloc 定期拍摄快照，记录占用最多的分配位置，以及相对上一次快照增长最多的位置；
+    - 同时记录本进程与 Chromium 等子进程的 RSS；
+    - stage() 记录每个处理阶段前后的 RSS 与 Python 堆变化，汇总为各阶段的内存增量。
+    """
+
+    def __init__(self, interval: float = SPIDER_MEMORY_INTERVAL_SECONDS, top: int = TOP_ALLOCATIONS):
+        self.interval = interval
+        self.top = top
+        self.snapshots = []
+        self.stages = {}
+        self._previous = None
+        self._task = None
+        self._started_at = None
+        self._started_tracing = False
+
+    def _filtered_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    def take_snapshot(self, label: str = "periodic") -> dict:
+        snapshot = self._filtered_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tree = process_tree_rss(os.getpid())
+        record = {
+            "time": datetime.now().isoformat(),
+            "label": label,
+            "rss_mb": _to_mb(tree["rss_bytes"]),
+            "children_rss_mb": _to_mb(tree["children_rss_bytes"]),
+            "children": tree["children"],
+            "traced_mb": _to_mb(current),
+            "traced_peak_mb": _to_mb(peak),
+            "top_allocations": [
+                {"location": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:self.top]
+            ],
+            "top_growth": [],
+        }
+        if self._previous is not None:
+            record["top_growth"] = [
+                {"location": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(self._previous, "lineno")[:self.top] if stat.size_diff > 0
+            ]
+        self._previous = snapshot
+        self.snapshots.append(record)
+        return record
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            # 拍摄快照需要遍历所有分配记录，放到线程中执行
+            await loop.run_in_executor(None, self.take_snapshot)
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        pid = os.getpid()
+        rss_before = read_rss_bytes(pid) or 0
+        children_before = process_tree_rss(pid)["children_rss_bytes"] or 0
+        traced_before = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            tree = process_tree_rss(pid)
+            rss_delta = (tree["rss_bytes"] or 0) - rss_before
+            children_delta = (tree["children_rss_bytes"] or 0) - children_before
+            traced_delta = tracemalloc.get_traced_memory()[0] - traced_before
+            stats = self.stages.setdefault(name, {"count": 0, "rss_delta_mb": 0.0, "max_rss_delta_mb": 0.0,
+                                                  "children_rss_delta_mb": 0.0, "traced_delta_mb": 0.0})
+            stats["count"] += 1
+            stats["rss_delta_mb"] += rss_delta / _MB
+            stats["max_rss_delta_mb"] = max(stats["max_rss_delta_mb"], rss_delta / _MB)
+            stats["children_rss_delta_mb"] += children_delta / _MB
+            stats["traced_delta_mb"] += traced_delta / _MB
+
+    def start(self):
+        """在事件循环中调用，开始追踪内存分配并定期拍摄快照。"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._started_at = time.time()
+        self.take_snapshot("start")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> dict:
+        """停止采样，拍摄最后一次快照并返回报告。"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.take_snapshot, "end")
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self.report()
+
+    def report(self) -> dict:
+        stages = {name: {key: (round(value, 2) if isinstance(value, float) else value)
+                         for key, value in stats.items()}
+                  for name, stats in self.stages.items()}
+        rss_values = [s["rss_mb"] for s in self.snapshots if s["rss_mb"] is not None]
+        return {
+            "started_at": datetime.fromtimestamp(self._started_at).isoformat() if self._started_at else None,
+            "duration_seconds": round(time.time() - self._started_at, 1) if self._started_at else 0,
+            "interval_seconds": self.interval,
+            "peak_rss_mb": max(rss_values) if rss_values else None,
+            "stages": stages,
+            "snapshots": self.snapshots,
+        }
+
+
+_sampler = None
+
+
+def start_memory_sampler() -> MemorySampler | None:
+    """SPIDER_MEMORY_PROFILE 开启时开始内存采样，返回采样器；未开启时返回 None。"""
+    global _sampler
+    if not SPIDER_MEMORY_PROFILE:
+        return None
+    if _sampler is None:
+        _sampler = MemorySampler()
+        _sampler.start()
+        print(f"已开启内存采样，每 {_sampler.interval:.0f} 秒拍摄一次快照。")
+    return _sampler
+
+
+async def stop_memory_sampler() -> dict | None:
+    """停止内存采样并返回报告；未开启时返回 None。"""
+    global _sampler
+    if _sampler is None:
+        return None
+    report = await _sampler.stop()
+    _sampler = None
+    return report
+
+
+def memory_stage(name: str):
+    """记录一个处理阶段的内存增量；未开启内存采样时不做任何事。"""
+    return _sampler.stage(name) if _sampler is not None else contextlib.nullcontext()
+
+
+def save_memory_report(task_name: str, report: dict, base_dir: str = MEMORY_REPORT_DIR) -> str:
+    """保存内存报告到 <目录>/<任务名>/<id>.json，返回文件路径；每个任务只保留最近的若干份。"""
+    directory = os.path.join(base_dir, task_log_slug(task_name))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"task_name": task_name, **report}, f, ensure_ascii=False, indent=2)
+    for name in sorted(os.listdir(directory), reverse=True)[MAX_REPORTS_PER_TASK:]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return path
@@ -0,0 +1,339 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+# 耗时类直方图的默认分桶 (秒)
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 字节类直方图的分桶
+BYTES_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000)
+# 事件循环延迟的分桶 (秒)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# 所有指标在此集中定义：名称 -> (类型, 说明, 直方图分桶)
+METRIC_DEFINITIONS = {
+    "goofish_pages_fetched_total": ("counter", "搜索结果页获取次数", None),
+    "goofish_items_total": ("counter", "处理的商品数，result 为 new / skipped / changed (降价等变动后重新分析) / prescreen_skipped (本地预筛跳过AI) / recommended", None),
+    "goofish_stage_seconds": ("histogram", "各处理阶段的耗时 (秒)", DEFAULT_BUCKETS),
+    "goofish_ai_requests_total": ("counter", "AI接口调用次数，outcome 为 success (接口返回响应) / error (调用失败)", None),
+    "goofish_ai_tokens_total": ("counter", "AI分析消耗的 token 数，kind 为 prompt / completion", None),
+    "goofish_ai_request_bytes": ("histogram", "AI分析请求体大小 (字节)", BYTES_BUCKETS),
+    "goofish_retries_total": ("counter", "带重试的函数发生重试的次数", None),
+    "goofish_images_total": ("counter", "商品图片处理数，result 为 downloaded / cached / failed", None),
+    "goofish_image_bytes_total": ("counter", "下载的图片字节数", None),
+    "goofish_notifications_total": ("counter", "通知发送结果，outcome 为 sent / failed", None),
+    "goofish_notification_send_seconds": ("histogram", "通知渠道的发送耗时 (秒)", DEFAULT_BUCKETS),
+    "goofish_outbox_messages": ("gauge", "通知发件箱中各状态的消息数", None),
+    "goofish_run_queue_pending": ("gauge", "运行队列中排队的任务数", None),
+    "goofish_run_queue_running": ("gauge", "运行队列中正在运行的任务数", None),
+    "goofish_run_queue_wait_seconds": ("histogram", "任务在运行队列中的排队时间 (秒)", DEFAULT_BUCKETS),
+    "goofish_spiders_running": ("gauge", "正在运行的爬虫进程数", None),
+    "goofish_time_to_first_item_seconds": ("histogram", "任务开始到拿到第一页商品的耗时 (秒)，method 为 api (一次请求应用筛选) / ui (逐个点击筛选项)", DEFAULT_BUCKETS),
+    "goofish_item_fetch_seconds": ("histogram", "单个商品详情和卖家信息的获取耗时 (秒)，mode 为 navigate / api / api_fallback", DEFAULT_BUCKETS),
+    "goofish_item_fetch_bytes": ("histogram", "单个商品详情和卖家信息的传输字节数", BYTES_BUCKETS),
+    "goofish_loop_lag_seconds": ("histogram", "事件循环心跳的延迟 (秒)，process 为 web / spider", LAG_BUCKETS),
+    "goofish_loop_blocked_total": ("counter", "事件循环被阻塞超过阈值的次数", None),
+    "goofish_loop_blocked_seconds": ("histogram", "超过阈值的事件循环阻塞时长 (秒)", LAG_BUCKETS),
+}
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，支持计数器、仪表和直方图，可在多线程中使用。"""
+
+    def __init__(self, definitions: dict = METRIC_DEFINITIONS):
+        self.definitions = definitions
+        self._lock = threading.Lock()
+        self._values = {}  # (name, labels) -> 值，用于计数器和仪表
+        self._histograms = {}  # (name, labels) -> [各分桶计数..., sum, count]
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values[(name, _label_key(labels))] = value
+
+    def clear_gauge(self, name: str):
+        with self._lock:
+            for key in [key for key in self._values if key[0] == name]:
+                del self._values[key]
+
+    def observe(self, name: str, value: float, **labels):
+        buckets = self.definitions[name][2]
+        key = (name, _label_key(labels))
+        with self._lock:
+            data = self._histograms.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """记录代码块的耗时，异常退出时同样记录。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """导出可序列化为 JSON 的快照。"""
+        with self._lock:
+            values = [[name, dict(labels), value] for (name, labels), value in self._values.items()]
+            histograms = [[name, dict(labels), list(data)] for (name, labels), data in self._histograms.items()]
+        return {"values": values, "histograms": histograms}
+
+
+def merge_snapshots(snapshots: list, include_gauges: bool = True, definitions: dict = METRIC_DEFINITIONS) -> dict:
+    """合并多个进程的快照：计数器和直方图相加，仪表取各进程之和。"""
+    values = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("values", []):
+            if name not in definitions:
+                continue
+            if not include_gauges and definitions[name][0] == "gauge":
+                continue
+            key = (name, _label_key(labels))
+            values[key] = values.get(key, 0) + value
+        for name, labels, data in snapshot.get("histograms", []):
+            if name not in definitions or len(data) != len(definitions[name][2]) + 2:
+                continue
+            key = (name, _label_key(labels))
+            if key in histograms:
+                histograms[key] = [a + b for a, b in zip(histograms[key], data)]
+            else:
+                histograms[key] = list(data)
+    return {
+        "values": [[name, dict(labels), value] for (name, labels), value in values.items()],
+        "histograms": [[name, dict(labels), data] for (name, labels), data in histograms.items()],
+    }
+
+
+def subtract_snapshot(snapshot: dict, base: dict, definitions: dict = METRIC_DEFINITIONS) -> dict:
+    """返回快照相对 base 的增量：计数器和直方图减去 base 中的值，仪表保持不变。"""
+    base_values = {(name, _label_key(labels)): value for name, labels, value in base.get("values", [])}
+    base_histograms = {(name, _label_key(labels)): data for name, labels, data in base.get("histograms", [])}
+    values = []
+    for name, labels, value in snapshot.get("values", []):
+        if name in definitions and definitions[name][0] == "counter":
+            value -= base_values.get((name, _label_key(labels)), 0)
+        values.append([name, labels, value])
+    histograms = []
+    for name, labels, data in snapshot.get("histograms", []):
+        previous = base_histograms.get((name, _label_key(labels)))
+        if previous is not None and len(previous) == len(data):
+            data = [a - b for a, b in zip(data, previous)]
+        histograms.append([name, labels, data])
+    return {"values": values, "histograms": histograms}
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict, extra: tuple = ()) -> str:
+    items = sorted(labels.items()) + list(extra)
+    if not items:
+        return ""
+    escaped = (f'{k}="{_escape_label_value(str(v))}"' for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(snapshot: dict, definitions: dict = METRIC_DEFINITIONS) -> str:
+    """将快照渲染为 Prometheus 文本格式。"""
+    by_name = {}
+    for name, labels, value in snapshot.get("values", []):
+        by_name.setdefault(name, []).append(("value", labels, value))
+    for name, labels, data in snapshot.get("histograms", []):
+        by_name.setdefault(name, []).append(("histogram", labels, data))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text, buckets = definitions[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for entry_kind, labels, data in sorted(by_name[name], key=lambda e: sorted(e[1].items())):
+            if entry_kind == "value":
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(data)}")
+                continue
+            for bound, count in zip(buckets, data[:len(buckets)]):
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', _format_value(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {data[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(data[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {data[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_json_atomic(path: str, data: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: str) -> dict | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+class MetricsAggregator:
+    """
+    Web服务汇总各爬虫进程指标的目录存储。
+    爬虫进程定期将累计快照写入 <目录>/spider-<pid>.json，结束时写入最终快照 (final=true)；
+    汇总时已结束或长时间未更新（进程被强制终止）的快照并入 retired.json 后删除，
+    因此计数器在进程退出后仍然保留。
+    因长时间未更新而并入的快照会在 retired.json 中记下当时的累计值；进程恢复写入后 (如事件循环曾被阻塞)，
+    只汇总相对该累计值的增量，避免重复计数。
+    """
+
+    RETIRED_NAME = "retired.json"
+    # 因长时间未更新而并入的进程的累计值保留多久，超过后视为进程确已退出
+    STALE_BASE_TTL_SECONDS = 7 * 86400
+
+    def __init__(self, directory: str = METRICS_DIR, stale_seconds: float | None = None):
+        self.directory = directory
+        # 超过若干个刷新周期未更新的快照视为进程已退出
+        self.stale_seconds = stale_seconds if stale_seconds is not None else max(60.0, METRICS_FLUSH_SECONDS * 6)
+        self._lock = threading.Lock()
+
+    def collect(self) -> list:
+        """返回所有爬虫进程（含已退出进程累计值）的快照列表。"""
+        with self._lock:
+            if not os.path.isdir(self.directory):
+                return []
+            retired_path = os.path.join(self.directory, self.RETIRED_NAME)
+            retired = _read_json(retired_path) or {"values": [], "histograms": []}
+            # 文件名 -> 并入时的累计快照，同一 pid 被新进程复用时按 started_at 区分
+            bases = retired.get("stale_bases", {})
+            live = []
+            finished = []
+            now = time.time()
+            for name in os.listdir(self.directory):
+                if not (name.startswith("spider-") and name.endswith(".json")):
+                    continue
+                path = os.path.join(self.directory, name)
+                snapshot = _read_json(path)
+                if snapshot is None:
+                    continue
+                base = bases.get(name)
+                if base is not None and base.get("started_at") != snapshot.get("started_at"):
+                    base = None
+                delta = subtract_snapshot(snapshot, base) if base is not None else snapshot
+                if snapshot.get("final") or now - snapshot.get("updated_at", 0) > self.stale_seconds:
+                    finished.append((path, delta))
+                    bases.pop(name, None)
+                    if not snapshot.get("final"):
+                        bases[name] = {
+                            "started_at": snapshot.get("started_at"),
+                            "retired_at": now,
+                            "values": snapshot.get("values", []),
+                            "histograms": snapshot.get("histograms", []),
+                        }
+                else:
+                    live.append(delta)
+            expired = [name for name, base in bases.items()
+                       if now - base.get("retired_at", 0) > self.STALE_BASE_TTL_SECONDS]
+            for name in expired:
+                del bases[name]
+            if finished or expired:
+                retired = merge_snapshots([retired] + [snapshot for _, snapshot in finished], include_gauges=False)
+                retired["stale_bases"] = bases
+                _write_json_atomic(retired_path, retired)
+                for path, _ in finished:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            totals = {"values": retired.get("values", []), "histograms": retired.get("histograms", [])}
+            return [totals] + live
+
+
+class MetricsFileWriter:
+    """爬虫进程内定期把指标快照写入汇总目录，供Web服务读取。"""
+
+    def __init__(self, registry: MetricsRegistry, directory: str = METRICS_DIR,
+                 interval: float = METRICS_FLUSH_SECONDS):
+        self.registry = registry
+        self.path = os.path.join(directory, f"spider-{os.getpid()}.json")
+        self.interval = interval
+        self.started_at = time.time()
+        self._task = None
+
+    def flush(self, final: bool = False):
+        snapshot = self.registry.snapshot()
+        snapshot["started_at"] = self.started_at
+        snapshot["updated_at"] = time.time()
+        snapshot["final"] = final
+        try:
+            _write_json_atomic(self.path, snapshot)
+        except OSError as e:
+            print(f"写入指标快照失败: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush, True)
+
+
+_registry = None
+_writer = None
+
+
+def get_metrics() -> MetricsRegistry:
+    global _registry
+    if _registry is None:
+        _registry = MetricsRegistry()
+    return _registry
+
+
+def start_metrics_writer():
+    """在爬虫进程中开始定期写出指标快照。"""
+    global _writer
+    if _writer is None:
+        _writer = MetricsFileWriter(get_metrics())
+        _writer.start()
+
+
+async def stop_metrics_writer():
+    """停止定期写出并写入最终快照。"""
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
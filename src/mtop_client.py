@@ -0,0 +1,142 @@
+import asyncio
+import hashlib
+import json
+import time
+from urllib.parse import urlencode
+
+from src.metrics import get_metrics
+
+# 闲鱼网页版 mtop 接口的 appKey 和网关地址
+MTOP_APP_KEY = "34839810"
+MTOP_GATEWAY = "https://h5api.m.goofish.com/h5"
+
+# 在页面中通过其自带的 lib.mtop 调用接口，签名、token 刷新和 Cookie 均由页面处理
+_LIB_MTOP_REQUEST_JS = """
+async ({api, v, data}) => {
+    if (!(window.lib && window.lib.mtop && window.lib.mtop.request)) {
+        return null;
+    }
+    try {
+        const res = await window.lib.mtop.request({
+            api, v, data, type: 'POST', dataType: 'json',
+            needLogin: false, sessionOption: 'AutoLoginOnly', timeout: 20000,
+        });
+        return JSON.stringify(res);
+    } catch (e) {
+        return JSON.stringify(e && e.ret ? e : {ret: [String(e)]});
+    }
+}
+"""
+
+
+def mtop_sign(token: str, timestamp: str, data: str, app_key: str = MTOP_APP_KEY) -> str:
+    """mtop H5 接口的签名：md5(token&时间戳&appKey&data)。"""
+    return hashlib.md5(f"{token}&{timestamp}&{app_key}&{data}".encode("utf-8")).hexdigest()
+
+
+def is_success(payload: dict | None) -> bool:
+    return bool(payload) and any(str(ret).startswith("SUCCESS") for ret in payload.get("ret", []))
+
+
+class PageMtopClient:
+    """
+    借用已建立会话的搜索页直接调用 mtop 接口，代替为每个商品详情和卖家主页打开新页面。
+    优先使用页面自带的 lib.mtop；页面中没有 lib.mtop 时，用浏览器上下文的请求对象
+    (共享 Cookie) 按 H5 签名规则自行请求。返回的 JSON 与导航时拦截到的接口响应结构相同。
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._use_lib_mtop = True
+
+    async def _request_via_context(self, api: str, data_json: str, version: str) -> str:
+        for _ in range(2):
+            cookies = await self.page.context.cookies("https://h5api.m.goofish.com")
+            token_cookie = next((c["value"] for c in cookies if c["name"] == "_m_h5_tk"), "")
+            token = token_cookie.split("_")[0]
+            timestamp = str(int(time.time() * 1000))
+            params = {
+                "jsv": "2.7.2", "appKey": MTOP_APP_KEY, "t": timestamp,
+                "sign": mtop_sign(token, timestamp, data_json), "v": version, "type": "originaljson",
+                "accountSite": "xianyu", "dataType": "json", "timeout": "20000", "api": api,
+                "sessionOption": "AutoLoginOnly",
+            }
+            response = await self.page.context.request.post(
+                f"{MTOP_GATEWAY}/{api}/{version}/?{urlencode(params)}",
+                form={"data": data_json},
+                headers={"Referer": "https://www.goofish.com/", "Origin": "https://www.goofish.com"},
+            )
+            text = await response.text()
+            # token 过期时响应会带上新的 _m_h5_tk Cookie，重试一次
+            if "FAIL_SYS_TOKEN_EXOIRED" in text or "FAIL_SYS_TOKEN_EMPTY" in text:
+                continue
+            return text
+        return text
+
+    async def request(self, api: str, data: dict, version: str = "1.0") -> tuple:
+        """调用接口，返回 (响应JSON, 响应字节数)；失败时 JSON 中的 ret 含错误信息。"""
+        data_json = json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+        text = None
+        if self._use_lib_mtop:
+            text = await self.page.evaluate(_LIB_MTOP_REQUEST_JS, {"api": api, "v": version, "data": data})
+            if text is None:
+                print("      [API模式] 页面中没有 lib.mtop，改为直接签名请求。")
+                self._use_lib_mtop = False
+        if text is None:
+            text = await self._request_via_context(api, data_json, version)
+        return json.loads(text), len(text.encode("utf-8"))
+
+
+class ItemFetchMeter:
+    """记录单个商品详情和卖家信息获取的耗时与传输字节数。"""
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.bytes = 0
+        self._started = time.perf_counter()
+        self._pending_sizes = []
+
+    def add_bytes(self, size: int):
+        self.bytes += size
+
+    def track_page(self, page):
+        """统计导航模式下页面加载的所有请求（文档、脚本、图片、接口）的传输字节数。"""
+        def on_request_finished(request):
+            self._pending_sizes.append(asyncio.ensure_future(request.sizes()))
+        page.on("requestfinished", on_request_finished)
+
+    async def collect_page_sizes(self):
+        """在关闭页面前调用，汇总已完成请求的字节数。"""
+        pending, self._pending_sizes = self._pending_sizes, []
+        for sizes in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(sizes, dict):
+                self.bytes += sizes.get("responseBodySize", 0) + sizes.get("responseHeadersSize", 0)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+
+class FetchStats:
+    """汇总一次运行中各获取模式的单商品耗时与字节数，用于对比 API 模式和导航模式。"""
+
+    def __init__(self, task_name: str):
+        self.task_name = task_name
+        self.modes = {}  # mode -> {"items", "seconds", "bytes"}
+
+    def record(self, meter: ItemFetchMeter):
+        seconds = meter.elapsed()
+        stats = self.modes.setdefault(meter.mode, {"items": 0, "seconds": 0.0, "bytes": 0})
+        stats["items"] += 1
+        stats["seconds"] += seconds
+        stats["bytes"] += meter.bytes
+        metrics = get_metrics()
+        metrics.observe("goofish_item_fetch_seconds", seconds, mode=meter.mode)
+        metrics.observe("goofish_item_fetch_bytes", meter.bytes, mode=meter.mode)
+
+    def summary(self) -> list:
+        lines = []
+        for mode, stats in sorted(self.modes.items()):
+            items = stats["items"]
+            lines.append(f"{mode}: {items} 个商品，平均每个 {stats['seconds'] / items:.1f} 秒、"
+                         f"{stats['bytes'] / items / 1024:.0f} KB")
+        return lines
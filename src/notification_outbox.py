@@ -0,0 +1,569 @@
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+
+from src.config import (
+    NOTIFY_DIGEST_CHANNELS,
+    NOTIFY_DIGEST_MAX_ITEMS,
+    NOTIFY_OUTBOX_FILE,
+    NOTIFY_RATE_LIMITS,
+    NOTIFY_URGENT_SCORE,
+)
+from src.notifier import build_notification_message, estimate_deal_score, get_notification_dispatcher
+
+# 未单独配置速率的渠道，默认每分钟最多发送的消息数
+DEFAULT_RATE_PER_MINUTE = 60
+# 单条消息的最大发送次数，超过后标记为失败
+MAX_ATTEMPTS = 8
+# 退避时间的基数和上限 (秒)
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 600
+# 发送中的消息的租约时长 (秒)，进程崩溃后租约过期的消息会被重新发送
+SENDING_LEASE_SECONDS = 120
+# 发送者租约时长 (秒)，同一时间只有一个进程负责投递，以保证速率限制全局生效
+SENDER_LEASE_SECONDS = 30
+# 已发送消息的保留时长 (秒)，用于去重
+SENT_RETENTION_SECONDS = 7 * 24 * 3600
+# 单条汇总消息最多包含的商品数，避免超出渠道的消息长度限制
+DIGEST_HARD_LIMIT = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    dedup_key TEXT NOT NULL,
+    message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    digest_group TEXT,
+    digest_window REAL NOT NULL DEFAULT 0,
+    digest_limit INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (channel, dedup_key)
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, channel, next_attempt_at);
+CREATE TABLE IF NOT EXISTS outbox_sender (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# 旧版本数据库缺少的列，连接时自动补齐
+_COLUMN_MIGRATIONS = {
+    "digest_group": "TEXT",
+    "digest_window": "REAL NOT NULL DEFAULT 0",
+    "digest_limit": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def parse_rate_limits(spec: str | None) -> dict:
+    """解析形如 "wecom=20,bark=30" 的渠道速率配置（条/分钟）。"""
+    limits = {}
+    for part in (spec or "").split(','):
+        if '=' not in part:
+            continue
+        name, value = part.split('=', 1)
+        try:
+            limits[name.strip()] = float(value)
+        except ValueError:
+            print(f"   -> [警告] 无法解析通知配置 '{part}'，已忽略。")
+    return limits
+
+
+def resolve_digest_settings(channel: str, task_config: dict | None) -> tuple | None:
+    """
+    返回渠道在该任务下的汇总设置 (窗口秒数, 最大条数)，不启用汇总时返回 None。
+    任务中的 digest_window_minutes / digest_max_items 优先于 NOTIFY_DIGEST_CHANNELS 的渠道配置。
+    """
+    task_config = task_config or {}
+    window_minutes = task_config.get("digest_window_minutes")
+    if window_minutes is None:
+        window_minutes = parse_rate_limits(NOTIFY_DIGEST_CHANNELS).get(channel)
+    if not window_minutes or window_minutes <= 0:
+        return None
+    max_items = task_config.get("digest_max_items") or NOTIFY_DIGEST_MAX_ITEMS
+    return float(window_minutes) * 60, min(int(max_items), DIGEST_HARD_LIMIT)
+
+
+class TokenBucket:
+    """按分钟计的令牌桶，桶容量等于每分钟的速率。"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(rate_per_minute, 1.0)
+        self.refill_per_second = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    def available(self) -> int:
+        self._refill()
+        return int(self.tokens)
+
+    def try_consume(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def drain(self):
+        """渠道返回限流错误时清空令牌，等待自然恢复。"""
+        self._refill()
+        self.tokens = 0
+
+
+class NotificationOutbox:
+    """基于 SQLite 的持久化通知发件箱，每条消息按渠道分别记录发送状态。"""
+
+    def __init__(self, filepath: str = NOTIFY_OUTBOX_FILE):
+        self.filepath = filepath
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.filepath, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(outbox)")}
+            for column, definition in _COLUMN_MIGRATIONS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE outbox ADD COLUMN {column} {definition}")
+            self._initialized = True
+        return conn
+
+    def enqueue(self, message: dict, dedup_key: str, channels: list, digests: dict | None = None) -> int:
+        """
+        为每个渠道写入一条待发送消息，同一渠道下相同去重键的消息只保留一条。返回新写入的条数。
+        digests 为 {渠道: (汇总分组, 窗口秒数, 最大条数)}，对应渠道的消息会等待合并发送。
+        """
+        now = time.time()
+        payload = json.dumps(message, ensure_ascii=False)
+        digests = digests or {}
+        conn = self._connect()
+        try:
+            cursor = conn.executemany(
+                "INSERT OR IGNORE INTO outbox (channel, dedup_key, message, next_attempt_at, created_at, updated_at, "
+                "digest_group, digest_window, digest_limit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (channel, dedup_key, payload, now, now, now, *(digests.get(channel) or (None, 0, 0)))
+                    for channel in channels
+                ],
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def claim(self, channel: str, limit: int) -> list:
+        """领取一个渠道下已到期的待发送消息，并标记为发送中。"""
+        if limit <= 0:
+            return []
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, message, attempts FROM outbox "
+                "WHERE channel = ? AND digest_group IS NULL AND ((status = 'pending' AND next_attempt_at <= ?) "
+                "OR (status = 'sending' AND next_attempt_at <= ?)) "
+                "ORDER BY id LIMIT ?",
+                (channel, now, now, limit),
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE outbox SET status = 'sending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                    [(now + SENDING_LEASE_SECONDS, now, row["id"]) for row in rows],
+                )
+            conn.execute("COMMIT")
+            return [{"id": row["id"], "message": json.loads(row["message"]), "attempts": row["attempts"]} for row in rows]
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def claim_digests(self, channel: str, limit: int) -> list:
+        """
+        领取一个渠道下已到期的汇总分组：窗口已结束或条数已达上限，且不在退避期内。
+        返回 [{"group": 分组, "rows": [...]}, ...]，每个分组合并为一条消息发送。
+        """
+        if limit <= 0:
+            return []
+        now = time.time()
+        claimable = "channel = ? AND digest_group IS NOT NULL AND (status = 'pending' OR (status = 'sending' AND next_attempt_at <= ?))"
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            groups = conn.execute(
+                f"SELECT digest_group, COUNT(*) AS n, MIN(created_at + digest_window) AS due_at, "
+                f"MIN(digest_limit) AS max_items, MAX(next_attempt_at) AS retry_at "
+                f"FROM outbox WHERE {claimable} GROUP BY digest_group ORDER BY due_at",
+                (channel, now),
+            ).fetchall()
+            result = []
+            for group in groups:
+                if len(result) >= limit:
+                    break
+                if group["retry_at"] > now or (group["due_at"] > now and group["n"] < group["max_items"]):
+                    continue
+                rows = conn.execute(
+                    f"SELECT id, message, attempts FROM outbox WHERE {claimable} AND digest_group = ? ORDER BY id LIMIT ?",
+                    (channel, now, group["digest_group"], DIGEST_HARD_LIMIT),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE outbox SET status = 'sending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                    [(now + SENDING_LEASE_SECONDS, now, row["id"]) for row in rows],
+                )
+                result.append({
+                    "group": group["digest_group"],
+                    "rows": [{"id": row["id"], "message": json.loads(row["message"]), "attempts": row["attempts"]} for row in rows],
+                })
+            conn.execute("COMMIT")
+            return result
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release(self, row_id: int):
+        """将已领取但未发送的消息退回待发送状态，不计入失败次数。"""
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ?, updated_at = ? WHERE id = ?",
+                (time.time(), time.time(), row_id),
+            )
+        finally:
+            conn.close()
+
+    def mark_sent(self, row_id: int):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = 'sent', attempts = attempts + 1, last_error = NULL, updated_at = ? WHERE id = ?",
+                (time.time(), row_id),
+            )
+        finally:
+            conn.close()
+
+    def mark_failed(self, row_id: int, attempts: int, error: str):
+        """记录一次发送失败：按指数退避重新排期，超过最大次数后标记为失败。"""
+        now = time.time()
+        attempts += 1
+        if attempts >= MAX_ATTEMPTS:
+            status, next_attempt_at = 'failed', now
+        else:
+            delay = min(BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), BACKOFF_MAX_SECONDS)
+            status, next_attempt_at = 'pending', now + delay * random.uniform(0.8, 1.2)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, next_attempt_at, error, now, row_id),
+            )
+        finally:
+            conn.close()
+
+    def pending_count(self, channels: list | None = None, immediate_only: bool = False) -> int:
+        """统计尚未发送完成的消息数，可限定渠道；immediate_only 时不计等待汇总的消息。"""
+        conn = self._connect()
+        try:
+            query = "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending')"
+            if immediate_only:
+                query += " AND digest_group IS NULL"
+            params = []
+            if channels is not None:
+                if not channels:
+                    return 0
+                query += f" AND channel IN ({','.join('?' * len(channels))})"
+                params = list(channels)
+            return conn.execute(query, params).fetchone()[0]
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        """按渠道和状态统计消息数量。"""
+        conn = self._connect()
+        try:
+            result = {}
+            for row in conn.execute("SELECT channel, status, COUNT(*) AS n FROM outbox GROUP BY channel, status"):
+                result.setdefault(row["channel"], {})[row["status"]] = row["n"]
+            return result
+        finally:
+            conn.close()
+
+    def purge_sent(self, older_than_seconds: float = SENT_RETENTION_SECONDS) -> int:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM outbox WHERE status = 'sent' AND updated_at < ?",
+                (time.time() - older_than_seconds,),
+            )
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def pending_channels(self) -> list:
+        """返回仍有待发送消息的渠道。"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT DISTINCT channel FROM outbox WHERE status IN ('pending', 'sending')")
+            return [row["channel"] for row in rows]
+        finally:
+            conn.close()
+
+    def acquire_sender_lease(self, owner: str, name: str = "sender") -> bool:
+        """尝试成为租约 name 的唯一持有者；租约过期前需要反复续约。"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires_at FROM outbox_sender WHERE name = ?", (name,)).fetchone()
+            if row and row["owner"] != owner and row["expires_at"] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO outbox_sender (name, owner, expires_at) VALUES (?, ?, ?)",
+                (name, owner, now + SENDER_LEASE_SECONDS),
+            )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def release_sender_lease(self, owner: str, name: str | None = None):
+        """释放租约 name；name 为空时释放该持有者的全部租约。"""
+        conn = self._connect()
+        try:
+            if name is None:
+                conn.execute("DELETE FROM outbox_sender WHERE owner = ?", (owner,))
+            else:
+                conn.execute("DELETE FROM outbox_sender WHERE name = ? AND owner = ?", (name, owner))
+        finally:
+            conn.close()
+
+
+def _is_rate_limited(error: str | None) -> bool:
+    """根据错误信息判断渠道是否在限流（HTTP 429 或企业微信 45009）。"""
+    return bool(error) and ("429" in error or "45009" in error)
+
+
+class OutboxSender:
+    """
+    后台投递器：从发件箱领取到期消息，按渠道令牌桶限速发送，失败时指数退避重试。
+    租约按渠道划分：只有配置了该渠道且发件箱中有该渠道待发送消息的进程才会竞争租约，
+    同一渠道同一时间只有一个进程在投递，以保证速率限制全局生效；
+    未配置某个渠道的进程 (如通知设置修改前启动的进程) 不会占住该渠道，由配置了它的进程投递。
+    """
+
+    def __init__(self, outbox: NotificationOutbox, dispatcher=None, poll_interval: float = 1.0):
+        self.outbox = outbox
+        self.dispatcher = dispatcher or get_notification_dispatcher()
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.rate_limits = parse_rate_limits(NOTIFY_RATE_LIMITS)
+        self.buckets = {}
+        self.leased_channels = set()
+        self.is_leader = False
+        self._task = None
+        self._stop_event = asyncio.Event()
+        self._last_purge = 0.0
+
+    async def _run_db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    def _bucket(self, name: str) -> TokenBucket:
+        if name not in self.buckets:
+            self.buckets[name] = TokenBucket(self.rate_limits.get(name, DEFAULT_RATE_PER_MINUTE))
+        return self.buckets[name]
+
+    async def _record_result(self, channel, rows: list, result: dict, label: str) -> bool:
+        bucket = self._bucket(channel.name)
+        if result["success"]:
+            for row in rows:
+                await self._run_db(self.outbox.mark_sent, row["id"])
+            print(f"   -> [通知发件箱] {channel.name} {label}发送成功。耗时 {result['latency_ms']}ms")
+            return True
+        if _is_rate_limited(result["error"]):
+            bucket.drain()
+        for row in rows:
+            await self._run_db(self.outbox.mark_failed, row["id"], row["attempts"], result["error"])
+        print(f"   -> [通知发件箱] {channel.name} {label}发送失败，稍后重试: {result['error']}")
+        return False
+
+    async def _drain_channel(self, channel) -> int:
+        bucket = self._bucket(channel.name)
+        sent = 0
+
+        # 汇总消息：每个到期分组合并为一条消息，只消耗一个令牌
+        digests = await self._run_db(self.outbox.claim_digests, channel.name, bucket.available())
+        for digest in digests:
+            if not bucket.try_consume():
+                for row in digest["rows"]:
+                    await self._run_db(self.outbox.release, row["id"])
+                continue
+            messages = [row["message"] for row in digest["rows"]]
+            result = await self.dispatcher.send_digest_to_channel(channel, messages, digest["group"])
+            if await self._record_result(channel, digest["rows"], result, f"汇总通知 ({len(messages)} 条) "):
+                sent += len(messages)
+
+        rows = await self._run_db(self.outbox.claim, channel.name, bucket.available())
+        for row in rows:
+            if not bucket.try_consume():
+                # 令牌不足（如渠道刚触发限流），退回待发送状态，等待下一轮
+                await self._run_db(self.outbox.release, row["id"])
+                continue
+            result = await self.dispatcher.send_to_channel(channel, row["message"])
+            if await self._record_result(channel, [row], result, "通知"):
+                sent += 1
+        return sent
+
+    async def drain_once(self) -> int:
+        """
+        执行一轮投递，返回发送成功的条数。
+        只为本进程已配置、且发件箱中有待发送消息的渠道竞争租约；不再需要的租约立即释放。
+        """
+        pending = set(await self._run_db(self.outbox.pending_channels)) if self.dispatcher.channels else set()
+        leased = []
+        for channel in self.dispatcher.channels:
+            if channel.name in pending and await self._run_db(
+                    self.outbox.acquire_sender_lease, self.owner, f"channel:{channel.name}"):
+                leased.append(channel)
+        for name in self.leased_channels - {channel.name for channel in leased}:
+            await self._run_db(self.outbox.release_sender_lease, self.owner, f"channel:{name}")
+        self.leased_channels = {channel.name for channel in leased}
+        self.is_leader = bool(leased)
+        if not leased:
+            return 0
+        results = await asyncio.gather(*(self._drain_channel(channel) for channel in leased))
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            await self._run_db(self.outbox.purge_sent)
+        return sum(results)
+
+    async def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                await self.drain_once()
+            except Exception as e:
+                print(f"   -> [通知发件箱] 投递过程中发生错误: {e}")
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self._task is None:
+            self._stop_event.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, flush_timeout: float = 0):
+        """
+        停止投递。flush_timeout > 0 且本进程为投递者时，先等待已入队的即时消息发送完毕（最多等待该秒数）；
+        其余消息（包括汇总窗口未结束的消息）保留在发件箱中，由下一个投递进程继续发送。
+        """
+        if self._task is None:
+            return
+        self._stop_event.set()
+        await self._task
+        self._task = None
+        if flush_timeout > 0:
+            deadline = time.monotonic() + flush_timeout
+            while time.monotonic() < deadline:
+                await self.drain_once()
+                if not self.is_leader or await self._run_db(
+                        self.outbox.pending_count, list(self.leased_channels), True) == 0:
+                    break
+                await asyncio.sleep(self.poll_interval)
+        await self._run_db(self.outbox.release_sender_lease, self.owner)
+        self.leased_channels = set()
+        self.is_leader = False
+
+
+_outbox = None
+
+
+def get_notification_outbox() -> NotificationOutbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = NotificationOutbox()
+    return _outbox
+
+
+async def enqueue_notification(product_data: dict, reason: str, dedup_key: str | None = None,
+                               task_config: dict | None = None, price_score: dict | None = None) -> int:
+    """
+    将通知写入发件箱后立即返回，由后台投递器异步发送，爬取流程无需等待投递结果。
+    dedup_key 默认为商品ID，同一商品在同一渠道只会通知一次。
+    启用汇总模式的渠道会将消息按任务合并发送。设置了 NOTIFY_URGENT_SCORE 时，以下紧急商品不等待汇总窗口：
+    相对原价的折扣得分达到该阈值，或价格模型的评分 price_score 被标记为低价异常 (z 分数达到 PRICE_ANOMALY_Z)。
+    """
+    dispatcher = get_notification_dispatcher()
+    if not dispatcher.channels:
+        print("警告：未在 .env 文件中配置任何通知服务 (NTFY_TOPIC_URL, WX_BOT_URL, GOTIFY_URL/TOKEN, BARK_URL, WEBHOOK_URL)，跳过通知。")
+        return 0
+
+    message = build_notification_message(product_data, reason)
+    dedup_key = dedup_key or str(product_data.get('商品ID') or product_data.get('商品链接', ''))
+    channels = [channel.name for channel in dispatcher.channels]
+
+    digests = {}
+    score = estimate_deal_score(product_data)
+    # 商品原价经常缺失，此时仍可依据价格模型相对同类商品的评分判断是否紧急
+    is_anomaly = bool(price_score and price_score.get("is_anomaly"))
+    urgent = NOTIFY_URGENT_SCORE is not None and (is_anomaly or (score is not None and score >= NOTIFY_URGENT_SCORE))
+    if not urgent:
+        group = (task_config or {}).get("task_name") or "default"
+        for channel in channels:
+            settings = resolve_digest_settings(channel, task_config)
+            if settings:
+                digests[channel] = (group, *settings)
+    elif score is not None and score >= NOTIFY_URGENT_SCORE:
+        print(f"   -> 商品得分 {score:.2f} 达到紧急阈值，跳过汇总窗口立即通知。")
+    else:
+        print(f"   -> 商品价格评分 z={price_score['z']} 为低价异常，跳过汇总窗口立即通知。")
+
+    inserted = await asyncio.get_running_loop().run_in_executor(
+        None, get_notification_outbox().enqueue, message, dedup_key, channels, digests
+    )
+    digest_note = f"，其中 {len(digests)} 个渠道等待汇总" if digests else ""
+    print(f"   -> 通知已加入发件箱 ({inserted}/{len(channels)} 个渠道，其余为重复通知{digest_note})。")
+    return inserted
+
+
+_sender = None
+
+
+def start_outbox_sender() -> OutboxSender:
+    """在当前事件循环中启动进程内共享的后台投递器。"""
+    global _sender
+    if _sender is None:
+        _sender = OutboxSender(get_notification_outbox())
+        _sender.start()
+    return _sender
+
+
+async def stop_outbox_sender(flush_timeout: float = 0):
+    """停止后台投递器，flush_timeout 秒内尽量发送完已入队的消息。"""
+    global _sender
+    if _sender is not None:
+        await _sender.stop(flush_timeout)
+        _sender = None
@@ -0,0 +1,386 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlencode, urlparse, urlunparse, parse_qsl
+
+import httpx
+
+# 通知配置可在运行时重新读取 (reload_notification_config)，因此通过模块访问而不是导入时复制
+from src import config
+from src.metrics import get_metrics
+from src.utils import convert_goofish_link, parse_price
+
+
+def build_notification_message(product_data: dict, reason: str) -> dict:
+    """将商品数据整理为与渠道无关的通知消息。"""
+    title = product_data.get('商品标题', 'N/A')
+    price = product_data.get('当前售价', 'N/A')
+    link = product_data.get('商品链接', '#')
+    mobile_link = convert_goofish_link(link) if config.PCURL_TO_MOBILE else None
+    if mobile_link:
+        content = f"价格: {price}\n原因: {reason}\n手机端链接: {mobile_link}\n电脑端链接: {link}"
+    else:
+        content = f"价格: {price}\n原因: {reason}\n链接: {link}"
+
+    image = product_data.get('商品主图链接')
+    if not image:
+        image_list = product_data.get('商品图片列表', [])
+        if image_list:
+            image = image_list[0]
+
+    return {
+        "title": f"🚨 新推荐! {title[:30]}...",
+        "content": content,
+        "link": mobile_link or link,
+        "image": image,
+        "item_title": title,
+    }
+
+
+def build_digest_message(messages: list, group: str | None = None) -> dict:
+    """将同一窗口内的多条推荐合并为一条汇总消息，每个商品保留价格、原因和链接。"""
+    blocks = []
+    for i, message in enumerate(messages, 1):
+        item_title = message.get("item_title") or message["title"]
+        blocks.append(f"【{i}】{item_title}\n{message['content']}")
+    suffix = f" ({group})" if group else ""
+    return {
+        "title": f"🚨 {len(messages)} 个新推荐{suffix}",
+        "content": "\n\n".join(blocks),
+        "link": messages[0]["link"] if messages else "#",
+        "image": messages[0].get("image") if messages else None,
+    }
+
+
+def estimate_deal_score(product_data: dict) -> float | None:
+    """按相对原价的折扣估计商品的紧急程度 (0~1，越大越划算)；缺少原价时返回 None。"""
+    price = parse_price(product_data.get('当前售价'))
+    original_price = parse_price(product_data.get('商品原价'))
+    if price is None or not original_price or original_price <= 0:
+        return None
+    return max(0.0, min(1.0, 1 - price / original_price))
+
+
+class NotificationChannel:
+    """通知渠道基类。子类只负责把消息转换为一次HTTP请求。"""
+
+    name = "base"
+    default_timeout = 10.0
+
+    def __init__(self, timeout: float | None = None):
+        self.timeout = timeout or self.default_timeout
+
+    def build_request(self, message: dict) -> dict:
+        """返回 httpx.AsyncClient.request 的参数。"""
+        raise NotImplementedError
+
+    def build_digest_request(self, messages: list, group: str | None = None) -> dict:
+        """返回汇总消息的请求参数，默认将多条消息合并为一条文本消息。"""
+        return self.build_request(build_digest_message(messages, group))
+
+    async def _send_request(self, http_client: httpx.AsyncClient, request: dict) -> httpx.Response:
+        response = await http_client.request(**request)
+        response.raise_for_status()
+        return response
+
+    async def send(self, http_client: httpx.AsyncClient, message: dict) -> httpx.Response:
+        return await self._send_request(http_client, self.build_request(message))
+
+    async def send_digest(self, http_client: httpx.AsyncClient, messages: list, group: str | None = None) -> httpx.Response:
+        return await self._send_request(http_client, self.build_digest_request(messages, group))
+
+
+class NtfyChannel(NotificationChannel):
+    name = "ntfy"
+
+    def __init__(self, topic_url: str, timeout: float | None = None):
+        super().__init__(timeout)
+        self.topic_url = topic_url
+
+    def build_request(self, message: dict) -> dict:
+        return {
+            "method": "POST",
+            "url": self.topic_url,
+            "content": message["content"].encode('utf-8'),
+            "headers": {
+                "Title": message["title"].encode('utf-8'),
+                "Priority": "urgent",
+                "Tags": "bell,vibration",
+            },
+        }
+
+
+class GotifyChannel(NotificationChannel):
+    name = "gotify"
+
+    def __init__(self, url: str, token: str, timeout: float | None = None):
+        super().__init__(timeout)
+        self.url = f"{url}/message?token={token}"
+
+    def build_request(self, message: dict) -> dict:
+        return {
+            "method": "POST",
+            "url": self.url,
+            "json": {"title": message["title"], "message": message["content"], "priority": 5},
+        }
+
+
+class BarkChannel(NotificationChannel):
+    name = "bark"
+
+    def __init__(self, url: str, timeout: float | None = None):
+        super().__init__(timeout)
+        self.url = url
+
+    def build_request(self, message: dict) -> dict:
+        payload = {
+            "title": message["title"],
+            "body": message["content"],
+            "level": "timeSensitive",
+            "group": "闲鱼监控",
+            "url": message["link"],
+        }
+        if message.get("image"):
+            payload["icon"] = message["image"]
+        return {
+            "method": "POST",
+            "url": self.url,
+            "json": payload,
+            "headers": {"Content-Type": "application/json; charset=utf-8"},
+        }
+
+
+def _to_wecom_markdown(title: str, content: str) -> str:
+    """将通知正文转换为企业微信Markdown格式，使链接可点击。"""
+    markdown_content = f"## {title}\n\n"
+    for line in content.split('\n'):
+        if line.startswith('手机端链接:') or line.startswith('电脑端链接:') or line.startswith('链接:'):
+            label, url = line.split(':', 1)
+            url = url.strip()
+            if url and url != '#':
+                markdown_content += f"- **{label}:** [{url}]({url})\n"
+            else:
+                markdown_content += f"- **{label}:** 暂无链接\n"
+        elif line:
+            markdown_content += f"- {line}\n"
+        else:
+            markdown_content += "\n"
+    return markdown_content
+
+
+class WeComChannel(NotificationChannel):
+    name = "wecom"
+
+    def __init__(self, url: str, timeout: float | None = None):
+        super().__init__(timeout)
+        self.url = url
+
+    def build_request(self, message: dict) -> dict:
+        return {
+            "method": "POST",
+            "url": self.url,
+            "json": {
+                "msgtype": "markdown",
+                "markdown": {"content": _to_wecom_markdown(message["title"], message["content"])},
+            },
+            "headers": {"Content-Type": "application/json"},
+        }
+
+    async def _send_request(self, http_client: httpx.AsyncClient, request: dict) -> httpx.Response:
+        response = await super()._send_request(http_client, request)
+        # 企业微信在HTTP 200中通过 errcode 返回业务错误（如触发频率限制）
+        result = response.json()
+        if result.get("errcode", 0) != 0:
+            raise RuntimeError(f"企业微信返回错误: {result}")
+        return response
+
+
+def _compile_json_template(template: str | None, setting_name: str):
+    """解析一次JSON模板，返回解析后的结构；为空或格式错误时返回 None。"""
+    if not template:
+        return None
+    try:
+        return json.loads(template)
+    except json.JSONDecodeError:
+        print(f"   -> [警告] Webhook 配置格式错误，请检查 .env 中的 {setting_name}。")
+        return None
+
+
+def _render_template(node, values: dict):
+    """将已解析模板中字符串里的 {{title}}/{{content}}（及旧的 ${title}/${content}）占位符替换为实际值。"""
+    if isinstance(node, str):
+        for key, value in values.items():
+            node = node.replace(f"${{{key}}}", value).replace(f"{{{{{key}}}}}", value)
+        return node
+    if isinstance(node, dict):
+        return {k: _render_template(v, values) for k, v in node.items()}
+    if isinstance(node, list):
+        return [_render_template(v, values) for v in node]
+    return node
+
+
+class WebhookChannel(NotificationChannel):
+    name = "webhook"
+    default_timeout = 15.0
+
+    def __init__(self, url: str, method: str = "POST", headers: str | None = None,
+                 content_type: str = "JSON", query_parameters: str | None = None,
+                 body: str | None = None, timeout: float | None = None):
+        super().__init__(timeout)
+        self.url = url
+        self.method = (method or "POST").upper()
+        self.content_type = (content_type or "JSON").upper()
+        self.headers = _compile_json_template(headers, "WEBHOOK_HEADERS") or {}
+        self.query_template = _compile_json_template(query_parameters, "WEBHOOK_QUERY_PARAMETERS")
+        self.body_template = _compile_json_template(body, "WEBHOOK_BODY")
+        self._url_parts = list(urlparse(url))
+        self._base_query = dict(parse_qsl(self._url_parts[4]))
+
+        if self.method not in ("GET", "POST"):
+            print(f"   -> [警告] 不支持的 WEBHOOK_METHOD: {self.method}。")
+        if self.method == "POST" and self.body_template is not None and self.content_type not in ("JSON", "FORM"):
+            print(f"   -> [警告] 不支持的 WEBHOOK_CONTENT_TYPE: {self.content_type}。")
+
+    def build_request(self, message: dict) -> dict:
+        values = {"title": message["title"], "content": message["content"]}
+        headers = dict(self.headers)
+        has_content_type = 'Content-Type' in headers or 'content-type' in headers
+
+        if self.method == "GET":
+            url = self.url
+            if self.query_template is not None:
+                query = dict(self._base_query)
+                query.update(_render_template(self.query_template, values))
+                url_parts = list(self._url_parts)
+                url_parts[4] = urlencode(query)
+                url = urlunparse(url_parts)
+            return {"method": "GET", "url": url, "headers": headers}
+
+        if self.method != "POST":
+            raise ValueError(f"不支持的 WEBHOOK_METHOD: {self.method}")
+
+        request = {"method": "POST", "url": self.url, "headers": headers}
+        if self.body_template is not None:
+            rendered = _render_template(self.body_template, values)
+            if self.content_type == "JSON":
+                request["json"] = rendered
+                if not has_content_type:
+                    headers['Content-Type'] = 'application/json; charset=utf-8'
+            elif self.content_type == "FORM":
+                request["data"] = rendered
+                if not has_content_type:
+                    headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        return request
+
+    def build_digest_request(self, messages: list, group: str | None = None) -> dict:
+        """JSON 请求体的汇总消息以数组形式发送，每个元素按模板渲染一个商品。"""
+        if self.method != "POST" or self.body_template is None or self.content_type != "JSON":
+            return super().build_digest_request(messages, group)
+        request = self.build_request(messages[0])
+        request["json"] = [
+            _render_template(self.body_template, {"title": m["title"], "content": m["content"]})
+            for m in messages
+        ]
+        return request
+
+
+class NotificationDispatcher:
+    """
+    多渠道通知分发器。
+    所有渠道共享一个带连接池的异步HTTP客户端并发推送，总耗时取决于最慢的渠道；
+    每个渠道独立超时，并返回各自的成功状态和耗时。
+    """
+
+    def __init__(self, channels: list, http_client: httpx.AsyncClient | None = None):
+        self.channels = channels
+        self._http_client = http_client
+
+    @classmethod
+    def from_config(cls) -> "NotificationDispatcher":
+        """根据 .env 中的通知配置构建渠道列表，模板和请求头只在此处解析一次。"""
+        channels = []
+        if config.NTFY_TOPIC_URL:
+            channels.append(NtfyChannel(config.NTFY_TOPIC_URL))
+        if config.GOTIFY_URL and config.GOTIFY_TOKEN:
+            channels.append(GotifyChannel(config.GOTIFY_URL, config.GOTIFY_TOKEN))
+        if config.BARK_URL:
+            channels.append(BarkChannel(config.BARK_URL))
+        if config.WX_BOT_URL:
+            channels.append(WeComChannel(config.WX_BOT_URL))
+        if config.WEBHOOK_URL:
+            channels.append(WebhookChannel(
+                config.WEBHOOK_URL,
+                method=config.WEBHOOK_METHOD,
+                headers=config.WEBHOOK_HEADERS,
+                content_type=config.WEBHOOK_CONTENT_TYPE,
+                query_parameters=config.WEBHOOK_QUERY_PARAMETERS,
+                body=config.WEBHOOK_BODY,
+            ))
+        return cls(channels)
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                timeout=httpx.Timeout(30.0),
+            )
+        return self._http_client
+
+    def get_channel(self, name: str) -> NotificationChannel | None:
+        return next((channel for channel in self.channels if channel.name == name), None)
+
+    async def send_to_channel(self, channel: NotificationChannel, message: dict) -> dict:
+        """向单个渠道发送消息，返回 {channel, success, latency_ms, error}。"""
+        return await self._timed_send(channel, channel.send(self.http_client, message))
+
+    async def send_digest_to_channel(self, channel: NotificationChannel, messages: list, group: str | None = None) -> dict:
+        """向单个渠道发送一条汇总消息，返回值同 send_to_channel。"""
+        return await self._timed_send(channel, channel.send_digest(self.http_client, messages, group))
+
+    async def _timed_send(self, channel: NotificationChannel, send_coro) -> dict:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(send_coro, timeout=channel.timeout)
+            result = {"channel": channel.name, "success": True, "error": None}
+        except asyncio.TimeoutError:
+            result = {"channel": channel.name, "success": False, "error": f"超时 ({channel.timeout}s)"}
+        except Exception as e:
+            result = {"channel": channel.name, "success": False, "error": f"{type(e).__name__}: {e}"}
+        elapsed = time.perf_counter() - start
+        result["latency_ms"] = round(elapsed * 1000, 1)
+        metrics = get_metrics()
+        metrics.inc("goofish_notifications_total", channel=channel.name,
+                    outcome="sent" if result["success"] else "failed")
+        metrics.observe("goofish_notification_send_seconds", elapsed, channel=channel.name)
+        return result
+
+    async def dispatch(self, message: dict) -> list:
+        """并发向所有渠道推送同一条消息。"""
+        if not self.channels:
+            return []
+        return list(await asyncio.gather(*(self.send_to_channel(channel, message) for channel in self.channels)))
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+_dispatcher = None
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """返回进程内共享的通知分发器，首次调用时根据配置构建。"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher.from_config()
+    return _dispatcher
+
+
+async def close_notification_dispatcher():
+    """关闭共享分发器的HTTP连接池。"""
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.aclose()
+        _dispatcher = None
@@ -0,0 +1,291 @@
+import glob
+import json
+import math
+import os
+import re
+import zlib
+
+import numpy as np
+
+from src.config import PRESCREEN, PRESCREEN_MODEL_FILE, PRESCREEN_SKIP_THRESHOLD
+from src.utils import parse_price
+
+# 哈希特征的桶数
+DEFAULT_BUCKETS = 1 << 18
+# 标题的字符 n-gram 长度
+NGRAM_SIZES = (1, 2, 3)
+# 数值特征：价格、想要人数、卖家好评率、卖家评价数、卖家在售/已售商品数
+DENSE_FEATURES = ("log_price", "log_wants", "seller_rate", "log_seller_reviews", "log_seller_items")
+# 校准报告的分箱数
+CALIBRATION_BINS = 10
+# 选择跳过阈值时尝试的候选值
+THRESHOLD_CANDIDATES = (0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3)
+# 由本地判断得出的结论（预筛跳过、图片重复复用）不是AI的判断，不能作为训练标签
+_NON_AI_VERDICT_KEYS = ("prescreen", "image_hash_match", "error")
+
+
+def _log1p_number(value) -> float:
+    number = parse_price(value)
+    return math.log1p(number) if number is not None and number > 0 else 0.0
+
+
+def _leading_number(value) -> float | None:
+    match = re.match(r"\s*(\d+(?:\.\d+)?)", str(value or ""))
+    return float(match.group(1)) if match else None
+
+
+def record_tokens(record: dict) -> list:
+    """记录的离散特征：标题字符 n-gram、商品标签、搜索关键词以及卖家信用等文本字段。"""
+    item = record.get('商品信息', {})
+    seller = record.get('卖家信息', {})
+    title = re.sub(r"\s+", " ", str(item.get('商品标题', ''))).lower()
+    tokens = ["__bias__"]
+    for n in NGRAM_SIZES:
+        tokens.extend(f"t{n}:{title[i:i + n]}" for i in range(max(len(title) - n + 1, 0)))
+    tokens.extend(f"tag:{tag}" for tag in item.get('商品标签', []) or [])
+    tokens.append(f"kw:{record.get('搜索关键字', '')}")
+    for field in ('卖家芝麻信用', '卖家注册时长', '卖家信用等级'):
+        if seller.get(field):
+            tokens.append(f"{field}:{seller[field]}")
+    return tokens
+
+
+def record_dense(record: dict) -> list:
+    """记录的数值特征，顺序与 DENSE_FEATURES 一致；缺失值记为 0。"""
+    item = record.get('商品信息', {})
+    seller = record.get('卖家信息', {})
+    rate = _leading_number(seller.get('作为卖家的好评率'))
+    return [
+        _log1p_number(item.get('当前售价')),
+        _log1p_number(item.get('“想要”人数')),
+        rate / 100 if rate is not None else 0.0,
+        _log1p_number(seller.get('卖家收到的评价总数')),
+        _log1p_number(seller.get('卖家在售/已售商品数')),
+    ]
+
+
+def _hash_token(token: str, buckets: int) -> int:
+    return zlib.crc32(token.encode("utf-8")) % buckets
+
+
+def training_label(record: dict) -> int | None:
+    """AI给出的推荐结论 (1/0)；没有AI结论或结论来自本地判断时返回 None。"""
+    analysis = record.get('ai_analysis')
+    if not isinstance(analysis, dict) or not isinstance(analysis.get('is_recommended'), bool):
+        return None
+    if any(key in analysis for key in _NON_AI_VERDICT_KEYS):
+        return None
+    return int(analysis['is_recommended'])
+
+
+def load_labeled_records(paths: list) -> list:
+    """读取结果文件中带AI结论的记录，同一商品只保留最后一条。"""
+    records = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if training_label(record) is None:
+                    continue
+                item = record.get('商品信息', {})
+                key = str(item.get('商品ID') or item.get('商品链接', ''))
+                records[key] = record
+    return list(records.values())
+
+
+def default_training_files(directory: str = "jsonl") -> list:
+    return sorted(glob.glob(os.path.join(directory, "*.jsonl")))
+
+
+def is_holdout(record: dict, holdout_percent: int = 20) -> bool:
+    """按商品ID的哈希划分验证集，重新训练时划分保持不变。"""
+    item = record.get('商品信息', {})
+    key = str(item.get('商品ID') or item.get('商品链接', ''))
+    return zlib.crc32(key.encode("utf-8")) % 100 < holdout_percent
+
+
+class PrescreenModel:
+    """
+    基于历史AI结论训练的哈希特征逻辑回归模型，用于在调用AI前筛掉把握很大的不推荐商品。
+    离散特征哈希到固定数量的桶中并按 1/sqrt(特征数) 归一化，数值特征按训练集的均值和标准差标准化。
+    """
+
+    def __init__(self, buckets: int = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.weights = np.zeros(buckets, dtype=np.float32)
+        self.dense_weights = np.zeros(len(DENSE_FEATURES), dtype=np.float32)
+        self.dense_mean = np.zeros(len(DENSE_FEATURES), dtype=np.float32)
+        self.dense_std = np.ones(len(DENSE_FEATURES), dtype=np.float32)
+        self.threshold = 0.0
+
+    def _encode(self, records: list) -> tuple:
+        indices, values, offsets = [], [], []
+        for record in records:
+            hashed = [_hash_token(token, self.buckets) for token in record_tokens(record)]
+            offsets.append(len(indices))
+            indices.extend(hashed)
+            values.extend([1 / math.sqrt(len(hashed))] * len(hashed))
+        dense = np.array([record_dense(record) for record in records], dtype=np.float32).reshape(-1, len(DENSE_FEATURES))
+        return (np.array(indices, dtype=np.int64), np.array(values, dtype=np.float32),
+                np.array(offsets, dtype=np.int64), dense)
+
+    def _logits(self, encoded: tuple) -> np.ndarray:
+        indices, values, offsets, dense = encoded
+        sparse = np.add.reduceat(self.weights[indices] * values, offsets) if len(offsets) else np.zeros(0)
+        return sparse + ((dense - self.dense_mean) / self.dense_std) @ self.dense_weights
+
+    def fit(self, records: list, labels, epochs: int = 300, learning_rate: float = 0.5, l2: float = 1e-4):
+        """全批量梯度下降训练。"""
+        labels = np.asarray(labels, dtype=np.float32)
+        encoded = self._encode(records)
+        indices, values, offsets, dense = encoded
+        self.dense_mean = dense.mean(axis=0)
+        self.dense_std = np.where(dense.std(axis=0) > 0, dense.std(axis=0), 1.0).astype(np.float32)
+        scaled_dense = (dense - self.dense_mean) / self.dense_std
+        lengths = np.diff(np.append(offsets, len(indices)))
+        for _ in range(epochs):
+            probabilities = 1 / (1 + np.exp(-self._logits(encoded)))
+            errors = (probabilities - labels) / len(labels)
+            sparse_grad = np.bincount(indices, weights=np.repeat(errors, lengths) * values, minlength=self.buckets)
+            self.weights -= (learning_rate * (sparse_grad + l2 * self.weights)).astype(np.float32)
+            self.dense_weights -= (learning_rate * (scaled_dense.T @ errors + l2 * self.dense_weights)).astype(np.float32)
+        return self
+
+    def predict(self, records: list) -> np.ndarray:
+        """返回每条记录被AI推荐的概率。"""
+        if not records:
+            return np.zeros(0)
+        return 1 / (1 + np.exp(-self._logits(self._encode(records))))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 先写临时文件再替换，避免爬虫进程读到写了一半的模型
+        tmp_path = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp_path, weights=self.weights, dense_weights=self.dense_weights, dense_mean=self.dense_mean,
+            dense_std=self.dense_std, threshold=np.float32(self.threshold), buckets=np.int64(self.buckets),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PrescreenModel":
+        with np.load(path) as data:
+            model = cls(int(data["buckets"]))
+            model.weights = data["weights"]
+            model.dense_weights = data["dense_weights"]
+            model.dense_mean = data["dense_mean"]
+            model.dense_std = data["dense_std"]
+            model.threshold = float(data["threshold"])
+        return model
+
+
+def _auc(labels: np.ndarray, scores: np.ndarray) -> float | None:
+    positives = labels.sum()
+    negatives = len(labels) - positives
+    if not positives or not negatives:
+        return None
+    ranks = np.empty(len(scores))
+    ranks[np.argsort(scores, kind="mergesort")] = np.arange(1, len(scores) + 1)
+    return float((ranks[labels == 1].sum() - positives * (positives + 1) / 2) / (positives * negatives))
+
+
+def evaluate(labels, probabilities, max_miss_rate: float) -> dict:
+    """
+    验证集报告：AUC、Brier 分数、校准分箱 (各概率区间的平均预测值与实际推荐率)，
+    以及各候选阈值下跳过的商品比例和被误跳过的推荐商品比例；
+    选择误跳过比例不超过 max_miss_rate 的最大阈值作为跳过阈值。
+    """
+    labels = np.asarray(labels, dtype=np.float64)
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    positives = int(labels.sum())
+    calibration = []
+    bins = np.minimum((probabilities * CALIBRATION_BINS).astype(int), CALIBRATION_BINS - 1)
+    for b in range(CALIBRATION_BINS):
+        mask = bins == b
+        if mask.any():
+            calibration.append({
+                "range": f"{b / CALIBRATION_BINS:.1f}-{(b + 1) / CALIBRATION_BINS:.1f}",
+                "items": int(mask.sum()),
+                "mean_predicted": round(float(probabilities[mask].mean()), 4),
+                "observed_rate": round(float(labels[mask].mean()), 4),
+            })
+    skip_rates = []
+    threshold = 0.0
+    for candidate in THRESHOLD_CANDIDATES:
+        skipped = probabilities < candidate
+        missed = int((skipped & (labels == 1)).sum())
+        miss_rate = missed / positives if positives else 0.0
+        skip_rates.append({
+            "threshold": candidate,
+            "skip_rate": round(float(skipped.mean()), 4) if len(labels) else 0.0,
+            "missed_recommended": missed,
+            "miss_rate": round(miss_rate, 4),
+        })
+        if positives and miss_rate <= max_miss_rate:
+            threshold = candidate
+    chosen = next((row for row in skip_rates if row["threshold"] == threshold), None)
+    auc = _auc(labels, probabilities)
+    return {
+        "items": len(labels),
+        "recommended": positives,
+        "auc": round(auc, 4) if auc is not None else None,
+        "brier": round(float(np.mean((probabilities - labels) ** 2)), 4) if len(labels) else None,
+        "calibration": calibration,
+        "skip_rates": skip_rates,
+        "max_miss_rate": max_miss_rate,
+        "threshold": threshold,
+        "expected_skip_rate": chosen["skip_rate"] if chosen else 0.0,
+    }
+
+
+def train_prescreen(paths: list, holdout_percent: int = 20, max_miss_rate: float = 0.02,
+                    buckets: int = DEFAULT_BUCKETS, epochs: int = 300) -> tuple:
+    """用结果文件训练预筛模型，返回 (模型, 报告)。跳过阈值由验证集决定，验证集中没有推荐商品时阈值为 0 (不跳过)。"""
+    records = load_labeled_records(paths)
+    train = [r for r in records if not is_holdout(r, holdout_percent)]
+    holdout = [r for r in records if is_holdout(r, holdout_percent)]
+    train_labels = [training_label(r) for r in train]
+    if not train or len(set(train_labels)) < 2:
+        raise ValueError(f"训练数据不足：共 {len(records)} 条带AI结论的记录，训练集需要同时包含推荐和不推荐的商品。")
+    model = PrescreenModel(buckets).fit(train, train_labels, epochs=epochs)
+    report = evaluate([training_label(r) for r in holdout], model.predict(holdout), max_miss_rate)
+    report.update({"train_items": len(train), "train_recommended": int(sum(train_labels)), "files": paths})
+    model.threshold = report["threshold"]
+    return model, report
+
+
+_model = None
+_model_loaded = False
+
+
+def get_prescreen_model() -> PrescreenModel | None:
+    """PRESCREEN 开启且模型文件存在时加载预筛模型，否则返回 None。"""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model_loaded = True
+        if PRESCREEN:
+            if os.path.exists(PRESCREEN_MODEL_FILE):
+                _model = PrescreenModel.load(PRESCREEN_MODEL_FILE)
+                if PRESCREEN_SKIP_THRESHOLD is not None:
+                    _model.threshold = PRESCREEN_SKIP_THRESHOLD
+                print(f"LOG: 已加载预筛模型，推荐概率低于 {_model.threshold:.1%} 的商品将跳过AI分析。")
+            else:
+                print(f"LOG: 未找到预筛模型 {PRESCREEN_MODEL_FILE}，请先运行 train_prescreen.py 训练。")
+    return _model
+
+
+def prescreen_verdict(model: PrescreenModel, record: dict) -> tuple:
+    """
+    返回 (推荐概率, 跳过时代替AI结论的结果)；概率不低于阈值时第二项为 None，照常调用AI。
+    """
+    probability = float(model.predict([record])[0])
+    if probability >= model.threshold:
+        return probability, None
+    return probability, {
+        "is_recommended": False,
+        "reason": f"本地预筛模型判断该商品被推荐的概率仅为 {probability:.1%}，已跳过AI分析。",
+        "prescreen": {"probability": round(probability, 4), "threshold": model.threshold},
+    }
@@ -0,0 +1,209 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+from src.config import PRICE_HISTORY, PRICE_HISTORY_FILE, PRICE_HISTORY_FLUSH_SECONDS
+from src.utils import parse_price
+
+# 按关键词统计每日价格时输出的分位数
+DAILY_PERCENTILES = (10, 25, 50, 75, 90)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS price_observations (
+    item_id TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    observed_at INTEGER NOT NULL,
+    price REAL NOT NULL,
+    want_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_price_item ON price_observations (item_id, observed_at);
+CREATE INDEX IF NOT EXISTS idx_price_keyword ON price_observations (keyword, observed_at);
+"""
+
+
+def _parse_want_count(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def observations_from_items(keyword: str, items: list, observed_at: int | None = None) -> list:
+    """把一页搜索结果转换为 (商品ID, 关键词, 时间戳, 价格, 想要人数) 观测记录，跳过价格无法解析的商品。"""
+    observed_at = int(observed_at if observed_at is not None else time.time())
+    rows = []
+    for item in items:
+        price = parse_price(item.get('当前售价'))
+        item_id = item.get('商品ID')
+        if price is None or not item_id or item_id == '未知ID':
+            continue
+        rows.append((str(item_id), keyword, observed_at, price, _parse_want_count(item.get('“想要”人数'))))
+    return rows
+
+
+def percentile(sorted_values: list, q: float) -> float | None:
+    """已排序数值的第 q 百分位数 (线性插值)。"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+class PriceHistoryStore:
+    """基于 SQLite 的价格时间序列，只追加写入，每行是一次在搜索结果中看到的商品价格。"""
+
+    def __init__(self, filepath: str = PRICE_HISTORY_FILE):
+        self.filepath = filepath
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.filepath, timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._initialized = True
+        return conn
+
+    def append(self, rows: list) -> int:
+        """在一个事务中批量写入观测记录，返回写入条数。"""
+        if not rows:
+            return 0
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO price_observations (item_id, keyword, observed_at, price, want_count) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            return len(rows)
+        finally:
+            conn.close()
+
+    def item_history(self, item_id: str, limit: int = 1000) -> list:
+        """返回商品的价格观测记录，按时间从早到晚排列。"""
+        if not os.path.exists(self.filepath):
+            return []
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT observed_at, keyword, price, want_count FROM ("
+                "SELECT * FROM price_observations WHERE item_id = ? ORDER BY observed_at DESC LIMIT ?"
+                ") ORDER BY observed_at",
+                (str(item_id), limit),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def keyword_prices(self, keyword: str, since: float) -> list:
+        """返回关键词在 since 之后每个商品每天的最后一次价格，[(日期, 价格)] 按日期排列。"""
+        if not os.path.exists(self.filepath):
+            return []
+        conn = self._connect()
+        try:
+            # 同一商品一天内可能被看到多次，只取当天最后一次的价格，避免频繁出现的商品左右统计结果
+            rows = conn.execute(
+                "SELECT date(observed_at, 'unixepoch', 'localtime') AS day, price, MAX(observed_at) "
+                "FROM price_observations WHERE keyword = ? AND observed_at >= ? "
+                "GROUP BY day, item_id ORDER BY day",
+                (keyword, int(since)),
+            ).fetchall()
+        finally:
+            conn.close()
+        return [(row["day"], row["price"]) for row in rows]
+
+    def keyword_daily_stats(self, keyword: str, days: int = 30) -> list:
+        """关键词每天的商品数、最低/最高价和各分位数价格。"""
+        by_day = {}
+        for day, price in self.keyword_prices(keyword, time.time() - days * 86400):
+            by_day.setdefault(day, []).append(price)
+        stats = []
+        for day, prices in by_day.items():
+            prices.sort()
+            entry = {"date": day, "items": len(prices), "min": prices[0], "max": prices[-1]}
+            for q in DAILY_PERCENTILES:
+                entry[f"p{q}"] = round(percentile(prices, q), 2)
+            stats.append(entry)
+        return stats
+
+
+class PriceHistoryWriter:
+    """爬虫进程内缓存观测记录，定期在线程池中批量写入，避免每页搜索结果都同步写库。"""
+
+    def __init__(self, store: PriceHistoryStore, interval: float = PRICE_HISTORY_FLUSH_SECONDS):
+        self.store = store
+        self.interval = interval
+        self._buffer = []
+        self._task = None
+
+    def add(self, rows: list):
+        self._buffer.extend(rows)
+
+    async def flush(self):
+        # 在事件循环线程中取走缓冲区，写库在线程池中进行
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.append, rows)
+        except sqlite3.Error as e:
+            print(f"写入价格历史失败，{len(rows)} 条观测记录已丢弃: {e}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+_store = None
+_writer = None
+
+
+def get_price_history_store() -> PriceHistoryStore:
+    global _store
+    if _store is None:
+        _store = PriceHistoryStore()
+    return _store
+
+
+def start_price_history_writer() -> PriceHistoryWriter | None:
+    """PRICE_HISTORY 开启时，在爬虫进程中开始定期批量写入价格观测记录。"""
+    global _writer
+    if not PRICE_HISTORY:
+        return None
+    if _writer is None:
+        _writer = PriceHistoryWriter(get_price_history_store())
+        _writer.start()
+    return _writer
+
+
+async def stop_price_history_writer():
+    """停止定期写入并写入剩余的观测记录。"""
+    global _writer
+    if _writer is not None:
+        await _writer.stop()
+        _writer = None
+
+
+def record_search_prices(keyword: str, items: list):
+    """记录一页搜索结果中所有商品的价格，只写入内存缓冲区；未启动写入器时不做任何事。"""
+    if _writer is not None:
+        _writer.add(observations_from_items(keyword, items))
@@ -0,0 +1,81 @@
+import time
+from collections import deque
+
+from src.config import PRICE_ANOMALY_Z, PRICE_MODEL_MIN_SAMPLES, PRICE_MODEL_WINDOW
+from src.price_history import get_price_history_store, percentile
+from src.utils import parse_price
+
+# 启动时从价格历史中读取最近多少天的价格作为初始样本
+HISTORY_SEED_DAYS = 14
+# MAD 换算为正态分布标准差的系数
+_MAD_TO_SIGMA = 1.4826
+
+
+class KeywordPriceModel:
+    """
+    单个关键词的在线价格模型：保留最近 window 个价格，用中位数和 MAD (中位数绝对偏差) 计算稳健 z 分数。
+    z = (中位数 - 价格) / (1.4826 * MAD)，价格越低于同类商品的典型价格，分数越高；不受少数离谱标价影响。
+    """
+
+    def __init__(self, window: int = PRICE_MODEL_WINDOW, min_samples: int = PRICE_MODEL_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._prices = deque(maxlen=window)
+        self._stats = None
+
+    def __len__(self) -> int:
+        return len(self._prices)
+
+    def update(self, prices):
+        for price in prices:
+            if price is not None and price > 0:
+                self._prices.append(price)
+        self._stats = None
+
+    def update_from_items(self, items: list):
+        self.update(parse_price(item.get('当前售价')) for item in items)
+
+    def _median_mad(self) -> tuple:
+        if self._stats is None:
+            values = sorted(self._prices)
+            median = percentile(values, 50)
+            mad = percentile(sorted(abs(v - median) for v in values), 50) if values else None
+            self._stats = (median, mad)
+        return self._stats
+
+    def score(self, price: float | None) -> dict | None:
+        """返回价格的 z 分数及所依据的中位数和样本数；样本不足、价格无效或价格完全一致时返回 None。"""
+        if price is None or len(self._prices) < self.min_samples:
+            return None
+        median, mad = self._median_mad()
+        if not mad:
+            return None
+        return {
+            "z": round((median - price) / (_MAD_TO_SIGMA * mad), 2),
+            "median": round(median, 2),
+            "samples": len(self._prices),
+        }
+
+    def score_items(self, items: list, anomaly_z: float = PRICE_ANOMALY_Z) -> list:
+        """
+        为一页商品打分，分数达到 anomaly_z 的标记为低价异常。
+        返回按分数从高到低排列的 [(商品, 评分)]，无法打分的商品保持原顺序排在最后。
+        """
+        scored = []
+        for item in items:
+            result = self.score(parse_price(item.get('当前售价')))
+            if result is not None:
+                result["is_anomaly"] = result["z"] >= anomaly_z
+            scored.append((item, result))
+        return sorted(scored, key=lambda pair: pair[1]["z"] if pair[1] else float('-inf'), reverse=True)
+
+    @classmethod
+    def from_history(cls, keyword: str, days: int = HISTORY_SEED_DAYS, **kwargs) -> "KeywordPriceModel":
+        """用价格历史中该关键词最近的价格初始化模型，避免每次运行都从零开始积累样本。"""
+        model = cls(**kwargs)
+        try:
+            rows = get_price_history_store().keyword_prices(keyword, time.time() - days * 86400)
+        except Exception as e:
+            print(f"LOG: 读取价格历史失败，价格模型将从本次搜索结果开始积累: {e}")
+            rows = []
+        model.update(price for _, price in rows)
+        return model
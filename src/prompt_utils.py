@@ -5,7 +5,7 @@ import sys
 
 import aiofiles
 
-from src.config import MODEL_NAME, client
+from src.config import MODEL_NAME, get_client
 
 # The meta-prompt to instruct the AI
 META_PROMPT_TEMPLATE = """
@@ -38,6 +38,7 @@ async def generate_criteria(user_description: str, reference_file_path: str) ->
     """
     Generates a new criteria file content using AI.
     """
+    client = get_client()
     if not client:
         raise RuntimeError("AI客户端未初始化，无法生成分析标准。请检查.env配置。")
 
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from src.config import PROFILE_DIR, SPIDER_PROFILE_INTERVAL_MS
+from src.task_logs import task_log_slug
+
+# 每个任务保留的性能分析报告数，超出后删除最旧的
+MAX_REPORTS_PER_TASK = 20
+# 单个采样栈的最大深度
+MAX_STACK_DEPTH = 128
+# 报告 id 的格式：时间戳-进程号，用于校验下载请求中的 id
+_REPORT_ID_PATTERN = re.compile(r"^\d{8}-\d{6}-\d+$")
+# 事件循环空闲等待时栈顶所在的函数 (等待网络/浏览器响应)
+_IDLE_FUNCTIONS = {"select", "poll", "epoll", "kqueue", "_poll", "wait"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RunProfiler:
+    """
+    爬虫运行的采样分析器。
+    后台线程按固定间隔读取目标线程（事件循环所在线程）的Python调用栈，
+    汇总为火焰图工具 (flamegraph.pl / speedscope) 可直接读取的折叠栈格式；
+    同时通过事件循环的任务工厂记录每个 asyncio 任务从创建到结束的墙钟时间。
+    只读取调用栈、不使用 sys.setprofile，开销与采样间隔有关而与代码执行量无关。
+    """
+
+    def __init__(self, interval_ms: float = SPIDER_PROFILE_INTERVAL_MS):
+        self.interval = max(interval_ms, 1) / 1000
+        self.stacks = Counter()
+        self.samples = 0
+        self.task_times = {}  # 协程名 -> {"count", "total_seconds", "max_seconds"}
+        self._pending_tasks = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._target_thread_id = None
+        self._loop = None
+        self._previous_factory = None
+        self._started_at = None
+        self._stopped_at = None
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self._target_thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(labels))] += 1
+            self.samples += 1
+
+    def _record_task(self, name: str, seconds: float):
+        stats = self.task_times.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        stats["count"] += 1
+        stats["total_seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        name = getattr(coro, "__qualname__", type(coro).__name__)
+        self._pending_tasks[task] = (name, time.perf_counter())
+
+        def on_done(done_task):
+            entry = self._pending_tasks.pop(done_task, None)
+            if entry is not None:
+                self._record_task(entry[0], time.perf_counter() - entry[1])
+
+        task.add_done_callback(on_done)
+        return task
+
+    def start(self):
+        """在事件循环中调用，开始对当前线程采样。"""
+        self._loop = asyncio.get_running_loop()
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._task_factory)
+        self._target_thread_id = threading.get_ident()
+        self._started_at = time.time()
+        self._thread = threading.Thread(target=self._sample_loop, name="run-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> dict:
+        """停止采样并返回报告。"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._loop is not None:
+            self._loop.set_task_factory(self._previous_factory)
+        self._stopped_at = time.time()
+        now = time.perf_counter()
+        # 停止时仍未结束的任务按已运行时间计入
+        for name, started in self._pending_tasks.values():
+            self._record_task(f"{name} (未结束)", now - started)
+        self._pending_tasks.clear()
+        return self.report()
+
+    def report(self, top: int = 30) -> dict:
+        """生成报告：折叠栈文本，以及按函数自身/累计采样数排序的前 top 项和 asyncio 任务耗时。"""
+        self_counts = Counter()
+        inclusive_counts = Counter()
+        idle_samples = 0
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                inclusive_counts[label] += count
+            if frames[-1].split(" ", 1)[0] in _IDLE_FUNCTIONS:
+                idle_samples += count
+
+        def ranked(counter):
+            return [{"function": label, "samples": count,
+                     "percent": round(count * 100 / self.samples, 1) if self.samples else 0.0}
+                    for label, count in counter.most_common(top)]
+
+        tasks = sorted(
+            ({"coroutine": name, "count": stats["count"],
+              "total_seconds": round(stats["total_seconds"], 3), "max_seconds": round(stats["max_seconds"], 3)}
+             for name, stats in self.task_times.items()),
+            key=lambda item: item["total_seconds"], reverse=True,
+        )
+        return {
+            "started_at": datetime.fromtimestamp(self._started_at).isoformat() if self._started_at else None,
+            "duration_seconds": round((self._stopped_at or time.time()) - (self._started_at or time.time()), 3),
+            "interval_ms": round(self.interval * 1000, 3),
+            "samples": self.samples,
+            # 事件循环空闲 (等待网络、浏览器或 sleep) 的采样占比
+            "idle_percent": round(idle_samples * 100 / self.samples, 1) if self.samples else 0.0,
+            "top_self": ranked(self_counts),
+            "top_inclusive": ranked(inclusive_counts),
+            "asyncio_tasks": tasks[:top],
+            "collapsed": "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()),
+        }
+
+
+def profile_dir(task_name: str, base_dir: str = PROFILE_DIR) -> str:
+    return os.path.join(base_dir, task_log_slug(task_name))
+
+
+def save_profile_report(task_name: str, report: dict, base_dir: str = PROFILE_DIR) -> str:
+    """
+    保存报告：<id>.collapsed 为折叠栈文本，<id>.json 为摘要。返回报告 id。
+    每个任务只保留最近 MAX_REPORTS_PER_TASK 份报告。
+    """
+    directory = profile_dir(task_name, base_dir)
+    os.makedirs(directory, exist_ok=True)
+    report_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    summary = {k: v for k, v in report.items() if k != "collapsed"}
+    summary.update({"id": report_id, "task_name": task_name})
+    with open(os.path.join(directory, f"{report_id}.collapsed"), 'w', encoding='utf-8') as f:
+        f.write(report.get("collapsed", "") + "\n")
+    with open(os.path.join(directory, f"{report_id}.json"), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    for old_id in [item["id"] for item in list_profile_reports(task_name, base_dir)][MAX_REPORTS_PER_TASK:]:
+        for ext in (".collapsed", ".json"):
+            try:
+                os.remove(os.path.join(directory, f"{old_id}{ext}"))
+            except OSError:
+                pass
+    return report_id
+
+
+def list_profile_reports(task_name: str, base_dir: str = PROFILE_DIR) -> list:
+    """返回任务的报告摘要列表（不含函数排行），最近的在前。"""
+    directory = profile_dir(task_name, base_dir)
+    if not os.path.isdir(directory):
+        return []
+    reports = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        reports.append({key: summary.get(key) for key in
+                        ("id", "started_at", "duration_seconds", "samples", "idle_percent")})
+    return reports
+
+
+def profile_report_path(task_name: str, report_id: str, fmt: str, base_dir: str = PROFILE_DIR) -> str | None:
+    """返回报告文件路径 (fmt 为 collapsed 或 json)；id 格式不合法或文件不存在时返回 None。"""
+    if fmt not in ("collapsed", "json") or not _REPORT_ID_PATTERN.match(report_id):
+        return None
+    path = os.path.join(profile_dir(task_name, base_dir), f"{report_id}.{fmt}")
+    return path if os.path.exists(path) else None
@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+
+from src.config import MAX_CONCURRENT_SPIDERS
+from src.metrics import get_metrics
+
+# 手动运行的优先级，高于任何任务配置的优先级
+MANUAL_RUN_PRIORITY = 1000
+
+
+def _percentile(sorted_values: list, ratio: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(ratio * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RunQueue:
+    """
+    位于调度器和进程启动之间的全局运行队列。
+    - 同时运行的爬虫数不超过 max_concurrent，其余运行按优先级（相同优先级按入队顺序）排队；
+    - 同一任务已在排队或运行中时，新的运行请求被合并，不会重复运行；
+    - 记录每次运行的排队等待时间，供 API 查询。
+
+    launcher(task_name) 是启动一次运行的协程函数，返回在运行结束时完成的 awaitable，
+    无法启动时返回 None。
+    """
+
+    def __init__(self, launcher, max_concurrent: int = MAX_CONCURRENT_SPIDERS, history_size: int = 200):
+        self.launcher = launcher
+        self.max_concurrent = max(1, max_concurrent)
+        self._heap = []
+        self._pending = {}  # task_name -> 排队记录
+        self._running = {}  # task_name -> 运行记录
+        self._run_tasks = set()
+        self._seq = itertools.count()
+        self._waits = deque(maxlen=history_size)
+        self._closed = False
+        self.counters = {"enqueued": 0, "coalesced": 0, "dispatched": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    def submit(self, task_name: str, priority: int = 0, source: str = "schedule") -> dict:
+        """
+        提交一次运行请求，返回 {"status": "queued" | "started" | "coalesced", "position": 排队位置}。
+        已在排队的任务以较高的优先级为准；已在运行的任务直接合并。
+        """
+        priority = priority or 0
+        if task_name in self._running:
+            self.counters["coalesced"] += 1
+            return {"status": "coalesced", "position": None}
+
+        entry = self._pending.get(task_name)
+        if entry is not None:
+            self.counters["coalesced"] += 1
+            if priority > entry["priority"]:
+                entry["priority"] = priority
+                entry["seq"] = next(self._seq)
+                heapq.heappush(self._heap, (-priority, entry["seq"], task_name))
+            return {"status": "coalesced", "position": self.position(task_name)}
+
+        entry = {
+            "task_name": task_name,
+            "priority": priority,
+            "source": source,
+            "seq": next(self._seq),
+            "enqueued_at": time.time(),
+        }
+        self._pending[task_name] = entry
+        heapq.heappush(self._heap, (-priority, entry["seq"], task_name))
+        self.counters["enqueued"] += 1
+        self._dispatch()
+        if task_name in self._running:
+            return {"status": "started", "position": None}
+        return {"status": "queued", "position": self.position(task_name)}
+
+    def cancel(self, task_name: str) -> bool:
+        """取消排队中的运行，已开始的运行不受影响。"""
+        if self._pending.pop(task_name, None) is None:
+            return False
+        self.counters["cancelled"] += 1
+        return True
+
+    def is_pending(self, task_name: str) -> bool:
+        return task_name in self._pending
+
+    def is_running(self, task_name: str) -> bool:
+        return task_name in self._running
+
+    def _ordered_pending(self) -> list:
+        return sorted(self._pending.values(), key=lambda entry: (-entry["priority"], entry["seq"]))
+
+    def position(self, task_name: str) -> int | None:
+        """任务在队列中的位置 (从1开始)，不在队列中时返回 None。"""
+        for index, entry in enumerate(self._ordered_pending(), start=1):
+            if entry["task_name"] == task_name:
+                return index
+        return None
+
+    def _pop_next(self) -> dict | None:
+        while self._heap:
+            _, seq, task_name = heapq.heappop(self._heap)
+            entry = self._pending.get(task_name)
+            # 已取消或优先级被提升后留下的旧记录
+            if entry is None or entry["seq"] != seq:
+                continue
+            del self._pending[task_name]
+            return entry
+        return None
+
+    def _dispatch(self):
+        while not self._closed and len(self._running) < self.max_concurrent:
+            entry = self._pop_next()
+            if entry is None:
+                return
+            entry["started_at"] = time.time()
+            entry["wait_seconds"] = entry["started_at"] - entry["enqueued_at"]
+            self._waits.append(entry["wait_seconds"])
+            get_metrics().observe("goofish_run_queue_wait_seconds", entry["wait_seconds"])
+            self._running[entry["task_name"]] = entry
+            self.counters["dispatched"] += 1
+            run_task = asyncio.create_task(self._run(entry))
+            self._run_tasks.add(run_task)
+            run_task.add_done_callback(self._run_tasks.discard)
+
+    async def _run(self, entry: dict):
+        task_name = entry["task_name"]
+        try:
+            waiter = await self.launcher(task_name)
+            if waiter is not None:
+                await waiter
+            self.counters["completed"] += 1
+        except Exception as e:
+            self.counters["failed"] += 1
+            print(f"运行队列启动任务 '{task_name}' 时出错: {e}")
+        finally:
+            self._running.pop(task_name, None)
+            self._dispatch()
+
+    def stats(self) -> dict:
+        """队列状态和排队等待时间统计。"""
+        now = time.time()
+        waits = sorted(self._waits)
+        wait_stats = {"count": len(waits), "avg_seconds": None, "p50_seconds": None,
+                      "p95_seconds": None, "max_seconds": None}
+        if waits:
+            wait_stats.update({
+                "avg_seconds": round(sum(waits) / len(waits), 3),
+                "p50_seconds": round(_percentile(waits, 0.5), 3),
+                "p95_seconds": round(_percentile(waits, 0.95), 3),
+                "max_seconds": round(waits[-1], 3),
+            })
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": [
+                {"task_name": entry["task_name"], "priority": entry["priority"], "source": entry["source"],
+                 "wait_seconds": round(entry["wait_seconds"], 3),
+                 "running_seconds": round(now - entry["started_at"], 3)}
+                for entry in self._running.values()
+            ],
+            "pending": [
+                {"task_name": entry["task_name"], "priority": entry["priority"], "source": entry["source"],
+                 "position": index, "waiting_seconds": round(now - entry["enqueued_at"], 3)}
+                for index, entry in enumerate(self._ordered_pending(), start=1)
+            ],
+            "counters": dict(self.counters),
+            "wait": wait_stats,
+        }
+
+    def close(self):
+        """清空排队中的运行并停止派发，已开始的运行不受影响。"""
+        self._closed = True
+        self._pending.clear()
+        self._heap.clear()
+
+    async def join(self):
+        """等待已开始的运行全部结束。"""
+        if self._run_tasks:
+            await asyncio.gather(*self._run_tasks, return_exceptions=True)
@@ -0,0 +1,110 @@
+import hashlib
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+
+# "每 N 分钟自动错开" 的调度写法，填写在任务的 cron 字段中，如 "@every 30m"、"@every 2h"
+_EVERY_PATTERN = re.compile(r"^@every\s+(\d+)\s*([mh])$", re.IGNORECASE)
+
+
+def task_offset_seconds(task_name: str, window_seconds: int) -> int:
+    """由任务名哈希得到 [0, window_seconds) 内的固定偏移量，同一任务每次计算结果相同。"""
+    if window_seconds <= 0:
+        return 0
+    digest = hashlib.sha1(task_name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % window_seconds
+
+
+def parse_every(cron_str: str) -> int | None:
+    """解析 "@every 30m" / "@every 2h" 写法，返回间隔分钟数；不是该写法时返回 None。"""
+    match = _EVERY_PATTERN.match((cron_str or "").strip())
+    if not match:
+        return None
+    minutes = int(match.group(1)) * (60 if match.group(2).lower() == "h" else 1)
+    if minutes <= 0:
+        raise ValueError("间隔必须大于 0")
+    return minutes
+
+
+class OffsetTrigger(BaseTrigger):
+    """将另一个触发器的每次触发时间整体推后固定秒数，用于错开同一时刻的定时任务。"""
+
+    def __init__(self, trigger: BaseTrigger, offset_seconds: int):
+        self.trigger = trigger
+        self.offset = timedelta(seconds=offset_seconds)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        base_previous = previous_fire_time - self.offset if previous_fire_time else None
+        next_time = self.trigger.get_next_fire_time(base_previous, now - self.offset)
+        return next_time + self.offset if next_time else None
+
+    def __str__(self):
+        return f"{self.trigger} +{int(self.offset.total_seconds())}s"
+
+    def __repr__(self):
+        return f"<OffsetTrigger ({self.trigger!r}, offset={int(self.offset.total_seconds())}s)>"
+
+
+def spread_interval_offsets(task_intervals: dict) -> dict:
+    """
+    为 "@every N" 任务分配偏移量：间隔相同的任务按任务名排序后在一个周期内等距分布，
+    例如三个每30分钟运行的任务分别在第 0、10、20 分钟运行。返回 {任务名: 偏移秒数}。
+    """
+    groups = {}
+    for task_name, minutes in task_intervals.items():
+        groups.setdefault(minutes, []).append(task_name)
+    offsets = {}
+    for minutes, names in groups.items():
+        step = minutes * 60 / len(names)
+        for index, task_name in enumerate(sorted(names)):
+            offsets[task_name] = int(index * step)
+    return offsets
+
+
+def build_interval_trigger(minutes: int, offset_seconds: int, timezone) -> IntervalTrigger:
+    """每 minutes 分钟触发一次，以当天零点加偏移量为起点，因此重启服务后触发时刻不变。"""
+    anchor = datetime.now(timezone).replace(hour=0, minute=0, second=0, microsecond=0)
+    return IntervalTrigger(minutes=minutes, start_date=anchor + timedelta(seconds=offset_seconds), timezone=timezone)
+
+
+def build_load_histogram(triggers: dict, start: datetime, hours: int = 24) -> dict:
+    """
+    统计 [start, start + hours) 内各任务的触发次数。
+    triggers 为 {任务名: 触发器}；返回按小时的运行数，以及同一分钟内触发次数最多的时刻。
+    """
+    end = start + timedelta(hours=hours)
+    per_hour = Counter()
+    per_minute = Counter()
+    tasks_per_hour = {}
+    for task_name, trigger in triggers.items():
+        fire_time = trigger.get_next_fire_time(None, start)
+        while fire_time is not None and fire_time < end:
+            hour = fire_time.replace(minute=0, second=0, microsecond=0)
+            per_hour[hour] += 1
+            per_minute[fire_time.replace(second=0, microsecond=0)] += 1
+            tasks_per_hour.setdefault(hour, set()).add(task_name)
+            previous = fire_time
+            fire_time = trigger.get_next_fire_time(previous, previous + timedelta(microseconds=1))
+
+    buckets = []
+    hour = start.replace(minute=0, second=0, microsecond=0)
+    while hour < end:
+        buckets.append({
+            "hour": hour.isoformat(),
+            "runs": per_hour.get(hour, 0),
+            "tasks": sorted(tasks_per_hour.get(hour, ())),
+        })
+        hour += timedelta(hours=1)
+    peak_minute, peak_runs = max(per_minute.items(), key=lambda item: item[1]) if per_minute else (None, 0)
+    return {
+        "start": start.isoformat(),
+        "hours": hours,
+        "total_runs": sum(per_hour.values()),
+        "max_runs_per_hour": max(per_hour.values()) if per_hour else 0,
+        "peak_minute": peak_minute.isoformat() if peak_minute else None,
+        "max_runs_per_minute": peak_runs,
+        "histogram": buckets,
+    }
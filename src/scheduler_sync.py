@@ -0,0 +1,113 @@
+from apscheduler.triggers.cron import CronTrigger
+
+from src.config import SCHEDULE_SPREAD_SECONDS
+from src.schedule_spread import (
+    OffsetTrigger,
+    build_interval_trigger,
+    parse_every,
+    spread_interval_offsets,
+    task_offset_seconds,
+)
+
+
+def task_job_id(task_id: int) -> str:
+    return f"task_{task_id}"
+
+
+class SchedulerReconciler:
+    """
+    将任务配置同步到调度器：比较期望的定时任务与已注册的定时任务，只新增、修改或删除有变化的部分。
+    未变化的定时任务保持原样，下次运行时间和错过触发 (misfire) 的记录都不受影响；
+    只有定时规则或错开偏移变化时才重新计算触发器。
+    """
+
+    def __init__(self, scheduler, job_func, spread_seconds: int = SCHEDULE_SPREAD_SECONDS):
+        self.scheduler = scheduler
+        self.job_func = job_func
+        self.spread_seconds = spread_seconds
+        # job_id -> (任务名, 定时规则, 偏移秒数)，与调度器中已注册的定时任务一一对应
+        self._signatures = {}
+
+    def desired_jobs(self, tasks: list) -> dict:
+        """根据任务列表计算期望的定时任务 {job_id: (task_id, 任务名, 定时规则, 偏移秒数)}。"""
+        schedulable = [task for task in tasks
+                       if task.get("task_name") and task.get("cron") and task.get("enabled", False)]
+
+        # "@every N" 任务：间隔相同的任务在一个周期内等距错开
+        intervals = {}
+        for task in schedulable:
+            try:
+                minutes = parse_every(task["cron"])
+            except ValueError:
+                continue
+            if minutes:
+                intervals[task["task_name"]] = minutes
+        interval_offsets = spread_interval_offsets(intervals)
+
+        desired = {}
+        for task in schedulable:
+            task_name = task["task_name"]
+            if task_name in interval_offsets:
+                offset = interval_offsets[task_name]
+            else:
+                # 按任务名哈希得到固定偏移，错开设置在同一时刻的任务
+                offset = task_offset_seconds(task_name, self.spread_seconds)
+            desired[task_job_id(task["id"])] = (task["id"], task_name, task["cron"], offset)
+        return desired
+
+    def build_trigger(self, cron_str: str, offset: int):
+        every_minutes = parse_every(cron_str)
+        if every_minutes:
+            return build_interval_trigger(every_minutes, offset, self.scheduler.timezone)
+        # 使用 CronTrigger.from_crontab 更稳健
+        trigger = CronTrigger.from_crontab(cron_str)
+        return OffsetTrigger(trigger, offset) if offset else trigger
+
+    def reconcile(self, tasks: list) -> dict:
+        """同步调度器，返回 {"added": [...], "updated": [...], "rescheduled": [...], "removed": [...]} (任务名或 job_id)。"""
+        desired = self.desired_jobs(tasks)
+        changes = {"added": [], "updated": [], "rescheduled": [], "removed": []}
+
+        for job_id in [job_id for job_id in self._signatures if job_id not in desired]:
+            del self._signatures[job_id]
+            if self.scheduler.get_job(job_id):
+                self.scheduler.remove_job(job_id)
+            changes["removed"].append(job_id)
+            print(f"  -> 已移除定时任务 {job_id}")
+
+        for job_id, (task_id, task_name, cron_str, offset) in desired.items():
+            signature = (task_name, cron_str, offset)
+            current = self._signatures.get(job_id)
+            if current == signature:
+                continue
+            offset_note = f" (错开 {offset} 秒)" if offset else ""
+            try:
+                if current is None:
+                    self.scheduler.add_job(
+                        self.job_func,
+                        trigger=self.build_trigger(cron_str, offset),
+                        args=[task_id, task_name],
+                        id=job_id,
+                        name=f"Scheduled: {task_name}",
+                        replace_existing=True
+                    )
+                    changes["added"].append(task_name)
+                    print(f"  -> 已为任务 '{task_name}' 添加定时规则: '{cron_str}'{offset_note}")
+                else:
+                    if current[0] != task_name:
+                        self.scheduler.modify_job(job_id, args=(task_id, task_name), name=f"Scheduled: {task_name}")
+                        changes["updated"].append(task_name)
+                    if current[1:] != signature[1:]:
+                        self.scheduler.reschedule_job(job_id, trigger=self.build_trigger(cron_str, offset))
+                        changes["rescheduled"].append(task_name)
+                        print(f"  -> 已将任务 '{task_name}' 的定时规则更新为: '{cron_str}'{offset_note}")
+            except ValueError as e:
+                print(f"  -> [警告] 任务 '{task_name}' 的 Cron 表达式 '{cron_str}' 无效，已跳过: {e}")
+                if current is not None:
+                    if self.scheduler.get_job(job_id):
+                        self.scheduler.remove_job(job_id)
+                    changes["removed"].append(job_id)
+                self._signatures.pop(job_id, None)
+                continue
+            self._signatures[job_id] = signature
+        return changes
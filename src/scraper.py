@@ -1,9 +1,11 @@
 import asyncio
+import contextlib
 import json
 import os
 import random
+import time
 from datetime import datetime
-from urllib.parse import urlencode
+from urllib.parse import parse_qs, urlencode, urlparse
 
 from playwright.async_api import (
     Response,
@@ -12,20 +14,29 @@ from playwright.async_api import (
 )
 
 from src.ai_handler import (
-    download_all_images,
+    download_item_images,
     get_ai_analysis,
-    send_ntfy_notification,
     cleanup_task_images,
+    remote_image_urls_enabled,
+    remove_downloaded_images,
 )
 from src.config import (
     AI_DEBUG_MODE,
     API_URL_PATTERN,
     DETAIL_API_URL_PATTERN,
+    IMAGE_HASH_DEDUP,
     LOGIN_IS_EDGE,
+    PRESCREEN,
+    PRICE_SCORE_IN_PROMPT,
     RUN_HEADLESS,
     RUNNING_IN_DOCKER,
     STATE_FILE,
 )
+from src.item_tracker import ItemTracker
+from src.memory_monitor import memory_stage
+from src.metrics import get_metrics
+from src.mtop_client import FetchStats, ItemFetchMeter, PageMtopClient, is_success
+from src.notification_outbox import enqueue_notification
 from src.parsers import (
     _parse_search_results_json,
     _parse_user_items_data,
@@ -33,6 +44,8 @@ from src.parsers import (
     parse_ratings_data,
     parse_user_head_data,
 )
+from src.price_history import record_search_prices
+from src.price_model import KeywordPriceModel
 from src.utils import (
     format_registration_days,
     get_link_unique_key,
@@ -42,13 +55,26 @@ from src.utils import (
 )
 
 
-async def scrape_user_profile(context, user_id: str) -> dict:
+async def fetch_item_images(item_data: dict, task_name: str) -> list:
+    """
+    按配置下载商品图片：内存模式返回图片字节（超限部分为落盘路径），否则返回本地文件路径。
+    AI直接使用图片URL且无需计算图片哈希时，不下载图片；服务商拒绝远程URL后恢复正常下载。
+    """
+    if remote_image_urls_enabled() and not IMAGE_HASH_DEDUP:
+        return []
+    return await download_item_images(item_data['商品ID'], item_data.get('商品图片列表', []), task_name)
+
+
+async def scrape_user_profile(context, user_id: str, meter: ItemFetchMeter | None = None) -> dict:
     """
     【新版】访问指定用户的个人主页，按顺序采集其摘要信息、完整的商品列表和完整的评价列表。
+    meter 不为空时统计页面加载的传输字节数。
     """
     print(f"   -> 开始采集用户ID: {user_id} 的完整信息...")
     profile_data = {}
     page = await context.new_page()
+    if meter is not None:
+        meter.track_page(page)
 
     # 为各项异步任务准备Future和数据容器
     head_api_future = asyncio.get_event_loop().create_future()
@@ -132,16 +158,208 @@ async def scrape_user_profile(context, user_id: str) -> dict:
         print(f"   [错误] 采集用户 {user_id} 信息时发生错误: {e}")
     finally:
         page.remove_listener("response", handle_response)
+        if meter is not None:
+            await meter.collect_page_sizes()
         await page.close()
         print(f"   -> 用户 {user_id} 信息采集完成。")
 
     return profile_data
 
 
-async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
+async def _fetch_card_pages(client: PageMtopClient, api: str, data: dict, meter: ItemFetchMeter,
+                            max_pages: int = 50) -> list:
+    """按页调用卖家商品/评价列表接口，直到 nextPage 为 false，返回所有 cardList。"""
+    cards = []
+    for page_number in range(1, max_pages + 1):
+        payload, size = await client.request(api, {**data, "pageNumber": page_number})
+        meter.add_bytes(size)
+        if not is_success(payload):
+            raise RuntimeError(f"{api} 调用失败: {payload.get('ret')}")
+        page_data = payload.get('data', {})
+        cards.extend(page_data.get('cardList', []))
+        if not page_data.get('nextPage', False):
+            break
+        await random_sleep(0.5, 1.5)
+    return cards
+
+
+async def scrape_user_profile_via_api(client: PageMtopClient, user_id: str, meter: ItemFetchMeter) -> dict | None:
+    """
+    API 模式：通过搜索页直接调用卖家主页的头部、商品列表和评价列表接口，
+    结果交给与导航模式相同的解析函数。任一接口失败时返回 None，由调用方改用导航模式。
+    """
+    print(f"   -> [API模式] 开始采集用户ID: {user_id} 的完整信息...")
+    try:
+        head_data, size = await client.request("mtop.idle.web.user.page.head", {"self": False, "userId": user_id})
+        meter.add_bytes(size)
+        if not is_success(head_data):
+            raise RuntimeError(f"用户头部信息接口调用失败: {head_data.get('ret')}")
+        profile_data = await parse_user_head_data(head_data)
+
+        all_items = await _fetch_card_pages(
+            client, "mtop.idle.web.xyh.item.list",
+            {"needGroupInfo": False, "userId": user_id, "pageSize": 20}, meter,
+        )
+        profile_data["卖家发布的商品列表"] = await _parse_user_items_data(all_items)
+
+        all_ratings = await _fetch_card_pages(
+            client, "mtop.idle.web.trade.rate.list",
+            {"cardType": 0, "userId": user_id, "pageSize": 20}, meter,
+        )
+        profile_data['卖家收到的评价列表'] = await parse_ratings_data(all_ratings)
+        profile_data.update(await calculate_reputation_from_ratings(all_ratings))
+    except Exception as e:
+        print(f"   [API模式] 采集用户 {user_id} 信息失败，改用页面导航: {e}")
+        return None
+    print(f"   -> [API模式] 用户 {user_id} 信息采集完成 (商品 {len(all_items)} 件，评价 {len(all_ratings)} 条)。")
+    return profile_data
+
+
+async def fetch_detail_by_navigation(context, item_url: str, meter: ItemFetchMeter) -> dict | None:
+    """打开商品详情页并拦截详情接口的响应，返回响应JSON；响应失败时返回 None。"""
+    detail_page = await context.new_page()
+    meter.track_page(detail_page)
+    try:
+        async with detail_page.expect_response(lambda r: DETAIL_API_URL_PATTERN in r.url, timeout=25000) as detail_info:
+            await detail_page.goto(item_url, wait_until="domcontentloaded", timeout=25000)
+
+        detail_response = await detail_info.value
+        if detail_response.ok:
+            return await detail_response.json()
+
+        print(f"   错误: 获取商品详情API响应失败，状态码: {detail_response.status}")
+        if AI_DEBUG_MODE:
+            print(f"--- [DETAIL DEBUG] FAILED RESPONSE from {item_url} ---")
+            try:
+                print(await detail_response.text())
+            except Exception as e:
+                print(f"无法读取响应内容: {e}")
+            print("----------------------------------------------------")
+        return None
+    finally:
+        await meter.collect_page_sizes()
+        await detail_page.close()
+
+
+async def fetch_detail_via_api(client: PageMtopClient, item_id: str, meter: ItemFetchMeter) -> dict | None:
+    """
+    API 模式：直接调用商品详情接口。成功或触发反爬验证时返回响应JSON（后者由调用方处理），
+    其他失败返回 None，由调用方改用导航模式。
+    """
+    try:
+        payload, size = await client.request("mtop.taobao.idle.pc.detail", {"itemId": item_id})
+    except Exception as e:
+        print(f"   [API模式] 调用商品详情接口出错，改用页面导航: {e}")
+        return None
+    meter.add_bytes(size)
+    if is_success(payload) or "FAIL_SYS_USER_VALIDATE" in str(payload.get('ret', [])):
+        return payload
+    print(f"   [API模式] 商品详情接口返回失败，改用页面导航: {payload.get('ret')}")
+    return None
+
+
+# 搜索接口名，与页面搜索时调用的接口相同
+SEARCH_API = API_URL_PATTERN.rsplit("/", 1)[-1]
+
+
+def search_request_data(response: Response) -> dict | None:
+    """取出页面初始搜索请求的 data 参数，作为直接请求筛选结果时的基础参数；无法解析时返回 None。"""
+    try:
+        request = response.request
+        values = parse_qs(request.post_data or "").get("data") or parse_qs(urlparse(request.url).query).get("data")
+        return json.loads(values[0]) if values else None
+    except (TypeError, ValueError):
+        return None
+
+
+def build_filtered_search_data(base_data: dict, page_number: int, personal_only: bool = False,
+                               min_price=None, max_price=None) -> dict:
+    """
+    在初始搜索参数上加入“最新”排序、个人闲置和价格区间筛选，
+    对应在页面上依次点击“新发布”->“最新”、“个人闲置”并填写价格后页面发出的请求。
+    """
+    search_filters = []
+    if min_price or max_price:
+        search_filters.append(f"priceRange:{min_price or 0},{max_price or ''};")
+    if personal_only:
+        search_filters.append("quickFilter:filterPersonal;")
+    data = {**base_data, "pageNumber": page_number, "sortField": "create", "sortValue": "desc"}
+    if search_filters:
+        data["fromFilter"] = True
+        data["propValueStr"] = {"searchFilter": "".join(search_filters)}
+    return data
+
+
+async def fetch_filtered_search_page(client: PageMtopClient, base_data: dict, page_number: int,
+                                     personal_only: bool = False, min_price=None, max_price=None) -> dict | None:
+    """通过搜索页直接请求一页已排序、已筛选的搜索结果；接口失败或响应中没有商品列表时返回 None。"""
+    data = build_filtered_search_data(base_data, page_number, personal_only, min_price, max_price)
+    try:
+        payload, _ = await client.request(SEARCH_API, data)
+    except Exception as e:
+        print(f"LOG: 直接请求第 {page_number} 页筛选结果失败: {e}")
+        return None
+    if not is_success(payload) or not isinstance(payload.get('data'), dict) or 'resultList' not in payload['data']:
+        print(f"LOG: 直接请求第 {page_number} 页筛选结果失败: {payload.get('ret')}")
+        return None
+    return payload
+
+
+async def apply_filters_by_clicking(page, personal_only: bool, min_price, max_price) -> Response | None:
+    """在页面上逐个点击筛选项，返回最后一次筛选触发的搜索响应。每一步都要等待新的搜索请求。"""
+    final_response = None
+    await page.click('text=新发布')
+    await random_sleep(2, 4) # 原来是 (1.5, 2.5)
+    async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
+        await page.click('text=最新')
+        # --- 修改: 增加排序后的等待时间 ---
+        await random_sleep(4, 7) # 原来是 (3, 5)
+    final_response = await response_info.value
+
+    if personal_only:
+        async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
+            await page.click('text=个人闲置')
+            # --- 修改: 将固定等待改为随机等待，并加长 ---
+            await random_sleep(4, 6) # 原来是 asyncio.sleep(5)
+        final_response = await response_info.value
+
+    if min_price or max_price:
+        price_container = page.locator('div[class*="search-price-input-container"]').first
+        if await price_container.is_visible():
+            if min_price:
+                await price_container.get_by_placeholder("¥").first.fill(min_price)
+                # --- 修改: 将固定等待改为随机等待 ---
+                await random_sleep(1, 2.5) # 原来是 asyncio.sleep(5)
+            if max_price:
+                await price_container.get_by_placeholder("¥").nth(1).fill(max_price)
+                # --- 修改: 将固定等待改为随机等待 ---
+                await random_sleep(1, 2.5) # 原来是 asyncio.sleep(5)
+
+            async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
+                await page.keyboard.press('Tab')
+                # --- 修改: 增加确认价格后的等待时间 ---
+                await random_sleep(4, 7) # 原来是 asyncio.sleep(5)
+            final_response = await response_info.value
+        else:
+            print("LOG: 警告 - 未找到价格输入容器。")
+    return final_response
+
+
+async def launch_browser(playwright):
+    """按运行环境启动浏览器：Edge、Docker 内置 Chromium 或本地 Chrome。"""
+    if LOGIN_IS_EDGE:
+        return await playwright.chromium.launch(headless=RUN_HEADLESS, channel="msedge")
+    # Docker环境内，使用Playwright自带的chromium；本地环境，使用系统安装的Chrome
+    if RUNNING_IN_DOCKER:
+        return await playwright.chromium.launch(headless=RUN_HEADLESS)
+    return await playwright.chromium.launch(headless=RUN_HEADLESS, channel="chrome")
+
+
+async def scrape_xianyu(task_config: dict, debug_limit: int = 0, browser=None):
     """
     【核心执行器】
     根据单个任务配置，异步爬取闲鱼商品数据，并对每个新发现的商品进行实时的、独立的AI分析和通知。
+    browser 为预热工作进程提前启动的浏览器，为空时自行启动；任务结束时浏览器都会被关闭。
     """
     keyword = task_config['keyword']
     max_pages = task_config.get('max_pages', 1)
@@ -152,36 +370,36 @@ async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
 
     processed_item_count = 0
     stop_scraping = False
+    task_name = task_config.get('task_name', 'default')
+    metrics = get_metrics()
+    # 获取商品详情和卖家信息的方式：navigate 为逐个打开页面，api 为通过搜索页直接调用接口
+    fetch_mode = task_config.get('fetch_mode') or 'navigate'
+    fetch_stats = FetchStats(task_name)
+    mtop_client = None
+    run_started = time.perf_counter()
+    if IMAGE_HASH_DEDUP:
+        # 图片哈希依赖 numpy，只在开启图片去重时导入，缩短爬虫进程的启动时间
+        from src.image_hash import (
+            compute_image_hashes,
+            match_previous_verdict,
+            record_image_hashes,
+            save_image_hash_index,
+        )
+    prescreen_model = None
+    if PRESCREEN:
+        # 预筛模型同样依赖 numpy，只在开启时导入
+        from src.prescreen import get_prescreen_model, prescreen_verdict
+        prescreen_model = get_prescreen_model()
 
-    processed_links = set()
     output_filename = os.path.join("jsonl", f"{keyword.replace(' ', '_')}_full_data.jsonl")
-    if os.path.exists(output_filename):
-        print(f"LOG: 发现已存在文件 {output_filename}，正在加载历史记录以去重...")
-        try:
-            with open(output_filename, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        record = json.loads(line)
-                        link = record.get('商品信息', {}).get('商品链接', '')
-                        if link:
-                            processed_links.add(get_link_unique_key(link))
-                    except json.JSONDecodeError:
-                        print(f"   [警告] 文件中有一行无法解析为JSON，已跳过。")
-            print(f"LOG: 加载完成，已记录 {len(processed_links)} 个已处理过的商品。")
-        except IOError as e:
-            print(f"   [警告] 读取历史文件时发生错误: {e}")
-    else:
-        print(f"LOG: 输出文件 {output_filename} 不存在，将创建新文件。")
-
-    async with async_playwright() as p:
-        if LOGIN_IS_EDGE:
-            browser = await p.chromium.launch(headless=RUN_HEADLESS, channel="msedge")
-        else:
-            # Docker环境内，使用Playwright自带的chromium；本地环境，使用系统安装的Chrome
-            if RUNNING_IN_DOCKER:
-                browser = await p.chromium.launch(headless=RUN_HEADLESS)
-            else:
-                browser = await p.chromium.launch(headless=RUN_HEADLESS, channel="chrome")
+    processed_links = ItemTracker(output_filename)
+    processed_links.load()
+    # 关键词的价格模型，用于在获取详情前为商品打分并排序
+    price_model = await asyncio.get_running_loop().run_in_executor(None, KeywordPriceModel.from_history, keyword)
+
+    async with (async_playwright() if browser is None else contextlib.nullcontext()) as p:
+        if browser is None:
+            browser = await launch_browser(p)
         context = await browser.new_context(storage_state=STATE_FILE, user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3")
         page = await context.new_page()
 
@@ -193,8 +411,9 @@ async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
             print(f"   -> 目标URL: {search_url}")
 
             # 使用 expect_response 在导航的同时捕获初始搜索的API数据
-            async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=30000) as response_info:
-                await page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
+            with metrics.timer("goofish_stage_seconds", stage="search"), memory_stage("search"):
+                async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=30000) as response_info:
+                    await page.goto(search_url, wait_until="domcontentloaded", timeout=60000)
 
             initial_response = await response_info.value
 
@@ -246,98 +465,127 @@ async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
             except PlaywrightTimeoutError:
                 print("LOG: 未检测到广告弹窗。")
 
-            final_response = None
             print("\nLOG: 步骤 2 - 应用筛选条件...")
-            await page.click('text=新发布')
-            await random_sleep(2, 4) # 原来是 (1.5, 2.5)
-            async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
-                await page.click('text=最新')
-                # --- 修改: 增加排序后的等待时间 ---
-                await random_sleep(4, 7) # 原来是 (3, 5)
-            final_response = await response_info.value
-
-            if personal_only:
-                async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
-                    await page.click('text=个人闲置')
-                    # --- 修改: 将固定等待改为随机等待，并加长 ---
-                    await random_sleep(4, 6) # 原来是 asyncio.sleep(5)
-                final_response = await response_info.value
-
-            if min_price or max_price:
-                price_container = page.locator('div[class*="search-price-input-container"]').first
-                if await price_container.is_visible():
-                    if min_price:
-                        await price_container.get_by_placeholder("¥").first.fill(min_price)
-                        # --- 修改: 将固定等待改为随机等待 ---
-                        await random_sleep(1, 2.5) # 原来是 asyncio.sleep(5)
-                    if max_price:
-                        await price_container.get_by_placeholder("¥").nth(1).fill(max_price)
-                        # --- 修改: 将固定等待改为随机等待 ---
-                        await random_sleep(1, 2.5) # 原来是 asyncio.sleep(5)
-
-                    async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
-                        await page.keyboard.press('Tab')
-                        # --- 修改: 增加确认价格后的等待时间 ---
-                        await random_sleep(4, 7) # 原来是 asyncio.sleep(5)
-                    final_response = await response_info.value
-                else:
-                    print("LOG: 警告 - 未找到价格输入容器。")
+            page_client = PageMtopClient(page)
+            # 优先在初始搜索参数上一次性加入排序和筛选条件直接请求，失败时再逐个点击筛选项
+            search_base_data = search_request_data(initial_response)
+            current_payload = None
+            if search_base_data is not None:
+                with metrics.timer("goofish_stage_seconds", stage="search"), memory_stage("search"):
+                    current_payload = await fetch_filtered_search_page(
+                        page_client, search_base_data, 1, personal_only, min_price, max_price)
+            if current_payload is not None:
+                filter_method = 'api'
+                print("LOG: 已通过一次接口请求应用排序和筛选条件。")
+            else:
+                filter_method = 'ui'
+                search_base_data = None
+                print("LOG: 改为在页面上逐个点击筛选项。")
+                final_response = await apply_filters_by_clicking(page, personal_only, min_price, max_price)
+                current_response = final_response if final_response and final_response.ok else initial_response
+                current_payload = await current_response.json() if current_response and current_response.ok else None
 
             print("\nLOG: 所有筛选已完成，开始处理商品列表...")
+            if fetch_mode == 'api':
+                mtop_client = page_client
+                print("LOG: 已启用API模式，商品详情和卖家信息将通过搜索页直接调用接口获取。")
 
-            current_response = final_response if final_response and final_response.ok else initial_response
             for page_num in range(1, max_pages + 1):
                 if stop_scraping: break
                 print(f"\n--- 正在处理第 {page_num}/{max_pages} 页 ---")
 
-                if page_num > 1:
+                if page_num > 1 and search_base_data is not None:
+                    # 页面上的结果未经筛选，翻页同样直接请求接口
+                    await random_sleep(5, 8)
+                    with metrics.timer("goofish_stage_seconds", stage="search"), memory_stage("search"):
+                        current_payload = await fetch_filtered_search_page(
+                            page_client, search_base_data, page_num, personal_only, min_price, max_price)
+                    if current_payload is None:
+                        print(f"LOG: 获取第 {page_num} 页失败，停止翻页。")
+                        break
+                elif page_num > 1:
                     # 查找未被禁用的“下一页”按钮。闲鱼通过添加 'disabled' 类名来禁用按钮，而不是使用 disabled 属性。
                     next_btn = page.locator("[class*='search-pagination-arrow-right']:not([class*='disabled'])")
                     if not await next_btn.count():
                         print("LOG: 已到达最后一页，未找到可用的“下一页”按钮，停止翻页。")
                         break
                     try:
-                        async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
-                            await next_btn.click()
-                            # --- 修改: 增加翻页后的等待时间 ---
-                            await random_sleep(5, 8) # 原来是 (1.5, 3.5)
-                        current_response = await response_info.value
+                        with metrics.timer("goofish_stage_seconds", stage="search"), memory_stage("search"):
+                            async with page.expect_response(lambda r: API_URL_PATTERN in r.url, timeout=20000) as response_info:
+                                await next_btn.click()
+                                # --- 修改: 增加翻页后的等待时间 ---
+                                await random_sleep(5, 8) # 原来是 (1.5, 3.5)
+                            current_response = await response_info.value
                     except PlaywrightTimeoutError:
                         print(f"LOG: 翻页到第 {page_num} 页超时，停止翻页。")
                         break
+                    current_payload = await current_response.json() if current_response and current_response.ok else None
 
-                if not (current_response and current_response.ok):
+                if current_payload is None:
                     print(f"LOG: 第 {page_num} 页响应无效，跳过。")
                     continue
 
-                basic_items = await _parse_search_results_json(await current_response.json(), f"第 {page_num} 页")
+                metrics.inc("goofish_pages_fetched_total", task=task_name)
+                basic_items = await _parse_search_results_json(current_payload, f"第 {page_num} 页")
                 if not basic_items: break
-
-                total_items_on_page = len(basic_items)
-                for i, item_data in enumerate(basic_items, 1):
+                record_search_prices(keyword, basic_items)
+                if page_num == 1:
+                    time_to_first_item = time.perf_counter() - run_started
+                    metrics.observe("goofish_time_to_first_item_seconds", time_to_first_item, method=filter_method)
+                    print(f"LOG: [首个商品] 任务开始 {time_to_first_item:.1f} 秒后拿到第一页商品 (筛选方式: {filter_method})。")
+
+                # 用本页价格更新模型后为商品打分，按价格偏低程度从高到低处理，最划算的商品最先分析和通知
+                price_model.update_from_items(basic_items)
+                scored_items = price_model.score_items(basic_items)
+                anomaly_count = sum(1 for _, score in scored_items if score and score["is_anomaly"])
+                if scored_items[0][1] is not None:
+                    print(f"LOG: 已按价格评分排序本页商品 (样本 {len(price_model)} 个)，其中 {anomaly_count} 个价格明显偏低。")
+
+                total_items_on_page = len(scored_items)
+                for i, (item_data, price_score) in enumerate(scored_items, 1):
                     if debug_limit > 0 and processed_item_count >= debug_limit:
                         print(f"LOG: 已达到调试上限 ({debug_limit})，停止获取新商品。")
                         stop_scraping = True
                         break
 
                     unique_key = get_link_unique_key(item_data["商品链接"])
+                    previous_record = None
+                    item_change = None
                     if unique_key in processed_links:
-                        print(f"   -> [页内进度 {i}/{total_items_on_page}] 商品 '{item_data['商品标题'][:20]}...' 已存在，跳过。")
-                        continue
-
-                    print(f"-> [页内进度 {i}/{total_items_on_page}] 发现新商品，获取详情: {item_data['商品标题'][:30]}...")
+                        item_change = processed_links.change(unique_key, item_data)
+                        if item_change is not None:
+                            previous_record = await asyncio.get_running_loop().run_in_executor(
+                                None, processed_links.previous_record, unique_key)
+                        if previous_record is None:
+                            print(f"   -> [页内进度 {i}/{total_items_on_page}] 商品 '{item_data['商品标题'][:20]}...' 已存在，跳过。")
+                            metrics.inc("goofish_items_total", task=task_name, result="skipped")
+                            continue
+                        print(f"-> [页内进度 {i}/{total_items_on_page}] 已处理过的商品有变动 ({item_change['变动说明']})，重新分析: {item_data['商品标题'][:30]}...")
+                    else:
+                        print(f"-> [页内进度 {i}/{total_items_on_page}] 发现新商品，获取详情: {item_data['商品标题'][:30]}...")
+                    if price_score is not None and price_score["is_anomaly"]:
+                        print(f"   [低价] 当前售价低于同类商品中位数 ¥{price_score['median']:g}，价格评分 z={price_score['z']}。")
                     # --- 修改: 访问详情页前的等待时间，模拟用户在列表页上看了一会儿 ---
                     await random_sleep(3, 6) # 原来是 (2, 4)
 
-                    detail_page = await context.new_page()
+                    meter = ItemFetchMeter('api' if mtop_client is not None else 'navigate')
                     try:
-                        async with detail_page.expect_response(lambda r: DETAIL_API_URL_PATTERN in r.url, timeout=25000) as detail_info:
-                            await detail_page.goto(item_data["商品链接"], wait_until="domcontentloaded", timeout=25000)
-
-                        detail_response = await detail_info.value
-                        if detail_response.ok:
-                            detail_json = await detail_response.json()
-
+                        if previous_record is not None:
+                            # 有变动的已处理商品：复用上次保存的图片列表和卖家信息，价格、标题等字段取自本次搜索结果
+                            item_data = {**previous_record.get('商品信息', {}), **item_data}
+                            user_profile_data = dict(previous_record.get('卖家信息', {}))
+                            user_id = None
+                        else:
+                            detail_json = None
+                            with metrics.timer("goofish_stage_seconds", stage="detail"), memory_stage("detail"):
+                                if mtop_client is not None:
+                                    detail_json = await fetch_detail_via_api(mtop_client, item_data['商品ID'], meter)
+                                if detail_json is None:
+                                    if mtop_client is not None:
+                                        meter.mode = 'api_fallback'
+                                    detail_json = await fetch_detail_by_navigation(context, item_data["商品链接"], meter)
+                            if detail_json is None:
+                                continue
                             ret_string = str(await safe_get(detail_json, 'ret', default=[]))
                             if "FAIL_SYS_USER_VALIDATE" in ret_string:
                                 print("\n==================== CRITICAL BLOCK DETECTED ====================")
@@ -383,107 +631,140 @@ async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
                             user_id = await safe_get(seller_do, 'sellerId')
                             if user_id:
                                 # 新的、高效的调用方式:
-                                user_profile_data = await scrape_user_profile(context, str(user_id))
+                                with metrics.timer("goofish_stage_seconds", stage="user_profile"), memory_stage("user_profile"):
+                                    profile_result = None
+                                    if mtop_client is not None:
+                                        profile_result = await scrape_user_profile_via_api(mtop_client, str(user_id), meter)
+                                    if profile_result is None:
+                                        if mtop_client is not None:
+                                            meter.mode = 'api_fallback'
+                                        profile_result = await scrape_user_profile(context, str(user_id), meter)
+                                    user_profile_data = profile_result
                             else:
                                 print("   [警告] 未能从详情API中获取到卖家ID。")
+                            fetch_stats.record(meter)
                             user_profile_data['卖家芝麻信用'] = zhima_credit_text
                             user_profile_data['卖家注册时长'] = registration_duration_text
 
-                            # 构建基础记录
-                            final_record = {
-                                "爬取时间": datetime.now().isoformat(),
-                                "搜索关键字": keyword,
-                                "任务名称": task_config.get('task_name', 'Untitled Task'),
-                                "商品信息": item_data,
-                                "卖家信息": user_profile_data
-                            }
-
-                            # --- START: Real-time AI Analysis & Notification ---
-                            from src.config import SKIP_AI_ANALYSIS
+                        # 构建基础记录
+                        final_record = {
+                            "爬取时间": datetime.now().isoformat(),
+                            "搜索关键字": keyword,
+                            "任务名称": task_config.get('task_name', 'Untitled Task'),
+                            "商品信息": item_data,
+                            "卖家信息": user_profile_data
+                        }
+                        if PRICE_SCORE_IN_PROMPT:
+                            final_record["价格评分"] = price_score
+                        notify_key = None
+                        if item_change is not None:
+                            # 记录变动信息供AI参考；通知按新价格去重，降价后的推荐会再次通知
+                            final_record["商品变动"] = item_change
+                            notify_key = f"{item_data['商品ID']}@{item_data.get('当前售价')}"
+
+                        # --- START: Real-time AI Analysis & Notification ---
+                        from src.config import SKIP_AI_ANALYSIS
+                        
+                        # 检查是否跳过AI分析并直接发送通知
+                        if SKIP_AI_ANALYSIS:
+                            print(f"   -> 环境变量 SKIP_AI_ANALYSIS 已设置，跳过AI分析并直接发送通知...")
+                            # 下载图片
+                            with metrics.timer("goofish_stage_seconds", stage="images"), memory_stage("images"):
+                                downloaded_image_paths = await fetch_item_images(item_data, task_name)
                             
-                            # 检查是否跳过AI分析并直接发送通知
-                            if SKIP_AI_ANALYSIS:
-                                print(f"   -> 环境变量 SKIP_AI_ANALYSIS 已设置，跳过AI分析并直接发送通知...")
-                                # 下载图片
-                                image_urls = item_data.get('商品图片列表', [])
-                                downloaded_image_paths = await download_all_images(item_data['商品ID'], image_urls, task_config.get('task_name', 'default'))
-                                
-                                # 删除下载的图片文件，节省空间
-                                for img_path in downloaded_image_paths:
-                                    try:
-                                        if os.path.exists(img_path):
-                                            os.remove(img_path)
-                                            print(f"   [图片] 已删除临时图片文件: {img_path}")
-                                    except Exception as e:
-                                        print(f"   [图片] 删除图片文件时出错: {e}")
-                                
-                                # 直接发送通知，将所有商品标记为推荐
-                                print(f"   -> 商品已跳过AI分析，准备发送通知...")
-                                await send_ntfy_notification(item_data, "商品已跳过AI分析，直接通知")
-                            else:
-                                print(f"   -> 开始对商品 #{item_data['商品ID']} 进行实时AI分析...")
-                                # 1. Download images
-                                image_urls = item_data.get('商品图片列表', [])
-                                downloaded_image_paths = await download_all_images(item_data['商品ID'], image_urls, task_config.get('task_name', 'default'))
-
-                                # 2. Get AI analysis
-                                ai_analysis_result = None
-                                if ai_prompt_text:
-                                    try:
-                                        # 注意：这里我们将整个记录传给AI，让它拥有最全的上下文
-                                        ai_analysis_result = await get_ai_analysis(final_record, downloaded_image_paths, prompt_text=ai_prompt_text)
-                                        if ai_analysis_result:
-                                            final_record['ai_analysis'] = ai_analysis_result
-                                            print(f"   -> AI分析完成。推荐状态: {ai_analysis_result.get('is_recommended')}")
-                                        else:
-                                            final_record['ai_analysis'] = {'error': 'AI analysis returned None after retries.'}
-                                    except Exception as e:
-                                        print(f"   -> AI分析过程中发生严重错误: {e}")
-                                        final_record['ai_analysis'] = {'error': str(e)}
-                                else:
-                                    print("   -> 任务未配置AI prompt，跳过分析。")
-
-                                # 删除下载的图片文件，节省空间
-                                for img_path in downloaded_image_paths:
-                                    try:
-                                        if os.path.exists(img_path):
-                                            os.remove(img_path)
-                                            print(f"   [图片] 已删除临时图片文件: {img_path}")
-                                    except Exception as e:
-                                        print(f"   [图片] 删除图片文件时出错: {e}")
-
-                                # 3. Send notification if recommended
-                                if ai_analysis_result and ai_analysis_result.get('is_recommended'):
-                                    print(f"   -> 商品被AI推荐，准备发送通知...")
-                                    await send_ntfy_notification(item_data, ai_analysis_result.get("reason", "无"))
-                            # --- END: Real-time AI Analysis & Notification ---
-
-                            # 4. 保存包含AI结果的完整记录
-                            await save_to_jsonl(final_record, keyword)
-
-                            processed_links.add(unique_key)
-                            processed_item_count += 1
-                            print(f"   -> 商品处理流程完毕。累计处理 {processed_item_count} 个新商品。")
-
-                            # --- 修改: 增加单个商品处理后的主要延迟 ---
-                            print("   [反爬] 执行一次主要的随机延迟以模拟用户浏览间隔...")
-                            await random_sleep(15, 30) # 原来是 (8, 15)，这是最重要的修改之一
+                            # 删除下载的图片文件，节省空间
+                            remove_downloaded_images(downloaded_image_paths)
+                            
+                            # 直接发送通知，将所有商品标记为推荐
+                            print(f"   -> 商品已跳过AI分析，准备发送通知...")
+                            await enqueue_notification(item_data, "商品已跳过AI分析，直接通知", dedup_key=notify_key,
+                                                      task_config=task_config, price_score=price_score)
                         else:
-                            print(f"   错误: 获取商品详情API响应失败，状态码: {detail_response.status}")
-                            if AI_DEBUG_MODE:
-                                print(f"--- [DETAIL DEBUG] FAILED RESPONSE from {item_data['商品链接']} ---")
+                            print(f"   -> 开始对商品 #{item_data['商品ID']} 进行实时AI分析...")
+                            # 0. 本地预筛：推荐概率很低的商品直接判为不推荐，不再下载图片和调用AI
+                            prescreen_result = None
+                            if prescreen_model is not None and ai_prompt_text:
+                                probability, prescreen_result = prescreen_verdict(prescreen_model, final_record)
+                                final_record['预筛概率'] = round(probability, 4)
+
+                            # 1. Download images
+                            downloaded_image_paths = []
+                            if prescreen_result is None:
+                                with metrics.timer("goofish_stage_seconds", stage="images"), memory_stage("images"):
+                                    downloaded_image_paths = await fetch_item_images(item_data, task_name)
+
+                            # 2. Get AI analysis
+                            ai_analysis_result = None
+                            image_hashes = []
+                            seller_key = str(user_id) if user_id and user_id != '暂无' else ''
+                            if IMAGE_HASH_DEDUP and downloaded_image_paths and item_change is None:
+                                # 图片与历史商品近似重复时，复用历史结论或直接标记盗图，跳过AI调用
+                                image_hashes = await compute_image_hashes(downloaded_image_paths)
+                                ai_analysis_result = match_previous_verdict(image_hashes, item_data['商品ID'], seller_key)
+
+                            if prescreen_result is not None:
+                                ai_analysis_result = prescreen_result
+                                final_record['ai_analysis'] = prescreen_result
+                                metrics.inc("goofish_items_total", task=task_name, result="prescreen_skipped")
+                                print(f"   -> {prescreen_result['reason']}")
+                            elif ai_analysis_result:
+                                final_record['ai_analysis'] = ai_analysis_result
+                                print(f"   -> 图片与历史商品重复，已跳过AI分析。推荐状态: {ai_analysis_result.get('is_recommended')}，原因: {ai_analysis_result.get('reason')}")
+                            elif ai_prompt_text:
                                 try:
-                                    print(await detail_response.text())
+                                    # 注意：这里我们将整个记录传给AI，让它拥有最全的上下文
+                                    with memory_stage("ai_analysis"):
+                                        ai_analysis_result = await get_ai_analysis(
+                                            final_record,
+                                            downloaded_image_paths,
+                                            prompt_text=ai_prompt_text,
+                                            image_urls=item_data.get('商品图片列表', []),
+                                            task_name=task_name,
+                                        )
+                                    if ai_analysis_result:
+                                        final_record['ai_analysis'] = ai_analysis_result
+                                        print(f"   -> AI分析完成。推荐状态: {ai_analysis_result.get('is_recommended')}")
+                                    else:
+                                        final_record['ai_analysis'] = {'error': 'AI analysis returned None after retries.'}
                                 except Exception as e:
-                                    print(f"无法读取响应内容: {e}")
-                                print("----------------------------------------------------")
+                                    print(f"   -> AI分析过程中发生严重错误: {e}")
+                                    final_record['ai_analysis'] = {'error': str(e)}
+                            else:
+                                print("   -> 任务未配置AI prompt，跳过分析。")
+
+                            if image_hashes:
+                                await record_image_hashes(image_hashes, item_data['商品ID'], seller_key, ai_analysis_result)
+
+                            # 删除下载的图片文件，节省空间
+                            remove_downloaded_images(downloaded_image_paths)
+
+                            # 3. Send notification if recommended
+                            if ai_analysis_result and ai_analysis_result.get('is_recommended'):
+                                print(f"   -> 商品被AI推荐，准备发送通知...")
+                                metrics.inc("goofish_items_total", task=task_name, result="recommended")
+                                await enqueue_notification(item_data, ai_analysis_result.get("reason", "无"), dedup_key=notify_key,
+                                                           task_config=task_config, price_score=price_score)
+                        # --- END: Real-time AI Analysis & Notification ---
+
+                        # 4. 保存包含AI结果和价格评分的完整记录
+                        final_record["价格评分"] = price_score
+                        record_offset = processed_links.end_offset()
+                        saved = await save_to_jsonl(final_record, keyword)
+
+                        processed_links.record(unique_key, item_data, record_offset if saved else None)
+                        processed_item_count += 1
+                        metrics.inc("goofish_items_total", task=task_name, result="new" if item_change is None else "changed")
+                        print(f"   -> 商品处理流程完毕。累计处理 {processed_item_count} 个新商品。")
+
+                        # --- 修改: 增加单个商品处理后的主要延迟 ---
+                        print("   [反爬] 执行一次主要的随机延迟以模拟用户浏览间隔...")
+                        await random_sleep(15, 30) # 原来是 (8, 15)，这是最重要的修改之一
 
                     except PlaywrightTimeoutError:
                         print(f"   错误: 访问商品详情页或等待API响应超时。")
                     except Exception as e:
                         print(f"   错误: 处理商品详情时发生未知错误: {e}")
                     finally:
-                        await detail_page.close()
                         # --- 修改: 增加关闭页面后的短暂整理时间 ---
                         await random_sleep(2, 4) # 原来是 (1, 2.5)
 
@@ -497,6 +778,9 @@ async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
         except Exception as e:
             print(f"\n爬取过程中发生未知错误: {e}")
         finally:
+            # 各获取模式的单商品平均耗时和传输量，用于对比 API 模式与导航模式
+            for line in fetch_stats.summary():
+                print(f"LOG: [获取统计] {line}")
             print("\nLOG: 任务执行完毕，浏览器将在5秒后自动关闭...")
             await asyncio.sleep(5)
             if debug_limit:
@@ -506,4 +790,7 @@ async def scrape_xianyu(task_config: dict, debug_limit: int = 0):
     # 清理任务图片目录
     cleanup_task_images(task_config.get('task_name', 'default'))
 
+    if IMAGE_HASH_DEDUP:
+        await save_image_hash_index()
+
     return processed_item_count
@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+
+class BoundedSubscriber:
+    """
+    SSE 流的订阅者，持有有界队列。
+    消费过慢导致队列已满时丢弃全部积压内容，只留下一个 resync 事件，由流重新推送完整快照。
+    """
+
+    # 默认最多缓存的事件数，子类按各自事件的大小覆盖
+    queue_size = 64
+
+    def __init__(self, queue_size: int | None = None):
+        self.queue = asyncio.Queue(maxsize=queue_size or self.queue_size)
+
+    def push(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+    async def get(self, timeout: float | None = None) -> dict | None:
+        """等待下一个事件，timeout 秒内没有事件时返回 None (调用方据此发送心跳)。"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def format_sse(event: str, data, event_id: int | None = None) -> str:
+    """格式化一条 SSE 消息，data 以 JSON 编码。"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
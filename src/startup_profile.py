@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+import time
+
+# 项目根目录，子进程在此目录下导入模块
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(output: str) -> list:
+    """
+    解析 `python -X importtime` 写到标准错误的输出。
+    返回 [{"module", "self_us", "cumulative_us", "depth"}]，顺序与输出一致（子模块在父模块之前）。
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            # 表头 "self [us] | cumulative | imported package"
+            continue
+        name = parts[2].rstrip()
+        stripped = name.lstrip(" ")
+        entries.append({
+            "module": stripped,
+            "self_us": self_us,
+            "cumulative_us": cumulative_us,
+            "depth": (len(name) - len(stripped)) // 2,
+        })
+    return entries
+
+
+def summarize_imports(entries: list, top: int = 15) -> dict:
+    """按顶层包汇总导入耗时 (各子模块 self 时间之和)，并列出累计耗时最长的模块。"""
+    by_package = {}
+    for entry in entries:
+        package = entry["module"].split(".")[0]
+        by_package[package] = by_package.get(package, 0) + entry["self_us"]
+    packages = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:top]
+    slowest = sorted(entries, key=lambda entry: entry["cumulative_us"], reverse=True)[:top]
+    return {
+        "total_us": sum(by_package.values()),
+        "packages": [{"package": name, "self_us": us} for name, us in packages],
+        "slowest_modules": slowest,
+    }
+
+
+def profile_startup(module: str, top: int = 15) -> str:
+    """在新的解释器中导入 module，返回导入耗时报告文本。"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        return f"导入 {module} 失败:\n{result.stderr[-2000:]}"
+
+    summary = summarize_imports(parse_importtime(result.stderr), top)
+    lines = [
+        f"--- 启动耗时分析: import {module} ---",
+        f"解释器启动 + 导入总耗时: {wall_ms:.0f} ms，其中模块导入: {summary['total_us'] / 1000:.0f} ms",
+        "",
+        "按顶层包汇总 (ms):",
+    ]
+    for item in summary["packages"]:
+        lines.append(f"  {item['self_us'] / 1000:8.1f}  {item['package']}")
+    lines.append("")
+    lines.append("累计耗时最长的模块 (ms):")
+    for entry in summary["slowest_modules"]:
+        lines.append(f"  {entry['cumulative_us'] / 1000:8.1f}  {entry['module']}")
+    return "\n".join(lines)
@@ -1,10 +1,7 @@
-import json
-
 from pydantic import BaseModel
 from typing import Optional
 
-from src.config import CONFIG_FILE
-from src.file_operator import FileOperator
+from src.task_registry import get_task_registry
 
 
 class Task(BaseModel):
@@ -20,6 +17,11 @@ class Task(BaseModel):
     ai_prompt_base_file: str
     ai_prompt_criteria_file: str
     is_running: Optional[bool] = False
+    digest_window_minutes: Optional[float] = None
+    digest_max_items: Optional[int] = None
+    priority: Optional[int] = None
+    profile: Optional[bool] = False
+    fetch_mode: Optional[str] = "navigate"
 
 
 class TaskUpdate(BaseModel):
@@ -35,61 +37,26 @@ class TaskUpdate(BaseModel):
     ai_prompt_base_file: Optional[str] = None
     ai_prompt_criteria_file: Optional[str] = None
     is_running: Optional[bool] = None
+    digest_window_minutes: Optional[float] = None
+    digest_max_items: Optional[int] = None
+    priority: Optional[int] = None
+    profile: Optional[bool] = None
+    fetch_mode: Optional[str] = None
 
 
 async def add_task(task: Task) -> bool:
-    config_file_op = FileOperator(CONFIG_FILE)
-
-    config_data_str = await config_file_op.read()
-    config_data = json.loads(config_data_str) if config_data_str else []
-    config_data.append(task)
-
-    return await config_file_op.write(json.dumps(config_data, ensure_ascii=False, indent=2))
+    await get_task_registry().add(task)
+    return True
 
 
 async def update_task(task_id: int, task: Task) -> bool:
-    config_file_op = FileOperator(CONFIG_FILE)
-
-    config_data_str = await config_file_op.read()
-
-    if not config_data_str:
-        return False
-
-    config_data = json.loads(config_data_str)
-
-    if len(config_data) <= task_id:
-        return False
-
-    config_data[task_id] = task
-
-    return await config_file_op.write(json.dumps(config_data, ensure_ascii=False, indent=2))
+    return await get_task_registry().update(task_id, task) is not None
 
 
 async def get_task(task_id: int) -> Task | None:
-    config_file_op = FileOperator(CONFIG_FILE)
-    config_data_str = await config_file_op.read()
-
-    if not config_data_str:
-        return None
-
-    config_data = json.loads(config_data_str)
-    if len(config_data) <= task_id:
-        return None
-
-    return config_data[task_id]
+    return await get_task_registry().get(task_id)
 
 
 async def remove_task(task_id: int) -> bool:
-    config_file_op = FileOperator(CONFIG_FILE)
-    config_data_str = await config_file_op.read()
-    if not config_data_str:
-        return True
-
-    config_data = json.loads(config_data_str)
-
-    if len(config_data) <= task_id:
-        return True
-
-    config_data.pop(task_id)
-
-    return await config_file_op.write(json.dumps(config_data, ensure_ascii=False, indent=2))
+    await get_task_registry().remove(task_id)
+    return True
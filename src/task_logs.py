@@ -0,0 +1,293 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from src.config import LOG_DIR, TASK_LOG_MAX_MB, TASK_LOG_RETENTION_DAYS
+
+# 汇总日志，Web UI 的实时日志页面读取该文件
+COMBINED_LOG_FILE = os.path.join(LOG_DIR, "scraper.log")
+TASK_LOG_DIR = os.path.join(LOG_DIR, "tasks")
+ACTIVE_LOG_NAME = "task.log"
+INDEX_NAME = "runs.jsonl"
+# 反向读取日志末尾时每次读取的块大小
+_TAIL_BLOCK_BYTES = 8192
+
+
+def _max_bytes() -> int:
+    return int(TASK_LOG_MAX_MB * 1024 * 1024)
+
+
+def task_log_slug(task_name: str) -> str:
+    """将任务名转换为可用作目录名的字符串。"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', task_name).strip('._') or "task"
+
+
+def archive_log_file(path: str) -> str | None:
+    """将日志文件压缩为带时间戳的 .gz 归档并删除原文件，返回归档路径。"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    base, ext = os.path.splitext(path)
+    archive_path = f"{base}-{datetime.now().strftime('%Y%m%d-%H%M%S')}{ext}.gz"
+    with open(path, 'rb') as src, gzip.open(archive_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+    return archive_path
+
+
+def prune_archives(directory: str, prefix: str, retention_days: float) -> list:
+    """删除目录中超过保留天数的 .gz 归档，返回被删除的文件名。"""
+    if retention_days <= 0 or not os.path.isdir(directory):
+        return []
+    cutoff = time.time() - retention_days * 86400
+    removed = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith(prefix) and name.endswith(".gz") and os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            removed.append(name)
+    return removed
+
+
+def read_last_lines(path: str, lines: int) -> str:
+    """从文件末尾反向按块读取最后若干行，耗时只与读取的行数相关，与文件大小无关。"""
+    if lines <= 0 or not os.path.exists(path):
+        return ""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b'\n') <= lines:
+            step = min(_TAIL_BLOCK_BYTES, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    return b''.join(data.splitlines(keepends=True)[-lines:]).decode('utf-8', errors='replace')
+
+
+class CombinedLog:
+    """所有任务共用的汇总日志。由Web进程统一写入，超过大小上限时压缩归档后重新开始。"""
+
+    def __init__(self, path: str = COMBINED_LOG_FILE):
+        self.path = path
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def write(self, data: bytes):
+        with self._lock:
+            if self._handle is None or self._handle.closed:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._handle = open(self.path, 'ab')
+            self._handle.write(data)
+            self._handle.flush()
+            if self._handle.tell() >= _max_bytes():
+                self._rotate()
+
+    def rotate(self):
+        with self._lock:
+            self._rotate()
+
+    def _rotate(self):
+        self.close()
+        archive_log_file(self.path)
+        prune_archives(os.path.dirname(self.path) or ".", os.path.basename(os.path.splitext(self.path)[0]) + "-",
+                       TASK_LOG_RETENTION_DAYS)
+
+    def close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class TaskRunLog:
+    """一次任务运行的日志写入器，写入任务的当前日志文件，并在结束时更新运行索引。"""
+
+    def __init__(self, store: "TaskLogStore", task_name: str, entry: dict):
+        self.store = store
+        self.task_name = task_name
+        self.entry = entry
+        self._handle = open(store.active_log_path(task_name), 'ab')
+
+    @property
+    def run_id(self) -> str:
+        return self.entry["run_id"]
+
+    def write(self, data: bytes):
+        self._handle.write(data)
+        self._handle.flush()
+
+    def finish(self, exit_code: int | None):
+        self.entry["end_offset"] = self._handle.tell()
+        self._handle.close()
+        self.entry["finished_at"] = datetime.now().isoformat(timespec="seconds")
+        self.entry["exit_code"] = exit_code
+        self.store._update_entry(self.task_name, self.entry)
+
+
+class TaskLogStore:
+    """
+    按任务划分的日志存储。每个任务一个目录，包含：
+    - task.log: 当前日志文件，超过大小上限或最早的运行超过保留期时在新运行开始前压缩归档；
+    - task-<时间>.log.gz: 压缩归档，超过保留期后删除；
+    - runs.jsonl: 每次运行的起止偏移量和退出码，用于直接定位某次运行的日志。
+    """
+
+    def __init__(self, base_dir: str = TASK_LOG_DIR):
+        self.base_dir = base_dir
+
+    def task_dir(self, task_name: str) -> str:
+        return os.path.join(self.base_dir, task_log_slug(task_name))
+
+    def active_log_path(self, task_name: str) -> str:
+        return os.path.join(self.task_dir(task_name), ACTIVE_LOG_NAME)
+
+    def _index_path(self, task_name: str) -> str:
+        return os.path.join(self.task_dir(task_name), INDEX_NAME)
+
+    def list_runs(self, task_name: str) -> list:
+        """返回任务的运行记录（按时间顺序）。"""
+        path = self._index_path(task_name)
+        if not os.path.exists(path):
+            return []
+        runs = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        runs.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        return runs
+
+    def _write_index(self, task_name: str, runs: list):
+        path = self._index_path(task_name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for run in runs:
+                f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, path)
+
+    def _update_entry(self, task_name: str, entry: dict):
+        runs = [entry if run["run_id"] == entry["run_id"] else run for run in self.list_runs(task_name)]
+        self._write_index(task_name, runs)
+
+    def _rotate_if_needed(self, task_name: str, runs: list) -> list:
+        """当前日志过大或最早的运行超过保留期时归档，并清理过期归档及其索引记录。"""
+        active_path = self.active_log_path(task_name)
+        active_runs = [run for run in runs if run["file"] == ACTIVE_LOG_NAME]
+        too_big = os.path.exists(active_path) and os.path.getsize(active_path) >= _max_bytes()
+        too_old = bool(active_runs) and TASK_LOG_RETENTION_DAYS > 0 and \
+            time.time() - active_runs[0].get("started_ts", time.time()) > TASK_LOG_RETENTION_DAYS * 86400
+        if too_big or too_old:
+            archive_path = archive_log_file(active_path)
+            if archive_path:
+                archive_name = os.path.basename(archive_path)
+                for run in active_runs:
+                    run["file"] = archive_name
+        removed = set(prune_archives(self.task_dir(task_name), "task-", TASK_LOG_RETENTION_DAYS))
+        return [run for run in runs if run["file"] not in removed]
+
+    def begin_run(self, task_name: str) -> TaskRunLog:
+        """开始一次新的运行：必要时先轮转日志，再记录本次运行在当前日志文件中的起始偏移量。"""
+        os.makedirs(self.task_dir(task_name), exist_ok=True)
+        runs = self._rotate_if_needed(task_name, self.list_runs(task_name))
+        active_path = self.active_log_path(task_name)
+        now = time.time()
+        entry = {
+            "run_id": f"{datetime.fromtimestamp(now).strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}",
+            "started_at": datetime.fromtimestamp(now).isoformat(timespec="seconds"),
+            "started_ts": now,
+            "file": ACTIVE_LOG_NAME,
+            "offset": os.path.getsize(active_path) if os.path.exists(active_path) else 0,
+            "end_offset": None,
+            "finished_at": None,
+            "exit_code": None,
+        }
+        self._write_index(task_name, runs + [entry])
+        return TaskRunLog(self, task_name, entry)
+
+    def get_run(self, task_name: str, run_id: str | None = None) -> dict | None:
+        """按 run_id 查找运行记录，run_id 为空或 "latest" 时返回最近一次运行。"""
+        runs = self.list_runs(task_name)
+        if not runs:
+            return None
+        if run_id in (None, "", "latest"):
+            return runs[-1]
+        return next((run for run in runs if run["run_id"] == run_id), None)
+
+    def read_run(self, task_name: str, run: dict, max_bytes: int | None = None) -> str:
+        """读取一次运行的日志；max_bytes 限定时只返回该次运行的最后 max_bytes 字节。"""
+        path = os.path.join(self.task_dir(task_name), run["file"])
+        if not os.path.exists(path):
+            return ""
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rb') as f:
+            if run.get("end_offset") is None:
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+            else:
+                end = run["end_offset"]
+            start = run["offset"]
+            if max_bytes is not None:
+                start = max(start, end - max_bytes)
+            f.seek(start)
+            data = f.read(max(0, end - start))
+        return data.decode('utf-8', errors='replace')
+
+    def tail(self, task_name: str, lines: int) -> str:
+        """返回任务当前日志文件的最后若干行。"""
+        return read_last_lines(self.active_log_path(task_name), lines)
+
+
+async def pump_process_output(stream: asyncio.StreamReader, run_log: TaskRunLog, combined_log: CombinedLog,
+                              prefix: str, on_line=None):
+    """
+    逐行读取子进程输出，写入任务日志和带任务名前缀的汇总日志。
+    on_line(line: str) 为可选回调，可用于从输出中解析进度。
+    """
+    loop = asyncio.get_running_loop()
+    prefix_bytes = prefix.encode('utf-8')
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # 单行超过缓冲区上限，读取剩余部分
+            line = await stream.read(64 * 1024)
+        if not line:
+            break
+        await loop.run_in_executor(None, _write_line, run_log, combined_log, prefix_bytes, line)
+        if on_line is not None:
+            try:
+                on_line(line.decode('utf-8', errors='replace'))
+            except Exception as e:
+                print(f"处理任务日志回调时出错: {e}")
+
+
+def _write_line(run_log: TaskRunLog, combined_log: CombinedLog, prefix: bytes, line: bytes):
+    run_log.write(line)
+    combined_log.write(prefix + line)
+
+
+_store = None
+_combined_log = None
+
+
+def get_task_log_store() -> TaskLogStore:
+    global _store
+    if _store is None:
+        _store = TaskLogStore()
+    return _store
+
+
+def get_combined_log() -> CombinedLog:
+    global _combined_log
+    if _combined_log is None:
+        _combined_log = CombinedLog()
+    return _combined_log
@@ -0,0 +1,184 @@
+import asyncio
+import copy
+import json
+import os
+
+from src.config import CONFIG_FILE
+
+# 只保存在内存中的运行时字段，不写入配置文件
+RUNTIME_FIELDS = ("is_running",)
+
+
+class TaskRegistry:
+    """
+    任务配置的内存缓存。
+    读取直接返回内存中的副本；所有修改通过同一把异步锁串行执行，并以先写临时文件再替换的方式落盘。
+    每次访问时检查文件的修改时间，发现外部编辑（如手动修改 config.json）时重新加载。
+    任务的运行状态只保存在内存中，不再在每次启动/停止时重写配置文件。
+    每个任务有一个保存在配置文件中的固定 id，删除其他任务不会改变它；
+    没有 id 的任务（旧配置或手动添加）在加载时按顺序分配并写回文件。
+    """
+
+    def __init__(self, filepath: str = CONFIG_FILE):
+        self.filepath = filepath
+        self._tasks = []
+        self._mtime = None
+        self._running = set()
+        self._next_id = 0
+        self._lock = asyncio.Lock()
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.filepath).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read_file(self) -> list:
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return []
+        return json.loads(content) if content.strip() else []
+
+    def _write_file(self, tasks: list):
+        directory = os.path.dirname(os.path.abspath(self.filepath))
+        tmp_path = os.path.join(directory, f".{os.path.basename(self.filepath)}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(tasks, ensure_ascii=False, indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.filepath)
+
+    async def _refresh(self):
+        """文件修改时间与缓存不一致时重新加载（调用方需持有锁）。"""
+        mtime = self._stat_mtime()
+        if self._mtime is not None and mtime == self._mtime:
+            return
+        try:
+            tasks = await asyncio.get_running_loop().run_in_executor(None, self._read_file)
+        except json.JSONDecodeError as e:
+            if self._mtime is None:
+                raise
+            # 外部编辑写入了不完整的JSON，继续使用上一次成功加载的配置
+            print(f"[警告] 配置文件 {self.filepath} 格式错误，继续使用缓存的任务配置: {e}")
+            return
+        if self._mtime is not None:
+            print(f"检测到配置文件 {self.filepath} 被外部修改，已重新加载任务配置。")
+        self._tasks = tasks
+        self._mtime = mtime
+        if self._assign_missing_ids():
+            await self._persist(self._tasks)
+
+    def _assign_missing_ids(self) -> bool:
+        """为缺少 id 或 id 重复的任务分配新 id，返回是否有改动。"""
+        seen = set()
+        for task in self._tasks:
+            task_id = task.get("id")
+            if isinstance(task_id, int) and not isinstance(task_id, bool) and task_id >= 0:
+                seen.add(task_id)
+        self._next_id = max(self._next_id, max(seen, default=-1) + 1)
+
+        changed = False
+        used = set()
+        for index, task in enumerate(self._tasks):
+            task_id = task.get("id")
+            if task_id in seen and task_id not in used:
+                used.add(task_id)
+                continue
+            self._tasks[index] = {"id": self._next_id, **{k: v for k, v in task.items() if k != "id"}}
+            used.add(self._next_id)
+            self._next_id += 1
+            changed = True
+        return changed
+
+    def _index_of(self, task_id: int) -> int | None:
+        for index, task in enumerate(self._tasks):
+            if task.get("id") == task_id:
+                return index
+        return None
+
+    async def _persist(self, tasks: list):
+        """保存任务列表（调用方需持有锁），运行时字段不写入文件。"""
+        stored = [{k: v for k, v in task.items() if k not in RUNTIME_FIELDS} for task in tasks]
+        await asyncio.get_running_loop().run_in_executor(None, self._write_file, stored)
+        self._tasks = stored
+        self._mtime = self._stat_mtime()
+
+    def _view(self, task: dict) -> dict:
+        view = copy.deepcopy(task)
+        view['is_running'] = task['id'] in self._running
+        return view
+
+    async def load(self):
+        """强制从磁盘加载配置。"""
+        async with self._lock:
+            self._mtime = None
+            await self._refresh()
+
+    async def list_tasks(self) -> list:
+        """返回所有任务的副本，附带 id 和内存中的 is_running 状态。"""
+        async with self._lock:
+            await self._refresh()
+            return [self._view(task) for task in self._tasks]
+
+    async def get(self, task_id: int) -> dict | None:
+        async with self._lock:
+            await self._refresh()
+            index = self._index_of(task_id)
+            return self._view(self._tasks[index]) if index is not None else None
+
+    async def add(self, task: dict) -> dict:
+        """追加一个任务并落盘，分配新的 id，返回带 id 的任务副本。"""
+        async with self._lock:
+            await self._refresh()
+            new_task = {"id": self._next_id, **{k: v for k, v in task.items() if k != "id"}}
+            self._next_id += 1
+            await self._persist(self._tasks + [new_task])
+            return self._view(self._tasks[-1])
+
+    async def update(self, task_id: int, changes: dict) -> dict | None:
+        """合并更新一个任务并落盘（id 不可修改），任务不存在时返回 None。"""
+        async with self._lock:
+            await self._refresh()
+            index = self._index_of(task_id)
+            if index is None:
+                return None
+            tasks = list(self._tasks)
+            tasks[index] = {**tasks[index], **{k: v for k, v in changes.items() if k != "id"}}
+            await self._persist(tasks)
+            return self._view(self._tasks[index])
+
+    async def remove(self, task_id: int) -> dict | None:
+        """删除一个任务并落盘，返回被删除的任务；其他任务的 id 不变。"""
+        async with self._lock:
+            await self._refresh()
+            index = self._index_of(task_id)
+            if index is None:
+                return None
+            tasks = list(self._tasks)
+            removed = tasks.pop(index)
+            await self._persist(tasks)
+            self._running.discard(task_id)
+            return removed
+
+    def set_running(self, task_id: int, is_running: bool):
+        """更新内存中的运行状态，不写入配置文件。"""
+        if is_running:
+            self._running.add(task_id)
+        else:
+            self._running.discard(task_id)
+
+    def is_running(self, task_id: int) -> bool:
+        return task_id in self._running
+
+
+_registry = None
+
+
+def get_task_registry() -> TaskRegistry:
+    """返回进程内共享的任务注册表。"""
+    global _registry
+    if _registry is None:
+        _registry = TaskRegistry()
+    return _registry
@@ -4,11 +4,23 @@ import math
 import os
 import random
 import re
+import sys
 from functools import wraps
 from urllib.parse import quote
 
-from openai import APIStatusError
-from requests.exceptions import HTTPError
+from src.metrics import get_metrics
+
+
+def _is_http_error(e: Exception) -> bool:
+    """
+    判断异常是否为 openai 或 requests 的HTTP错误。
+    只检查已经导入的模块：模块未导入时不可能抛出它的异常，因此无需为此在启动时导入 openai / requests。
+    """
+    openai_module = sys.modules.get("openai")
+    if openai_module is not None and isinstance(e, openai_module.APIStatusError):
+        return True
+    requests_exceptions = sys.modules.get("requests.exceptions")
+    return requests_exceptions is not None and isinstance(e, requests_exceptions.HTTPError)
 
 
 def retry_on_failure(retries=3, delay=5):
@@ -21,20 +33,22 @@ def retry_on_failure(retries=3, delay=5):
             for i in range(retries):
                 try:
                     return await func(*args, **kwargs)
-                except (APIStatusError, HTTPError) as e:
-                    print(f"函数 {func.__name__} 第 {i + 1}/{retries} 次尝试失败，发生HTTP错误。")
-                    if hasattr(e, 'status_code'):
-                        print(f"  - 状态码 (Status Code): {e.status_code}")
-                    if hasattr(e, 'response') and hasattr(e.response, 'text'):
-                        response_text = e.response.text
-                        print(
-                            f"  - 返回值 (Response): {response_text[:300]}{'...' if len(response_text) > 300 else ''}")
                 except json.JSONDecodeError as e:
                     print(f"函数 {func.__name__} 第 {i + 1}/{retries} 次尝试失败: JSON解析错误 - {e}")
                 except Exception as e:
-                    print(f"函数 {func.__name__} 第 {i + 1}/{retries} 次尝试失败: {type(e).__name__} - {e}")
+                    if _is_http_error(e):
+                        print(f"函数 {func.__name__} 第 {i + 1}/{retries} 次尝试失败，发生HTTP错误。")
+                        if hasattr(e, 'status_code'):
+                            print(f"  - 状态码 (Status Code): {e.status_code}")
+                        if hasattr(e, 'response') and hasattr(e.response, 'text'):
+                            response_text = e.response.text
+                            print(
+                                f"  - 返回值 (Response): {response_text[:300]}{'...' if len(response_text) > 300 else ''}")
+                    else:
+                        print(f"函数 {func.__name__} 第 {i + 1}/{retries} 次尝试失败: {type(e).__name__} - {e}")
 
                 if i < retries - 1:
+                    get_metrics().inc("goofish_retries_total", function=func.__name__)
                     print(f"将在 {delay} 秒后重试...")
                     await asyncio.sleep(delay)
 
@@ -73,6 +87,14 @@ def convert_goofish_link(url: str) -> str:
     return url
 
 
+def parse_price(value) -> float | None:
+    """把 "¥1,234" 这类价格文本转换为数字，无法解析时返回 None。"""
+    try:
+        return float(str(value).replace('¥', '').replace(',', '').strip())
+    except (TypeError, ValueError):
+        return None
+
+
 def get_link_unique_key(link: str) -> str:
     """截取链接中第一个"&"之前的内容作为唯一标识依据。"""
     return link.split('&', 1)[0]
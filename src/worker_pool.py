@@ -0,0 +1,137 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+from src.config import SPIDER_WORKER_MAX_IDLE_MINUTES, SPIDER_WORKER_POOL_SIZE
+
+SPIDER_SCRIPT = "spider_v2.py"
+
+
+async def spawn_spider_process(*args: str, stdin=None) -> asyncio.subprocess.Process:
+    """
+    使用与Web服务器相同的Python解释器启动爬虫脚本，输出合并到 stdout 管道。
+    在非 Windows 系统上，使用 setsid 创建新进程组，以便能终止整个进程树（包括浏览器）。
+    """
+    preexec_fn = os.setsid if sys.platform != "win32" else None
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-u", SPIDER_SCRIPT, *args,
+        stdin=stdin,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        preexec_fn=preexec_fn
+    )
+
+
+def kill_process_group(process: asyncio.subprocess.Process):
+    """终止进程及其整个进程组。"""
+    if process.returncode is not None:
+        return
+    try:
+        if sys.platform != "win32":
+            os.killpg(os.getpgid(process.pid), signal.SIGTERM)
+        else:
+            process.terminate()
+    except ProcessLookupError:
+        pass
+
+
+class SpiderWorkerPool:
+    """
+    预热的爬虫工作进程池。
+    工作进程 (spider_v2.py --worker) 提前完成解释器启动、模块导入和客户端初始化，
+    在标准输入上等待任务。每个进程只执行一个任务后退出，取用后在后台补充新进程，
+    因此任务之间仍然完全隔离，停止任务时也仍可直接终止其进程组。
+    """
+
+    def __init__(self, size: int = SPIDER_WORKER_POOL_SIZE,
+                 max_idle_seconds: float = SPIDER_WORKER_MAX_IDLE_MINUTES * 60,
+                 spawn=None):
+        self.size = max(0, size)
+        self.max_idle_seconds = max_idle_seconds
+        self._spawn = spawn or (lambda: spawn_spider_process("--worker", stdin=asyncio.subprocess.PIPE))
+        self._idle = []  # [(进程, 启动时间)]
+        self._refill_task = None
+        self._closed = False
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    async def start(self):
+        self._closed = False
+        await self._refill()
+
+    async def _refill(self):
+        while not self._closed and len(self._idle) < self.size:
+            try:
+                process = await self._spawn()
+            except Exception as e:
+                print(f"启动预热爬虫进程失败: {e}")
+                return
+            self._idle.append((process, time.monotonic()))
+
+    def _schedule_refill(self):
+        if self._closed or self.size == 0:
+            return
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def acquire(self) -> asyncio.subprocess.Process | None:
+        """取出一个可用的空闲进程；没有可用进程时返回 None，由调用方按原方式启动新进程。"""
+        now = time.monotonic()
+        while self._idle:
+            process, started = self._idle.pop(0)
+            if process.returncode is not None:
+                print(f"预热爬虫进程 {process.pid} 已意外退出，返回码: {process.returncode}")
+                continue
+            if now - started > self.max_idle_seconds:
+                await self._retire(process)
+                continue
+            self._schedule_refill()
+            return process
+        self._schedule_refill()
+        return None
+
+    async def submit(self, process: asyncio.subprocess.Process, job: dict):
+        """将任务写入工作进程的标准输入并关闭，工作进程执行完该任务后退出。"""
+        process.stdin.write((json.dumps(job, ensure_ascii=False) + "\n").encode('utf-8'))
+        await process.stdin.drain()
+        process.stdin.close()
+
+    async def _retire(self, process: asyncio.subprocess.Process, timeout: float = 5):
+        """关闭标准输入让空闲进程自行退出，超时未退出则终止其进程组。"""
+        try:
+            process.stdin.close()
+        except Exception:
+            pass
+        try:
+            await asyncio.wait_for(process.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            kill_process_group(process)
+            await process.wait()
+
+    async def recycle(self):
+        """替换所有空闲进程，使其重新加载配置（如 .env 或登录状态更新后）。"""
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._retire(process) for process, _ in idle))
+        self._schedule_refill()
+
+    async def close(self):
+        self._closed = True
+        if self._refill_task is not None:
+            await asyncio.gather(self._refill_task, return_exceptions=True)
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._retire(process) for process, _ in idle))
+
+
+_pool = None
+
+
+def get_worker_pool() -> SpiderWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = SpiderWorkerPool()
+    return _pool
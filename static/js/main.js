@@ -2,7 +2,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const mainContent = document.getElementById('main-content');
     const navLinks = document.querySelectorAll('.nav-link');
     let logRefreshInterval = null;
+    let logEventSource = null;
+    const LOG_TAIL_KB = 64;
+    // 日志面板最多保留的字符数，避免长时间运行后页面卡顿
+    const LOG_MAX_CHARS = 1024 * 1024;
     let taskRefreshInterval = null;
+    let taskEventSource = null;
 
     // --- Templates for each section ---
     const templates = {
@@ -48,6 +53,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 <div class="section-header">
                     <h2>运行日志</h2>
                     <div class="log-controls">
+                        <select id="log-task-selector">
+                            <option value="">全部任务</option>
+                        </select>
                         <label>
                             <input type="checkbox" id="auto-refresh-logs-checkbox">
                             自动刷新
@@ -407,9 +415,22 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    async function fetchLogs(fromPos = 0) {
+    async function fetchTaskLogs(taskId, runId = 'latest') {
         try {
-            const response = await fetch(`/api/logs?from_pos=${fromPos}`);
+            const response = await fetch(`/api/tasks/${taskId}/logs?run_id=${encodeURIComponent(runId)}`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return await response.json();
+        } catch (error) {
+            console.error("无法获取任务日志:", error);
+            return {content: `加载任务日志失败: ${error.message}`, run: null};
+        }
+    }
+
+    async function fetchLogs(fromPos = 0, tailKb = 0) {
+        try {
+            const response = await fetch(`/api/logs?from_pos=${fromPos}&tail_kb=${tailKb}`);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -567,6 +588,15 @@ document.addEventListener('DOMContentLoaded', function() {
                     <p class="form-hint">HTTP/S代理地址，支持 http 和 socks5 格式</p>
                 </div>
                 
+                <div class="form-group">
+                    <label for="ai-image-input-mode">图片传输方式</label>
+                    <select id="ai-image-input-mode" name="AI_IMAGE_INPUT_MODE">
+                        <option value="base64" ${settings.AI_IMAGE_INPUT_MODE !== 'url' ? 'selected' : ''}>Base64 上传</option>
+                        <option value="url" ${settings.AI_IMAGE_INPUT_MODE === 'url' ? 'selected' : ''}>直接传图片链接</option>
+                    </select>
+                    <p class="form-hint">服务商支持拉取远程图片时可选择"直接传图片链接"，节省下载和上传流量；服务商拒绝时会自动回退为 Base64 上传</p>
+                </div>
+                
                 <div class="form-group">
                     <button type="button" id="test-ai-settings-btn" class="control-button">测试连接（浏览器）</button>
                     <button type="button" id="test-ai-settings-backend-btn" class="control-button">测试连接（后端容器）</button>
@@ -591,6 +621,12 @@ document.addEventListener('DOMContentLoaded', function() {
             : `<span class="tag status-error">异常</span>`;
 
         const env = status.env_file || {};
+        const formatMb = (value) => value === null || value === undefined ? '未知' : `${value} MB`;
+        const memoryItems = (status.running_tasks || []).map(task => `
+                <li class="status-item">
+                    <span class="label">内存: ${task.task_name || task.task_id} (PID ${task.pid})</span>
+                    <span class="value">${formatMb(task.rss_mb)} + 浏览器 ${formatMb(task.children_rss_mb)}</span>
+                </li>`).join('');
 
         return `
             <ul class="status-list">
@@ -614,6 +650,10 @@ document.addEventListener('DOMContentLoaded', function() {
                     <span class="label">Ntfy Topic URL</span>
                     <span class="value">${renderStatusTag(env.ntfy_topic_url_set)}</span>
                 </li>
+                <li class="status-item">
+                    <span class="label">Web服务内存</span>
+                    <span class="value">${formatMb(status.web_rss_mb)}</span>
+                </li>${memoryItems}
             </ul>
         `;
     }
@@ -677,6 +717,21 @@ document.addEventListener('DOMContentLoaded', function() {
         return `<div id="results-grid">${cards}</div>`;
     }
 
+    function renderTaskStatus(task) {
+        if (task.is_running !== true) {
+            if (task.queue_position) {
+                return `<span class="status-badge status-stopped">排队中 (第 ${task.queue_position} 位)</span>`;
+            }
+            return `<span class="status-badge status-stopped">已停止</span>`;
+        }
+        const progress = task.progress;
+        let detail = '';
+        if (progress && progress.max_pages) {
+            detail = `<div class="task-progress">第 ${progress.page}/${progress.max_pages} 页 · 新商品 ${progress.processed} · 推荐 ${progress.recommended}</div>`;
+        }
+        return `<span class="status-badge status-running">运行中</span>${detail}`;
+    }
+
     function renderTasksTable(tasks) {
         if (!tasks || tasks.length === 0) {
             return '<p>没有找到任何任务。请点击右上角“创建新任务”来添加一个。</p>';
@@ -702,12 +757,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
         const tableBody = tasks.map(task => {
             const isRunning = task.is_running === true;
-            const statusBadge = isRunning
-                ? `<span class="status-badge status-running">运行中</span>`
-                : `<span class="status-badge status-stopped">已停止</span>`;
+            const statusBadge = renderTaskStatus(task);
 
-            const actionButton = isRunning
-                ? `<button class="action-btn stop-task-btn" data-task-id="${task.id}">停止</button>`
+            const actionButton = isRunning || task.queue_position
+                ? `<button class="action-btn stop-task-btn" data-task-id="${task.id}">${isRunning ? '停止' : '取消排队'}</button>`
                 : `<button class="action-btn run-task-btn" data-task-id="${task.id}" ${!task.enabled ? 'disabled title="任务已禁用"' : ''}>运行</button>`;
 
             return `
@@ -719,7 +772,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     </label>
                 </td>
                 <td>${task.task_name}</td>
-                <td>${statusBadge}</td>
+                <td class="task-status-cell">${statusBadge}</td>
                 <td><span class="tag">${task.keyword}</span></td>
                 <td>${task.min_price || '不限'} - ${task.max_price || '不限'}</td>
                 <td>${task.personal_only ? '<span class="tag personal">个人闲置</span>' : ''}</td>
@@ -738,15 +791,27 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
 
-    async function navigateTo(hash) {
+    function stopLogStreaming() {
         if (logRefreshInterval) {
             clearInterval(logRefreshInterval);
             logRefreshInterval = null;
         }
+        if (logEventSource) {
+            logEventSource.close();
+            logEventSource = null;
+        }
+    }
+
+    async function navigateTo(hash) {
+        stopLogStreaming();
         if (taskRefreshInterval) {
             clearInterval(taskRefreshInterval);
             taskRefreshInterval = null;
         }
+        if (taskEventSource) {
+            taskEventSource.close();
+            taskEventSource = null;
+        }
         const sectionId = hash.substring(1) || 'tasks';
 
         // Update nav links active state
@@ -767,16 +832,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
             // --- Load data for the current section ---
             if (sectionId === 'tasks') {
-                const container = document.getElementById('tasks-table-container');
-                const refreshTasks = async () => {
-                    const tasks = await fetchTasks();
-                    // Avoid re-rendering if in edit mode to not lose user input
-                    if (container && !container.querySelector('tr.editing')) {
-                        container.innerHTML = renderTasksTable(tasks);
-                    }
-                };
-                await refreshTasks();
-                taskRefreshInterval = setInterval(refreshTasks, 5000);
+                await initializeTasksView();
             } else if (sectionId === 'results') {
                 await initializeResultsView();
             } else if (sectionId === 'logs') {
@@ -790,13 +846,86 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // 任务列表通过服务端推送的事件增量更新，浏览器不支持 SSE 时退回每5秒轮询
+    async function initializeTasksView() {
+        const container = document.getElementById('tasks-table-container');
+        let tasksById = {};
+
+        const renderAll = (tasks) => {
+            tasksById = {};
+            (tasks || []).forEach(task => { tasksById[task.id] = task; });
+            // Avoid re-rendering if in edit mode to not lose user input
+            if (container && !container.querySelector('tr.editing')) {
+                container.innerHTML = renderTasksTable(tasks);
+            }
+        };
+
+        const updateTaskRow = (taskId, changes) => {
+            const task = tasksById[taskId];
+            if (!task) return;
+            const runningChanged = changes.is_running !== undefined && changes.is_running !== task.is_running;
+            Object.assign(task, changes);
+            const row = container.querySelector(`tr[data-task-id="${taskId}"]`);
+            if (!row || row.classList.contains('editing')) return;
+            if (runningChanged) {
+                // 运行状态变化会影响操作按钮，重新渲染整张表
+                renderAll(Object.values(tasksById));
+                return;
+            }
+            row.querySelector('.task-status-cell').innerHTML = renderTaskStatus(task);
+        };
+
+        if (!window.EventSource) {
+            const refreshTasks = async () => renderAll(await fetchTasks());
+            await refreshTasks();
+            taskRefreshInterval = setInterval(refreshTasks, 5000);
+            return;
+        }
+
+        taskEventSource = new EventSource('/api/events');
+        const listen = (type, handler) => taskEventSource.addEventListener(type, (event) => handler(JSON.parse(event.data)));
+        listen('snapshot', renderAll);
+        listen('tasks', renderAll);
+        listen('task_started', (data) => updateTaskRow(data.task_id, {is_running: true, progress: null, queue_position: null}));
+        listen('task_progress', (data) => updateTaskRow(data.task_id, {
+            progress: {page: data.page, max_pages: data.max_pages, processed: data.processed, recommended: data.recommended}
+        }));
+        listen('task_finished', (data) => updateTaskRow(data.task_id, {is_running: false, progress: null}));
+    }
+
     async function initializeLogsView() {
         const logContainer = document.getElementById('log-content-container');
         const refreshBtn = document.getElementById('refresh-logs-btn');
         const autoRefreshCheckbox = document.getElementById('auto-refresh-logs-checkbox');
         const clearBtn = document.getElementById('clear-logs-btn');
+        const taskSelector = document.getElementById('log-task-selector');
         let currentLogSize = 0;
 
+        const tasks = await fetchTasks();
+        if (tasks) {
+            tasks.forEach(task => {
+                const option = document.createElement('option');
+                option.value = task.id;
+                option.textContent = task.task_name;
+                taskSelector.appendChild(option);
+            });
+        }
+
+        // 选中单个任务时显示该任务最近一次运行的日志
+        const showTaskRun = async () => {
+            const data = await fetchTaskLogs(taskSelector.value);
+            let header = '该任务尚无运行记录。';
+            if (data.run) {
+                const status = data.run.finished_at ? `结束于 ${data.run.finished_at}，退出码 ${data.run.exit_code}` : '运行中';
+                header = `# 最近一次运行: ${data.run.started_at} (${status})\n`;
+            }
+            const shouldAutoScroll = logContainer.scrollHeight - logContainer.clientHeight <= logContainer.scrollTop + 5;
+            logContainer.textContent = header + (data.content || '');
+            if (shouldAutoScroll) {
+                logContainer.scrollTop = logContainer.scrollHeight;
+            }
+        };
+
         const updateLogs = async (isFullRefresh = false) => {
             // For incremental updates, check if user is at the bottom BEFORE adding new content.
             const shouldAutoScroll = isFullRefresh || (logContainer.scrollHeight - logContainer.clientHeight <= logContainer.scrollTop + 5);
@@ -806,7 +935,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 logContainer.textContent = '正在加载...';
             }
 
-            const logData = await fetchLogs(currentLogSize);
+            // 全量刷新只加载最后一部分日志
+            const logData = await fetchLogs(currentLogSize, isFullRefresh ? LOG_TAIL_KB : 0);
 
             if (isFullRefresh) {
                 // If the log is empty, show a message instead of a blank screen.
@@ -827,13 +957,62 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         };
 
-        refreshBtn.addEventListener('click', () => updateLogs(true));
+        const appendLogContent = (content, replace) => {
+            const shouldAutoScroll = replace || (logContainer.scrollHeight - logContainer.clientHeight <= logContainer.scrollTop + 5);
+            if (replace || logContainer.textContent === '日志为空，等待内容...') {
+                logContainer.textContent = content || '日志为空，等待内容...';
+            } else {
+                let text = logContainer.textContent + content;
+                if (text.length > LOG_MAX_CHARS) {
+                    text = text.slice(text.length - LOG_MAX_CHARS);
+                }
+                logContainer.textContent = text;
+            }
+            if (shouldAutoScroll) {
+                logContainer.scrollTop = logContainer.scrollHeight;
+            }
+        };
+
+        // 优先使用服务端推送 (SSE)，浏览器不支持时退回每秒轮询
+        const startLogStreaming = () => {
+            stopLogStreaming();
+            if (taskSelector.value !== '') {
+                logRefreshInterval = setInterval(showTaskRun, 2000);
+                return;
+            }
+            if (!window.EventSource) {
+                logRefreshInterval = setInterval(() => updateLogs(false), 1000);
+                return;
+            }
+            logEventSource = new EventSource(`/api/logs/stream?tail_kb=${LOG_TAIL_KB}`);
+            logEventSource.addEventListener('reset', (event) => {
+                const data = JSON.parse(event.data);
+                appendLogContent(data.content, true);
+                currentLogSize = data.pos;
+            });
+            logEventSource.addEventListener('chunk', (event) => {
+                const data = JSON.parse(event.data);
+                appendLogContent(data.content, false);
+                currentLogSize = data.pos;
+            });
+        };
+
+        const refreshCurrentView = () => taskSelector.value === '' ? updateLogs(true) : showTaskRun();
+
+        refreshBtn.addEventListener('click', refreshCurrentView);
+
+        taskSelector.addEventListener('change', async () => {
+            await refreshCurrentView();
+            if (autoRefreshCheckbox.checked) {
+                startLogStreaming();
+            }
+        });
 
         clearBtn.addEventListener('click', async () => {
             if (confirm('你确定要清空所有运行日志吗？此操作不可恢复。')) {
                 const result = await clearLogs();
                 if (result) {
-                    await updateLogs(true);
+                    await refreshCurrentView();
                     alert('日志已清空。');
                 }
             }
@@ -841,13 +1020,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
         autoRefreshCheckbox.addEventListener('change', () => {
             if (autoRefreshCheckbox.checked) {
-                if (logRefreshInterval) clearInterval(logRefreshInterval);
-                logRefreshInterval = setInterval(() => updateLogs(false), 1000);
+                startLogStreaming();
             } else {
-                if (logRefreshInterval) {
-                    clearInterval(logRefreshInterval);
-                    logRefreshInterval = null;
-                }
+                stopLogStreaming();
             }
         });
 
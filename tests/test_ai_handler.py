@@ -4,10 +4,13 @@ import base64
 import os
 import json
 from unittest.mock import patch, mock_open, MagicMock, AsyncMock
+from src import ai_handler
 from src.ai_handler import (
     safe_print,
     _download_single_image,
     download_all_images,
+    download_images_in_memory,
+    _resize_image_bytes,
     cleanup_task_images,
     encode_image_to_base64,
     validate_ai_response_format,
@@ -71,6 +74,42 @@ async def test_download_all_images(mock_download_single, mock_exists, mock_maked
     mock_makedirs.assert_called_once()
 
 
+@patch("src.ai_handler._fetch_image_bytes")
+@pytest.mark.asyncio
+async def test_download_images_in_memory(mock_fetch, tmp_path):
+    """Test that images stay in memory until the cap, then spill to disk"""
+    mock_fetch.side_effect = [b"a" * 600, b"b" * 600]
+
+    with patch("src.ai_handler.IMAGE_MEMORY_LIMIT_MB", 1000 / (1024 * 1024)), \
+            patch("src.ai_handler.IMAGE_MAX_DIMENSION", 0), \
+            patch("src.ai_handler.IMAGE_SAVE_DIR", str(tmp_path)):
+        result = await download_images_in_memory(
+            "12345", ["https://test.com/image1.jpg", "https://test.com/image2.jpg"], "test_task"
+        )
+
+    assert result[0] == b"a" * 600
+    assert isinstance(result[1], str)
+    with open(result[1], "rb") as f:
+        assert f.read() == b"b" * 600
+
+
+def test_resize_image_bytes():
+    """Test the _resize_image_bytes function"""
+    from io import BytesIO
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (2000, 1000), "white").save(buffer, format="PNG")
+    original = buffer.getvalue()
+
+    resized = _resize_image_bytes(original, 500)
+    with Image.open(BytesIO(resized)) as img:
+        assert max(img.size) == 500
+
+    # Images already within bounds are returned untouched
+    assert _resize_image_bytes(resized, 1000) is resized
+
+
 @patch("src.ai_handler.os.path.exists")
 @patch("src.ai_handler.shutil.rmtree")
 def test_cleanup_task_images(mock_rmtree, mock_exists):
@@ -109,6 +148,11 @@ def test_encode_image_to_base64(mock_file, mock_exists):
     assert result == expected
 
 
+def test_encode_image_bytes_to_base64():
+    """Test that in-memory image bytes are encoded without touching the filesystem"""
+    assert encode_image_to_base64(b"test image data") == base64.b64encode(b"test image data").decode('utf-8')
+
+
 def test_validate_ai_response_format():
     """Test the validate_ai_response_format function"""
     # Test valid response
@@ -147,15 +191,15 @@ def test_validate_ai_response_format():
     assert validate_ai_response_format(invalid_response) is False
 
 
-@patch("src.ai_handler.requests.post")
 @pytest.mark.asyncio
-async def test_send_ntfy_notification(mock_requests_post):
+async def test_send_ntfy_notification():
     """Test the send_ntfy_notification function"""
-    # Mock successful response
-    mock_response = MagicMock()
-    mock_response.raise_for_status.return_value = None
-    mock_requests_post.return_value = mock_response
-    
+    mock_dispatcher = MagicMock()
+    mock_dispatcher.channels = [MagicMock()]
+    mock_dispatcher.dispatch = AsyncMock(return_value=[
+        {"channel": "ntfy", "success": True, "error": None, "latency_ms": 12.0}
+    ])
+
     # Test data
     product_data = {
         "商品标题": "Test Product",
@@ -163,20 +207,23 @@ async def test_send_ntfy_notification(mock_requests_post):
         "商品链接": "https://item.goofish.com/item.htm?id=12345"
     }
     reason = "test reason"
-    
-    # Call function with a mock NTFY_TOPIC_URL
-    with patch("src.ai_handler.NTFY_TOPIC_URL", "https://ntfy.test.com"):
-        await send_ntfy_notification(product_data, reason)
-    
+
+    with patch("src.ai_handler.get_notification_dispatcher", return_value=mock_dispatcher):
+        results = await send_ntfy_notification(product_data, reason)
+
     # Verify
-    mock_requests_post.assert_called_once()
+    mock_dispatcher.dispatch.assert_called_once()
+    message = mock_dispatcher.dispatch.call_args[0][0]
+    assert "test reason" in message["content"]
+    assert results[0]["success"] is True
 
 
-@patch("src.ai_handler.client")
+@patch("src.ai_handler.get_client")
 @patch("src.ai_handler.encode_image_to_base64")
 @pytest.mark.asyncio
-async def test_get_ai_analysis(mock_encode_image, mock_client):
+async def test_get_ai_analysis(mock_encode_image, mock_get_client):
     """Test the get_ai_analysis function"""
+    mock_client = mock_get_client.return_value
     # Mock encode_image_to_base64 to return a base64 string
     mock_encode_image.return_value = "dGVzdCBpbWFnZSBkYXRh"  # "test image data" base64 encoded
     
@@ -226,4 +273,165 @@ async def test_get_ai_analysis(mock_encode_image, mock_client):
     # Verify
     assert result is not None
     assert result["is_recommended"] is True
-    assert result["reason"] == "test reason"
\ No newline at end of file
+    assert result["reason"] == "test reason"
+
+def _valid_ai_response():
+    return json.dumps({
+        "prompt_version": "1.0",
+        "is_recommended": False,
+        "reason": "test reason",
+        "risk_tags": [],
+        "criteria_analysis": {
+            "model_chip": {}, "battery_health": {}, "condition": {}, "history": {},
+            "seller_type": {"analysis_details": {
+                "temporal_analysis": "", "selling_behavior": "",
+                "buying_behavior": "", "behavioral_summary": ""
+            }},
+            "shipping": {}, "seller_credit": {}
+        }
+    })
+
+
+class _RemoteImageRejected(Exception):
+    status_code = 400
+
+
+@pytest.mark.asyncio
+async def test_get_ai_analysis_url_mode_falls_back_to_base64(tmp_path, monkeypatch):
+    """Test that image URLs are sent directly and fall back to base64 when rejected"""
+    monkeypatch.chdir(tmp_path)
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = _valid_ai_response()
+
+    sent_messages = []
+
+    async def fake_create(**kwargs):
+        sent_messages.append(kwargs["messages"])
+        if len(sent_messages) == 1:
+            raise _RemoteImageRejected("Error code: 400 - image url could not be downloaded")
+        return completion
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = fake_create
+    product_data = {"商品信息": {"商品ID": "12345", "商品标题": "Test Product"}}
+
+    with patch("src.ai_handler.get_client", return_value=mock_client), \
+            patch("src.ai_handler.AI_IMAGE_INPUT_MODE", "url"), \
+            patch("src.ai_handler._remote_image_urls_supported", True), \
+            patch("src.ai_handler.IMAGE_IN_MEMORY", True), \
+            patch("src.ai_handler._fetch_image_bytes", AsyncMock(return_value=b"image-bytes")):
+        result = await get_ai_analysis(
+            product_data, [], "Test prompt", image_urls=["https://img.test.com/1.jpg"]
+        )
+
+    first_image = sent_messages[0][0]["content"][0]["image_url"]["url"]
+    second_image = sent_messages[1][0]["content"][0]["image_url"]["url"]
+    assert first_image == "https://img.test.com/1.jpg"
+    assert second_image == "data:image/jpeg;base64," + base64.b64encode(b"image-bytes").decode()
+    assert result["image_input"]["mode"] == "base64"
+    assert result["image_input"]["fallback_from"] == "url"
+
+
+@pytest.mark.asyncio
+async def test_get_ai_analysis_fallback_removes_spilled_images(tmp_path, monkeypatch):
+    """Test images downloaded for the base64 fallback go to the task folder and are deleted afterwards"""
+    monkeypatch.chdir(tmp_path)
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = _valid_ai_response()
+    calls = []
+
+    async def fake_create(**kwargs):
+        calls.append(kwargs["messages"])
+        if len(calls) == 1:
+            raise _RemoteImageRejected("Error code: 400 - image url could not be downloaded")
+        return completion
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = fake_create
+    product_data = {"商品信息": {"商品ID": "12345", "商品标题": "Test Product"}}
+    written = []
+    original_write = ai_handler._write_bytes
+
+    def record_write(path, data):
+        written.append(path)
+        original_write(path, data)
+
+    with patch("src.ai_handler.get_client", return_value=mock_client), \
+            patch("src.ai_handler.AI_IMAGE_INPUT_MODE", "url"), \
+            patch("src.ai_handler._remote_image_urls_supported", True), \
+            patch("src.ai_handler.IMAGE_IN_MEMORY", True), \
+            patch("src.ai_handler.IMAGE_MEMORY_LIMIT_MB", 0), \
+            patch("src.ai_handler._write_bytes", record_write), \
+            patch("src.ai_handler._fetch_image_bytes", AsyncMock(return_value=b"image-bytes")):
+        result = await get_ai_analysis(
+            product_data, [], "Test prompt", image_urls=["https://img.test.com/1.jpg"], task_name="camera"
+        )
+        assert ai_handler.remote_image_urls_enabled() is False
+
+    assert result["image_input"]["mode"] == "base64"
+    assert len(written) == 1 and "task_images_camera" in written[0]
+    assert not os.path.exists(written[0])
+
+
+@pytest.mark.asyncio
+async def test_get_ai_analysis_fallback_does_not_use_up_retries(tmp_path, monkeypatch):
+    """Test a rejection on the last attempt still retries once with base64"""
+    monkeypatch.chdir(tmp_path)
+    invalid = MagicMock()
+    invalid.choices = [MagicMock()]
+    invalid.choices[0].message.content = "not json"
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = _valid_ai_response()
+
+    sent_messages = []
+
+    async def fake_create(**kwargs):
+        sent_messages.append(kwargs["messages"])
+        if len(sent_messages) < 3:
+            return invalid
+        if len(sent_messages) == 3:
+            raise _RemoteImageRejected("Error code: 400 - image url could not be downloaded")
+        return completion
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = fake_create
+    product_data = {"商品信息": {"商品ID": "12345", "商品标题": "Test Product"}}
+
+    with patch("src.ai_handler.get_client", return_value=mock_client), \
+            patch("src.ai_handler.AI_IMAGE_INPUT_MODE", "url"), \
+            patch("src.ai_handler._remote_image_urls_supported", True), \
+            patch("src.ai_handler.IMAGE_IN_MEMORY", True), \
+            patch("src.ai_handler._fetch_image_bytes", AsyncMock(return_value=b"image-bytes")):
+        result = await get_ai_analysis(
+            product_data, [], "Test prompt", image_urls=["https://img.test.com/1.jpg"]
+        )
+
+    assert len(sent_messages) == 4
+    assert result["image_input"]["fallback_from"] == "url"
+    assert result["reason"] == "test reason"
+
+
+@pytest.mark.asyncio
+async def test_get_ai_analysis_url_mode_records_savings(tmp_path, monkeypatch):
+    """Test that URL mode records the bytes it avoided uploading"""
+    monkeypatch.chdir(tmp_path)
+    completion = MagicMock()
+    completion.choices = [MagicMock()]
+    completion.choices[0].message.content = _valid_ai_response()
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(return_value=completion)
+    product_data = {"商品信息": {"商品ID": "12345", "商品标题": "Test Product"}}
+
+    with patch("src.ai_handler.get_client", return_value=mock_client), \
+            patch("src.ai_handler.AI_IMAGE_INPUT_MODE", "url"), \
+            patch("src.ai_handler._remote_image_urls_supported", True):
+        result = await get_ai_analysis(
+            product_data, [b"x" * 300], "Test prompt", image_urls=["https://img.test.com/1.jpg"]
+        )
+
+    assert result["image_input"]["mode"] == "url"
+    assert result["image_input"]["bytes_saved"] == 400
+    assert result["image_input"]["bytes_saved_estimated"] is False
@@ -38,6 +38,7 @@ def test_config_constants():
     assert "Accept-Language" in IMAGE_DOWNLOAD_HEADERS
 
 
+@patch.dict("os.environ")
 @patch("src.config.os.getenv")
 def test_config_environment_variables(mock_getenv):
     """Test that environment variables are properly handled"""
@@ -74,7 +75,7 @@ def test_config_environment_variables(mock_getenv):
 
 
 @patch("src.config.os.getenv")
-@patch("src.config.AsyncOpenAI")
+@patch("openai.AsyncOpenAI")
 def test_client_initialization(mock_async_openai, mock_getenv):
     """Test that the AI client is properly initialized"""
     # Mock environment variables
@@ -89,8 +90,11 @@ def test_client_initialization(mock_async_openai, mock_getenv):
     import importlib
     import src.config
     importlib.reload(src.config)
-    
-    # Verify client was created
+
+    # The client is only created on first use, and then reused
+    mock_async_openai.assert_not_called()
+    assert src.config.get_client() is mock_async_openai.return_value
+    assert src.config.get_client() is mock_async_openai.return_value
     mock_async_openai.assert_called_once_with(api_key="test_key", base_url="https://api.test.com")
 
 
@@ -111,4 +115,42 @@ def test_client_initialization_missing_config(mock_getenv):
     importlib.reload(src.config)
     
     # Verify client is None
-    assert src.config.client is None
\ No newline at end of file
+    assert src.config.get_client() is None
+    assert src.config.client is None
+
+
+def test_import_does_not_load_openai():
+    """Test importing config does not import openai or create directories"""
+    import subprocess
+    import sys
+    code = "import sys, src.config; print('openai' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip().splitlines()[-1] == "False"
+
+def test_reload_notification_config(tmp_path, monkeypatch):
+    """Test notification settings saved to .env take effect without restarting"""
+    import src.config
+    monkeypatch.delenv("NTFY_TOPIC_URL", raising=False)
+    monkeypatch.delenv("BARK_URL", raising=False)
+    env_file = tmp_path / ".env"
+    env_file.write_text("NTFY_TOPIC_URL=https://ntfy.test.com/topic\nBARK_URL=\n", encoding="utf-8")
+
+    src.config.reload_notification_config(str(env_file))
+
+    assert src.config.NTFY_TOPIC_URL == "https://ntfy.test.com/topic"
+    assert not src.config.BARK_URL
+    monkeypatch.undo()
+    src.config._load_notification_config()
+
+
+def test_import_applies_proxy():
+    """Test importing config sets the proxy environment variables before any client is created"""
+    import os
+    import subprocess
+    import sys
+    env = dict(os.environ, PROXY_URL="http://proxy.test.com:8080")
+    env.pop("HTTP_PROXY", None)
+    env.pop("HTTPS_PROXY", None)
+    code = "import os, src.config; print(os.environ.get('HTTP_PROXY'), os.environ.get('HTTPS_PROXY'))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    assert result.stdout.strip().splitlines()[-1] == "http://proxy.test.com:8080 http://proxy.test.com:8080"
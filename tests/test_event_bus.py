@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from src.event_bus import EventBus, EventSubscriber, TaskProgressParser, stream_events
+
+
+def _parse_sse(raw: str) -> tuple[str, dict]:
+    lines = raw.strip().split("\n")
+    return lines[0][len("event: "):], json.loads(lines[-1][len("data: "):])
+
+
+@pytest.mark.asyncio
+async def test_publish_reaches_all_subscribers():
+    """Test a published event is delivered to every subscriber with a sequence number"""
+    bus = EventBus()
+    first, second = bus.subscribe(), bus.subscribe()
+    bus.publish("task_started", {"task_id": 0})
+
+    event = await first.get(timeout=1)
+    assert event["type"] == "task_started"
+    assert event["seq"] == 1
+    assert event["data"] == {"task_id": 0}
+    assert (await second.get(timeout=1)) == event
+
+    bus.unsubscribe(second)
+    bus.publish("task_finished", {"task_id": 0})
+    assert (await first.get(timeout=1))["seq"] == 2
+    assert second.queue.empty()
+
+
+def test_subscriber_overflow_requests_resync():
+    """Test a slow subscriber drops its backlog and receives a resync event"""
+    subscriber = EventSubscriber(queue_size=2)
+    for i in range(3):
+        subscriber.push({"type": "task_progress", "data": {"page": i}})
+    assert subscriber.queue.qsize() == 1
+    assert subscriber.queue.get_nowait()["type"] == "resync"
+
+
+def test_task_progress_parser():
+    """Test progress is parsed from the scraper's own output lines"""
+    parser = TaskProgressParser()
+    assert parser.feed("LOG: 正在监控...\n") is None
+    assert parser.feed("\n--- 正在处理第 2/5 页 ---\n") == {
+        "page": 2, "max_pages": 5, "processed": 0, "recommended": 0,
+    }
+    parser.feed("   -> 商品被AI推荐，准备发送通知...\n")
+    progress = parser.feed("   -> 商品处理流程完毕。累计处理 7 个新商品。\n")
+    assert progress == {"page": 2, "max_pages": 5, "processed": 7, "recommended": 1}
+
+
+@pytest.mark.asyncio
+async def test_stream_events_snapshot_then_events():
+    """Test the SSE stream starts with a snapshot, pushes events, and re-snapshots on resync"""
+    bus = EventBus()
+    snapshots = []
+
+    async def snapshot_factory():
+        snapshots.append(1)
+        return [{"id": 0, "is_running": False}]
+
+    stream = stream_events(bus, snapshot_factory, heartbeat=1)
+    event, data = _parse_sse(await stream.__anext__())
+    assert event == "snapshot"
+    assert data == [{"id": 0, "is_running": False}]
+
+    bus.publish("task_progress", {"task_id": 0, "page": 1})
+    event, data = _parse_sse(await asyncio.wait_for(stream.__anext__(), timeout=2))
+    assert event == "task_progress"
+    assert data == {"task_id": 0, "page": 1}
+
+    subscriber = next(iter(bus.subscribers))
+    subscriber.queue.put_nowait({"type": "resync", "data": {}})
+    event, _ = _parse_sse(await asyncio.wait_for(stream.__anext__(), timeout=2))
+    assert event == "snapshot"
+    assert len(snapshots) == 2
+
+    await stream.aclose()
+    assert not bus.subscribers
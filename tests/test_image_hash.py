@@ -0,0 +1,90 @@
+import pytest
+from io import BytesIO
+from unittest.mock import patch
+
+from PIL import Image
+
+from src.image_hash import (
+    ImageHashIndex,
+    compute_dhash,
+    compute_image_hashes,
+    match_previous_verdict,
+)
+
+
+def _make_image_bytes(size=(64, 64), step=4):
+    """Build a simple horizontal gradient image"""
+    img = Image.new("L", size)
+    img.putdata([(x * step) % 256 for y in range(size[1]) for x in range(size[0])])
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_compute_dhash_is_stable_across_resizes():
+    """Test that a resized copy of an image hashes to a near-identical value"""
+    original = _make_image_bytes((64, 64))
+    with Image.open(BytesIO(original)) as img:
+        buffer = BytesIO()
+        img.resize((128, 128)).save(buffer, format="JPEG", quality=70)
+
+    distance = bin(compute_dhash(original) ^ compute_dhash(buffer.getvalue())).count("1")
+    assert distance <= 6
+
+
+def test_image_hash_index_find():
+    """Test Hamming-distance lookups with and without the band index"""
+    index = ImageHashIndex("unused.npz")
+    index.add("1", [0b1111], {"is_recommended": True, "reason": "ok", "seller_id": "s1"})
+    index.add("2", [0xFFFF_0000_FFFF_0000])
+
+    # Unindexed tail is scanned linearly
+    assert index.find(0b0111, max_distance=1) == [("1", 1)]
+
+    # After building the band index the same results are returned
+    index._rebuild_bands()
+    assert index.find(0b0111, max_distance=1) == [("1", 1)]
+    assert index.find(0b0111, max_distance=0) == []
+
+    item_id, matched, verdict = index.find_similar_item([0b1111, 0xFFFF], max_distance=2)
+    assert item_id == "1"
+    assert matched == 1
+    assert verdict["seller_id"] == "s1"
+
+
+def test_image_hash_index_save_and_load(tmp_path):
+    """Test that the index round-trips through disk"""
+    filepath = str(tmp_path / "index.npz")
+    index = ImageHashIndex(filepath)
+    index.add("42", [123, 456], {"is_recommended": False, "reason": "no", "seller_id": "s"})
+    assert index.save()
+
+    loaded = ImageHashIndex(filepath)
+    assert loaded.load()
+    assert len(loaded) == 2
+    assert loaded.find(456, max_distance=0) == [("42", 0)]
+    assert loaded.find_similar_item([123])[2]["reason"] == "no"
+
+
+def test_match_previous_verdict():
+    """Test verdict reuse for reposts and the stolen-photo flag for other sellers"""
+    index = ImageHashIndex("unused.npz")
+    index.add("100", [1, 2], {"is_recommended": True, "reason": "good deal", "seller_id": "seller_a"})
+
+    with patch("src.image_hash.get_image_hash_index", return_value=index):
+        reused = match_previous_verdict([1, 2], "200", "seller_a")
+        stolen = match_previous_verdict([1, 2], "300", "seller_b")
+        unrelated = match_previous_verdict([0xFFFF_FFFF_FFFF_0000], "400", "seller_c")
+
+    assert reused["is_recommended"] is True
+    assert reused["reused_from_item_id"] == "100"
+    assert stolen["is_recommended"] is False
+    assert "疑似盗图" in stolen["risk_tags"]
+    assert unrelated is None
+
+
+@pytest.mark.asyncio
+async def test_compute_image_hashes_skips_invalid_images():
+    """Test that undecodable images are skipped"""
+    hashes = await compute_image_hashes([_make_image_bytes(), b"not an image"])
+    assert len(hashes) == 1
@@ -0,0 +1,90 @@
+import json
+
+from src.item_tracker import ItemTracker, item_fingerprint, material_change
+
+
+def _write_records(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def _record(item_id, price, title="索尼 A7M3", wants="3", seller=None):
+    return {
+        "商品信息": {
+            "商品ID": item_id,
+            "商品标题": title,
+            "当前售价": price,
+            "“想要”人数": wants,
+            "商品链接": f"https://www.goofish.com/item?id={item_id}&categoryId=1",
+            "商品图片列表": [f"https://img/{item_id}.jpg"],
+        },
+        "卖家信息": seller or {"卖家昵称": "someone"},
+    }
+
+
+def test_material_change_only_for_price_drops_and_title_edits():
+    """Test only a big enough price drop or a new title triggers re-analysis"""
+    base = item_fingerprint({"当前售价": "¥5,000", "商品标题": "相机", "“想要”人数": "3"})
+    assert base == (5000.0, "相机", "3")
+    assert material_change(base, (3800.0, "相机", "3"), 5).startswith("降价 ¥5000 -> ¥3800")
+    assert material_change(base, (4900.0, "相机", "3"), 5) is None
+    assert material_change(base, (5500.0, "相机", "3"), 5) is None
+    assert material_change(base, (5000.0, "相机", "40"), 5) is None
+    assert material_change(base, (5000.0, "相机 急出", "3"), 5) == "标题已修改"
+    assert material_change((None, "相机", "3"), (100.0, "相机", "3"), 5) is None
+
+
+def test_tracker_uses_latest_record_as_baseline(tmp_path):
+    """Test fingerprints come from the most recent record of each item"""
+    path = tmp_path / "kw_full_data.jsonl"
+    _write_records(path, [_record("1", "5000"), _record("2", "800"), _record("1", "4500", seller={"卖家昵称": "latest"})])
+    tracker = ItemTracker(str(path), enabled=True, price_drop_percent=5)
+    tracker.load()
+
+    key = "https://www.goofish.com/item?id=1"
+    assert len(tracker) == 2 and key in tracker
+    # 相对最近一次记录 (4500) 只降了约 2%，不重新分析
+    assert tracker.change(key, {"当前售价": "4400", "商品标题": "索尼 A7M3"}) is None
+    change = tracker.change(key, {"当前售价": "3800", "商品标题": "索尼 A7M3"})
+    assert change["上次售价"] == 4500.0
+    assert tracker.previous_record(key)["卖家信息"] == {"卖家昵称": "latest"}
+
+    tracker.record(key, {"当前售价": "3800", "商品标题": "索尼 A7M3"})
+    assert tracker.change(key, {"当前售价": "3800", "商品标题": "索尼 A7M3"}) is None
+
+
+def test_tracker_disabled_or_unknown_items(tmp_path):
+    """Test no change is reported when tracking is off or the item is new"""
+    path = tmp_path / "kw_full_data.jsonl"
+    _write_records(path, [_record("1", "5000")])
+    tracker = ItemTracker(str(path), enabled=False)
+    tracker.load()
+    key = "https://www.goofish.com/item?id=1"
+    assert tracker.change(key, {"当前售价": "100", "商品标题": "索尼 A7M3"}) is None
+
+    missing = ItemTracker(str(tmp_path / "missing.jsonl"), enabled=True)
+    missing.load()
+    assert len(missing) == 0
+    assert missing.change(key, {"当前售价": "100"}) is None
+
+
+def test_previous_record_reads_latest_line_by_offset(tmp_path):
+    """Test previous_record seeks to the latest record of the item, including records appended during the run"""
+    path = tmp_path / "kw_full_data.jsonl"
+    _write_records(path, [_record("1", "5000"), _record("2", "800", title="富士 X100V")])
+    tracker = ItemTracker(str(path), enabled=True)
+    tracker.load()
+    key = "https://www.goofish.com/item?id=2"
+    assert tracker.previous_record(key)["商品信息"]["商品标题"] == "富士 X100V"
+
+    offset = tracker.end_offset()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(_record("2", "700", seller={"卖家昵称": "appended"}), ensure_ascii=False) + "\n")
+    tracker.record(key, {"当前售价": "700", "商品标题": "索尼 A7M3"}, offset)
+    assert tracker.previous_record(key)["卖家信息"] == {"卖家昵称": "appended"}
+
+    # 文件被外部改写后，偏移处不再是该商品的记录
+    _write_records(path, [_record("3", "100"), _record("3", "100"), _record("3", "100")])
+    assert tracker.previous_record(key) is None
+    assert tracker.previous_record("https://www.goofish.com/item?id=404") is None
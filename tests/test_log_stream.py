@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import pytest
+
+from src.log_stream import LogSubscriber, LogTailer, read_tail, stream_log_events
+
+
+def _parse_sse(raw: str) -> tuple[str, dict]:
+    lines = raw.strip().split("\n")
+    return lines[0][len("event: "):], json.loads(lines[1][len("data: "):])
+
+
+def test_read_tail_starts_at_line_boundary(tmp_path):
+    """Test read_tail returns only complete lines from the end of the file"""
+    path = tmp_path / "scraper.log"
+    path.write_text("first line\nsecond line\nthird line\n", encoding="utf-8")
+
+    content, size = read_tail(str(path), 15)
+    assert content == "third line\n"
+    assert size == path.stat().st_size
+    assert read_tail(str(path), 1024)[0].startswith("first line")
+    assert read_tail(str(tmp_path / "missing.log"), 1024) == ("", 0)
+
+
+def test_subscriber_overflow_requests_resync():
+    """Test a slow subscriber drops its backlog and receives a resync event"""
+    subscriber = LogSubscriber(queue_size=2)
+    for i in range(3):
+        subscriber.push({"type": "chunk", "content": str(i)})
+    assert subscriber.queue.qsize() == 1
+    assert subscriber.queue.get_nowait() == {"type": "resync"}
+
+
+@pytest.mark.asyncio
+async def test_tailer_shares_one_reader(tmp_path):
+    """Test several subscribers receive the same appended chunks from one reader"""
+    path = tmp_path / "scraper.log"
+    path.write_text("old\n", encoding="utf-8")
+    tailer = LogTailer(str(path), poll_interval=0.01)
+    first, second = tailer.subscribe(), tailer.subscribe()
+    task = tailer._task
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("新的一行\n")
+
+    event = await first.get(timeout=1)
+    assert event["type"] == "chunk"
+    assert event["content"] == "新的一行\n"
+    assert (await second.get(timeout=1)) == event
+    assert tailer._task is task
+
+    # 文件被清空时推送 reset
+    path.write_text("", encoding="utf-8")
+    assert (await first.get(timeout=1))["type"] == "reset"
+
+    tailer.unsubscribe(first)
+    tailer.unsubscribe(second)
+    await asyncio.sleep(0.05)
+    assert tailer._task is None
+
+
+@pytest.mark.asyncio
+async def test_stream_log_events_snapshot_then_chunks(tmp_path):
+    """Test the SSE stream starts with the tail snapshot and then pushes new content only once"""
+    path = tmp_path / "scraper.log"
+    path.write_text("a" * 100 + "\nline 1\n", encoding="utf-8")
+
+    stream = stream_log_events(str(path), tail_bytes=20, heartbeat=1)
+    event, data = _parse_sse(await stream.__anext__())
+    assert event == "reset"
+    assert data["content"] == "line 1\n"
+
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("line 2\n")
+    event, data = _parse_sse(await asyncio.wait_for(stream.__anext__(), timeout=2))
+    assert event == "chunk"
+    assert data["content"] == "line 2\n"
+    assert data["pos"] == path.stat().st_size
+    await stream.aclose()
@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+import pytest
+
+from src.loop_watchdog import LoopWatchdog
+from src.metrics import get_metrics
+
+
+def _blocked_count():
+    for name, labels, value in get_metrics().snapshot()["values"]:
+        if name == "goofish_loop_blocked_total" and labels == {"process": "test"}:
+            return value
+    return 0
+
+
+def blocking_call():
+    time.sleep(0.3)
+
+
+@pytest.mark.asyncio
+async def test_reports_blocking_call_with_stack():
+    """Test a synchronous call that blocks the loop is reported with its stack"""
+    before = _blocked_count()
+    watchdog = LoopWatchdog("test", threshold_ms=100, interval=0.01)
+    watchdog.start()
+    await asyncio.sleep(0.05)
+    blocking_call()
+    await asyncio.sleep(0.05)
+    await watchdog.stop()
+
+    assert len(watchdog.recent) == 1
+    stall = watchdog.recent[0]
+    assert stall["blocked_ms"] >= 250
+    assert "blocking_call" in stall["stack"]
+    assert _blocked_count() == before + 1
+
+
+@pytest.mark.asyncio
+async def test_ignores_short_pauses():
+    """Test pauses below the threshold only contribute to the lag histogram"""
+    watchdog = LoopWatchdog("test", threshold_ms=200, interval=0.01)
+    watchdog.start()
+    for _ in range(5):
+        time.sleep(0.02)
+        await asyncio.sleep(0.01)
+    await watchdog.stop()
+    assert len(watchdog.recent) == 0
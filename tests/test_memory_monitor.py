@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src import memory_monitor
+from src.memory_monitor import MemorySampler, descendant_pids, process_tree_rss, read_rss_bytes, save_memory_report
+
+linux_only = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="RSS is read from /proc")
+
+
+@linux_only
+def test_process_tree_rss_includes_children():
+    """Test RSS is read for the process and its child processes"""
+    child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(5)"])
+    try:
+        assert read_rss_bytes(os.getpid()) > 0
+        assert child.pid in descendant_pids(os.getpid())
+        tree = process_tree_rss(os.getpid())
+        assert tree["children"] >= 1
+        assert tree["children_rss_bytes"] > 0
+    finally:
+        child.kill()
+        child.wait()
+
+
+def test_read_rss_of_missing_process():
+    """Test an unknown pid yields None instead of raising"""
+    assert read_rss_bytes(2 ** 30) is None
+
+
+@pytest.mark.asyncio
+async def test_sampler_records_stages_and_allocations():
+    """Test stage deltas and top allocation sites are reported"""
+    sampler = MemorySampler(interval=60)
+    sampler.start()
+    with sampler.stage("alloc"):
+        kept = [bytearray(1024) for _ in range(20000)]
+    report = await sampler.stop()
+
+    assert [s["label"] for s in report["snapshots"]] == ["start", "end"]
+    assert report["stages"]["alloc"]["count"] == 1
+    assert report["stages"]["alloc"]["traced_delta_mb"] > 10
+    locations = [a["location"] for a in report["snapshots"][-1]["top_allocations"]]
+    assert any("test_memory_monitor.py" in location for location in locations)
+    growth = report["snapshots"][-1]["top_growth"]
+    assert growth and "test_memory_monitor.py" in growth[0]["location"]
+    assert len(kept) == 20000
+
+
+def test_save_memory_report_prunes(tmp_path, monkeypatch):
+    """Test reports are written per task and old ones are removed"""
+    monkeypatch.setattr(memory_monitor, "MAX_REPORTS_PER_TASK", 1)
+    monkeypatch.setattr(memory_monitor.os, "getpid", lambda: 1)
+    first = save_memory_report("A B", {"stages": {}}, base_dir=str(tmp_path))
+    monkeypatch.setattr(memory_monitor.os, "getpid", lambda: 2)
+    second = save_memory_report("A B", {"stages": {}}, base_dir=str(tmp_path))
+    assert not os.path.exists(first)
+    assert os.path.exists(second)
+    assert os.path.dirname(second) == os.path.join(str(tmp_path), "A_B")
@@ -0,0 +1,132 @@
+import json
+import os
+import time
+
+from src.metrics import (
+    MetricsAggregator,
+    MetricsFileWriter,
+    MetricsRegistry,
+    merge_snapshots,
+    render_prometheus,
+)
+
+
+def test_counters_and_gauges():
+    """Test counters accumulate per label set and gauges are replaced"""
+    registry = MetricsRegistry()
+    registry.inc("goofish_items_total", task="A", result="new")
+    registry.inc("goofish_items_total", 2, task="A", result="new")
+    registry.inc("goofish_items_total", task="A", result="skipped")
+    registry.set_gauge("goofish_spiders_running", 3)
+    registry.set_gauge("goofish_spiders_running", 1)
+
+    values = {(name, tuple(sorted(labels.items()))): value for name, labels, value in registry.snapshot()["values"]}
+    assert values[("goofish_items_total", (("result", "new"), ("task", "A")))] == 3
+    assert values[("goofish_items_total", (("result", "skipped"), ("task", "A")))] == 1
+    assert values[("goofish_spiders_running", ())] == 1
+
+    registry.clear_gauge("goofish_spiders_running")
+    assert all(name != "goofish_spiders_running" for name, _, _ in registry.snapshot()["values"])
+
+
+def test_histogram_render():
+    """Test histogram buckets are cumulative and rendered in Prometheus text format"""
+    registry = MetricsRegistry()
+    registry.observe("goofish_stage_seconds", 0.2, stage="detail")
+    registry.observe("goofish_stage_seconds", 3, stage="detail")
+    registry.observe("goofish_stage_seconds", 1000, stage="detail")
+    text = render_prometheus(registry.snapshot())
+
+    assert "# TYPE goofish_stage_seconds histogram" in text
+    assert 'goofish_stage_seconds_bucket{stage="detail",le="0.1"} 0' in text
+    assert 'goofish_stage_seconds_bucket{stage="detail",le="0.25"} 1' in text
+    assert 'goofish_stage_seconds_bucket{stage="detail",le="5"} 2' in text
+    assert 'goofish_stage_seconds_bucket{stage="detail",le="+Inf"} 3' in text
+    assert 'goofish_stage_seconds_sum{stage="detail"} 1003.2' in text
+    assert 'goofish_stage_seconds_count{stage="detail"} 3' in text
+
+
+def test_render_escapes_label_values():
+    """Test quotes, backslashes and newlines in label values are escaped"""
+    registry = MetricsRegistry()
+    registry.inc("goofish_items_total", task='a"b\\c\nd', result="new")
+    text = render_prometheus(registry.snapshot())
+    assert 'goofish_items_total{result="new",task="a\\"b\\\\c\\nd"} 1' in text
+
+
+def test_merge_sums_counters_and_can_drop_gauges():
+    """Test merging snapshots from several processes"""
+    a, b = MetricsRegistry(), MetricsRegistry()
+    a.inc("goofish_retries_total", function="f")
+    b.inc("goofish_retries_total", 4, function="f")
+    a.observe("goofish_stage_seconds", 1, stage="search")
+    b.observe("goofish_stage_seconds", 2, stage="search")
+    b.set_gauge("goofish_spiders_running", 2)
+
+    merged = merge_snapshots([a.snapshot(), b.snapshot()])
+    assert [v for n, _, v in merged["values"] if n == "goofish_retries_total"] == [5]
+    assert merged["histograms"][0][2][-2:] == [3, 2]
+    assert any(n == "goofish_spiders_running" for n, _, _ in merged["values"])
+
+    without_gauges = merge_snapshots([a.snapshot(), b.snapshot()], include_gauges=False)
+    assert all(n != "goofish_spiders_running" for n, _, _ in without_gauges["values"])
+
+
+def test_aggregator_retires_finished_and_stale_snapshots(tmp_path):
+    """Test counters from exited spider processes are kept after their files are removed"""
+    directory = str(tmp_path)
+    registry = MetricsRegistry()
+    registry.inc("goofish_pages_fetched_total", task="A")
+    writer = MetricsFileWriter(registry, directory=directory)
+    writer.flush(final=True)
+
+    stale = {"values": [["goofish_pages_fetched_total", {"task": "A"}, 2]], "histograms": [],
+             "updated_at": time.time() - 3600, "final": False}
+    live = {"values": [["goofish_pages_fetched_total", {"task": "A"}, 5]], "histograms": [],
+            "updated_at": time.time(), "final": False}
+    for name, data in (("spider-1.json", stale), ("spider-2.json", live)):
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    aggregator = MetricsAggregator(directory=directory, stale_seconds=60)
+    merged = merge_snapshots(aggregator.collect())
+    assert merged["values"] == [["goofish_pages_fetched_total", {"task": "A"}, 8]]
+    assert sorted(os.listdir(directory)) == ["retired.json", "spider-2.json"]
+
+    # 再次汇总时已退出进程的计数不会重复累加
+    os.remove(os.path.join(directory, "spider-2.json"))
+    merged = merge_snapshots(aggregator.collect())
+    assert merged["values"] == [["goofish_pages_fetched_total", {"task": "A"}, 3]]
+
+
+def test_aggregator_does_not_double_count_resumed_stale_process(tmp_path):
+    """Test a spider retired as stale only adds its increase when it later writes its final snapshot"""
+    directory = str(tmp_path)
+    registry = MetricsRegistry()
+    registry.inc("goofish_pages_fetched_total", 3, task="A")
+    registry.observe("goofish_stage_seconds", 0.2, stage="detail")
+    writer = MetricsFileWriter(registry, directory=directory)
+    writer.flush()
+    with open(writer.path, encoding="utf-8") as f:
+        snapshot = json.load(f)
+    snapshot["updated_at"] = time.time() - 3600
+    with open(writer.path, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f)
+
+    aggregator = MetricsAggregator(directory=directory, stale_seconds=60)
+    merged = merge_snapshots(aggregator.collect())
+    assert merged["values"] == [["goofish_pages_fetched_total", {"task": "A"}, 3]]
+    assert not os.path.exists(writer.path)
+
+    # 事件循环恢复后继续写入累计快照：存活期间和最终快照都只计入增量
+    registry.inc("goofish_pages_fetched_total", 2, task="A")
+    writer.flush()
+    merged = merge_snapshots(aggregator.collect())
+    assert merged["values"] == [["goofish_pages_fetched_total", {"task": "A"}, 5]]
+    registry.observe("goofish_stage_seconds", 0.3, stage="detail")
+    writer.flush(final=True)
+    merged = merge_snapshots(aggregator.collect())
+    assert merged["values"] == [["goofish_pages_fetched_total", {"task": "A"}, 5]]
+    assert merged["histograms"][0][2][-1] == 2
+    assert merge_snapshots(aggregator.collect())["values"] == [["goofish_pages_fetched_total", {"task": "A"}, 5]]
+
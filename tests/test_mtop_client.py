@@ -0,0 +1,111 @@
+import hashlib
+import json
+
+import pytest
+
+from src.mtop_client import FetchStats, ItemFetchMeter, PageMtopClient, is_success, mtop_sign
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self._text = text
+
+    async def text(self):
+        return self._text
+
+
+class FakeRequestContext:
+    def __init__(self, texts):
+        self.texts = list(texts)
+        self.calls = []
+
+    async def post(self, url, form=None, headers=None):
+        self.calls.append((url, form))
+        return FakeResponse(self.texts.pop(0))
+
+
+class FakeContext:
+    def __init__(self, texts):
+        self.request = FakeRequestContext(texts)
+
+    async def cookies(self, url):
+        return [{"name": "_m_h5_tk", "value": "abc123_1700000000000"}]
+
+
+class FakePage:
+    def __init__(self, evaluate_result=None, texts=()):
+        self.evaluate_result = evaluate_result
+        self.evaluate_calls = []
+        self.context = FakeContext(texts)
+
+    async def evaluate(self, script, arg):
+        self.evaluate_calls.append(arg)
+        return self.evaluate_result
+
+
+def test_mtop_sign_and_success():
+    """Test the H5 signature and SUCCESS detection"""
+    expected = hashlib.md5(b"tok&1&34839810&{}").hexdigest()
+    assert mtop_sign("tok", "1", "{}") == expected
+    assert is_success({"ret": ["SUCCESS::调用成功"]})
+    assert not is_success({"ret": ["FAIL_SYS_USER_VALIDATE::被挤爆啦"]})
+    assert not is_success(None)
+
+
+@pytest.mark.asyncio
+async def test_request_uses_page_lib_mtop():
+    """Test requests go through the page's lib.mtop and report the payload size"""
+    text = json.dumps({"ret": ["SUCCESS::调用成功"], "data": {"itemDO": {}}})
+    page = FakePage(evaluate_result=text)
+    payload, size = await PageMtopClient(page).request("mtop.taobao.idle.pc.detail", {"itemId": "1"})
+    assert payload["data"] == {"itemDO": {}}
+    assert size == len(text.encode("utf-8"))
+    assert page.evaluate_calls == [{"api": "mtop.taobao.idle.pc.detail", "v": "1.0", "data": {"itemId": "1"}}]
+
+
+@pytest.mark.asyncio
+async def test_request_falls_back_to_signed_request():
+    """Test a signed request is sent when the page has no lib.mtop, retrying once on token expiry"""
+    page = FakePage(evaluate_result=None, texts=[
+        json.dumps({"ret": ["FAIL_SYS_TOKEN_EXOIRED::令牌过期"]}),
+        json.dumps({"ret": ["SUCCESS::调用成功"], "data": {"ok": 1}}),
+        json.dumps({"ret": ["SUCCESS::调用成功"], "data": {"ok": 2}}),
+    ])
+    client = PageMtopClient(page)
+    payload, _ = await client.request("mtop.idle.web.user.page.head", {"userId": "9"})
+    assert payload["data"] == {"ok": 1}
+    url, form = page.context.request.calls[-1]
+    assert "/mtop.idle.web.user.page.head/1.0/" in url and "appKey=34839810" in url
+    assert form == {"data": '{"userId":"9"}'}
+
+    # 之后的请求不再尝试 lib.mtop
+    payload, _ = await client.request("mtop.idle.web.user.page.head", {"userId": "9"})
+    assert payload["data"] == {"ok": 2}
+    assert len(page.evaluate_calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_meter_and_stats_summary():
+    """Test page request sizes are collected and summarized per mode"""
+    class FakeRequest:
+        async def sizes(self):
+            return {"responseBodySize": 1000, "responseHeadersSize": 24}
+
+    class MeterPage:
+        def on(self, event, handler):
+            self.handler = handler
+
+    meter = ItemFetchMeter("navigate")
+    page = MeterPage()
+    meter.track_page(page)
+    page.handler(FakeRequest())
+    page.handler(FakeRequest())
+    await meter.collect_page_sizes()
+    meter.add_bytes(2048)
+    assert meter.bytes == 4096
+
+    stats = FetchStats("T")
+    stats.record(meter)
+    assert stats.modes["navigate"]["items"] == 1
+    assert stats.summary()[0].startswith("navigate: 1 个商品")
+    assert "4 KB" in stats.summary()[0]
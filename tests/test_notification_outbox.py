@@ -0,0 +1,282 @@
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.notification_outbox import (
+    MAX_ATTEMPTS,
+    NotificationOutbox,
+    OutboxSender,
+    TokenBucket,
+    enqueue_notification,
+    parse_rate_limits,
+    resolve_digest_settings,
+)
+from src.notifier import NotificationChannel, NotificationDispatcher
+
+
+MESSAGE = {"title": "t", "content": "c", "link": "#", "image": None}
+
+
+class _FakeChannel(NotificationChannel):
+    """A fake channel that records sent messages and can be told to fail"""
+
+    def __init__(self, name, error=None):
+        super().__init__()
+        self.name = name
+        self.error = error
+        self.sent = []
+
+    async def send(self, http_client, message):
+        if self.error:
+            raise RuntimeError(self.error)
+        self.sent.append(message)
+
+    async def send_digest(self, http_client, messages, group=None):
+        if self.error:
+            raise RuntimeError(self.error)
+        self.sent.append({"digest": group, "messages": messages})
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return NotificationOutbox(str(tmp_path / "outbox.db"))
+
+
+def test_parse_rate_limits():
+    """Test parsing per-channel rate limits"""
+    assert parse_rate_limits("wecom=20, bark=30") == {"wecom": 20.0, "bark": 30.0}
+    assert parse_rate_limits("wecom=abc,ntfy") == {}
+    assert parse_rate_limits(None) == {}
+
+
+def test_token_bucket():
+    """Test the token bucket limits consumption to its capacity"""
+    bucket = TokenBucket(3)
+    assert bucket.available() == 3
+    assert [bucket.try_consume() for _ in range(4)] == [True, True, True, False]
+    bucket.drain()
+    assert bucket.available() == 0
+
+
+def test_enqueue_dedup(outbox):
+    """Test the same dedup key is only stored once per channel"""
+    assert outbox.enqueue(MESSAGE, "item-1", ["ntfy", "wecom"]) == 2
+    assert outbox.enqueue(MESSAGE, "item-1", ["ntfy", "wecom"]) == 0
+    assert outbox.enqueue(MESSAGE, "item-2", ["ntfy"]) == 1
+    assert outbox.pending_count() == 3
+    assert outbox.pending_count(["wecom"]) == 1
+
+
+def test_claim_and_backoff(outbox):
+    """Test claimed rows are leased and failures are rescheduled, then marked failed"""
+    outbox.enqueue(MESSAGE, "item-1", ["ntfy"])
+    rows = outbox.claim("ntfy", 10)
+    assert len(rows) == 1
+    assert rows[0]["message"] == MESSAGE
+    # 已领取的消息在租约期内不会被再次领取
+    assert outbox.claim("ntfy", 10) == []
+
+    outbox.mark_failed(rows[0]["id"], rows[0]["attempts"], "HTTP 500")
+    # 退避期内不会被领取
+    assert outbox.claim("ntfy", 10) == []
+    assert outbox.stats() == {"ntfy": {"pending": 1}}
+
+    outbox.mark_failed(rows[0]["id"], MAX_ATTEMPTS - 1, "HTTP 500")
+    assert outbox.stats() == {"ntfy": {"failed": 1}}
+    assert outbox.pending_count() == 0
+
+
+def test_outbox_survives_restart(outbox):
+    """Test pending rows are visible to a new outbox instance on the same file"""
+    outbox.enqueue(MESSAGE, "item-1", ["ntfy"])
+    reopened = NotificationOutbox(outbox.filepath)
+    assert reopened.pending_count() == 1
+    assert reopened.claim("ntfy", 10)[0]["message"] == MESSAGE
+
+
+def test_sender_lease(outbox):
+    """Test only one sender holds the lease at a time"""
+    assert outbox.acquire_sender_lease("a") is True
+    assert outbox.acquire_sender_lease("b") is False
+    assert outbox.acquire_sender_lease("a") is True
+    outbox.release_sender_lease("a")
+    assert outbox.acquire_sender_lease("b") is True
+
+
+def test_channel_leases_are_independent(outbox):
+    """Test leases are held per channel and released together on stop"""
+    assert outbox.acquire_sender_lease("a", "channel:ntfy") is True
+    assert outbox.acquire_sender_lease("b", "channel:ntfy") is False
+    assert outbox.acquire_sender_lease("b", "channel:wecom") is True
+    outbox.release_sender_lease("a")
+    assert outbox.acquire_sender_lease("b", "channel:ntfy") is True
+
+
+@pytest.mark.asyncio
+async def test_sender_without_channels_takes_no_lease(outbox):
+    """Test a sender with no configured channels never holds a lease"""
+    outbox.enqueue(MESSAGE, "item-1", ["ntfy"])
+    idle = OutboxSender(outbox, NotificationDispatcher([]))
+    assert await idle.drain_once() == 0
+    assert idle.is_leader is False
+
+    channel = _FakeChannel("ntfy")
+    assert await OutboxSender(outbox, NotificationDispatcher([channel])).drain_once() == 1
+    assert len(channel.sent) == 1
+
+
+@pytest.mark.asyncio
+async def test_sender_picks_up_channel_added_later(outbox):
+    """Test a channel added after the sender started is drained, even while another sender holds a different channel"""
+    wecom = _FakeChannel("wecom")
+    stale = OutboxSender(outbox, NotificationDispatcher([wecom]))
+    outbox.enqueue(MESSAGE, "item-1", ["wecom"])
+    assert await stale.drain_once() == 1
+    outbox.enqueue(MESSAGE, "item-2", ["wecom", "ntfy"])
+
+    dispatcher = NotificationDispatcher([])
+    sender = OutboxSender(outbox, dispatcher, poll_interval=0.01)
+    sender.start()
+    dispatcher.channels.append(_FakeChannel("ntfy"))
+    ntfy = dispatcher.channels[0]
+    # 旧进程仍持有 wecom 的租约，但不会阻止新进程投递 ntfy
+    assert await stale.drain_once() == 1
+    await sender.stop(flush_timeout=2)
+
+    assert len(ntfy.sent) == 1
+    assert len(wecom.sent) == 2
+    assert outbox.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_sender_drain_rate_limit_and_retry(outbox):
+    """Test the sender respects the channel rate limit and retries failed channels"""
+    ok = _FakeChannel("ntfy")
+    broken = _FakeChannel("wecom", error="HTTP 429 Too Many Requests")
+    dispatcher = NotificationDispatcher([ok, broken])
+    for i in range(5):
+        outbox.enqueue(MESSAGE, f"item-{i}", ["ntfy", "wecom"])
+
+    with patch("src.notification_outbox.NOTIFY_RATE_LIMITS", "ntfy=3"):
+        sender = OutboxSender(outbox, dispatcher)
+    sent = await sender.drain_once()
+
+    assert sent == 3
+    assert len(ok.sent) == 3
+    stats = outbox.stats()
+    assert stats["ntfy"] == {"pending": 2, "sent": 3}
+    # 限流错误清空令牌桶，失败消息进入退避
+    assert sender.buckets["wecom"].available() == 0
+    assert stats["wecom"]["pending"] == 5
+
+
+@pytest.mark.asyncio
+async def test_sender_stop_flushes(outbox):
+    """Test stopping the sender with a flush timeout delivers queued messages"""
+    channel = _FakeChannel("ntfy")
+    sender = OutboxSender(outbox, NotificationDispatcher([channel]), poll_interval=0.01)
+    sender.start()
+    outbox.enqueue(MESSAGE, "item-1", ["ntfy"])
+
+    start = time.monotonic()
+    await sender.stop(flush_timeout=2)
+    assert time.monotonic() - start < 2
+    assert len(channel.sent) == 1
+    assert outbox.pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_enqueue_notification_does_not_send(outbox):
+    """Test enqueue_notification only writes to the outbox"""
+    channel = _FakeChannel("ntfy")
+    product = {"商品ID": "123", "商品标题": "Test Product", "当前售价": "100", "商品链接": "https://www.goofish.com/item?id=123"}
+    with patch("src.notification_outbox.get_notification_dispatcher", return_value=NotificationDispatcher([channel])), \
+            patch("src.notification_outbox.get_notification_outbox", return_value=outbox):
+        assert await enqueue_notification(product, "good") == 1
+        assert await enqueue_notification(product, "good") == 0
+
+    assert channel.sent == []
+    rows = outbox.claim("ntfy", 10)
+    assert len(rows) == 1
+    assert "good" in rows[0]["message"]["content"]
+
+
+def test_resolve_digest_settings():
+    """Test task digest settings take precedence over channel settings"""
+    with patch("src.notification_outbox.NOTIFY_DIGEST_CHANNELS", "wecom=10"), \
+            patch("src.notification_outbox.NOTIFY_DIGEST_MAX_ITEMS", 5):
+        assert resolve_digest_settings("wecom", None) == (600.0, 5)
+        assert resolve_digest_settings("ntfy", None) is None
+        assert resolve_digest_settings("ntfy", {"digest_window_minutes": 1, "digest_max_items": 3}) == (60.0, 3)
+        assert resolve_digest_settings("wecom", {"digest_window_minutes": 0}) is None
+
+
+def test_claim_digests_by_window_and_count(outbox):
+    """Test digest groups are claimed once their window ends or they reach the item limit"""
+    outbox.enqueue(MESSAGE, "a-1", ["wecom"], {"wecom": ("task-a", 3600, 2)})
+    outbox.enqueue(MESSAGE, "b-1", ["wecom"], {"wecom": ("task-b", 0, 10)})
+    # 汇总消息不会被即时领取
+    assert outbox.claim("wecom", 10) == []
+
+    digests = outbox.claim_digests("wecom", 10)
+    assert [d["group"] for d in digests] == ["task-b"]
+
+    outbox.enqueue(MESSAGE, "a-2", ["wecom"], {"wecom": ("task-a", 3600, 2)})
+    digests = outbox.claim_digests("wecom", 10)
+    assert [d["group"] for d in digests] == ["task-a"]
+    assert len(digests[0]["rows"]) == 2
+    assert outbox.pending_count(immediate_only=True) == 0
+
+
+@pytest.mark.asyncio
+async def test_sender_sends_digest_as_one_message(outbox):
+    """Test a due digest group is delivered as a single message using one token"""
+    channel = _FakeChannel("wecom")
+    for i in range(3):
+        outbox.enqueue({**MESSAGE, "title": f"t{i}"}, f"item-{i}", ["wecom"], {"wecom": ("MacBook", 0, 10)})
+
+    with patch("src.notification_outbox.NOTIFY_RATE_LIMITS", "wecom=1"):
+        sender = OutboxSender(outbox, NotificationDispatcher([channel]))
+    assert await sender.drain_once() == 3
+    assert len(channel.sent) == 1
+    assert channel.sent[0]["digest"] == "MacBook"
+    assert [m["title"] for m in channel.sent[0]["messages"]] == ["t0", "t1", "t2"]
+    assert outbox.stats() == {"wecom": {"sent": 3}}
+
+
+@pytest.mark.asyncio
+async def test_enqueue_notification_urgent_bypasses_digest(outbox):
+    """Test items above the urgent score skip the digest window"""
+    dispatcher = NotificationDispatcher([_FakeChannel("wecom")])
+    task = {"task_name": "MacBook", "digest_window_minutes": 10}
+    cheap = {"商品ID": "1", "商品标题": "A", "当前售价": "¥1000", "商品原价": "¥5000", "商品链接": "#"}
+    normal = {"商品ID": "2", "商品标题": "B", "当前售价": "¥4500", "商品原价": "¥5000", "商品链接": "#"}
+    with patch("src.notification_outbox.get_notification_dispatcher", return_value=dispatcher), \
+            patch("src.notification_outbox.get_notification_outbox", return_value=outbox), \
+            patch("src.notification_outbox.NOTIFY_URGENT_SCORE", 0.5):
+        await enqueue_notification(cheap, "good", task_config=task)
+        await enqueue_notification(normal, "good", task_config=task)
+
+    assert [r["message"]["item_title"] for r in outbox.claim("wecom", 10)] == ["A"]
+    # 普通商品仍在汇总窗口内
+    assert outbox.claim_digests("wecom", 10) == []
+    assert outbox.pending_count(immediate_only=True) == 1
+
+
+@pytest.mark.asyncio
+async def test_enqueue_notification_price_anomaly_is_urgent(outbox):
+    """Test an item flagged as a price anomaly skips the digest window even without an original price"""
+    dispatcher = NotificationDispatcher([_FakeChannel("wecom")])
+    task = {"task_name": "MacBook", "digest_window_minutes": 10}
+    product = {"商品ID": "1", "商品标题": "A", "当前售价": "¥1000", "商品链接": "#"}
+    anomaly = {"z": 3.1, "median": 4000, "samples": 50, "is_anomaly": True}
+    typical = {"z": 0.2, "median": 4000, "samples": 50, "is_anomaly": False}
+    with patch("src.notification_outbox.get_notification_dispatcher", return_value=dispatcher), \
+            patch("src.notification_outbox.get_notification_outbox", return_value=outbox), \
+            patch("src.notification_outbox.NOTIFY_URGENT_SCORE", 0.5):
+        await enqueue_notification(product, "good", dedup_key="a", task_config=task, price_score=anomaly)
+        await enqueue_notification(product, "good", dedup_key="b", task_config=task, price_score=typical)
+
+    assert outbox.pending_count(immediate_only=True) == 1
+    assert outbox.pending_count() == 2
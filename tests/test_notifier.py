@@ -0,0 +1,158 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from src.notifier import (
+    BarkChannel,
+    NotificationChannel,
+    NotificationDispatcher,
+    WeComChannel,
+    WebhookChannel,
+    build_digest_message,
+    build_notification_message,
+    estimate_deal_score,
+)
+
+
+MESSAGE = {
+    "title": "🚨 新推荐! Test Product...",
+    "content": "价格: 100\n原因: \"good\"\n链接: https://www.goofish.com/item?id=1",
+    "link": "https://www.goofish.com/item?id=1",
+    "image": "https://img.test.com/1.jpg",
+}
+
+
+class _SlowChannel(NotificationChannel):
+    """A fake channel that just sleeps"""
+
+    def __init__(self, name, delay, timeout=None):
+        super().__init__(timeout)
+        self.name = name
+        self.delay = delay
+
+    async def send(self, http_client, message):
+        await asyncio.sleep(self.delay)
+
+
+def test_build_notification_message():
+    """Test the build_notification_message function"""
+    product = {
+        "商品标题": "Test Product",
+        "当前售价": "¥100",
+        "商品链接": "https://www.goofish.com/item?id=1",
+        "商品图片列表": ["https://img.test.com/1.jpg"],
+    }
+    message = build_notification_message(product, "good")
+    assert message["title"].startswith("🚨 新推荐! Test Product")
+    assert "¥100" in message["content"]
+    assert message["image"] == "https://img.test.com/1.jpg"
+
+
+def test_webhook_channel_renders_compiled_templates():
+    """Test that webhook templates are parsed once and rendered per message"""
+    channel = WebhookChannel(
+        "https://hook.test.com/send?a=b",
+        method="POST",
+        headers='{"X-Token": "secret"}',
+        body='{"title": "{{title}}", "content": "${content}", "tags": ["{{title}}"]}',
+    )
+    request = channel.build_request(MESSAGE)
+    assert request["json"]["content"] == MESSAGE["content"]
+    assert request["json"]["tags"] == [MESSAGE["title"]]
+    assert request["headers"]["X-Token"] == "secret"
+    assert request["headers"]["Content-Type"].startswith("application/json")
+
+    get_channel = WebhookChannel(
+        "https://hook.test.com/send?a=b",
+        method="GET",
+        query_parameters='{"title": "{{title}}"}',
+    )
+    url = httpx.URL(get_channel.build_request(MESSAGE)["url"])
+    assert url.params["a"] == "b"
+    assert url.params["title"] == MESSAGE["title"]
+
+
+def test_wecom_channel_markdown_links():
+    """Test that WeCom messages render links as markdown"""
+    request = WeComChannel("https://wecom.test.com").build_request(MESSAGE)
+    content = request["json"]["markdown"]["content"]
+    assert "[https://www.goofish.com/item?id=1](https://www.goofish.com/item?id=1)" in content
+
+
+@pytest.mark.asyncio
+async def test_dispatch_runs_channels_concurrently():
+    """Test that total latency tracks the slowest channel, not the sum"""
+    dispatcher = NotificationDispatcher([_SlowChannel("a", 0.2), _SlowChannel("b", 0.2), _SlowChannel("c", 0.2)])
+    start = time.perf_counter()
+    results = await dispatcher.dispatch(MESSAGE)
+    elapsed = time.perf_counter() - start
+
+    assert [r["success"] for r in results] == [True, True, True]
+    assert elapsed < 0.5
+
+
+@pytest.mark.asyncio
+async def test_dispatch_applies_per_channel_timeout():
+    """Test that a slow channel times out without affecting the others"""
+    dispatcher = NotificationDispatcher([_SlowChannel("fast", 0), _SlowChannel("slow", 1, timeout=0.05)])
+    results = {r["channel"]: r for r in await dispatcher.dispatch(MESSAGE)}
+
+    assert results["fast"]["success"] is True
+    assert results["slow"]["success"] is False
+    assert "超时" in results["slow"]["error"]
+
+
+@pytest.mark.asyncio
+async def test_dispatch_over_shared_http_client():
+    """Test real channel requests over a mocked transport"""
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if "wecom" in request.url.host:
+            return httpx.Response(200, json={"errcode": 45009, "errmsg": "api freq out of limit"})
+        return httpx.Response(200, json={"code": 200})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    dispatcher = NotificationDispatcher(
+        [BarkChannel("https://bark.test.com/key"), WeComChannel("https://wecom.test.com/hook")],
+        http_client=client,
+    )
+    results = {r["channel"]: r for r in await dispatcher.dispatch(MESSAGE)}
+    await dispatcher.aclose()
+
+    assert len(seen) == 2
+    assert json.loads(seen[0].content)["icon"] == MESSAGE["image"]
+    assert results["bark"]["success"] is True
+    assert results["wecom"]["success"] is False
+
+
+def test_build_digest_message():
+    """Test several recommendations are merged into one message"""
+    messages = [dict(MESSAGE, item_title="Item A"), dict(MESSAGE, item_title="Item B")]
+    digest = build_digest_message(messages, "MacBook")
+    assert digest["title"] == "🚨 2 个新推荐 (MacBook)"
+    assert "【1】Item A" in digest["content"]
+    assert "【2】Item B" in digest["content"]
+    assert digest["link"] == MESSAGE["link"]
+
+    # 企业微信汇总消息中的每个链接都可点击
+    markdown = WeComChannel("https://wecom.test/hook").build_digest_request(messages)["json"]["markdown"]["content"]
+    assert markdown.count("[https://www.goofish.com/item?id=1]") == 2
+
+
+def test_webhook_digest_json_array():
+    """Test a JSON webhook sends digests as an array rendered per item"""
+    channel = WebhookChannel("https://hook.test/send", body='{"t": "{{title}}"}')
+    request = channel.build_digest_request([dict(MESSAGE, title="a"), dict(MESSAGE, title="b")])
+    assert request["json"] == [{"t": "a"}, {"t": "b"}]
+
+
+def test_estimate_deal_score():
+    """Test the discount based deal score"""
+    assert estimate_deal_score({"当前售价": "¥1000", "商品原价": "¥4000"}) == 0.75
+    assert estimate_deal_score({"当前售价": "¥1000", "商品原价": "暂无"}) is None
+    assert estimate_deal_score({"当前售价": "¥5000", "商品原价": "¥4000"}) == 0.0
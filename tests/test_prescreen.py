@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.prescreen import (
+    PrescreenModel,
+    evaluate,
+    load_labeled_records,
+    prescreen_verdict,
+    record_dense,
+    record_tokens,
+    train_prescreen,
+    training_label,
+)
+
+
+def _record(item_id, title, price, recommended, analysis_extra=None):
+    return {
+        "搜索关键字": "相机",
+        "商品信息": {"商品ID": str(item_id), "商品标题": title, "当前售价": str(price), "“想要”人数": "3",
+                     "商品标签": ["验货宝"] if recommended else []},
+        "卖家信息": {"作为卖家的好评率": "99.50%" if recommended else "N/A", "卖家收到的评价总数": 120,
+                     "卖家芝麻信用": "信用极好"},
+        "ai_analysis": {"is_recommended": recommended, "reason": "x", **(analysis_extra or {})},
+    }
+
+
+def _dataset(count=400):
+    records = []
+    for i in range(count):
+        good = i % 4 == 0
+        title = f"索尼 A7M4 全新未拆 {i}" if good else f"配件 坏机 拆机件 {i}"
+        records.append(_record(i, title, 9000 if good else 150, good))
+    return records
+
+
+def _write(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_features_cover_title_tags_and_seller():
+    """Test title n-grams, tags, keyword and seller fields become features"""
+    record = _record(1, "A7", 1000, True)
+    tokens = record_tokens(record)
+    assert {"__bias__", "t1:a", "t2:a7", "tag:验货宝", "kw:相机", "卖家芝麻信用:信用极好"} <= set(tokens)
+    dense = record_dense(record)
+    assert dense[0] == pytest.approx(np.log1p(1000))
+    assert dense[2] == pytest.approx(0.995)
+
+
+def test_only_ai_verdicts_are_training_labels(tmp_path):
+    """Test prescreen, image-hash and failed verdicts are not reused as labels"""
+    assert training_label(_record(1, "a", 1, True)) == 1
+    assert training_label(_record(1, "a", 1, False, {"prescreen": {"probability": 0.01}})) is None
+    assert training_label(_record(1, "a", 1, False, {"image_hash_match": {}})) is None
+    assert training_label({"ai_analysis": {"error": "timeout"}}) is None
+
+    path = tmp_path / "kw_full_data.jsonl"
+    _write(path, [_record(1, "旧标题", 100, False), _record(1, "新标题", 80, True), _record(2, "b", 1, False)])
+    records = load_labeled_records([str(path)])
+    assert len(records) == 2
+    assert any(r["商品信息"]["商品标题"] == "新标题" for r in records)
+
+
+def test_train_separates_classes_and_picks_safe_threshold(tmp_path):
+    """Test training learns the verdict pattern and the threshold keeps misses under the limit"""
+    path = tmp_path / "kw_full_data.jsonl"
+    _write(path, _dataset())
+    model, report = train_prescreen([str(path)], holdout_percent=25, max_miss_rate=0.0, buckets=1 << 12)
+
+    assert report["items"] > 0 and report["recommended"] > 0
+    assert report["auc"] > 0.95
+    assert report["threshold"] > 0
+    chosen = next(row for row in report["skip_rates"] if row["threshold"] == report["threshold"])
+    assert chosen["missed_recommended"] == 0
+    assert report["expected_skip_rate"] > 0.5
+    assert sum(row["items"] for row in report["calibration"]) == report["items"]
+
+    saved = tmp_path / "model.npz"
+    model.save(str(saved))
+    loaded = PrescreenModel.load(str(saved))
+    probability, skipped = prescreen_verdict(loaded, _record(9999, "配件 坏机 拆机件", 150, False))
+    assert skipped is not None and skipped["is_recommended"] is False
+    assert skipped["prescreen"]["probability"] == pytest.approx(probability, abs=1e-4)
+    _, kept = prescreen_verdict(loaded, _record(9998, "索尼 A7M4 全新未拆", 9000, True))
+    assert kept is None
+
+
+def test_train_requires_both_classes(tmp_path):
+    """Test training refuses data without any recommended items"""
+    path = tmp_path / "kw_full_data.jsonl"
+    _write(path, [_record(i, "x", 1, False) for i in range(20)])
+    with pytest.raises(ValueError):
+        train_prescreen([str(path)])
+
+
+def test_evaluate_without_positives_never_skips():
+    """Test no skip threshold is chosen when the holdout has no recommended items"""
+    report = evaluate([0, 0, 0], [0.001, 0.2, 0.5], max_miss_rate=0.02)
+    assert report["threshold"] == 0.0
+    assert report["auc"] is None
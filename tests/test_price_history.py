@@ -0,0 +1,78 @@
+import asyncio
+import time
+from datetime import datetime
+
+from src.price_history import (
+    PriceHistoryStore,
+    PriceHistoryWriter,
+    observations_from_items,
+    percentile,
+)
+
+
+def _item(item_id, price, wants="3"):
+    return {"商品ID": item_id, "当前售价": price, "“想要”人数": wants}
+
+
+def test_observations_skip_unparseable_items():
+    """Test search items become compact observations and bad prices are skipped"""
+    rows = observations_from_items("相机", [_item("1", "¥5,000"), _item("2", "价格异常"), _item("未知ID", "10"),
+                                           _item("3", "200", wants="NaN")], observed_at=100)
+    assert rows == [("1", "相机", 100, 5000.0, 3), ("3", "相机", 100, 200.0, None)]
+
+
+def test_percentile_interpolates():
+    """Test percentiles use linear interpolation between ranks"""
+    values = [100.0, 200.0, 300.0, 400.0]
+    assert percentile(values, 50) == 250.0
+    assert percentile(values, 0) == 100.0
+    assert percentile(values, 100) == 400.0
+    assert percentile([], 50) is None
+
+
+def test_item_history_and_daily_stats(tmp_path):
+    """Test item history is ordered and daily stats count each item once per day"""
+    store = PriceHistoryStore(str(tmp_path / "prices.db"))
+    # 取当天中午，保证所有观测落在同一天
+    now = int(time.mktime(datetime.now().replace(hour=12, minute=0, second=0, microsecond=0).timetuple()))
+    store.append([
+        ("1", "相机", now - 60, 5000.0, 3),
+        ("1", "相机", now - 30, 3800.0, 5),
+        ("2", "相机", now - 30, 1000.0, 1),
+        ("3", "相机", now - 30, 2000.0, None),
+        ("9", "手机", now - 30, 99.0, 0),
+    ])
+
+    history = store.item_history("1")
+    assert [row["price"] for row in history] == [5000.0, 3800.0]
+    assert history[-1]["want_count"] == 5
+    assert [row["price"] for row in store.item_history("1", limit=1)] == [3800.0]
+
+    days = store.keyword_daily_stats("相机", days=1)
+    assert len(days) == 1
+    today = days[0]
+    # 商品1当天只计最后一次的价格 (3800)
+    assert today["items"] == 3
+    assert (today["min"], today["p50"], today["max"]) == (1000.0, 2000.0, 3800.0)
+
+
+def test_missing_database_returns_empty(tmp_path):
+    """Test queries on a store that has never been written return no data"""
+    store = PriceHistoryStore(str(tmp_path / "missing.db"))
+    assert store.item_history("1") == []
+    assert store.keyword_daily_stats("相机") == []
+
+
+def test_writer_batches_until_flush(tmp_path):
+    """Test observations stay in memory until the writer flushes them in one batch"""
+    store = PriceHistoryStore(str(tmp_path / "prices.db"))
+
+    async def scenario():
+        writer = PriceHistoryWriter(store, interval=3600)
+        writer.start()
+        writer.add(observations_from_items("相机", [_item("1", "100"), _item("2", "200")]))
+        assert store.item_history("1") == []
+        await writer.stop()
+
+    asyncio.run(scenario())
+    assert [row["price"] for row in store.item_history("2")] == [200.0]
@@ -0,0 +1,64 @@
+import time
+from unittest.mock import patch
+
+from src.price_history import PriceHistoryStore
+from src.price_model import KeywordPriceModel
+
+
+def _items(*prices):
+    return [{"商品ID": str(i), "当前售价": str(price)} for i, price in enumerate(prices)]
+
+
+def test_robust_z_score_ignores_outliers():
+    """Test the median/MAD score is positive for cheap items and unaffected by absurd prices"""
+    model = KeywordPriceModel(window=100, min_samples=5)
+    model.update([900, 950, 1000, 1000, 1050, 1100, 99999])
+    cheap = model.score(500)
+    assert cheap["median"] == 1000
+    assert cheap["z"] > 4
+    assert model.score(1000)["z"] == 0
+    assert model.score(2000)["z"] < 0
+
+
+def test_no_score_without_enough_samples_or_spread():
+    """Test scoring is skipped until the model has enough varied samples"""
+    model = KeywordPriceModel(window=100, min_samples=5)
+    model.update([100, 200])
+    assert model.score(50) is None
+    flat = KeywordPriceModel(window=100, min_samples=3)
+    flat.update([100, 100, 100, 100])
+    assert flat.score(50) is None
+    assert model.score(None) is None
+
+
+def test_window_keeps_only_recent_prices():
+    """Test old prices roll out of the window"""
+    model = KeywordPriceModel(window=5, min_samples=1)
+    model.update([10000] * 5)
+    model.update([100, 110, 90, 100, 105])
+    assert len(model) == 5
+    assert model.score(100)["median"] == 100
+
+
+def test_score_items_orders_best_deals_first():
+    """Test items are sorted by descending score with unscorable items last"""
+    model = KeywordPriceModel(window=100, min_samples=5)
+    model.update([900, 950, 1000, 1050, 1100])
+    items = _items(1000, "价格异常", 400, 950)
+    scored = model.score_items(items, anomaly_z=2.0)
+    assert [item["当前售价"] for item, _ in scored] == ["400", "950", "1000", "价格异常"]
+    assert scored[0][1]["is_anomaly"] is True
+    assert scored[1][1]["is_anomaly"] is False
+    assert scored[-1][1] is None
+
+
+def test_from_history_seeds_recent_prices(tmp_path):
+    """Test the model starts from the keyword's recorded prices"""
+    store = PriceHistoryStore(str(tmp_path / "prices.db"))
+    now = int(time.time())
+    store.append([(str(i), "相机", now, float(price), None) for i, price in enumerate([100, 200, 300])])
+    store.append([("x", "手机", now, 5.0, None)])
+    with patch("src.price_model.get_price_history_store", return_value=store):
+        model = KeywordPriceModel.from_history("相机", min_samples=1)
+    assert len(model) == 3
+    assert model.score(200)["median"] == 200
@@ -10,7 +10,8 @@ from src.prompt_utils import generate_criteria, update_config_with_new_task
 async def test_generate_criteria():
     """Test the generate_criteria function"""
     # Mock client
-    with patch("src.prompt_utils.client") as mock_client:
+    with patch("src.prompt_utils.get_client") as mock_get_client:
+        mock_client = mock_get_client.return_value
         # Mock response
         mock_completion = AsyncMock()
         mock_completion.choices = [MagicMock()]
@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+import pytest
+
+from src import run_profiler
+from src.run_profiler import RunProfiler, list_profile_reports, profile_report_path, save_profile_report
+
+
+def busy_work(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+
+async def cpu_step():
+    busy_work(0.15)
+
+
+async def slow_wait():
+    await asyncio.sleep(0.1)
+
+
+@pytest.mark.asyncio
+async def test_profiler_samples_stacks_and_task_times():
+    """Test the profiler captures the running function and asyncio task wall times"""
+    profiler = RunProfiler(interval_ms=2)
+    profiler.start()
+    await asyncio.gather(cpu_step(), slow_wait())
+    report = profiler.stop()
+
+    assert report["samples"] > 10
+    assert any(item["function"].startswith("busy_work (test_run_profiler.py:")
+               for item in report["top_inclusive"])
+    assert "busy_work (test_run_profiler.py:" in report["collapsed"]
+    line = report["collapsed"].splitlines()[0]
+    assert int(line.rsplit(" ", 1)[1]) > 0
+
+    tasks = {item["coroutine"]: item for item in report["asyncio_tasks"]}
+    assert tasks["cpu_step"]["count"] == 1
+    assert tasks["cpu_step"]["total_seconds"] >= 0.15
+    assert tasks["slow_wait"]["total_seconds"] >= 0.1
+    # 停止后恢复原来的任务工厂
+    assert asyncio.get_running_loop().get_task_factory() is None
+
+
+def test_save_list_and_prune_reports(tmp_path, monkeypatch):
+    """Test reports are saved per task, listed newest first and pruned"""
+    monkeypatch.setattr(run_profiler, "MAX_REPORTS_PER_TASK", 2)
+    report = {"samples": 3, "idle_percent": 50.0, "duration_seconds": 1.0, "collapsed": "a;b 3"}
+    ids = []
+    for i in range(3):
+        monkeypatch.setattr(run_profiler.os, "getpid", lambda i=i: 100 + i)
+        ids.append(save_profile_report("My Task", report, base_dir=str(tmp_path)))
+
+    listed = list_profile_reports("My Task", base_dir=str(tmp_path))
+    assert [item["id"] for item in listed] == [ids[2], ids[1]]
+    assert listed[0]["samples"] == 3
+
+    path = profile_report_path("My Task", ids[2], "collapsed", base_dir=str(tmp_path))
+    assert open(path, encoding="utf-8").read() == "a;b 3\n"
+    assert profile_report_path("My Task", ids[0], "json", base_dir=str(tmp_path)) is None
+    assert profile_report_path("My Task", "../../etc/passwd", "json", base_dir=str(tmp_path)) is None
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from src.run_queue import RunQueue
+
+
+class FakeLauncher:
+    """Launcher whose runs only finish when the test releases them"""
+
+    def __init__(self):
+        self.started = []
+        self.events = {}
+
+    async def __call__(self, task_name):
+        self.started.append(task_name)
+        self.events[task_name] = asyncio.Event()
+        return self.events[task_name].wait()
+
+    async def finish(self, task_name):
+        while task_name not in self.events:
+            await asyncio.sleep(0)
+        self.events[task_name].set()
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_cap_and_priority_order():
+    """Test runs beyond the cap wait and start in priority order as slots free up"""
+    launcher = FakeLauncher()
+    queue = RunQueue(launcher, max_concurrent=2)
+
+    assert queue.submit("A")["status"] == "started"
+    assert queue.submit("B")["status"] == "started"
+    assert queue.submit("C", priority=0) == {"status": "queued", "position": 1}
+    assert queue.submit("D", priority=5) == {"status": "queued", "position": 1}
+    await asyncio.sleep(0)
+    assert launcher.started == ["A", "B"]
+    assert queue.position("C") == 2
+
+    await launcher.finish("A")
+    assert launcher.started == ["A", "B", "D"]
+    await launcher.finish("B")
+    assert launcher.started == ["A", "B", "D", "C"]
+
+    stats = queue.stats()
+    assert stats["counters"]["dispatched"] == 4
+    assert stats["counters"]["completed"] == 2
+    assert stats["wait"]["count"] == 4
+    assert {run["task_name"] for run in stats["running"]} == {"C", "D"}
+
+    await launcher.finish("C")
+    await launcher.finish("D")
+    await queue.join()
+
+
+@pytest.mark.asyncio
+async def test_duplicate_runs_are_coalesced():
+    """Test a task already running or pending is not queued twice, and a higher priority is kept"""
+    launcher = FakeLauncher()
+    queue = RunQueue(launcher, max_concurrent=1)
+
+    queue.submit("A")
+    assert queue.submit("A")["status"] == "coalesced"
+    queue.submit("B")
+    queue.submit("C", priority=1)
+    assert queue.position("B") == 2
+    assert queue.submit("B", priority=10) == {"status": "coalesced", "position": 1}
+    assert queue.stats()["counters"]["coalesced"] == 2
+
+    await launcher.finish("A")
+    assert launcher.started == ["A", "B"]
+    await launcher.finish("B")
+    await launcher.finish("C")
+    assert launcher.started == ["A", "B", "C"]
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_close():
+    """Test cancelled runs never start and close stops further dispatching"""
+    launcher = FakeLauncher()
+    queue = RunQueue(launcher, max_concurrent=1)
+    queue.submit("A")
+    queue.submit("B")
+    queue.submit("C")
+
+    assert queue.cancel("B") is True
+    assert queue.cancel("B") is False
+    assert queue.position("C") == 1
+
+    queue.close()
+    await launcher.finish("A")
+    await queue.join()
+    assert launcher.started == ["A"]
+    assert queue.stats()["pending"] == []
+
+
+@pytest.mark.asyncio
+async def test_launcher_failure_frees_the_slot():
+    """Test a launcher error is counted and the next run still starts"""
+    started = []
+
+    async def launcher(task_name):
+        started.append(task_name)
+        if task_name == "bad":
+            raise RuntimeError("spawn failed")
+        return None
+
+    queue = RunQueue(launcher, max_concurrent=1)
+    queue.submit("bad")
+    queue.submit("good")
+    await queue.join()
+    await queue.join()
+    assert started == ["bad", "good"]
+    assert queue.stats()["counters"]["failed"] == 1
+    assert queue.stats()["counters"]["completed"] == 1
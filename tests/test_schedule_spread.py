@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from apscheduler.triggers.cron import CronTrigger
+
+from src.schedule_spread import (
+    OffsetTrigger,
+    build_interval_trigger,
+    build_load_histogram,
+    parse_every,
+    spread_interval_offsets,
+    task_offset_seconds,
+)
+
+TZ = ZoneInfo("Asia/Shanghai")
+
+
+def test_task_offset_is_deterministic():
+    """Test offsets depend only on the task name and stay inside the window"""
+    first = task_offset_seconds("MacBook Air M1", 600)
+    assert first == task_offset_seconds("MacBook Air M1", 600)
+    assert 0 <= first < 600
+    assert task_offset_seconds("MacBook Air M1", 0) == 0
+    offsets = {task_offset_seconds(f"task {i}", 600) for i in range(20)}
+    assert len(offsets) > 10
+
+
+def test_parse_every():
+    """Test the '@every' interval syntax"""
+    assert parse_every("@every 30m") == 30
+    assert parse_every("@EVERY 2h") == 120
+    assert parse_every("*/30 * * * *") is None
+    assert parse_every(None) is None
+    with pytest.raises(ValueError):
+        parse_every("@every 0m")
+
+
+def test_offset_trigger_shifts_every_fire_time():
+    """Test the wrapped cron keeps its period but fires a fixed number of seconds later"""
+    cron = CronTrigger.from_crontab("0 * * * *", timezone=TZ)
+    trigger = OffsetTrigger(cron, 150)
+    now = datetime(2026, 10, 19, 12, 1, tzinfo=TZ)
+
+    first = trigger.get_next_fire_time(None, now)
+    assert first == datetime(2026, 10, 19, 12, 2, 30, tzinfo=TZ)
+    second = trigger.get_next_fire_time(first, first + timedelta(microseconds=1))
+    assert second == datetime(2026, 10, 19, 13, 2, 30, tzinfo=TZ)
+
+
+def test_spread_interval_offsets_evenly():
+    """Test tasks sharing an interval are spaced evenly across the period"""
+    offsets = spread_interval_offsets({"b": 30, "a": 30, "c": 30, "hourly": 60})
+    assert offsets == {"a": 0, "b": 600, "c": 1200, "hourly": 0}
+
+
+def test_load_histogram_shows_spread():
+    """Test the histogram counts runs per hour and reports the busiest minute"""
+    start = datetime(2026, 10, 19, 0, 0, tzinfo=TZ)
+    same_minute = {f"task {i}": CronTrigger.from_crontab("0 * * * *", timezone=TZ) for i in range(3)}
+    load = build_load_histogram(same_minute, start, hours=2)
+    assert load["total_runs"] == 6
+    assert [bucket["runs"] for bucket in load["histogram"]] == [3, 3]
+    assert load["max_runs_per_minute"] == 3
+
+    spread = {name: OffsetTrigger(trigger, task_offset_seconds(name, 3000))
+              for name, trigger in same_minute.items()}
+    assert build_load_histogram(spread, start, hours=2)["max_runs_per_minute"] < 3
+
+    intervals = {"a": build_interval_trigger(30, 0, TZ), "b": build_interval_trigger(30, 900, TZ)}
+    load = build_load_histogram(intervals, start, hours=1)
+    assert load["total_runs"] == 4
+    assert load["max_runs_per_minute"] == 1
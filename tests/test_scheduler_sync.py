@@ -0,0 +1,65 @@
+import pytest
+from apscheduler.schedulers.background import BackgroundScheduler
+
+from src.schedule_spread import OffsetTrigger
+from src.scheduler_sync import SchedulerReconciler
+
+
+def job_func(task_id, task_name):
+    pass
+
+
+def _task(task_id, name, cron="0 * * * *", enabled=True):
+    return {"id": task_id, "task_name": name, "cron": cron, "enabled": enabled}
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
+    scheduler.start(paused=True)
+    yield scheduler
+    scheduler.shutdown(wait=False)
+
+
+def test_initial_sync_adds_jobs_by_stable_id(scheduler):
+    """Test jobs are keyed by task id and disabled or unscheduled tasks are skipped"""
+    reconciler = SchedulerReconciler(scheduler, job_func, spread_seconds=0)
+    changes = reconciler.reconcile([
+        _task(3, "A"), _task(7, "B", cron="@every 30m"), _task(8, "C", enabled=False), _task(9, "D", cron=None),
+    ])
+    assert sorted(changes["added"]) == ["A", "B"]
+    assert sorted(job.id for job in scheduler.get_jobs()) == ["task_3", "task_7"]
+    assert scheduler.get_job("task_3").args == (3, "A")
+
+
+def test_only_changed_jobs_are_touched(scheduler):
+    """Test unchanged jobs keep their job object and next run time while others are updated"""
+    reconciler = SchedulerReconciler(scheduler, job_func, spread_seconds=0)
+    tasks = [_task(0, "A"), _task(1, "B"), _task(2, "C")]
+    reconciler.reconcile(tasks)
+    untouched = scheduler.get_job("task_2")
+    next_run = untouched.next_run_time
+
+    changes = reconciler.reconcile([_task(1, "B renamed"), _task(2, "C")])
+    assert changes == {"added": [], "updated": ["B renamed"], "rescheduled": [], "removed": ["task_0"]}
+    assert scheduler.get_job("task_0") is None
+    assert scheduler.get_job("task_1").args == (1, "B renamed")
+    assert scheduler.get_job("task_2").next_run_time == next_run
+
+    changes = reconciler.reconcile([_task(1, "B renamed", cron="30 * * * *"), _task(2, "C")])
+    assert changes["rescheduled"] == ["B renamed"]
+    assert scheduler.get_job("task_1").next_run_time.minute == 30
+    assert reconciler.reconcile([_task(1, "B renamed", cron="30 * * * *"), _task(2, "C")]) == {
+        "added": [], "updated": [], "rescheduled": [], "removed": [],
+    }
+
+
+def test_spread_offsets_and_invalid_cron(scheduler):
+    """Test the spread window wraps cron triggers and an invalid cron removes the old job"""
+    reconciler = SchedulerReconciler(scheduler, job_func, spread_seconds=600)
+    reconciler.reconcile([_task(0, "A")])
+    assert isinstance(scheduler.get_job("task_0").trigger, OffsetTrigger)
+
+    changes = reconciler.reconcile([_task(0, "A", cron="not a cron")])
+    assert changes["removed"] == ["task_0"]
+    assert scheduler.get_jobs() == []
@@ -2,7 +2,7 @@ import pytest
 import asyncio
 import json
 from unittest.mock import patch, mock_open, MagicMock, AsyncMock
-from src.scraper import scrape_user_profile, scrape_xianyu
+from src.scraper import fetch_item_images, scrape_user_profile, scrape_xianyu
 
 
 @pytest.mark.asyncio
@@ -91,4 +91,110 @@ async def test_scrape_xianyu():
         # Expected due to mocking complexity
         pass
     
-    assert True  # If we get here without major issues, test passes
\ No newline at end of file
+    assert True  # If we get here without major issues, test passes
+
+@pytest.mark.asyncio
+async def test_scrape_user_profile_via_api_paginates():
+    """Test API mode fetches all item and rating pages and uses the shared parsers"""
+    from src.mtop_client import ItemFetchMeter
+    from src.scraper import scrape_user_profile_via_api
+
+    ok = ["SUCCESS::调用成功"]
+    responses = {
+        ("mtop.idle.web.user.page.head", None): {"ret": ok, "data": {"baseInfo": {}, "module": {}}},
+        ("mtop.idle.web.xyh.item.list", 1): {"ret": ok, "data": {"cardList": [{"cardData": {"id": "1"}}], "nextPage": True}},
+        ("mtop.idle.web.xyh.item.list", 2): {"ret": ok, "data": {"cardList": [{"cardData": {"id": "2"}}], "nextPage": False}},
+        ("mtop.idle.web.trade.rate.list", 1): {"ret": ok, "data": {"cardList": [], "nextPage": False}},
+    }
+    calls = []
+
+    class FakeClient:
+        async def request(self, api, data, version="1.0"):
+            calls.append((api, data.get("pageNumber")))
+            return responses[(api, data.get("pageNumber"))], 100
+
+    meter = ItemFetchMeter("api")
+    with patch("src.scraper.random_sleep", AsyncMock()):
+        profile = await scrape_user_profile_via_api(FakeClient(), "42", meter)
+
+    assert profile is not None
+    assert len(profile["卖家发布的商品列表"]) == 2
+    assert profile["卖家收到的评价列表"] == []
+    assert [c[0] for c in calls].count("mtop.idle.web.xyh.item.list") == 2
+    assert meter.bytes == 400
+
+
+@pytest.mark.asyncio
+async def test_scrape_user_profile_via_api_returns_none_on_failure():
+    """Test API mode signals a fallback when an endpoint fails"""
+    from src.mtop_client import ItemFetchMeter
+    from src.scraper import scrape_user_profile_via_api
+
+    class FailingClient:
+        async def request(self, api, data, version="1.0"):
+            return {"ret": ["FAIL_SYS_ILLEGAL_ACCESS::非法请求"]}, 10
+
+    assert await scrape_user_profile_via_api(FailingClient(), "42", ItemFetchMeter("api")) is None
+
+
+def test_search_request_data_reads_initial_post_body():
+    """Test the page's own search request parameters are reused as the base query"""
+    from urllib.parse import urlencode
+    from src.scraper import search_request_data
+
+    response = MagicMock()
+    response.request.post_data = urlencode({"data": json.dumps({"keyword": "相机", "pageNumber": 1, "rowsPerPage": 30})})
+    response.request.url = "https://h5api.m.goofish.com/h5/mtop.taobao.idlemtopsearch.pc.search/1.0/?appKey=1"
+    assert search_request_data(response) == {"keyword": "相机", "pageNumber": 1, "rowsPerPage": 30}
+
+    response.request.post_data = "data=not-json"
+    assert search_request_data(response) is None
+
+
+def test_build_filtered_search_data_combines_sort_and_filters():
+    """Test sort, personal-only and price filters are folded into one search query"""
+    from src.scraper import build_filtered_search_data
+
+    data = build_filtered_search_data({"keyword": "相机", "rowsPerPage": 30}, 2,
+                                      personal_only=True, min_price="100", max_price="500")
+    assert data["keyword"] == "相机"
+    assert data["pageNumber"] == 2
+    assert (data["sortField"], data["sortValue"]) == ("create", "desc")
+    assert data["propValueStr"] == {"searchFilter": "priceRange:100,500;quickFilter:filterPersonal;"}
+
+    plain = build_filtered_search_data({"keyword": "相机"}, 1)
+    assert "propValueStr" not in plain
+
+
+@pytest.mark.asyncio
+async def test_fetch_filtered_search_page_falls_back_on_failure():
+    """Test a failed or malformed search response signals the UI-click fallback"""
+    from src.scraper import fetch_filtered_search_page
+
+    class FakeClient:
+        def __init__(self, payload):
+            self.payload = payload
+
+        async def request(self, api, data, version="1.0"):
+            return self.payload, 10
+
+    ok = ["SUCCESS::调用成功"]
+    good = {"ret": ok, "data": {"resultList": []}}
+    assert await fetch_filtered_search_page(FakeClient(good), {"keyword": "x"}, 1) == good
+    assert await fetch_filtered_search_page(FakeClient({"ret": ["FAIL_SYS_TOKEN_EMPTY::令牌为空"]}), {"keyword": "x"}, 1) is None
+    assert await fetch_filtered_search_page(FakeClient({"ret": ok, "data": {}}), {"keyword": "x"}, 1) is None
+
+
+@pytest.mark.asyncio
+async def test_fetch_item_images_downloads_after_url_rejection():
+    """Test images are skipped in URL mode and downloaded once the provider has rejected remote URLs"""
+    item = {"商品ID": "1", "商品图片列表": ["https://img.test.com/1.jpg"]}
+    download = AsyncMock(return_value=["images/task_images_camera/1.jpg"])
+    with patch("src.ai_handler.AI_IMAGE_INPUT_MODE", "url"), \
+            patch("src.scraper.IMAGE_HASH_DEDUP", False), \
+            patch("src.scraper.download_item_images", download):
+        with patch("src.ai_handler._remote_image_urls_supported", True):
+            assert await fetch_item_images(item, "camera") == []
+        with patch("src.ai_handler._remote_image_urls_supported", False):
+            assert await fetch_item_images(item, "camera") == ["images/task_images_camera/1.jpg"]
+    download.assert_awaited_once_with("1", ["https://img.test.com/1.jpg"], "camera")
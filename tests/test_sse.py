@@ -0,0 +1,21 @@
+import pytest
+
+from src.sse import BoundedSubscriber, format_sse
+
+
+def test_format_sse():
+    """Test events are framed with an optional id and JSON data"""
+    assert format_sse("chunk", {"content": "新"}) == 'event: chunk\ndata: {"content": "新"}\n\n'
+    assert format_sse("tasks", [1], event_id=7) == "event: tasks\nid: 7\ndata: [1]\n\n"
+
+
+@pytest.mark.asyncio
+async def test_bounded_subscriber_overflow_and_timeout():
+    """Test overflow replaces the backlog with one resync event and get() times out to None"""
+    subscriber = BoundedSubscriber(queue_size=2)
+    assert subscriber.queue.maxsize == 2
+    for i in range(3):
+        subscriber.push({"type": "chunk", "content": str(i)})
+    assert await subscriber.get(timeout=1) == {"type": "resync"}
+    assert await subscriber.get(timeout=0.01) is None
+    assert BoundedSubscriber().queue.maxsize == BoundedSubscriber.queue_size
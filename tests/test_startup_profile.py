@@ -0,0 +1,25 @@
+from src.startup_profile import parse_importtime, summarize_imports
+
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       100 |        100 |     openai._types
+import time:       400 |        500 |   openai
+import time:        50 |         50 |   json
+import time:       200 |        750 | src.config
+"""
+
+
+def test_parse_importtime():
+    """Test parsing the -X importtime output, skipping the header"""
+    entries = parse_importtime(SAMPLE)
+    assert [e["module"] for e in entries] == ["openai._types", "openai", "json", "src.config"]
+    assert entries[0] == {"module": "openai._types", "self_us": 100, "cumulative_us": 100, "depth": 2}
+    assert entries[-1]["depth"] == 0
+
+
+def test_summarize_imports_groups_by_package():
+    """Test self time is summed per top-level package and modules are ranked by cumulative time"""
+    summary = summarize_imports(parse_importtime(SAMPLE), top=2)
+    assert summary["total_us"] == 750
+    assert summary["packages"] == [{"package": "openai", "self_us": 500}, {"package": "src", "self_us": 200}]
+    assert [e["module"] for e in summary["slowest_modules"]] == ["src.config", "openai"]
@@ -0,0 +1,104 @@
+import asyncio
+import gzip
+import os
+from unittest.mock import patch
+
+import pytest
+
+from src.task_logs import (
+    CombinedLog,
+    TaskLogStore,
+    pump_process_output,
+    read_last_lines,
+    task_log_slug,
+)
+
+
+def test_task_log_slug():
+    """Test task names are turned into safe directory names"""
+    assert task_log_slug("MacBook Air M1") == "MacBook_Air_M1"
+    assert task_log_slug("a/b:c") == "a_b_c"
+    assert task_log_slug("婴儿车") == "婴儿车"
+
+
+def test_read_last_lines(tmp_path):
+    """Test reading the last lines of a file larger than one block"""
+    path = tmp_path / "task.log"
+    path.write_text("".join(f"line {i}\n" for i in range(5000)), encoding="utf-8")
+    assert read_last_lines(str(path), 3) == "line 4997\nline 4998\nline 4999\n"
+    assert read_last_lines(str(path), 0) == ""
+    assert read_last_lines(str(tmp_path / "missing.log"), 3) == ""
+
+
+def test_runs_are_indexed_by_offset(tmp_path):
+    """Test each run records its offsets so it can be read back on its own"""
+    store = TaskLogStore(str(tmp_path))
+    first = store.begin_run("Task A")
+    first.write(b"run one\n")
+    first.finish(0)
+    second = store.begin_run("Task A")
+    second.write(b"run two\n")
+
+    # 运行中的记录读取到当前文件末尾
+    latest = store.get_run("Task A")
+    assert latest["run_id"] == second.run_id
+    assert latest["exit_code"] is None
+    assert store.read_run("Task A", latest) == "run two\n"
+
+    second.finish(1)
+    runs = store.list_runs("Task A")
+    assert [run["exit_code"] for run in runs] == [0, 1]
+    assert store.read_run("Task A", runs[0]) == "run one\n"
+    assert store.read_run("Task A", store.get_run("Task A", runs[1]["run_id"]), max_bytes=4) == "two\n"
+    assert store.tail("Task A", 1) == "run two\n"
+
+
+def test_rotation_archives_and_keeps_runs_readable(tmp_path):
+    """Test an oversized log is compressed before the next run and old runs stay readable"""
+    store = TaskLogStore(str(tmp_path))
+    with patch("src.task_logs.TASK_LOG_MAX_MB", 10 / (1024 * 1024)):
+        run = store.begin_run("Task A")
+        run.write(b"0123456789 old run\n")
+        run.finish(0)
+        new_run = store.begin_run("Task A")
+        new_run.write(b"new run\n")
+        new_run.finish(0)
+
+    runs = store.list_runs("Task A")
+    assert runs[0]["file"].endswith(".log.gz")
+    assert runs[1]["file"] == "task.log"
+    assert runs[1]["offset"] == 0
+    assert store.read_run("Task A", runs[0]) == "0123456789 old run\n"
+    with gzip.open(os.path.join(store.task_dir("Task A"), runs[0]["file"]), "rb") as f:
+        assert f.read() == b"0123456789 old run\n"
+
+
+def test_combined_log_rotates(tmp_path):
+    """Test the combined log is archived once it exceeds the size limit"""
+    log = CombinedLog(str(tmp_path / "scraper.log"))
+    with patch("src.task_logs.TASK_LOG_MAX_MB", 10 / (1024 * 1024)):
+        log.write(b"0123456789abc\n")
+        log.write(b"after\n")
+    log.close()
+    assert (tmp_path / "scraper.log").read_bytes() == b"after\n"
+    assert len(list(tmp_path.glob("scraper-*.log.gz"))) == 1
+
+
+@pytest.mark.asyncio
+async def test_pump_process_output(tmp_path):
+    """Test subprocess output goes to the task log and the prefixed combined log"""
+    store = TaskLogStore(str(tmp_path / "tasks"))
+    combined = CombinedLog(str(tmp_path / "scraper.log"))
+    run = store.begin_run("Task A")
+    lines = []
+
+    reader = asyncio.StreamReader()
+    reader.feed_data("第一行\nsecond\n".encode("utf-8"))
+    reader.feed_eof()
+    await pump_process_output(reader, run, combined, "[Task A] ", on_line=lines.append)
+    run.finish(0)
+    combined.close()
+
+    assert store.read_run("Task A", store.get_run("Task A")) == "第一行\nsecond\n"
+    assert (tmp_path / "scraper.log").read_text(encoding="utf-8") == "[Task A] 第一行\n[Task A] second\n"
+    assert lines == ["第一行\n", "second\n"]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from src.task_registry import TaskRegistry
+
+
+TASKS = [
+    {"task_name": "A", "enabled": True, "keyword": "a", "is_running": True},
+    {"task_name": "B", "enabled": False, "keyword": "b"},
+]
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(TASKS, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.asyncio
+async def test_list_tasks_adds_runtime_fields(config_file):
+    """Test tasks get an id and in-memory running state, ignoring persisted is_running"""
+    registry = TaskRegistry(config_file)
+    tasks = await registry.list_tasks()
+    assert [t["id"] for t in tasks] == [0, 1]
+    assert [t["is_running"] for t in tasks] == [False, False]
+
+    registry.set_running(1, True)
+    assert (await registry.get(1))["is_running"] is True
+    # 运行状态不写入配置文件
+    assert "is_running" not in json.loads(open(config_file, encoding="utf-8").read())[1]
+
+
+@pytest.mark.asyncio
+async def test_reads_return_copies(config_file):
+    """Test callers cannot mutate the cached tasks"""
+    registry = TaskRegistry(config_file)
+    task = await registry.get(0)
+    task["keyword"] = "changed"
+    assert (await registry.get(0))["keyword"] == "a"
+
+
+@pytest.mark.asyncio
+async def test_mutations_persist_atomically(config_file):
+    """Test add/update/remove write the file without runtime fields"""
+    registry = TaskRegistry(config_file)
+    added = await registry.add({"task_name": "C", "keyword": "c", "is_running": True, "id": 99})
+    assert added["id"] == 2
+    await registry.update(0, {"keyword": "aa"})
+    assert (await registry.remove(1))["task_name"] == "B"
+
+    stored = json.loads(open(config_file, encoding="utf-8").read())
+    assert [t["task_name"] for t in stored] == ["A", "C"]
+    assert stored[0]["keyword"] == "aa"
+    # id 保存在配置文件中，运行状态不保存
+    assert [t["id"] for t in stored] == [0, 2]
+    assert all("is_running" not in t for t in stored)
+    assert not os.path.exists(os.path.join(os.path.dirname(config_file), ".config.json.tmp"))
+    assert await registry.update(5, {"keyword": "x"}) is None
+
+
+@pytest.mark.asyncio
+async def test_ids_stay_stable_after_remove(config_file):
+    """Test removing a task does not change the ids of later tasks and ids are never reused"""
+    registry = TaskRegistry(config_file)
+    await registry.add({"task_name": "C"})
+    registry.set_running(2, True)
+    await registry.remove(0)
+    assert [t["id"] for t in await registry.list_tasks()] == [1, 2]
+    assert (await registry.get(2))["task_name"] == "C"
+    assert registry.is_running(2) is True
+    assert await registry.get(0) is None
+
+    await registry.remove(2)
+    assert (await registry.add({"task_name": "D"}))["id"] == 3
+
+
+@pytest.mark.asyncio
+async def test_assigns_missing_and_duplicate_ids(config_file):
+    """Test legacy tasks get ids persisted and duplicated ids are reassigned"""
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump([{"task_name": "A", "id": 5}, {"task_name": "B"}, {"task_name": "C", "id": 5}], f)
+    registry = TaskRegistry(config_file)
+    assert [t["id"] for t in await registry.list_tasks()] == [5, 6, 7]
+    stored = json.loads(open(config_file, encoding="utf-8").read())
+    assert [t["id"] for t in stored] == [5, 6, 7]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_updates_are_serialized(config_file):
+    """Test concurrent mutations do not clobber each other"""
+    registry = TaskRegistry(config_file)
+    await asyncio.gather(*(registry.add({"task_name": f"T{i}"}) for i in range(20)))
+    stored = json.loads(open(config_file, encoding="utf-8").read())
+    assert len(stored) == 22
+
+
+@pytest.mark.asyncio
+async def test_detects_external_edits(config_file):
+    """Test an external edit to config.json is picked up on the next read"""
+    registry = TaskRegistry(config_file)
+    await registry.list_tasks()
+
+    with open(config_file, "w", encoding="utf-8") as f:
+        json.dump(TASKS + [{"task_name": "External"}], f)
+    stat = os.stat(config_file)
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert [t["task_name"] for t in await registry.list_tasks()] == ["A", "B", "External"]
+
+    # 外部写入了损坏的JSON时继续使用缓存
+    with open(config_file, "w", encoding="utf-8") as f:
+        f.write("[{")
+    os.utime(config_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000))
+    assert len(await registry.list_tasks()) == 3
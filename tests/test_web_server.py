@@ -0,0 +1,48 @@
+import json
+from unittest.mock import AsyncMock
+
+import pytest
+from apscheduler.schedulers.background import BackgroundScheduler
+
+import web_server
+from src.scheduler_sync import SchedulerReconciler
+from src.task_registry import TaskRegistry
+
+
+TASKS = [
+    {"task_name": "A", "enabled": True, "keyword": "a", "cron": "0 * * * *"},
+    {"task_name": "B", "enabled": True, "keyword": "b", "cron": "15 * * * *"},
+]
+
+
+def job_func(task_id, task_name):
+    pass
+
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(TASKS, ensure_ascii=False), encoding="utf-8")
+    scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
+    scheduler.start(paused=True)
+    monkeypatch.setattr(web_server, "task_registry", TaskRegistry(str(path)))
+    monkeypatch.setattr(web_server, "scheduler", scheduler)
+    monkeypatch.setattr(web_server, "scheduler_reconciler", SchedulerReconciler(scheduler, job_func, spread_seconds=0))
+    monkeypatch.setattr(web_server, "publish_tasks_changed", AsyncMock())
+    yield scheduler
+    scheduler.shutdown(wait=False)
+
+
+@pytest.mark.asyncio
+async def test_update_task_cron_reschedules_only_that_job(scheduler):
+    """Test changing a task's cron through the API reschedules its job and leaves other jobs untouched"""
+    await web_server.reload_scheduler_jobs()
+    other = scheduler.get_job("task_1")
+    next_run = other.next_run_time
+
+    result = await web_server.update_task_api(0, web_server.TaskUpdate(cron="30 * * * *"), username="admin")
+
+    assert result["task"]["cron"] == "30 * * * *"
+    assert scheduler.get_job("task_0").next_run_time.minute == 30
+    assert scheduler.get_job("task_1") is other
+    assert scheduler.get_job("task_1").next_run_time == next_run
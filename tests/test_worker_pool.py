@@ -0,0 +1,79 @@
+import asyncio
+import sys
+
+import pytest
+
+from src.worker_pool import SpiderWorkerPool
+
+# 模拟工作进程：等待标准输入中的一行任务，回显后退出；标准输入关闭时直接退出
+_FAKE_WORKER = "import sys; line = sys.stdin.readline(); print('job ' + line.strip() if line else 'idle exit')"
+
+
+def _fake_spawn():
+    return asyncio.create_subprocess_exec(
+        sys.executable, "-c", _FAKE_WORKER,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+
+
+@pytest.mark.asyncio
+async def test_acquire_submit_and_refill():
+    """Test a warm worker runs the submitted job and the pool refills in the background"""
+    pool = SpiderWorkerPool(size=1, spawn=_fake_spawn)
+    await pool.start()
+    assert pool.idle_count == 1
+
+    process = await pool.acquire()
+    assert process is not None
+    await pool.submit(process, {"task_name": "Task A"})
+    output = await asyncio.wait_for(process.stdout.read(), timeout=5)
+    assert output.decode().strip() == 'job {"task_name": "Task A"}'
+    assert await process.wait() == 0
+
+    await asyncio.wait_for(pool._refill_task, timeout=5)
+    assert pool.idle_count == 1
+    await pool.close()
+    assert pool.idle_count == 0
+
+
+@pytest.mark.asyncio
+async def test_acquire_skips_dead_and_expired_workers():
+    """Test exited or expired workers are discarded instead of being handed out"""
+    pool = SpiderWorkerPool(size=1, max_idle_seconds=0, spawn=_fake_spawn)
+    await pool.start()
+    # 空闲时间超过上限的进程被回收，本次调用方需自行启动新进程
+    assert await pool.acquire() is None
+    await asyncio.wait_for(pool._refill_task, timeout=5)
+
+    pool.max_idle_seconds = 3600
+    dead, _ = pool._idle[0]
+    dead.stdin.close()
+    await dead.wait()
+    assert await pool.acquire() is None
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_recycle_replaces_idle_workers():
+    """Test recycle retires idle workers so new ones pick up changed settings"""
+    pool = SpiderWorkerPool(size=2, spawn=_fake_spawn)
+    await pool.start()
+    old = [process for process, _ in pool._idle]
+    await pool.recycle()
+    assert all(process.returncode == 0 for process in old)
+    await asyncio.wait_for(pool._refill_task, timeout=5)
+    assert pool.idle_count == 2
+    assert not {process.pid for process, _ in pool._idle} & {process.pid for process in old}
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_empty_pool_returns_none():
+    """Test a pool of size 0 never spawns workers"""
+    pool = SpiderWorkerPool(size=0, spawn=_fake_spawn)
+    await pool.start()
+    assert await pool.acquire() is None
+    assert pool._refill_task is None
+    await pool.close()
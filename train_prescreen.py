@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import sys
+
+from src.config import PRESCREEN_MODEL_FILE
+from src.prescreen import default_training_files, train_prescreen
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="用结果文件中历史的AI推荐结论训练本地预筛模型，并在验证集上输出校准和跳过率报告。",
+        epilog="""
+使用示例:
+  python train_prescreen.py
+  python train_prescreen.py --files jsonl/a7m4_full_data.jsonl --max-miss-rate 0.01
+""",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--files", nargs="*", help="训练用的结果文件 (默认: jsonl/ 目录下的所有 .jsonl 文件)。")
+    parser.add_argument("--output", type=str, default=PRESCREEN_MODEL_FILE, help=f"模型保存路径 (默认: {PRESCREEN_MODEL_FILE})。")
+    parser.add_argument("--holdout-percent", type=int, default=20, help="用作验证集的商品比例 (%%，默认: 20)。")
+    parser.add_argument("--max-miss-rate", type=float, default=0.02,
+                        help="验证集中允许被误跳过的推荐商品比例，用于选择跳过阈值 (默认: 0.02)。")
+    parser.add_argument("--epochs", type=int, default=300, help="训练轮数 (默认: 300)。")
+    args = parser.parse_args()
+
+    files = args.files or default_training_files()
+    if not files:
+        sys.exit("错误: 没有找到结果文件，请先运行监控任务积累带AI结论的记录。")
+
+    try:
+        model, report = train_prescreen(files, args.holdout_percent, args.max_miss_rate, epochs=args.epochs)
+    except ValueError as e:
+        sys.exit(f"错误: {e}")
+
+    model.save(args.output)
+    report_path = os.path.splitext(args.output)[0] + "_report.json"
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"训练集 {report['train_items']} 条 (推荐 {report['train_recommended']} 条)，"
+          f"验证集 {report['items']} 条 (推荐 {report['recommended']} 条)。")
+    print(f"验证集 AUC: {report['auc']}，Brier 分数: {report['brier']}")
+    print("\n校准 (预测概率区间 / 商品数 / 平均预测值 / 实际推荐率):")
+    for row in report["calibration"]:
+        print(f"  {row['range']}  {row['items']:>6}  {row['mean_predicted']:.3f}  {row['observed_rate']:.3f}")
+    print("\n跳过率 (阈值 / 跳过比例 / 被误跳过的推荐商品):")
+    for row in report["skip_rates"]:
+        print(f"  {row['threshold']:<6}  {row['skip_rate']:.1%}  {row['missed_recommended']} ({row['miss_rate']:.1%})")
+    if report["threshold"] > 0:
+        print(f"\n已选择跳过阈值 {report['threshold']}，预计可跳过 {report['expected_skip_rate']:.1%} 的AI调用。")
+    else:
+        print("\n验证集中没有满足误跳过比例要求的阈值，模型不会跳过任何商品。")
+    print(f"模型已保存到 {args.output}，报告已保存到 {report_path}。设置 PRESCREEN=true 后生效。")
+
+
+if __name__ == "__main__":
+    main()
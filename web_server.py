@@ -8,20 +8,35 @@ import signal
 import sys
 import base64
 from contextlib import asynccontextmanager
+from datetime import datetime
 from dotenv import dotenv_values
 from fastapi import FastAPI, Request, HTTPException, Depends, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from src.prompt_utils import generate_criteria, update_config_with_new_task
-from fastapi.responses import HTMLResponse, JSONResponse
+from src.prompt_utils import generate_criteria
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from typing import List, Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
 
+from src.config import reload_notification_config
 from src.file_operator import FileOperator
-from src.task import get_task, update_task
+from src.event_bus import TaskProgressParser, get_event_bus, stream_events
+from src.log_stream import read_tail, stream_log_events
+from src.memory_monitor import process_tree_rss, read_rss_bytes
+from src.loop_watchdog import start_loop_watchdog, stop_loop_watchdog
+from src.task_logs import get_combined_log, get_task_log_store, pump_process_output
+from src.metrics import MetricsAggregator, get_metrics, merge_snapshots, render_prometheus
+from src.notification_outbox import get_notification_outbox, start_outbox_sender, stop_outbox_sender
+from src.notifier import close_notification_dispatcher
+from src.price_history import get_price_history_store
+from src.run_profiler import list_profile_reports, profile_report_path
+from src.run_queue import MANUAL_RUN_PRIORITY, RunQueue
+from src.schedule_spread import build_load_histogram
+from src.scheduler_sync import SchedulerReconciler
+from src.task_registry import get_task_registry
+from src.worker_pool import get_worker_pool, spawn_spider_process
 
 
 class Task(BaseModel):
@@ -37,6 +52,11 @@ class Task(BaseModel):
     ai_prompt_base_file: str
     ai_prompt_criteria_file: str
     is_running: Optional[bool] = False
+    digest_window_minutes: Optional[float] = None
+    digest_max_items: Optional[int] = None
+    priority: Optional[int] = None
+    profile: Optional[bool] = False
+    fetch_mode: Optional[str] = "navigate"
 
 
 class TaskUpdate(BaseModel):
@@ -52,6 +72,11 @@ class TaskUpdate(BaseModel):
     ai_prompt_base_file: Optional[str] = None
     ai_prompt_criteria_file: Optional[str] = None
     is_running: Optional[bool] = None
+    digest_window_minutes: Optional[float] = None
+    digest_max_items: Optional[int] = None
+    priority: Optional[int] = None
+    profile: Optional[bool] = None
+    fetch_mode: Optional[str] = None
 
 
 class TaskGenerateRequest(BaseModel):
@@ -92,30 +117,44 @@ class NotificationSettings(BaseModel):
 async def lifespan(app: FastAPI):
     """
     管理应用的生命周期事件。
-    启动时：重置任务状态，加载并启动调度器。
-    关闭时：确保终止所有子进程和调度器。
+    启动时：加载任务配置，启动调度器和通知投递器。
+    关闭时：确保终止所有子进程、调度器和通知投递器。
     """
     # Startup
-    await _set_all_tasks_stopped_in_config()
+    await task_registry.load()
     await reload_scheduler_jobs()
     if not scheduler.running:
         scheduler.start()
+    # Web服务常驻运行，负责投递爬虫进程退出时仍未发送完的通知
+    start_outbox_sender()
+    await worker_pool.start()
+    start_loop_watchdog("web")
 
     yield
 
+    await stop_loop_watchdog()
+
     # Shutdown
     if scheduler.running:
         print("正在关闭调度器...")
         scheduler.shutdown()
 
+    # 先清空运行队列，避免终止进程后继续启动排队中的任务
+    run_queue.close()
     global scraper_processes
     if scraper_processes:
         print("Web服务器正在关闭，正在终止所有爬虫进程...")
         stop_tasks = [stop_task_process(task_id) for task_id in list(scraper_processes.keys())]
         await asyncio.gather(*stop_tasks)
         print("所有爬虫进程已终止。")
+    await run_queue.join()
 
-    await _set_all_tasks_stopped_in_config()
+    await worker_pool.close()
+    if _log_pump_tasks:
+        await asyncio.gather(*_log_pump_tasks, return_exceptions=True)
+    combined_log.close()
+    await stop_outbox_sender()
+    await close_notification_dispatcher()
 
 
 def load_notification_settings():
@@ -190,7 +229,8 @@ def load_ai_settings():
         "OPENAI_API_KEY": config.get("OPENAI_API_KEY", ""),
         "OPENAI_BASE_URL": config.get("OPENAI_BASE_URL", ""),
         "OPENAI_MODEL_NAME": config.get("OPENAI_MODEL_NAME", ""),
-        "PROXY_URL": config.get("PROXY_URL", "")
+        "PROXY_URL": config.get("PROXY_URL", ""),
+        "AI_IMAGE_INPUT_MODE": config.get("AI_IMAGE_INPUT_MODE", "base64")
     }
 
 
@@ -206,7 +246,7 @@ def save_ai_settings(settings: dict):
 
     # Update or add AI settings
     setting_keys = [
-        "OPENAI_API_KEY", "OPENAI_BASE_URL", "OPENAI_MODEL_NAME", "PROXY_URL"
+        "OPENAI_API_KEY", "OPENAI_BASE_URL", "OPENAI_MODEL_NAME", "PROXY_URL", "AI_IMAGE_INPUT_MODE"
     ]
 
     # Create a dictionary of existing settings
@@ -319,118 +359,170 @@ app.mount("/static", AuthenticatedStaticFiles(directory="static"), name="static"
 # Setup templates
 templates = Jinja2Templates(directory="templates")
 
-# --- Scheduler Functions ---
-async def run_single_task(task_id: int, task_name: str):
+# 任务配置的内存缓存，所有对 config.json 的读写都经由它完成
+task_registry = get_task_registry()
+# 按任务划分的运行日志，以及所有任务共用的汇总日志 (logs/scraper.log)
+task_log_store = get_task_log_store()
+combined_log = get_combined_log()
+_log_pump_tasks = set()
+# 任务生命周期事件总线，以及各运行中任务的最新进度（仅在内存中）
+event_bus = get_event_bus()
+task_progress = {}
+# 预热的爬虫工作进程池
+worker_pool = get_worker_pool()
+
+
+async def get_tasks_snapshot() -> list:
+    """返回带运行状态和进度的任务列表，数据全部来自内存缓存。"""
+    tasks = await task_registry.list_tasks()
+    for task in tasks:
+        task['progress'] = task_progress.get(task['id'])
+        task['queue_position'] = run_queue.position(task['task_name'])
+    return tasks
+
+
+async def publish_tasks_changed():
+    """任务配置变更后向仪表盘推送完整的任务列表。"""
+    event_bus.publish("tasks", await get_tasks_snapshot())
+
+
+async def launch_spider_process(task_id: int, task_name: str):
     """
-    由调度器调用的函数，用于启动单个爬虫任务。
+    启动爬虫子进程，优先使用进程池中已预热的工作进程，没有可用进程时启动新进程。
+    其输出由后台协程逐行写入任务自己的运行日志和汇总日志，
+    避免多个任务直接追加同一个文件导致内容交错；同时从输出中解析进度，
+    并通过事件总线推送任务的启动、进度和结束事件。返回 (进程, 输出转发任务)。
     """
-    print(f"定时任务触发: 正在为任务 '{task_name}' 启动爬虫...")
-    log_file_handle = None
+    loop = asyncio.get_running_loop()
+    run_log = await loop.run_in_executor(None, task_log_store.begin_run, task_name)
     try:
-        # 更新任务状态为“运行中”
-        await update_task_running_status(task_id, True)
-
-        # 确保日志目录存在，并以追加模式打开日志文件
-        os.makedirs("logs", exist_ok=True)
-        log_file_path = os.path.join("logs", "scraper.log")
-        log_file_handle = open(log_file_path, 'a', encoding='utf-8')
-
-        # 使用与Web服务器相同的Python解释器来运行爬虫脚本
-        # 将 stdout 和 stderr 重定向到日志文件
-        # 在非 Windows 系统上，使用 setsid 创建新进程组，以便能终止整个进程树
-        preexec_fn = os.setsid if sys.platform != "win32" else None
-        process = await asyncio.create_subprocess_exec(
-            sys.executable, "-u", "spider_v2.py", "--task-name", task_name,
-            stdout=log_file_handle,
-            stderr=log_file_handle,
-            preexec_fn=preexec_fn
-        )
+        process = await worker_pool.acquire()
+        if process is not None:
+            try:
+                await worker_pool.submit(process, {"task_name": task_name})
+            except (BrokenPipeError, ConnectionResetError):
+                print(f"预热爬虫进程 {process.pid} 不可用，改为启动新进程。")
+                process = None
+        if process is None:
+            process = await spawn_spider_process("--task-name", task_name)
+    except Exception:
+        await loop.run_in_executor(None, run_log.finish, None)
+        raise
+
+    task_registry.set_running(task_id, True)
+    parser = TaskProgressParser()
+    task_progress[task_id] = parser.snapshot()
+    event_bus.publish("task_started", {
+        "task_id": task_id, "task_name": task_name, "pid": process.pid, "run_id": run_log.run_id,
+    })
+
+    def on_line(line: str):
+        progress = parser.feed(line)
+        if progress is not None:
+            task_progress[task_id] = progress
+            event_bus.publish("task_progress", {"task_id": task_id, "task_name": task_name, **progress})
+
+    async def forward_output():
+        returncode = None
+        try:
+            await pump_process_output(process.stdout, run_log, combined_log, f"[{task_name}] ", on_line=on_line)
+        finally:
+            returncode = await process.wait()
+            await loop.run_in_executor(None, run_log.finish, returncode)
+            task_registry.set_running(task_id, False)
+            task_progress.pop(task_id, None)
+            if scraper_processes.get(task_id) is process:
+                del scraper_processes[task_id]
+            event_bus.publish("task_finished", {
+                "task_id": task_id, "task_name": task_name, "exit_code": returncode,
+                "run_id": run_log.run_id, "progress": parser.snapshot(),
+            })
 
-        # 等待进程结束
-        await process.wait()
+    pump_task = asyncio.create_task(forward_output())
+    _log_pump_tasks.add(pump_task)
+    pump_task.add_done_callback(_log_pump_tasks.discard)
+    return process, pump_task
+
+async def launch_queued_run(task_name: str):
+    """
+    运行队列派发任务时调用：启动爬虫进程并登记到进程表，使定时运行也可以被停止。
+    返回在进程结束且输出全部写入日志后完成的协程。
+    """
+    tasks = await task_registry.list_tasks()
+    task = next((t for t in tasks if t.get('task_name') == task_name), None)
+    if task is None:
+        print(f"排队中的任务 '{task_name}' 已不存在，跳过运行。")
+        return None
+
+    task_id = task['id']
+    process, pump_task = await launch_spider_process(task_id, task_name)
+    scraper_processes[task_id] = process
+    print(f"启动任务 '{task_name}' (PID: {process.pid})，日志输出到 {task_log_store.active_log_path(task_name)}")
+    # 排队中其他任务的位置随之变化
+    await publish_tasks_changed()
+
+    async def wait_for_exit():
+        await pump_task
+        log_file_path = task_log_store.active_log_path(task_name)
         if process.returncode == 0:
-            print(f"定时任务 '{task_name}' 执行成功。日志已写入 {log_file_path}")
+            print(f"任务 '{task_name}' 执行成功。日志已写入 {log_file_path}")
         else:
-            print(f"定时任务 '{task_name}' 执行失败。返回码: {process.returncode}。详情请查看 {log_file_path}")
+            print(f"任务 '{task_name}' 执行失败。返回码: {process.returncode}。详情请查看 {log_file_path}")
 
-    except Exception as e:
-        print(f"启动定时任务 '{task_name}' 时发生错误: {e}")
-    finally:
-        # 确保文件句柄被关闭
-        if log_file_handle:
-            log_file_handle.close()
-        # 任务结束后，更新状态为“已停止”
-        await update_task_running_status(task_id, False)
+    return wait_for_exit()
 
 
-async def _set_all_tasks_stopped_in_config():
-    """读取配置文件，将所有任务的 is_running 状态设置为 false。"""
-    try:
-        # 使用 aiofiles 异步读写
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            if not content.strip():
-                return
-            tasks = json.loads(content)
-
-        # 检查是否有任何任务的状态需要被更新
-        needs_update = any(task.get('is_running') for task in tasks)
-
-        if needs_update:
-            for task in tasks:
-                task['is_running'] = False
-
-            async with aiofiles.open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(tasks, ensure_ascii=False, indent=2))
-            print("所有任务状态已在配置文件中重置为“已停止”。")
-
-    except FileNotFoundError:
-        # 配置文件不存在，无需操作
-        pass
-    except Exception as e:
-        print(f"重置任务状态时出错: {e}")
+# 所有爬虫运行都经过该队列，限制同时运行的爬虫数
+run_queue = RunQueue(launch_queued_run)
 
 
-async def reload_scheduler_jobs():
+# --- Scheduler Functions ---
+async def run_single_task(task_id: int, task_name: str):
     """
-    重新加载所有定时任务。清空现有任务，并从 config.json 重新创建。
+    由调度器调用的函数，将任务加入运行队列，由队列按并发上限和优先级启动。
     """
-    print("正在重新加载定时任务调度器...")
-    scheduler.remove_all_jobs()
-    try:
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            tasks = json.loads(await f.read())
+    task = await task_registry.get(task_id)
+    priority = (task or {}).get("priority") or 0
+    result = run_queue.submit(task_name, priority=priority, source="schedule")
+    if result["status"] == "started":
+        print(f"定时任务触发: 正在为任务 '{task_name}' 启动爬虫...")
+    elif result["status"] == "queued":
+        print(f"定时任务触发: 任务 '{task_name}' 已加入运行队列，排在第 {result['position']} 位。")
+        await publish_tasks_changed()
+    else:
+        print(f"定时任务触发: 任务 '{task_name}' 已在运行或排队中，本次触发已合并。")
 
-        for i, task in enumerate(tasks):
-            task_name = task.get("task_name")
-            cron_str = task.get("cron")
-            is_enabled = task.get("enabled", False)
 
-            if task_name and cron_str and is_enabled:
-                try:
-                    # 使用 CronTrigger.from_crontab 更稳健
-                    trigger = CronTrigger.from_crontab(cron_str)
-                    scheduler.add_job(
-                        run_single_task,
-                        trigger=trigger,
-                        args=[i, task_name],
-                        id=f"task_{i}",
-                        name=f"Scheduled: {task_name}",
-                        replace_existing=True
-                    )
-                    print(f"  -> 已为任务 '{task_name}' 添加定时规则: '{cron_str}'")
-                except ValueError as e:
-                    print(f"  -> [警告] 任务 '{task_name}' 的 Cron 表达式 '{cron_str}' 无效，已跳过: {e}")
-
-    except FileNotFoundError:
-        print(f"[警告] 配置文件 {CONFIG_FILE} 未找到，无法加载定时任务。")
+# 任务配置与调度器之间的增量同步
+scheduler_reconciler = SchedulerReconciler(scheduler, run_single_task)
+
+
+async def reload_scheduler_jobs():
+    """
+    将 config.json 中的任务同步到调度器，只新增、修改或删除有变化的定时任务，
+    未变化的定时任务保留原有的下次运行时间。
+    """
+    try:
+        tasks = await task_registry.list_tasks()
+        changes = scheduler_reconciler.reconcile(tasks)
     except Exception as e:
-        print(f"[错误] 重新加载定时任务时发生错误: {e}")
+        print(f"[错误] 同步定时任务时发生错误: {e}")
+        return
 
-    print("定时任务加载完成。")
+    if not any(changes.values()):
+        return
+    print(f"定时任务同步完成：新增 {len(changes['added'])}，更新 {len(changes['updated']) + len(changes['rescheduled'])}，"
+          f"移除 {len(changes['removed'])}。")
     if scheduler.get_jobs():
-        print("当前已调度的任务:")
-        scheduler.print_jobs()
+        load = get_schedule_load()
+        print(f"未来24小时共触发 {load['total_runs']} 次，单小时最多 {load['max_runs_per_hour']} 次，"
+              f"同一分钟最多 {load['max_runs_per_minute']} 次 ({load['peak_minute']})。")
+
+
+def get_schedule_load(hours: int = 24) -> dict:
+    """根据当前已注册的定时任务，统计从现在起每小时的运行次数。"""
+    triggers = {job.args[1]: job.trigger for job in scheduler.get_jobs()}
+    return build_load_histogram(triggers, datetime.now(scheduler.timezone), hours)
 
 
 @app.get("/health")
@@ -460,21 +552,28 @@ async def get_tasks(username: str = Depends(verify_credentials)):
     读取并返回 config.json 中的所有任务。
     """
     try:
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            content = await f.read()
-            tasks = json.loads(content)
-            # 为每个任务添加一个唯一的 id
-            for i, task in enumerate(tasks):
-                task['id'] = i
-            return tasks
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail=f"配置文件 {CONFIG_FILE} 未找到。")
+        # 每个任务附带唯一的 id 以及内存中的运行状态和进度
+        return await get_tasks_snapshot()
     except json.JSONDecodeError:
         raise HTTPException(status_code=500, detail=f"配置文件 {CONFIG_FILE} 格式错误。")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"读取任务配置时发生错误: {e}")
 
 
+@app.get("/api/events")
+async def task_events(username: str = Depends(verify_credentials)):
+    """
+    以 Server-Sent Events 推送任务事件：连接时推送一次任务列表快照 (snapshot)，
+    之后推送 tasks / task_started / task_progress / task_finished 增量事件。
+    事件均来自内存，空闲的仪表盘不会产生任何磁盘读取。
+    """
+    return StreamingResponse(
+        stream_events(event_bus, get_tasks_snapshot),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/tasks/generate", response_model=dict)
 async def generate_task(req: TaskGenerateRequest, username: str = Depends(verify_credentials)):
     """
@@ -519,26 +618,22 @@ async def generate_task(req: TaskGenerateRequest, username: str = Depends(verify
         "description": req.description,
         "ai_prompt_base_file": "prompts/base_prompt.txt",
         "ai_prompt_criteria_file": output_filename,
-        "is_running": False
     }
 
     # 5. 将新任务添加到 config.json
-    success = await update_config_with_new_task(new_task, CONFIG_FILE)
-    if not success:
+    try:
+        new_task_with_id = await task_registry.add(new_task)
+    except Exception as e:
         # 如果更新失败，最好能把刚刚创建的文件删掉，以保持一致性
         if os.path.exists(output_filename):
             os.remove(output_filename)
-        raise HTTPException(status_code=500, detail="更新配置文件 config.json 失败。")
+        raise HTTPException(status_code=500, detail=f"更新配置文件 config.json 失败: {e}")
 
     # 重新加载调度器以包含新任务
     await reload_scheduler_jobs()
+    await publish_tasks_changed()
 
     # 6. 返回成功创建的任务（包含ID）
-    async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-        tasks = json.loads(await f.read())
-    new_task_with_id = new_task.copy()
-    new_task_with_id['id'] = len(tasks) - 1
-
     return {"message": "AI 任务创建成功。", "task": new_task_with_id}
 
 
@@ -548,22 +643,9 @@ async def create_task(task: Task, username: str = Depends(verify_credentials)):
     创建一个新任务并将其添加到 config.json。
     """
     try:
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            tasks = json.loads(await f.read())
-    except (FileNotFoundError, json.JSONDecodeError):
-        tasks = []
-
-    new_task_data = task.dict()
-    if 'is_running' not in new_task_data:
-        new_task_data['is_running'] = False
-    tasks.append(new_task_data)
-
-    try:
-        async with aiofiles.open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(tasks, ensure_ascii=False, indent=2))
-
-        new_task_data['id'] = len(tasks) - 1
+        new_task_data = await task_registry.add(task.dict())
         await reload_scheduler_jobs()
+        await publish_tasks_changed()
         return {"message": "任务创建成功。", "task": new_task_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"写入配置文件时发生错误: {e}")
@@ -574,12 +656,13 @@ async def update_task_api(task_id: int, task_update: TaskUpdate, username: str =
     """
     更新指定ID任务的属性。
     """
-    task = await get_task(task_id)
+    task = await task_registry.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务未找到。")
 
-    # 更新数据
+    # 更新数据（运行状态由进程管理维护，不接受客户端修改）
     update_data = task_update.dict(exclude_unset=True)
+    update_data.pop('is_running', None)
 
     if not update_data:
         return JSONResponse(content={"message": "数据无变化，未执行更新。"}, status_code=200)
@@ -605,44 +688,30 @@ async def update_task_api(task_id: int, task_update: TaskUpdate, username: str =
     # 如果任务从“启用”变为“禁用”，且正在运行，则先停止它
     if 'enabled' in update_data and not update_data['enabled']:
         if scraper_processes.get(task_id):
-            print(f"任务 '{tasks[task_id]['task_name']}' 已被禁用，正在停止其进程...")
+            print(f"任务 '{task['task_name']}' 已被禁用，正在停止其进程...")
             await stop_task_process(task_id) # 这会处理进程和is_running状态
 
-    task.update(update_data)
-
-    success = await update_task(task_id, task)
-
-    if not success:
+    try:
+        task = await task_registry.update(task_id, update_data)
+    except Exception as e:
         raise HTTPException(status_code=500, detail=f"写入配置文件时发生错误: {e}")
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务未找到。")
 
+    # 只有定时规则或启用状态变化的任务会被重新调度，其他任务保留原有的下次运行时间
+    await reload_scheduler_jobs()
+    await publish_tasks_changed()
     return {"message": "任务更新成功。", "task": task}
 
-async def start_task_process(task_id: int, task_name: str):
-    """内部函数：启动一个指定的任务进程。"""
-    global scraper_processes
-    if scraper_processes.get(task_id) and scraper_processes[task_id].returncode is None:
-        print(f"任务 '{task_name}' (ID: {task_id}) 已在运行中。")
-        return
-
-    try:
-        os.makedirs("logs", exist_ok=True)
-        log_file_path = os.path.join("logs", "scraper.log")
-        log_file_handle = open(log_file_path, 'a', encoding='utf-8')
-
-        preexec_fn = os.setsid if sys.platform != "win32" else None
-        process = await asyncio.create_subprocess_exec(
-            sys.executable, "-u", "spider_v2.py", "--task-name", task_name,
-            stdout=log_file_handle,
-            stderr=log_file_handle,
-            preexec_fn=preexec_fn
-        )
-        scraper_processes[task_id] = process
-        print(f"启动任务 '{task_name}' (PID: {process.pid})，日志输出到 {log_file_path}")
-
-        # 更新配置文件中的状态
-        await update_task_running_status(task_id, True)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"启动任务 '{task_name}' 进程时出错: {e}")
+async def start_task_process(task_id: int, task_name: str) -> dict:
+    """内部函数：以手动运行的优先级将任务加入运行队列，未达到并发上限时立即启动。"""
+    result = run_queue.submit(task_name, priority=MANUAL_RUN_PRIORITY, source="manual")
+    if result["status"] == "coalesced":
+        print(f"任务 '{task_name}' (ID: {task_id}) 已在运行或排队中。")
+    elif result["status"] == "queued":
+        print(f"任务 '{task_name}' (ID: {task_id}) 已加入运行队列，排在第 {result['position']} 位。")
+        await publish_tasks_changed()
+    return result
 
 
 async def stop_task_process(task_id: int):
@@ -651,8 +720,8 @@ async def stop_task_process(task_id: int):
     process = scraper_processes.get(task_id)
     if not process or process.returncode is not None:
         print(f"任务ID {task_id} 没有正在运行的进程。")
-        # 确保配置文件状态正确
-        await update_task_running_status(task_id, False)
+        # 确保运行状态正确
+        task_registry.set_running(task_id, False)
         if task_id in scraper_processes:
             del scraper_processes[task_id]
         return
@@ -672,60 +741,105 @@ async def stop_task_process(task_id: int):
     finally:
         if task_id in scraper_processes:
             del scraper_processes[task_id]
-        await update_task_running_status(task_id, False)
-
-
-async def update_task_running_status(task_id: int, is_running: bool):
-    """更新 config.json 中指定任务的 is_running 状态。"""
-    try:
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            tasks = json.loads(await f.read())
-
-        if 0 <= task_id < len(tasks):
-            tasks[task_id]['is_running'] = is_running
-            async with aiofiles.open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(tasks, ensure_ascii=False, indent=2))
-    except Exception as e:
-        print(f"更新任务 {task_id} 状态时出错: {e}")
+        task_registry.set_running(task_id, False)
 
 
 @app.post("/api/tasks/start/{task_id}", response_model=dict)
 async def start_single_task(task_id: int, username: str = Depends(verify_credentials)):
     """启动单个任务。"""
     try:
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            tasks = json.loads(await f.read())
-        if not (0 <= task_id < len(tasks)):
+        task = await task_registry.get(task_id)
+        if task is None:
             raise HTTPException(status_code=404, detail="任务未找到。")
 
-        task = tasks[task_id]
         if not task.get("enabled", False):
             raise HTTPException(status_code=400, detail="任务已被禁用，无法启动。")
 
-        await start_task_process(task_id, task['task_name'])
-        return {"message": f"任务 '{task['task_name']}' 已启动。"}
+        result = await start_task_process(task_id, task['task_name'])
+        if result["status"] == "queued":
+            message = f"已达到同时运行的任务上限，任务 '{task['task_name']}' 已加入运行队列，排在第 {result['position']} 位。"
+        elif result["status"] == "coalesced":
+            message = f"任务 '{task['task_name']}' 已在运行或排队中。"
+        else:
+            message = f"任务 '{task['task_name']}' 已启动。"
+        return {"message": message, **result}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/api/tasks/stop/{task_id}", response_model=dict)
 async def stop_single_task(task_id: int, username: str = Depends(verify_credentials)):
-    """停止单个任务。"""
+    """停止单个任务；任务还在排队时取消排队。"""
+    task = await task_registry.get(task_id)
+    if task is not None and run_queue.cancel(task['task_name']):
+        await publish_tasks_changed()
+        return {"message": f"任务 '{task['task_name']}' 已取消排队。"}
     await stop_task_process(task_id)
     return {"message": f"任务ID {task_id} 已发送停止信号。"}
 
 
+@app.get("/api/schedule/load")
+async def get_schedule_load_api(hours: int = 24, username: str = Depends(verify_credentials)):
+    """返回未来若干小时内定时任务按小时的运行次数，用于检查负载是否集中在同一时段。"""
+    if hours <= 0 or hours > 24 * 7:
+        raise HTTPException(status_code=400, detail="hours 必须在 1 到 168 之间。")
+    return get_schedule_load(hours)
+
+
+@app.get("/api/queue")
+async def get_run_queue(username: str = Depends(verify_credentials)):
+    """返回运行队列的状态：运行中和排队中的任务、计数器以及排队等待时间统计。"""
+    return run_queue.stats()
+
+
+metrics_aggregator = MetricsAggregator()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics(username: str = Depends(verify_credentials)):
+    """以 Prometheus 文本格式导出本进程和各爬虫进程汇总后的指标。"""
+    metrics = get_metrics()
+    queue_stats = run_queue.stats()
+    metrics.set_gauge("goofish_run_queue_pending", len(queue_stats["pending"]))
+    metrics.set_gauge("goofish_run_queue_running", len(queue_stats["running"]))
+    metrics.set_gauge("goofish_spiders_running",
+                      sum(1 for process in scraper_processes.values() if process.returncode is None))
+
+    loop = asyncio.get_running_loop()
+    try:
+        outbox_stats = await loop.run_in_executor(None, get_notification_outbox().stats)
+    except Exception as e:
+        print(f"读取通知发件箱统计失败: {e}")
+        outbox_stats = {}
+    metrics.clear_gauge("goofish_outbox_messages")
+    for channel, statuses in outbox_stats.items():
+        for outbox_status, count in statuses.items():
+            metrics.set_gauge("goofish_outbox_messages", count, channel=channel, status=outbox_status)
+
+    spider_snapshots = await loop.run_in_executor(None, metrics_aggregator.collect)
+    snapshot = merge_snapshots([metrics.snapshot()] + spider_snapshots)
+    return PlainTextResponse(render_prometheus(snapshot), media_type="text/plain; version=0.0.4")
+
+
 
 
 @app.get("/api/logs")
-async def get_logs(from_pos: int = 0, username: str = Depends(verify_credentials)):
+async def get_logs(from_pos: int = 0, tail_kb: int = 0, username: str = Depends(verify_credentials)):
     """
-    获取爬虫日志文件的内容。支持从指定位置增量读取。
+    获取爬虫日志文件的内容。支持从指定位置增量读取；tail_kb > 0 时只返回最后 tail_kb KB。
     """
     log_file_path = os.path.join("logs", "scraper.log")
     if not os.path.exists(log_file_path):
         return JSONResponse(content={"new_content": "日志文件不存在或尚未创建。", "new_pos": 0})
 
+    if tail_kb > 0:
+        content, file_size = await asyncio.get_running_loop().run_in_executor(
+            None, read_tail, log_file_path, tail_kb * 1024
+        )
+        return {"new_content": content, "new_pos": file_size}
+
     try:
         # 使用二进制模式打开以精确获取文件大小和位置
         async with aiofiles.open(log_file_path, 'rb') as f:
@@ -756,6 +870,105 @@ async def get_logs(from_pos: int = 0, username: str = Depends(verify_credentials
         )
 
 
+@app.get("/api/logs/stream")
+async def stream_logs(tail_kb: int = 64, username: str = Depends(verify_credentials)):
+    """
+    以 Server-Sent Events 推送爬虫日志。
+    连接建立后先推送最后 tail_kb KB 的内容（reset 事件），之后只推送新增内容（chunk 事件）。
+    所有连接共享同一个文件读取器。
+    """
+    log_file_path = os.path.join("logs", "scraper.log")
+    tail_bytes = max(1, min(tail_kb, 1024)) * 1024
+    return StreamingResponse(
+        stream_log_events(log_file_path, tail_bytes),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/tasks/{task_id}/runs")
+async def list_task_runs(task_id: int, username: str = Depends(verify_credentials)):
+    """返回指定任务的运行记录（起止时间、退出码及其在日志文件中的偏移量），最近的在前。"""
+    task = await task_registry.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务未找到。")
+    runs = await asyncio.get_running_loop().run_in_executor(None, task_log_store.list_runs, task['task_name'])
+    return {"task_name": task['task_name'], "runs": list(reversed(runs))}
+
+
+@app.get("/api/tasks/{task_id}/logs")
+async def get_task_logs(task_id: int, run_id: Optional[str] = None, lines: int = 0, tail_kb: int = 256,
+                        username: str = Depends(verify_credentials)):
+    """
+    获取指定任务的日志。
+    - lines > 0：返回任务日志的最后 lines 行；
+    - 否则返回 run_id 对应运行（默认最近一次）的日志，最多 tail_kb KB。
+    """
+    task = await task_registry.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务未找到。")
+    task_name = task['task_name']
+    loop = asyncio.get_running_loop()
+    if lines > 0:
+        content = await loop.run_in_executor(None, task_log_store.tail, task_name, min(lines, 10000))
+        return {"task_name": task_name, "run": None, "content": content}
+
+    run = await loop.run_in_executor(None, task_log_store.get_run, task_name, run_id)
+    if run is None:
+        if run_id:
+            raise HTTPException(status_code=404, detail="运行记录未找到。")
+        return {"task_name": task_name, "run": None, "content": ""}
+    content = await loop.run_in_executor(None, task_log_store.read_run, task_name, run, max(1, tail_kb) * 1024)
+    return {"task_name": task_name, "run": run, "content": content}
+
+
+@app.get("/api/tasks/{task_id}/profiles")
+async def list_task_profiles(task_id: int, username: str = Depends(verify_credentials)):
+    """返回指定任务的性能分析报告列表，最近的在前。"""
+    task = await task_registry.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务未找到。")
+    reports = await asyncio.get_running_loop().run_in_executor(None, list_profile_reports, task['task_name'])
+    return {"task_name": task['task_name'], "profiles": reports}
+
+
+@app.get("/api/tasks/{task_id}/profiles/{report_id}")
+async def download_task_profile(task_id: int, report_id: str, format: str = "collapsed",
+                                username: str = Depends(verify_credentials)):
+    """
+    下载性能分析报告。
+    - format=collapsed：折叠栈文本，可直接交给 flamegraph.pl 或 speedscope 生成火焰图；
+    - format=json：摘要，包含按函数排序的采样数和各 asyncio 任务的耗时。
+    """
+    if format not in ("collapsed", "json"):
+        raise HTTPException(status_code=400, detail="format 只能是 collapsed 或 json。")
+    task = await task_registry.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="任务未找到。")
+    path = profile_report_path(task['task_name'], report_id, format)
+    if path is None:
+        raise HTTPException(status_code=404, detail="性能分析报告未找到。")
+    media_type = "application/json" if format == "json" else "text/plain; charset=utf-8"
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+
+@app.get("/api/price-history/items/{item_id}")
+async def get_item_price_history(item_id: str, limit: int = 1000, username: str = Depends(verify_credentials)):
+    """返回商品在各次搜索中被看到时的价格和想要人数，按时间从早到晚排列。"""
+    history = await asyncio.get_running_loop().run_in_executor(
+        None, get_price_history_store().item_history, item_id, max(1, min(limit, 10000))
+    )
+    return {"item_id": item_id, "observations": history}
+
+
+@app.get("/api/price-history/keywords/{keyword}/daily")
+async def get_keyword_daily_prices(keyword: str, days: int = 30, username: str = Depends(verify_credentials)):
+    """返回关键词最近 days 天每天的商品数、最低/最高价和 p10/p25/p50/p75/p90 分位数价格。"""
+    stats = await asyncio.get_running_loop().run_in_executor(
+        None, get_price_history_store().keyword_daily_stats, keyword, max(1, min(days, 365))
+    )
+    return {"keyword": keyword, "days": stats}
+
 @app.delete("/api/logs", response_model=dict)
 async def clear_logs(username: str = Depends(verify_credentials)):
     """
@@ -779,20 +992,21 @@ async def delete_task(task_id: int, username: str = Depends(verify_credentials))
     """
     从 config.json 中删除指定ID的任务。
     """
-    try:
-        async with aiofiles.open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            tasks = json.loads(await f.read())
-    except (FileNotFoundError, json.JSONDecodeError) as e:
-        raise HTTPException(status_code=500, detail=f"读取或解析配置文件失败: {e}")
-
-    if not (0 <= task_id < len(tasks)):
+    task = await task_registry.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务未找到。")
 
-    # 如果任务正在运行，先停止它
+    # 如果任务正在排队或运行，先取消或停止它
+    run_queue.cancel(task['task_name'])
     if scraper_processes.get(task_id):
         await stop_task_process(task_id)
 
-    deleted_task = tasks.pop(task_id)
+    try:
+        deleted_task = await task_registry.remove(task_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"写入配置文件时发生错误: {e}")
+    if deleted_task is None:
+        raise HTTPException(status_code=404, detail="任务未找到。")
 
     # 尝试删除关联的 criteria 文件
     criteria_file = deleted_task.get("ai_prompt_criteria_file")
@@ -804,15 +1018,10 @@ async def delete_task(task_id: int, username: str = Depends(verify_credentials))
             # 如果文件删除失败，只记录日志，不中断主流程
             print(f"警告: 删除文件 {criteria_file} 失败: {e}")
 
-    try:
-        async with aiofiles.open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            await f.write(json.dumps(tasks, ensure_ascii=False, indent=2))
-
-        await reload_scheduler_jobs()
+    await reload_scheduler_jobs()
+    await publish_tasks_changed()
 
-        return {"message": "任务删除成功。", "task_name": deleted_task.get("task_name")}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"写入配置文件时发生错误: {e}")
+    return {"message": "任务删除成功。", "task_name": deleted_task.get("task_name")}
 
 
 @app.get("/api/results/files")
@@ -915,18 +1124,37 @@ async def get_system_status(username: str = Depends(verify_credentials)):
 
     # 检查是否有任何任务进程仍在运行
     running_pids = []
+    running_processes = {}
     for task_id, process in list(scraper_processes.items()):
         if process.returncode is None:
             running_pids.append(process.pid)
+            running_processes[task_id] = process.pid
         else:
             # 进程已结束，从字典中清理
             print(f"检测到任务进程 {process.pid} (ID: {task_id}) 已结束，返回码: {process.returncode}。")
             del scraper_processes[task_id]
-            # 异步更新配置文件状态
-            asyncio.create_task(update_task_running_status(task_id, False))
+            task_registry.set_running(task_id, False)
+
+    # 各运行中任务的内存占用：爬虫进程自身及其 Chromium 等子进程的 RSS (MB)，仅 Linux 可读取
+    loop = asyncio.get_running_loop()
+    running_tasks = []
+    for task_id, pid in running_processes.items():
+        tree = await loop.run_in_executor(None, process_tree_rss, pid)
+        task = await task_registry.get(task_id)
+        running_tasks.append({
+            "task_id": task_id,
+            "task_name": task["task_name"] if task else None,
+            "pid": pid,
+            "rss_mb": round(tree["rss_bytes"] / 1048576, 1) if tree["rss_bytes"] is not None else None,
+            "children_rss_mb": round(tree["children_rss_bytes"] / 1048576, 1) if tree["children_rss_bytes"] is not None else None,
+            "children": tree["children"],
+        })
+    web_rss = read_rss_bytes(os.getpid())
 
     status = {
         "scraper_running": len(running_pids) > 0,
+        "running_tasks": running_tasks,
+        "web_rss_mb": round(web_rss / 1048576, 1) if web_rss is not None else None,
         "login_state_file": {
             "exists": os.path.exists("xianyu_state.json"),
             "path": "xianyu_state.json"
@@ -1046,6 +1274,13 @@ async def update_notification_settings(settings: NotificationSettings, username:
         # Convert Pydantic model to dict, excluding None values
         settings_dict = settings.dict(exclude_none=True)
         save_notification_settings(settings_dict)
+        # 本进程的发送器按新的渠道配置重建，以便发出新渠道中待发送的通知
+        reload_notification_config()
+        await stop_outbox_sender()
+        await close_notification_dispatcher()
+        start_outbox_sender()
+        # 预热进程在启动时已加载 .env，替换为新进程以使用新的设置
+        await worker_pool.recycle()
         return {"message": "通知设置已成功更新。"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"更新通知设置时出错: {e}")
@@ -1066,6 +1301,7 @@ async def update_ai_settings(settings: dict, username: str = Depends(verify_cred
     """
     try:
         save_ai_settings(settings)
+        await worker_pool.recycle()
         return {"message": "AI模型设置已成功更新。"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"更新AI模型设置时出错: {e}")
@@ -1128,9 +1364,10 @@ async def test_ai_settings_backend(username: str = Depends(verify_credentials)):
     测试AI模型设置是否有效（从后端容器内发起）。
     """
     try:
-        from src.config import client, BASE_URL, MODEL_NAME
+        from src.config import get_client, BASE_URL, MODEL_NAME
 
         # 使用与spider_v2.py相同的AI客户端配置
+        client = get_client()
         if not client:
             return {
                 "success": False,